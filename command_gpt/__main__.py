@@ -0,0 +1,143 @@
+# Command line entry point. Usage: python -m command_gpt run --help
+
+import argparse
+import sys
+import time
+
+from config import (
+    BATCH_DEFAULT_REQUEST,
+    BATCH_MAX_LOOPS,
+    BATCH_MAX_WORKERS,
+    BATCH_PROCESSES,
+    COMMAND_PROTOCOL,
+    LLM_CACHE_ENABLED,
+    RULESET_CANDIDATES,
+    SERVICE_DIR,
+    SERVICE_HOST,
+    SERVICE_MAX_WORKERS,
+    SERVICE_PORT,
+)
+from command_gpt.batch import (
+    JOB_ERROR,
+    TOOLKITS,
+    BatchJob,
+    format_summary,
+    load_jobs_file,
+    load_ruleset_file,
+    run_batch,
+)
+from command_gpt.utils.command_parser import PROTOCOLS
+from command_gpt.utils.console_logger import ConsoleLogger
+
+
+def _run(args) -> int:
+    jobs = [load_ruleset_file(path) for path in args.rulesets]
+    for path in args.jobs:
+        jobs.extend(load_jobs_file(path))
+    jobs.extend(BatchJob(name=topic, request=args.request, topic=topic)
+                for topic in args.topic)
+    if not jobs:
+        print("No jobs given (pass ruleset files, --jobs or --topic)", file=sys.stderr)
+        return 2
+
+    if args.headless:
+        ConsoleLogger.configure(headless=True)
+
+    start = time.perf_counter()
+    results = run_batch(
+        jobs,
+        batch_dir=args.batch_dir,
+        max_workers=args.workers,
+        max_loops=args.max_loops,
+        toolkit_class=TOOLKITS[args.toolkit],
+        model_name=args.model,
+        use_library=not args.no_library,
+        processes=args.processes,
+        protocol=args.protocol,
+        ruleset_candidates=args.ruleset_candidates,
+    )
+    ConsoleLogger.flush()
+    print(format_summary(results, time.perf_counter() - start))
+    # Cache & scheduler stats live in the worker processes when sharded
+    in_process = args.processes <= 1
+    if LLM_CACHE_ENABLED and in_process:
+        from command_gpt.utils.llm_cache import get_response_cache
+        stats = get_response_cache().stats()
+        print(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%}), "
+              f"{stats['entries']} entries, {stats['evictions']} evicted")
+    print(f"Repeated commands: {sum(r.repeated_commands for r in results)} served from cache, "
+          f"~{sum(r.loops_saved for r in results)} loops & {sum(r.tokens_saved for r in results)} tokens saved")
+    if in_process:
+        from command_gpt.utils.rate_limiter import get_scheduler
+        chat = get_scheduler("chat").stats()
+        print(f"LLM requests: {chat['admitted']} admitted, {chat['retries']} retried "
+              f"({chat['rate_limit_errors']} rate limited), {chat['wait_seconds']:.1f}s spent waiting")
+    return 1 if any(result.status == JOB_ERROR for result in results) else 0
+
+
+def _serve(args) -> int:
+    from command_gpt.service import serve
+
+    if args.headless:
+        ConsoleLogger.configure(headless=True)
+    serve(args.host, args.port, args.service_dir, args.workers, use_library=not args.no_library)
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m command_gpt", description="CommandGPT")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser(
+        "run", help="Run one or more jobs in parallel, each in its own workspace")
+    run_parser.add_argument("rulesets", nargs="*",
+                            help="Plain text ruleset files (one job each)")
+    run_parser.add_argument("--jobs", action="append", default=[],
+                            help="JSONL file of jobs with a 'ruleset' or 'topic' (& optional 'request', 'name')")
+    run_parser.add_argument("--topic", action="append", default=[],
+                            help="Generate a ruleset for this topic & run it (repeatable)")
+    run_parser.add_argument("--request", default=BATCH_DEFAULT_REQUEST,
+                            help="Request used to generate rulesets for --topic jobs")
+    run_parser.add_argument("--workers", type=int, default=BATCH_MAX_WORKERS,
+                            help="Jobs run at once (per process with --processes)")
+    run_parser.add_argument("--processes", type=int, default=BATCH_PROCESSES,
+                            help="Shard jobs across this many worker processes sharing one memory server")
+    run_parser.add_argument("--max-loops", type=int, default=BATCH_MAX_LOOPS)
+    run_parser.add_argument("--toolkit", choices=TOOLKITS.keys(), default="base")
+    run_parser.add_argument("--model", default="default_chat_llm",
+                            help="Model name registered in config.py")
+    run_parser.add_argument("--protocol", choices=PROTOCOLS, default=COMMAND_PROTOCOL,
+                            help="Send commands as <cmd> lines (text) or native function calls (functions)")
+    run_parser.add_argument("--ruleset-candidates", type=int, default=RULESET_CANDIDATES,
+                            help="Rulesets generated concurrently & ranked for each --topic job (each one costs a generation request)")
+    run_parser.add_argument("--batch-dir",
+                            help="Output directory (default: a timestamped directory under BATCH_DIR)")
+    run_parser.add_argument("--no-library", action="store_true",
+                            help="Always generate rulesets for --topic jobs instead of reusing ones from the ruleset library")
+    run_parser.add_argument("--headless", action="store_true",
+                            help="Emit JSONL events instead of colored console output")
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="Run a local HTTP service that queues jobs & streams their progress (see command_gpt/service.py)")
+    serve_parser.add_argument("--host", default=SERVICE_HOST)
+    serve_parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    serve_parser.add_argument("--workers", type=int, default=SERVICE_MAX_WORKERS,
+                              help="Jobs run at once")
+    serve_parser.add_argument("--service-dir", default=SERVICE_DIR,
+                              help="Job log & job output directory")
+    serve_parser.add_argument("--no-library", action="store_true",
+                              help="Always generate rulesets for topic jobs instead of reusing ones from the ruleset library")
+    serve_parser.add_argument("--headless", action="store_true",
+                              help="Emit JSONL events instead of colored console output")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        return _run(args)
+    if args.command == "serve":
+        return _serve(args)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
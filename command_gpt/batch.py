@@ -0,0 +1,384 @@
+# Batch runs: executes many CommandGPT jobs (rulesets or request/topic pairs) on a worker pool, each in its own workspace
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+from pathlib import Path
+import re
+import time
+from typing import Callable, Iterable, List, NamedTuple, Optional, Type
+
+from config import (
+    BATCH_DEFAULT_REQUEST,
+    BATCH_DIR,
+    BATCH_MAX_LOOPS,
+    BATCH_MAX_WORKERS,
+    BATCH_PROCESSES,
+    COMMAND_PROTOCOL,
+    RULESET_CANDIDATES,
+    RULESET_LIBRARY_ENABLED,
+    get_model,
+)
+from command_gpt.tooling.tool_executor import ToolExecutor
+from command_gpt.tooling.toolkits import BaseToolkit, MemoryOnlyToolkit
+from command_gpt.utils.console_logger import ConsoleLogger
+from command_gpt.utils.workspace_writer import get_workspace_writer
+
+# Job statuses
+JOB_FINISHED = "finished"  # Agent ran the finish command
+JOB_MAX_LOOPS = "max_loops"  # Stopped after max_loops without finishing
+JOB_ERROR = "error"
+
+# Tools that need a human at the keyboard are never given to batch jobs
+BATCH_EXCLUDED_TOOLS = ["human_input"]
+
+# Toolkits jobs can choose by name
+TOOLKITS = {
+    "base": BaseToolkit,
+    "memory_only": MemoryOnlyToolkit,
+}
+
+
+class BatchJob(NamedTuple):
+    """A ruleset to run, or a request/topic pair to generate one from (non-interactively)."""
+    name: str
+    ruleset: Optional[str] = None
+    request: str = BATCH_DEFAULT_REQUEST
+    topic: Optional[str] = None
+
+
+class JobResult(NamedTuple):
+    name: str
+    status: str
+    loops: int
+    prompt_tokens: int
+    completion_tokens: int
+    wall_seconds: float
+    workspace: str
+    response: str = ""
+    error: str = ""
+    # Repeated commands served from cache & estimated savings (see RepetitionDetector.stats)
+    repeated_commands: int = 0
+    loops_saved: int = 0
+    tokens_saved: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+# region Loading Jobs
+
+def safe_job_name(name: str) -> str:
+    """Make a job name safe to use as a directory name."""
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("._") or "job"
+
+
+def load_jobs_file(path: str) -> List[BatchJob]:
+    """
+    Load jobs from a JSONL file, one object per line with either "ruleset" or "topic" (& optionally "request" & "name").
+    - Blank lines & lines starting with # are skipped.
+    """
+    jobs = []
+    with open(path, "r", encoding="utf-8") as jobs_file:
+        for line_number, line in enumerate(jobs_file, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            entry = json.loads(line)
+            if not entry.get("ruleset") and not entry.get("topic"):
+                raise ValueError(
+                    f"{path}:{line_number}: job needs a 'ruleset' or a 'topic'")
+            jobs.append(BatchJob(
+                name=entry.get("name") or f"{Path(path).stem}-{line_number}",
+                ruleset=entry.get("ruleset"),
+                request=entry.get("request") or BATCH_DEFAULT_REQUEST,
+                topic=entry.get("topic"),
+            ))
+    return jobs
+
+
+def load_ruleset_file(path: str) -> BatchJob:
+    """Load a plain text ruleset as a job named after the file."""
+    return BatchJob(name=Path(path).stem, ruleset=Path(path).read_text(encoding="utf-8"))
+
+
+def dedupe_job_names(jobs: Iterable[BatchJob]) -> List[BatchJob]:
+    """Sanitize job names & suffix duplicates so every job gets its own workspace."""
+    seen = {}
+    unique = []
+    for job in jobs:
+        name = safe_job_name(job.name)
+        seen[name] = seen.get(name, 0) + 1
+        if seen[name] > 1:
+            name = f"{name}-{seen[name]}"
+        unique.append(job._replace(name=name))
+    return unique
+
+# endregion
+# region Running Jobs
+
+
+def run_job(
+    job: BatchJob,
+    job_dir: Path,
+    llm,
+    tool_executor: ToolExecutor,
+    toolkit_class: Type[BaseToolkit] = BaseToolkit,
+    max_loops: int = BATCH_MAX_LOOPS,
+    library=None,
+    on_loop: Optional[Callable] = None,
+    protocol: str = COMMAND_PROTOCOL,
+    ruleset_candidates: int = RULESET_CANDIDATES,
+) -> JobResult:
+    """
+    Run a single job to completion (finish command, max_loops or error) & return its stats. Never raises.
+    - The agent works in job_dir/workspace; the ruleset used is saved to job_dir/ruleset.txt.
+    - With a RulesetLibrary, topic jobs reuse or store their ruleset there & the job's outcome is recorded against it.
+    - on_loop receives the agent's LoopEvent after every loop (see CommandGPT.subscribe).
+    - protocol is how the agent sends commands (PROTOCOL_TEXT or PROTOCOL_FUNCTIONS, see command_parser.py).
+    - ruleset_candidates rulesets are generated & ranked for topic jobs (see RulesetGeneratorAgent.run).
+    """
+    from command_gpt.command_gpt import CommandGPT
+    from command_gpt.prompting.ruleset_generator import RulesetGeneratorAgent
+    from command_gpt.utils.vector_memory import close_retriever, create_vectorstore_retriever
+
+    ConsoleLogger.set_agent_prefix(job.name)
+    workspace_dir = job_dir / "workspace"
+    workspace_dir.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    agent = None
+    memory = None
+    library_entry_id = None
+    try:
+        ruleset = job.ruleset
+        if not ruleset:
+            generator = RulesetGeneratorAgent.from_request_and_topic(
+                request=job.request,
+                topic=job.topic,
+                llm=llm,
+            )
+            try:
+                if library is not None:
+                    ruleset = generator.run_with_library(
+                        library, interactive=False, candidates=ruleset_candidates)
+                    library_entry_id = generator.library_entry_id
+                else:
+                    ruleset = generator.run(
+                        interactive=False, candidates=ruleset_candidates)
+            finally:
+                generator.close()
+        (job_dir / "ruleset.txt").write_text(ruleset, encoding="utf-8")
+
+        toolkit = toolkit_class(
+            workspace_dir=str(workspace_dir), excluded_tools=BATCH_EXCLUDED_TOOLS)
+        memory = create_vectorstore_retriever()
+        agent = CommandGPT.from_ruleset_and_tools(
+            ruleset,
+            tools=toolkit.get_toolkit(),
+            llm=llm,
+            memory=memory,
+            tool_executor=tool_executor,
+            workspace_dir=str(workspace_dir),
+            protocol=protocol,
+        )
+        if on_loop is not None:
+            agent.subscribe(on_loop)
+        response = agent.run(max_loops=max_loops)
+        status = JOB_FINISHED if agent.finished else JOB_MAX_LOOPS
+        error = ""
+    except Exception as e:
+        ConsoleLogger.log_error(f"Job {job.name} failed: {e}")
+        response = ""
+        status = JOB_ERROR
+        error = str(e)
+    finally:
+        if agent is not None:
+            agent.close()
+        if memory is not None:
+            close_retriever(memory)
+        ConsoleLogger.set_agent_prefix(None)
+
+    result = JobResult(
+        name=job.name,
+        status=status,
+        loops=agent.loop_count if agent else 0,
+        prompt_tokens=agent.prompt_tokens if agent else 0,
+        completion_tokens=agent.completion_tokens if agent else 0,
+        wall_seconds=time.perf_counter() - start,
+        workspace=str(workspace_dir),
+        response=response,
+        error=error,
+        repeated_commands=agent.repetition_detector.stats["cache_hits"] if agent else 0,
+        loops_saved=agent.repetition_detector.stats["loops_saved"] if agent else 0,
+        tokens_saved=agent.repetition_detector.stats["tokens_saved"] if agent else 0,
+    )
+    if library_entry_id is not None:
+        library.record_outcome(library_entry_id, result.status,
+                               result.loops, result.total_tokens)
+    return result
+
+
+def run_batch(
+    jobs: List[BatchJob],
+    batch_dir: Optional[str] = None,
+    max_workers: int = BATCH_MAX_WORKERS,
+    max_loops: int = BATCH_MAX_LOOPS,
+    toolkit_class: Type[BaseToolkit] = BaseToolkit,
+    model_name: str = "default_chat_llm",
+    use_library: bool = RULESET_LIBRARY_ENABLED,
+    processes: int = BATCH_PROCESSES,
+    protocol: str = COMMAND_PROTOCOL,
+    ruleset_candidates: int = RULESET_CANDIDATES,
+) -> List[JobResult]:
+    """
+    Run jobs on a pool of max_workers threads, each in its own workspace under batch_dir, & write summary.json there.
+    - Jobs share one LLM & one ToolExecutor, so per-tool concurrency limits apply across the batch.
+    - With use_library, topic jobs reuse rulesets from the ruleset library (see ruleset_library.py).
+    - With processes > 1, jobs are sharded across that many worker processes (max_workers threads each), see _run_sharded().
+    """
+    batch_path = Path(batch_dir or Path(BATCH_DIR) / time.strftime("%Y%m%d-%H%M%S"))
+    batch_path.mkdir(parents=True, exist_ok=True)
+    jobs = dedupe_job_names(jobs)
+    if processes > 1 and len(jobs) > 1:
+        results = _run_sharded(jobs, batch_path, processes, max_workers,
+                               max_loops, toolkit_class, model_name, use_library, protocol,
+                               ruleset_candidates)
+    else:
+        results = _run_jobs(jobs, batch_path, max_workers,
+                            max_loops, toolkit_class, model_name, use_library, protocol,
+                            ruleset_candidates)
+
+    summary = [dict(result._asdict(), total_tokens=result.total_tokens)
+               for result in results]
+    (batch_path / "summary.json").write_text(
+        json.dumps(summary, indent=2), encoding="utf-8")
+    return results
+
+
+def _run_jobs(
+    jobs: List[BatchJob],
+    batch_path: Path,
+    max_workers: int,
+    max_loops: int,
+    toolkit_class: Type[BaseToolkit],
+    model_name: str,
+    use_library: bool,
+    protocol: str,
+    ruleset_candidates: int,
+) -> List[JobResult]:
+    """Run jobs on a thread pool in this process (results in job order)."""
+    llm = get_model(model_name)
+    tool_executor = ToolExecutor()
+    library = None
+    if use_library:
+        from command_gpt.prompting.ruleset_library import get_ruleset_library
+        library = get_ruleset_library()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="batch-job") as executor:
+            futures = [
+                executor.submit(run_job, job, batch_path / job.name,
+                                llm, tool_executor, toolkit_class, max_loops, library,
+                                protocol=protocol, ruleset_candidates=ruleset_candidates)
+                for job in jobs
+            ]
+            return [future.result() for future in futures]
+    finally:
+        tool_executor.shutdown()
+        get_workspace_writer().flush_all()
+
+
+def _run_shard(
+    jobs: List[BatchJob],
+    batch_path: Path,
+    memory_address,
+    memory_authkey: bytes,
+    processes: int,
+    max_workers: int,
+    max_loops: int,
+    toolkit_class: Type[BaseToolkit],
+    model_name: str,
+    use_library: bool,
+    protocol: str,
+    ruleset_candidates: int,
+) -> List[JobResult]:
+    """
+    Worker process entry point: run a shard of jobs on threads, with agent memory kept on the memory server.
+    """
+    from command_gpt.utils.memory_server import use_memory_server
+    from command_gpt.utils.rate_limiter import scale_rate_limits
+
+    # Each process schedules its own requests, so each gets an equal share of the rate limits
+    scale_rate_limits(1 / processes)
+    use_memory_server(memory_address, memory_authkey)
+    return _run_jobs(jobs, batch_path, max_workers, max_loops, toolkit_class, model_name, use_library, protocol,
+                     ruleset_candidates)
+
+
+def _run_sharded(
+    jobs: List[BatchJob],
+    batch_path: Path,
+    processes: int,
+    max_workers: int,
+    max_loops: int,
+    toolkit_class: Type[BaseToolkit],
+    model_name: str,
+    use_library: bool,
+    protocol: str,
+    ruleset_candidates: int,
+) -> List[JobResult]:
+    """
+    Deal jobs round robin into one shard per worker process & run them, with one memory server process owning every
+    agent's vector memory & the embedding cache (so FAISS indexes & embeddings aren't duplicated per process).
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from command_gpt.utils.memory_server import MemoryServer
+
+    processes = min(processes, len(jobs))
+    shards = [jobs[i::processes] for i in range(processes)]
+    ConsoleLogger.log(
+        f"Sharding {len(jobs)} jobs across {processes} processes", color=ConsoleLogger.COLOR_MAGENTA)
+    with MemoryServer() as memory_server:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [
+                executor.submit(_run_shard, shard, batch_path, memory_server.address, memory_server.authkey,
+                                processes, max_workers, max_loops, toolkit_class, model_name, use_library, protocol,
+                                ruleset_candidates)
+                for shard in shards
+            ]
+            shard_results = [future.result() for future in futures]
+        stats = memory_server.service().stats()
+        ConsoleLogger.log(
+            f"Memory server: {stats['namespaces']} agents, {stats['documents']} documents, "
+            f"{stats['hits']} embedding cache hits, {stats['misses']} misses", color=ConsoleLogger.COLOR_MAGENTA)
+
+    # Back to job order
+    results = {result.name: result for shard in shard_results for result in shard}
+    return [results[job.name] for job in jobs]
+
+# endregion
+
+
+def format_summary(results: List[JobResult], batch_seconds: Optional[float] = None) -> str:
+    """Format job results as a plain text table (the TOTAL row shows batch_seconds as its wall time if given)."""
+    rows = [["job", "status", "loops", "tokens", "wall time"]]
+    for result in results:
+        rows.append([
+            result.name,
+            result.status,
+            str(result.loops),
+            str(result.total_tokens),
+            f"{result.wall_seconds:.1f}s",
+        ])
+    rows.append([
+        "TOTAL",
+        f"{sum(r.status == JOB_FINISHED for r in results)}/{len(results)} finished",
+        str(sum(r.loops for r in results)),
+        str(sum(r.total_tokens for r in results)),
+        f"{batch_seconds if batch_seconds is not None else sum(r.wall_seconds for r in results):.1f}s",
+    ])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+        for row in rows
+    )
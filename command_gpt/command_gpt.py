@@ -1,6 +1,7 @@
 from __future__ import annotations
-from typing import List, Optional
-from pydantic import ValidationError
+from pathlib import Path
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
 
 from langchain.chains.llm import LLMChain
 from langchain.chat_models.base import BaseChatModel
@@ -14,10 +15,50 @@ from langchain.schema import (
 from langchain.tools.base import BaseTool
 from langchain.vectorstores.base import VectorStoreRetriever
 
-from command_gpt.utils.command_parser import GPTCommand, CommandGPTOutputParser, COMMAND_FORMAT
+from config import COMMAND_PROTOCOL, LLM_MAX_CONSECUTIVE_ERRORS, STREAM_STOP_AT_COMMAND, WORKSPACE_DIR
+from command_gpt.tooling.result_budget import ResultBudget
+from command_gpt.tooling.tool_executor import STATUS_ERROR, STATUS_TIMEOUT, ToolExecutor, ToolResult
+from command_gpt.utils.command_parser import (
+    FUNCTION_CALL_KEY,
+    PROTOCOL_FUNCTIONS,
+    BaseCommandGPTOutputParser,
+    CommandGPTOutputParser,
+    FunctionCallOutputParser,
+    GPTCommand,
+)
 from command_gpt.utils.console_logger import ConsoleLogger
+from command_gpt.utils.custom_stream import CommandComplete, CommandStreamDetector
+from command_gpt.utils.function_calling import (
+    FunctionCallChain,
+    format_function_call,
+    function_call_message,
+    function_definitions,
+    get_function_call,
+    reply_text,
+)
+from command_gpt.prompting.context_budget import ContextBudget, is_context_overflow
 from command_gpt.prompting.prompt import CommandGPTPrompt
-from command_gpt.utils.evaluate import get_filesystem_representation
+from command_gpt.prompting.prompt_generator import PromptGenerator
+from command_gpt.utils.evaluate import WorkspaceIndex, get_filesystem_representation
+from command_gpt.utils.repetition_detector import RepetitionDetector
+from command_gpt.utils.workspace_writer import get_workspace_writer
+
+
+# Loop statuses besides the tool statuses (STATUS_* in tool_executor.py)
+LOOP_CACHED = "cached"  # Repeated command served from the repetition detector's cache
+LOOP_FINISH = "finish"
+LOOP_LLM_ERROR = "llm_error"  # LLM call failed, loop skipped
+
+
+class LoopEvent(NamedTuple):
+    """Summary of one loop, passed to listeners registered with CommandGPT.subscribe()."""
+    loop: int
+    command: str
+    status: str
+    seconds: float
+    tool_seconds: float
+    prompt_tokens: int
+    completion_tokens: int
 
 
 class CommandGPT:
@@ -27,8 +68,11 @@ class CommandGPT:
         self,
         memory: VectorStoreRetriever,
         chain: LLMChain,
-        output_parser: CommandGPTOutputParser,
+        output_parser: BaseCommandGPTOutputParser,
         tools: List[BaseTool],
+        tool_executor: Optional[ToolExecutor] = None,
+        stop_at_command: bool = STREAM_STOP_AT_COMMAND,
+        workspace_dir: str = WORKSPACE_DIR,
     ):
         self.memory = memory
         self.full_message_history: List[BaseMessage] = []
@@ -36,6 +80,30 @@ class CommandGPT:
         self.chain = chain
         self.output_parser = output_parser
         self.tools = tools
+        # Shut down in close() only if created here (batch jobs share one)
+        self._owns_tool_executor = tool_executor is None
+        self.tool_executor = tool_executor or ToolExecutor()
+        # Status & timing of the most recent tool call
+        self.last_tool_result: Optional[ToolResult] = None
+        # Cached file stats for the workspace listing, kept fresh by write notifications
+        self.workspace_index = WorkspaceIndex()
+        # Watches the response stream & cuts it off at </cmd> (streaming LLMs only)
+        self.command_detector = CommandStreamDetector(
+            stop_on_command=stop_at_command)
+        # Workspace listed to the agent each loop (should match the toolkit's workspace_dir)
+        self.workspace_path = Path(workspace_dir)
+        # Keeps large tool results in the workspace, with a digest in history & memory
+        self.result_budget = ResultBudget(
+            workspace_dir, token_counter=chain.llm.get_num_tokens)
+        # Serves repeated read-only commands from cache & flags command cycles (see stats for what it saved)
+        self.repetition_detector = RepetitionDetector(
+            workspace_dir, token_counter=chain.llm.get_num_tokens)
+        # Usage stats (tokens are estimated with the LLM's token counter)
+        self.loop_count = 0
+        self.finished = False  # Set once the agent runs the finish command
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._loop_listeners: List[Callable[[LoopEvent], None]] = []
 
     @classmethod
     def from_ruleset_and_tools(
@@ -44,27 +112,62 @@ class CommandGPT:
         memory: VectorStoreRetriever,
         tools: List[BaseTool],
         llm: BaseChatModel,
-        output_parser: Optional[CommandGPTOutputParser] = None,
+        output_parser: Optional[BaseCommandGPTOutputParser] = None,
+        tool_executor: Optional[ToolExecutor] = None,
+        stop_at_command: bool = STREAM_STOP_AT_COMMAND,
+        workspace_dir: str = WORKSPACE_DIR,
+        protocol: str = COMMAND_PROTOCOL,
     ) -> CommandGPT:
+        """
+        - protocol is PROTOCOL_TEXT (<cmd> lines parsed from the reply) or PROTOCOL_FUNCTIONS (tools sent as function
+          definitions, for models supporting function calls, e.g. FunctionCallingChatOpenAI)
+        """
+        functions = protocol == PROTOCOL_FUNCTIONS
         prompt = CommandGPTPrompt(
             ruleset=ruleset,
             tools=tools,
-            input_variables=["memory", "messages", "user_input"],
+            input_variables=["memory", "messages", "user_input", "workspace"],
             token_counter=llm.get_num_tokens,
+            context_budget=ContextBudget.for_llm(llm),
+            protocol=protocol,
+            function_definitions=PromptGenerator._generate_functions_from_tools(tools) if functions else [],
         )
 
-        chain = LLMChain(llm=llm, prompt=prompt)
+        chain = (FunctionCallChain if functions else LLMChain)(llm=llm, prompt=prompt)
+        if output_parser is None:
+            output_parser = FunctionCallOutputParser() if functions else CommandGPTOutputParser()
 
         return cls(
             memory,
             chain,
-            output_parser or CommandGPTOutputParser(),
+            output_parser,
             tools,
+            tool_executor,
+            stop_at_command,
+            workspace_dir,
         )
 
-    def run(self) -> str:
+    def subscribe(self, listener: Callable[[LoopEvent], None]):
+        """
+        Register a callback that receives a LoopEvent at the end of every loop (on the thread running the agent).
+        """
+        self._loop_listeners.append(listener)
+
+    def close(self):
+        """
+        Detach from the shared WorkspaceWriter (workspace index & repetition detector) & release loop listeners, so a
+        finished agent can be collected. Shuts down the tool executor if this agent created it.
+        """
+        self.workspace_index.close()
+        self.repetition_detector.close()
+        self._loop_listeners.clear()
+        if self._owns_tool_executor:
+            self.tool_executor.shutdown()
+
+    def run(self, max_loops: Optional[int] = None) -> str:
         """
         Kicks off interaction loop with AI
+        - Returns the finish command's response, or an empty string if max_loops is reached first
         """
 
         system_message = (
@@ -72,38 +175,92 @@ class CommandGPT:
         )
 
         # Interaction Loop
-        loop_count = 0
-        while True:
-            loop_count += 1
+        consecutive_errors = 0
+        while max_loops is None or self.loop_count < max_loops:
+            self.loop_count += 1
+            loop_start = time.perf_counter()
             messages = self.full_message_history
 
             # todo: build in human input
             # user_input = ConsoleLogger.input("You: ")
 
-            # Get file system representation & append to messages
-            files = get_filesystem_representation(verbose=False)
-            system_message = f"Current loop count: {loop_count}\nFiles: {files} \nUse commands to achieve the defined goals. Do not ask for my input. Always provide commands."
+            # Get file system representation & append to messages (committing buffered writes first so sizes are current)
+            get_workspace_writer().flush_all()
+            files = get_filesystem_representation(
+                path=self.workspace_path, verbose=False, index=self.workspace_index)
+            workspace = str(files)
+            system_message = f"Current loop count: {self.loop_count}\nFiles: {workspace} \nUse commands to achieve the defined goals. Do not ask for my input. Always provide commands."
 
             # Set response color for console logger
             ConsoleLogger.set_response_stream_color()
             # Send message to AI, get response
-            assistant_reply = self.chain.run(
-                messages=messages,
-                memory=self.memory,
-                user_input=system_message,
-            )
+            try:
+                reply = self.get_reply(
+                    messages, system_message, workspace)
+            except Exception as e:
+                # The request scheduler already retried rate limits & transient errors; skip this loop unless it keeps failing
+                ConsoleLogger.end_stream()
+                consecutive_errors += 1
+                ConsoleLogger.log_error(
+                    f"LLM call failed ({consecutive_errors}/{LLM_MAX_CONSECUTIVE_ERRORS}): {e}")
+                self._notify_loop(loop_start, "", LOOP_LLM_ERROR, 0, 0)
+                if consecutive_errors >= LLM_MAX_CONSECUTIVE_ERRORS:
+                    raise
+                continue
+            consecutive_errors = 0
+            # Reply text plus its function call (if any), as memory & token counts see it
+            assistant_reply = reply_text(reply)
+            loop_prompt_tokens = self.chain.prompt.last_prompt_tokens
+            loop_completion_tokens = self.chain.llm.get_num_tokens(
+                assistant_reply)
+            self.prompt_tokens += loop_prompt_tokens
+            self.completion_tokens += loop_completion_tokens
 
             # Update message history
             self.full_message_history.append(
                 HumanMessage(content=system_message))
             # self.full_message_history.append(SystemMessage(content=system_message))
-            self.full_message_history.append(
-                AIMessage(content=assistant_reply))
+            self.full_message_history.append(reply)
 
             # Parse command and execute
             tools = {t.name: t for t in self.tools}
-            action = self.output_parser.parse(assistant_reply)
-            command_result = self.try_execute_command(tools, action)
+            action = self.output_parser.parse_message(reply)
+            call = get_function_call(reply)
+            if call:
+                ConsoleLogger.log_tool(f"Function call: {format_function_call(call)}")
+            if action.repairs:
+                ConsoleLogger.log_tool(
+                    f"Repaired command locally: {', '.join(action.repairs)}")
+            if action.name == "finish":
+                self.finished = True
+                self._notify_loop(loop_start, action.name, LOOP_FINISH,
+                                  loop_prompt_tokens, loop_completion_tokens)
+                return action.args.get("response", "")
+            repetition = self.repetition_detector.check(
+                action.name, action.args, workspace)
+            if repetition.cached_result is not None:
+                ConsoleLogger.log_tool(
+                    f"Repeated {action.name} (same as loop {repetition.repeat_of_loop}), served from cache")
+                self.repetition_detector.record_cache_hit(repetition)
+                command_result = repetition.cached_result
+                tool_result = None
+            else:
+                command_result = self.try_execute_command(tools, action)
+                tool_result = self.last_tool_result
+                budgeted = self.result_budget.apply(
+                    self.loop_count, action.name, action.args, command_result,
+                    tokens=tool_result.tokens if tool_result else None)
+                if tool_result and not tool_result.cached and self.tool_executor.result_cache is not None:
+                    self.tool_executor.result_cache.record_tokens(
+                        tools[action.name], action.args, budgeted.original_tokens)
+                self.chain.prompt.remember_tokens(budgeted.text, budgeted.tokens)
+                if budgeted.full_output_path:
+                    ConsoleLogger.log_tool(
+                        f"Result was {budgeted.original_tokens} tokens, keeping a {budgeted.tokens} token digest (full output in {budgeted.full_output_path})")
+                command_result = budgeted.text
+                self.repetition_detector.record_result(
+                    repetition, command_result,
+                    self.last_tool_result.duration_seconds if self.last_tool_result else 0.0)
 
             memory_to_add = (
                 f"Assistant Reply: {assistant_reply} " f"\nResult: {command_result} "
@@ -112,29 +269,85 @@ class CommandGPT:
             self.memory.add_documents([Document(page_content=memory_to_add)])
             self.full_message_history.append(
                 SystemMessage(content=command_result))
+            if repetition.cycle:
+                ConsoleLogger.log_error(
+                    f"Command cycle detected: {' -> '.join(repetition.cycle)}")
+                self.full_message_history.append(SystemMessage(
+                    content=self.repetition_detector.correction_message(repetition)))
 
-    def try_execute_command(self, tools_available: List[BaseTool], command: GPTCommand):
+            if repetition.cached_result is not None:
+                status = LOOP_CACHED
+            else:
+                status = tool_result.status if tool_result else STATUS_ERROR
+            self._notify_loop(loop_start, action.name, status, loop_prompt_tokens,
+                              loop_completion_tokens, tool_result.duration_seconds if tool_result else 0.0)
+
+        return ""
+
+    def _notify_loop(self, loop_start: float, command: str, status: str, prompt_tokens: int,
+                     completion_tokens: int, tool_seconds: float = 0.0):
+        event = LoopEvent(self.loop_count, command, status, time.perf_counter() - loop_start,
+                          tool_seconds, prompt_tokens, completion_tokens)
+        for listener in self._loop_listeners:
+            listener(event)
+
+    def get_reply(self, messages: List[BaseMessage], user_input: str, workspace: str) -> AIMessage:
         """
-        Executes a command if available in tools, otherwise returns an error message
+        Send the prompt to the LLM & return its reply (with its function call, if any), re-packing the prompt more tightly
+        after each context-length error
         """
+        prompt: CommandGPTPrompt = self.chain.prompt
+        definitions = prompt.function_definitions if prompt.protocol == PROTOCOL_FUNCTIONS else None
+        while True:
+            try:
+                with function_definitions(definitions):
+                    outputs = self.chain(
+                        dict(
+                            messages=messages,
+                            memory=self.memory,
+                            user_input=user_input,
+                            workspace=workspace,
+                        ),
+                        callbacks=[self.command_detector],
+                    )
+                reply = function_call_message(
+                    outputs[self.chain.output_key], outputs.get(FUNCTION_CALL_KEY))
+            except CommandComplete as complete:
+                # Generation was stopped at </cmd>, so the LLM end callbacks didn't run
+                reply = AIMessage(content=complete.text)
+                ConsoleLogger.end_stream()
+            except Exception as e:
+                if not is_context_overflow(e) or not prompt.tighten(str(e)):
+                    raise
+                ConsoleLogger.log_error(
+                    f"Prompt too long for the context window, re-packing (level {prompt.pack_level})")
+                continue
+            prompt.record_success()
+            return reply
+
+    def try_execute_command(self, tools_available: Dict[str, BaseTool], command: GPTCommand):
+        """
+        Executes a command if available in tools (through the tool executor), otherwise returns an error message
+        """
+        self.last_tool_result = None
         if command.name == "finish":
-            return command.args["response"]
+            return command.args.get("response", "")
         if command.name in tools_available:
             tool = tools_available[command.name]
-            try:
-                observation = tool.run(command.args)
-            except ValidationError as e:
-                observation = (
-                    f"Validation Error in args: {str(e)}, args: {command.args}"
-                )
-            except Exception as e:
-                observation = (
-                    f"Error: {str(e)}, {type(e).__name__}, args: {command.args}"
-                )
-            result = f"Command {tool.name} returned: {observation}"
+            tool_result = self.tool_executor.execute(tool, command.args)
+            self.last_tool_result = tool_result
+            if tool_result.status == STATUS_TIMEOUT:
+                ConsoleLogger.log_error(
+                    f"Command {tool.name} timed out after {tool_result.duration_seconds:.1f}s")
+                result = f"Command {tool.name} did not finish in time ({tool_result.output}). Try a smaller request or a different command."
+            else:
+                if tool_result.cached:
+                    ConsoleLogger.log_tool(
+                        f"{tool.name} result unchanged since it was last read, served from cache")
+                result = f"Command {tool.name} returned: {tool_result.output}"
         elif command.name == "ERROR":
             ConsoleLogger.log_error("Command not parsed")
-            result = f"Improperly formatted command line. Proper formatting:\n\n {COMMAND_FORMAT}"
+            result = self.output_parser.get_format_instructions()
         else:
             result = (
                 f"Unknown command '{command.name}'. Please refer to the Commands list for available commands and only respond in the specified command line format."
@@ -0,0 +1,113 @@
+# Per-model context window budgets, learned from context-length errors so prompts can use the full window
+
+import json
+from pathlib import Path
+import re
+import threading
+from typing import Any, Dict, Optional
+
+from config import (
+    CONTEXT_INITIAL_SLACK,
+    CONTEXT_SLACK_DECAY,
+    CONTEXT_SLACK_PATH,
+    MODEL_CONTEXT_WINDOWS,
+)
+
+# e.g. "This model's maximum context length is 4097 tokens. However, your messages resulted in 4301 tokens."
+MAX_CONTEXT_PATTERN = re.compile(r"maximum context length is (\d+)")
+ACTUAL_TOKENS_PATTERN = re.compile(
+    r"(?:resulted in|you requested) (\d+) tokens(?: \((\d+) in the (?:messages|prompt))?")
+# Fallback growth when an error doesn't say how many tokens were sent
+UNKNOWN_OVERFLOW_GROWTH = 1.1
+
+_slack_lock = threading.Lock()
+
+
+def is_context_overflow(error: BaseException) -> bool:
+    message = str(error)
+    return "context_length_exceeded" in message or "maximum context length" in message
+
+
+def unwrap_model(llm: Any) -> Any:
+    """
+    Return the model inside any wrappers (response cache, rate limiter) that keep the real model in .llm.
+    """
+    while not hasattr(llm, "model_name") and hasattr(llm, "llm"):
+        llm = llm.llm
+    return llm
+
+
+def get_model_name(llm: Any) -> Optional[str]:
+    return getattr(unwrap_model(llm), "model_name", None)
+
+
+class ContextBudget:
+    """
+    Prompt token budget for one model: its context window divided by the learned slack between our token counts & the API's.
+    - record_overflow() learns from context-length errors (the API reports the real count & window); the slack is saved per model.
+    - record_success() lets the slack decay back toward the largest ratio actually observed, so headroom isn't kept forever.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        window: int,
+        slack_path: str = CONTEXT_SLACK_PATH,
+    ):
+        self.model_name = model_name
+        self.window = window
+        self.slack_path = Path(slack_path)
+        saved = self._load().get(model_name, {})
+        self.slack: float = saved.get("slack", CONTEXT_INITIAL_SLACK)
+        # Largest real/counted ratio seen in an error, the floor slack decays toward
+        self.observed: float = saved.get("observed", 1.0)
+
+    @classmethod
+    def for_llm(cls, llm: Any) -> Optional["ContextBudget"]:
+        """Return a budget for llm's model, or None if its context window isn't in MODEL_CONTEXT_WINDOWS."""
+        model_name = get_model_name(llm)
+        if model_name not in MODEL_CONTEXT_WINDOWS:
+            return None
+        return cls(model_name, MODEL_CONTEXT_WINDOWS[model_name])
+
+    def prompt_token_limit(self) -> int:
+        """Max prompt tokens (as counted locally) that fit in the window."""
+        return int(self.window / self.slack)
+
+    def record_overflow(self, error_text: str, counted_tokens: int):
+        """
+        Learn from a context-length error for a prompt counted at counted_tokens.
+        """
+        window_match = MAX_CONTEXT_PATTERN.search(error_text)
+        if window_match:
+            self.window = int(window_match.group(1))
+        actual_match = ACTUAL_TOKENS_PATTERN.search(error_text)
+        if actual_match and counted_tokens > 0:
+            # Prefer the prompt-only count when the completion is included in the total
+            actual = int(actual_match.group(2) or actual_match.group(1))
+            self.observed = max(self.observed, actual / counted_tokens)
+            self.slack = max(self.slack, self.observed)
+        else:
+            self.slack *= UNKNOWN_OVERFLOW_GROWTH
+        self._save()
+
+    def record_success(self):
+        self.slack = max(self.observed, self.slack * (1 - CONTEXT_SLACK_DECAY))
+
+    # region Persistence
+
+    def _load(self) -> Dict[str, Dict[str, float]]:
+        try:
+            return json.loads(self.slack_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        with _slack_lock:
+            data = self._load()
+            data[self.model_name] = {
+                "slack": self.slack, "observed": self.observed}
+            self.slack_path.parent.mkdir(parents=True, exist_ok=True)
+            self.slack_path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+
+    # endregion
@@ -1,9 +1,11 @@
 # Full prompt with base prompt, time, memory, and historical messages
 
+from collections import OrderedDict
+import json
 import time
-from typing import Any, Callable, List
+from typing import Any, Callable, Dict, List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 
 from langchain.prompts.chat import (
     BaseChatPromptTemplate,
@@ -12,57 +14,170 @@ from langchain.schema import BaseMessage, HumanMessage, SystemMessage
 from langchain.tools.base import BaseTool
 from langchain.vectorstores.base import VectorStoreRetriever
 
+from config import CONTEXT_RESPONSE_RESERVE_TOKENS
+from command_gpt.prompting.context_budget import ContextBudget
 from command_gpt.prompting.prompt_generator import get_prompt
+from command_gpt.utils.command_parser import PROTOCOL_FUNCTIONS, PROTOCOL_TEXT
 from command_gpt.utils.console_logger import ConsoleLogger
 
+# Prefix of the (per-second) time message; the LLM response cache ignores the rest of the line
+TIME_PROMPT_PREFIX = "The current time and date is"
+
+# Packing levels, tightened one at a time after a context-length error (each level includes the ones before it)
+PACK_FULL = 0
+PACK_NO_MEMORY = 1  # Drop relevant memory
+PACK_SHORT_HISTORY = 2  # Keep only the last couple of historical messages
+PACK_SHORT_WORKSPACE = 3  # Truncate the workspace listing in the input message
+PACK_SHORT_TOOL_OUTPUT = 4  # Truncate every historical message (mostly tool output)
+PACK_MAX = PACK_SHORT_TOOL_OUTPUT
+# A tightened level is relaxed by one after this many successes in a row whose prompt used at most PACK_RELAX_HEADROOM
+# of the token limit (relaxing straight to PACK_FULL would just overflow again on the next long history)
+PACK_RELAX_SUCCESSES = 3
+PACK_RELAX_HEADROOM = 0.8
+
+SHORT_HISTORY_MESSAGES = 2
+SHORT_WORKSPACE_CHARS = 1000
+SHORT_MESSAGE_CHARS = 500
+# Share of the prompt budget relevant memory may take up (was 2500 of 4100)
+MEMORY_SHARE = 0.6
+# Token counts remembered for message & memory texts (history is re-counted every loop otherwise)
+TOKEN_MEMO_SIZE = 256
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + f"... [truncated {len(text) - max_chars} chars]"
+
 
 class CommandGPTPrompt(BaseChatPromptTemplate, BaseModel):
     """
     Prompt template for Command-GPT with base prompt, time, memory, and historical messages. Gets full prompt from prompt_generator.py.
+    - With a context_budget, the token limit follows the model's window (adjusted by learned slack) instead of send_token_limit.
+    - After a context-length error, tighten() re-packs the next prompt more aggressively (see PACK_* levels); record_success() relaxes it
+      one level at a time once prompts fit with room to spare.
+    - An optional "workspace" input is the listing embedded in user_input, so it can be truncated when packing tightly.
+    - Token counts are memoized by text; remember_tokens() seeds counts already known (e.g. for cached tool results).
+    - With PROTOCOL_FUNCTIONS, the command instructions are left out & function_definitions (sent with the request) are
+      counted against the budget instead.
     """
     ruleset: str
     tools: List[BaseTool]
     token_counter: Callable[[str], int]
-    send_token_limit: int = 4100  # Lowered due to infrequent token limit errors
+    send_token_limit: int = 4100  # Used when the model's context window is unknown
+    response_token_reserve: int = CONTEXT_RESPONSE_RESERVE_TOKENS
+    context_budget: Optional[ContextBudget] = None
+    pack_level: int = PACK_FULL
+    # Token count of the most recently formatted prompt (read by CommandGPT for usage stats)
+    last_prompt_tokens: int = 0
+    protocol: str = PROTOCOL_TEXT
+    function_definitions: List[Dict] = []
 
     # todo: probably move to command_gpt.py for more holistic logging
     # Always log full prompt on first run
     is_first_run = True
+    _token_counts: "OrderedDict[str, int]" = PrivateAttr(default_factory=OrderedDict)
+    # Successes in a row with headroom at the current pack level
+    _relax_count: int = PrivateAttr(default=0)
+
+    class Config:
+        arbitrary_types_allowed = True
 
     def construct_full_prompt(self) -> str:
         # Construct full prompt
-        full_prompt = get_prompt(self.ruleset, self.tools)
+        full_prompt = get_prompt(self.ruleset, self.tools, self.protocol)
 
         # Log full prompt on first run
         if self.is_first_run:
-            ConsoleLogger.log(
-                f"\nFULL PROMPT:\n\n{full_prompt}", ConsoleLogger.COLOR_INPUT)
+            ConsoleLogger.log_prompt(full_prompt)
             self.is_first_run = False
         return full_prompt
 
+    # region Budgeting
+
+    def token_limit(self) -> int:
+        if self.context_budget is not None:
+            return self.context_budget.prompt_token_limit()
+        return self.send_token_limit
+
+    def tighten(self, error_text: str) -> bool:
+        """
+        Learn from a context-length error & pack the next prompt more tightly. Returns False once nothing is left to tighten.
+        """
+        if self.context_budget is not None:
+            self.context_budget.record_overflow(
+                error_text, self.last_prompt_tokens)
+        self._relax_count = 0
+        if self.pack_level >= PACK_MAX:
+            return False
+        self.pack_level += 1
+        return True
+
+    def record_success(self):
+        """
+        Learn from a request that fit & relax the pack level by one after PACK_RELAX_SUCCESSES roomy prompts in a row.
+        """
+        if self.context_budget is not None:
+            self.context_budget.record_success()
+        if self.pack_level == PACK_FULL:
+            return
+        if self.last_prompt_tokens > self.token_limit() * PACK_RELAX_HEADROOM:
+            self._relax_count = 0
+            return
+        self._relax_count += 1
+        if self._relax_count >= PACK_RELAX_SUCCESSES:
+            self.pack_level -= 1
+            self._relax_count = 0
+
+    def remember_tokens(self, text: str, tokens: int):
+        self._token_counts[text] = tokens
+        self._token_counts.move_to_end(text)
+        while len(self._token_counts) > TOKEN_MEMO_SIZE:
+            self._token_counts.popitem(last=False)
+
+    def _count(self, text: str) -> int:
+        tokens = self._token_counts.get(text)
+        if tokens is None:
+            tokens = self.token_counter(text)
+            self.remember_tokens(text, tokens)
+        return tokens
+
+    # endregion
+
     def format_messages(self, **kwargs: Any) -> List[BaseMessage]:
+        limit = self.token_limit()
         base_prompt = SystemMessage(content=self.construct_full_prompt())
         time_prompt = SystemMessage(
-            content=f"The current time and date is {time.strftime('%c')}"
+            content=f"{TIME_PROMPT_PREFIX} {time.strftime('%c')}"
         )
-        used_tokens = self.token_counter(base_prompt.content) + self.token_counter(
+
+        # Input message (with the workspace listing truncated if packing tightly)
+        user_input = kwargs["user_input"]
+        workspace = kwargs.get("workspace")
+        if self.pack_level >= PACK_SHORT_WORKSPACE and workspace:
+            user_input = user_input.replace(
+                workspace, _truncate(workspace, SHORT_WORKSPACE_CHARS))
+        input_message = HumanMessage(content=user_input)
+
+        used_tokens = self._count(base_prompt.content) + self.token_counter(
             time_prompt.content
-        )
+        ) + self.token_counter(input_message.content)
+        if self.protocol == PROTOCOL_FUNCTIONS:
+            # Approximation: the API renders definitions into the prompt in its own format
+            used_tokens += self._count(json.dumps(self.function_definitions))
 
         # Get relevant memory & format into message
         memory: VectorStoreRetriever = kwargs["memory"]
         previous_messages = kwargs["messages"]
-        relevant_docs = memory.get_relevant_documents(
-            str(previous_messages[-10:]))
-        relevant_memory = [d.page_content for d in relevant_docs]
-        relevant_memory_tokens = sum(
-            [self.token_counter(doc) for doc in relevant_memory]
-        )
-        while used_tokens + relevant_memory_tokens > 2500:
+        relevant_memory = []
+        if self.pack_level < PACK_NO_MEMORY:
+            relevant_docs = memory.get_relevant_documents(
+                str(previous_messages[-10:]))
+            relevant_memory = [d.page_content for d in relevant_docs]
+        relevant_memory_tokens = [self._count(doc) for doc in relevant_memory]
+        while relevant_memory and used_tokens + sum(relevant_memory_tokens) > limit * MEMORY_SHARE:
             relevant_memory = relevant_memory[:-1]
-            relevant_memory_tokens = sum(
-                [self.token_counter(doc) for doc in relevant_memory]
-            )
+            relevant_memory_tokens = relevant_memory_tokens[:-1]
         content_format = (
             f"This reminds you of these events "
             f"from your past:\n{relevant_memory}\n\n"
@@ -71,15 +186,21 @@ class CommandGPTPrompt(BaseChatPromptTemplate, BaseModel):
         used_tokens += self.token_counter(memory_message.content)
 
         # Append historical messages if there is space
+        recent_messages = previous_messages[-10:]
+        if self.pack_level >= PACK_SHORT_HISTORY:
+            recent_messages = previous_messages[-SHORT_HISTORY_MESSAGES:]
         historical_messages: List[BaseMessage] = []
-        for message in previous_messages[-10:][::-1]:
-            message_tokens = self.token_counter(message.content)
-            if used_tokens + message_tokens > self.send_token_limit - 1000:
+        for message in recent_messages[::-1]:
+            if self.pack_level >= PACK_SHORT_TOOL_OUTPUT:
+                message = message.copy(
+                    update={"content": _truncate(message.content, SHORT_MESSAGE_CHARS)})
+            message_tokens = self._count(message.content)
+            if used_tokens + message_tokens > limit - self.response_token_reserve:
                 break
             historical_messages = [message] + historical_messages
             used_tokens += message_tokens
 
-        input_message = HumanMessage(content=kwargs["user_input"])
+        self.last_prompt_tokens = used_tokens
         messages: List[BaseMessage] = [
             base_prompt, time_prompt, memory_message]
         messages += historical_messages
@@ -1,9 +1,9 @@
 # This file contains the PromptGenerator class, which is used to generate the prompt string for Command-GPT and contains static helper methods for generating sections, numbered lists, and commands from other classes.
 
-from typing import List
+from typing import Dict, List
 
 from langchain.tools.base import BaseTool
-from command_gpt.utils.command_parser import COMMAND_FORMAT
+from command_gpt.utils.command_parser import COMMAND_FORMAT, PROTOCOL_FUNCTIONS, PROTOCOL_TEXT
 
 
 class PromptGenerator:
@@ -15,6 +15,8 @@ class PromptGenerator:
     sections: List[str] = []
     tools: List[BaseTool] = []
     ruleset: str = ""
+    # With PROTOCOL_FUNCTIONS, commands are sent as function definitions instead of being listed in the prompt
+    protocol: str = PROTOCOL_TEXT
 
     # region STATIC GENERATOR METHODS
 
@@ -34,6 +36,37 @@ class PromptGenerator:
         output = output[:-2]
         return output
 
+    @staticmethod
+    def _generate_function_definition(tool: BaseTool) -> Dict:
+        """
+        Generates a function definition (name, description & JSON schema of the arguments) for the function-call protocol.
+        - Same arguments, types & descriptions as _generate_command_string
+        """
+        properties = {}
+        for arg_name, arg_details in tool.args.items():
+            properties[arg_name] = {
+                "type": arg_details.get('type', 'string'),  # default to string
+                "description": arg_details.get('description', ''),
+            }
+            if "items" in arg_details:
+                properties[arg_name]["items"] = arg_details["items"]
+        if tool.args_schema is not None:
+            required = tool.args_schema.schema().get("required", [])
+        else:
+            required = list(properties)
+        return {
+            "name": tool.name,
+            "description": tool.description,
+            "parameters": {"type": "object", "properties": properties, "required": required},
+        }
+
+    @staticmethod
+    def _generate_functions_from_tools(tools: List[BaseTool]) -> List[Dict]:
+        """
+        Generates list of function definitions for the function-call protocol.
+        """
+        return [PromptGenerator._generate_function_definition(tool) for tool in tools]
+
     @staticmethod
     def _generate_commands_from_tools(tools: List[BaseTool]) -> List[str]:
         """
@@ -86,11 +119,18 @@ class PromptGenerator:
             prompt_string += section
 
         prompt_string += "Response:\n"
-        prompt_string += "You can provide tags to be parsed by the system and used for some semblance of \"state\". Only one of each tag is allowed per response. Before providing any tags, verbally process your thoughts, including reasoning, overall progress, and your current plan. After this summary, provide content in tags, the most important tag being the <cmd></cmd> tag which gives you access to the command line. Additionally, provide a <context></context> tag to capture the essence of what you are doing in the larger picture.\n\n"
+        if self.protocol == PROTOCOL_FUNCTIONS:
+            prompt_string += "Before calling a function, verbally process your thoughts, including reasoning, overall progress, and your current plan. After this summary, provide a <context></context> tag to capture the essence of what you are doing in the larger picture. Then call exactly one of the provided functions.\n\n"
+        else:
+            prompt_string += "You can provide tags to be parsed by the system and used for some semblance of \"state\". Only one of each tag is allowed per response. Before providing any tags, verbally process your thoughts, including reasoning, overall progress, and your current plan. After this summary, provide a <context></context> tag to capture the essence of what you are doing in the larger picture. End your response with the most important tag, the <cmd></cmd> tag which gives you access to the command line; anything after </cmd> is discarded.\n\n"
 
         # Add ruleset (You are xxx-GPT...)
         prompt_string += f"{self.ruleset}\n\n"
 
+        # Commands are sent as function definitions (see _generate_functions_from_tools)
+        if self.protocol == PROTOCOL_FUNCTIONS:
+            return prompt_string
+
         # Build commands section from tools
         formatted_commands = self._generate_commands_from_tools(self.tools)
         commands_prompt_string = "Commands:\n"
@@ -109,9 +149,10 @@ class PromptGenerator:
     # endregion
 
 
-def get_prompt(ruleset: str, tools: List[BaseTool]) -> str:
+def get_prompt(ruleset: str, tools: List[BaseTool], protocol: str = PROTOCOL_TEXT) -> str:
     """
     Defines sections & tools for prompt & generates the full prompt string with the above code
+    - With PROTOCOL_FUNCTIONS, the cli-gpt command line instructions & command list are left out
     """
 
     # Initialize the PromptGenerator object
@@ -119,27 +160,37 @@ def get_prompt(ruleset: str, tools: List[BaseTool]) -> str:
 
     # Build sections
     sections = []
+    if protocol == PROTOCOL_FUNCTIONS:
+        identity = "You are a monitored autonomous AI agent who can only interface with the outside world through the functions provided to you."
+        directives = [
+            "Process information verbally, including reasoning, decision making, and planning in every response, written before the function call.",
+            "Call exactly one function in every response.",
+        ]
+        constraints = ["The only human input you receive is computer-generated."]
+    else:
+        identity = "You are a monitored autonomous AI agent who can only interface with the outside world through a custom command line interface known as cli-gpt."
+        directives = [
+            "Process information verbally, including reasoning, decision making, and planning in every response, written before the cli-gpt command line.",
+            f"Include a cli-gpt command line in every response, denoted with the custom formatting:\n {COMMAND_FORMAT} \n",
+        ]
+        constraints = [
+            "The only human input you receive is computer-generated.",
+            "The command line response format must be exactly correct."
+        ]
     sections.append(PromptGenerator._generate_unordered_list_section(
         "Identity",
-        [
-            "You are a monitored autonomous AI agent who can only interface with the outside world through a custom command line interface known as cli-gpt."
-        ]
+        [identity]
     ))
     sections.append(PromptGenerator._generate_numbered_list_section(
         "Prime Directives",
-        [
-            "Process information verbally, including reasoning, decision making, and planning in every response, written before the cli-gpt command line.",
-            f"Include a cli-gpt command line in every response, denoted with the custom formatting:\n {COMMAND_FORMAT} \n",
+        directives + [
             "Operate on your objectives. All necessary information is in your prompting and training data.",
             "Work towards your goals, regularly writing content to markdown (.md) files.",
         ]
     ))
     sections.append(PromptGenerator._generate_numbered_list_section(
         "Constraints",
-        [
-            "The only human input you receive is computer-generated.",
-            "The command line response format must be exactly correct."
-        ]
+        constraints
     ))
     sections.append(PromptGenerator._generate_numbered_list_section(
         "Resources",
@@ -163,6 +214,7 @@ def get_prompt(ruleset: str, tools: List[BaseTool]) -> str:
     prompt_generator.sections = sections
     prompt_generator.ruleset = ruleset
     prompt_generator.tools = tools
+    prompt_generator.protocol = protocol
 
     # Generate the prompt string
     prompt_string = prompt_generator.generate_prompt_string()
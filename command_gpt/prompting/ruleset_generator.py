@@ -1,9 +1,7 @@
 from __future__ import annotations
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
 
-from langchain.vectorstores import FAISS
-from langchain.docstore import InMemoryDocstore
-from langchain.embeddings import OpenAIEmbeddings
 from langchain.chains.llm import LLMChain
 from langchain.chat_models.base import BaseChatModel
 from langchain.schema import (
@@ -15,10 +13,36 @@ from langchain.schema import (
 )
 from langchain.vectorstores.base import VectorStoreRetriever
 
-import faiss
-
+from config import RULESET_CANDIDATES, RULESET_LIBRARY_REUSE_SIMILARITY
 from command_gpt.utils.console_logger import ConsoleLogger
+from command_gpt.utils.rate_limiter import PRIORITY_HIGH, request_priority
+from command_gpt.utils.vector_memory import close_retriever, create_vectorstore_retriever
+from command_gpt.prompting.ruleset_library import RulesetLibrary
 from command_gpt.prompting.ruleset_prompt import RulesetPrompt
+from command_gpt.prompting.ruleset_ranking import (
+    RULESET_VARIANTS,
+    RulesetCandidate,
+    rank_rulesets,
+    score_ruleset,
+)
+
+# Added to a variant's temperature each time the variant list wraps around
+VARIANT_TEMPERATURE_STEP = 0.1
+
+
+def _with_temperature(llm: Any, temperature: float) -> Any:
+    """
+    Copy llm (and the model inside any wrappers) with a different temperature & no callbacks, so concurrent candidates don't stream over each other.
+    - Models without a temperature field are returned as is
+    """
+    if hasattr(llm, "temperature"):
+        return llm.copy(update={"temperature": temperature, "callbacks": None})
+    if hasattr(llm, "llm"):
+        update = {"llm": _with_temperature(llm.llm, temperature), "callbacks": None}
+        if hasattr(llm, "backups"):
+            update["backups"] = [_with_temperature(backup, temperature) for backup in llm.backups]
+        return llm.copy(update=update)
+    return llm
 
 
 class RulesetGeneratorAgent:
@@ -39,6 +63,8 @@ class RulesetGeneratorAgent:
         self.full_message_history: List[BaseMessage] = []
         self.next_action_count = 0
         self.chain = chain
+        # Id of the ruleset in the library once run_with_library() has stored or reused one
+        self.library_entry_id: Optional[str] = None
 
     @classmethod
     def from_request_and_topic(
@@ -59,20 +85,13 @@ class RulesetGeneratorAgent:
             token_counter=llm.get_num_tokens,
         )
 
-        # Define your embedding model
-        embeddings_model = OpenAIEmbeddings()
-        # Initialize the vectorstore as empty
-        embedding_size = 1536
-        index = faiss.IndexFlatL2(embedding_size)
-        vectorstore = FAISS(embeddings_model.embed_query,
-                            index, InMemoryDocstore({}), {})
-
         chain = LLMChain(llm=llm, prompt=prompt)
         return cls(
             request=request,
             topic=topic,
             chain=chain,
-            memory=vectorstore.as_retriever()
+            # Empty vectorstore using the shared embeddings model
+            memory=create_vectorstore_retriever()
         )
 
     @classmethod
@@ -117,10 +136,19 @@ class RulesetGeneratorAgent:
             llm=llm
         )
 
-    def run(self) -> str:
+    def run(self, interactive: bool = True, candidates: int = RULESET_CANDIDATES) -> str:
         """
         Kicks off interaction loop with AI
+        :param interactive: If False, returns the first (or best ranked) ruleset without asking for feedback (e.g. batch runs)
+        :param candidates: Rulesets generated concurrently per round & ranked locally; 1 generates & streams one at a time
         """
+        if candidates > 1:
+            return self._run_candidates(interactive, candidates)
+
+        if not interactive:
+            self._generate(loop_count=1)
+            return self.generated_ruleset
+
         # Note about ruleset generator
         ConsoleLogger.log("\nNOTE: The ruleset generator is a work in progress. Providing feedback for refined rulesets is experimental; keep it concise for best results. Feedback is appreciated :)\n", color=ConsoleLogger.COLOR_MAGENTA)
         # Interaction Loop
@@ -129,13 +157,6 @@ class RulesetGeneratorAgent:
             # user_input = ConsoleLogger.input("You: ")
             loop_count += 1
 
-            messages = self.full_message_history
-            messages.append(
-                SystemMessage(
-                    content=f"Loop count: {loop_count}"
-                )
-            )
-
             # Get user input beyond initial prompt
             if (loop_count > 1):
                 user_input = ConsoleLogger.input(
@@ -145,43 +166,201 @@ class RulesetGeneratorAgent:
                 else:
                     self.user_feedback.append(user_input)
 
-            # Update prompt with user feedback if exists
-            if self.user_feedback:
-                # todo: use user feedback in a more fine tuned way
-                prompt = RulesetPrompt(
-                    ruleset_that_will=self.request,
-                    topic=self.topic,
-                    generated_ruleset=self.generated_ruleset,
-                    input_variables=["memory", "messages"],
-                    token_counter=self.chain.llm.get_num_tokens,
-                    user_feedback=user_input
-                )
-                self.chain.prompt = prompt
+            # A human is waiting on this one, so it goes ahead of queued agent requests
+            with request_priority(PRIORITY_HIGH):
+                self._generate(loop_count)
 
-            ConsoleLogger.log(
-                f"FULL PROMPT:\n\n{self.chain.prompt.construct_full_prompt()}\n",
-                color=ConsoleLogger.COLOR_INPUT
+    def close(self):
+        """
+        Release the generator's memory (e.g. its namespace on a memory server) once no more rulesets are needed.
+        """
+        if self.memory is not None:
+            close_retriever(self.memory)
+            self.memory = None
+
+    def _generate(self, loop_count: int):
+        """
+        Generate a ruleset (using the latest user feedback if any) & record it in message history & memory
+        """
+        messages = self.full_message_history
+        messages.append(
+            SystemMessage(
+                content=f"Loop count: {loop_count}"
             )
+        )
 
-            # Set response color for console logger
-            ConsoleLogger.set_response_stream_color()
-            # Send message to AI, get response
-            self.generated_ruleset = self.chain.run(
-                messages=messages,
-                memory=self.memory,
-                user_input="You're doing great. Without any other niceties, provide a ruleset with no additional text before or after. Your message should start with \"You are xxx-GPT...\"",
+        # Update prompt with user feedback if exists
+        if self.user_feedback:
+            # todo: use user feedback in a more fine tuned way
+            prompt = RulesetPrompt(
+                ruleset_that_will=self.request,
+                topic=self.topic,
+                generated_ruleset=self.generated_ruleset,
+                input_variables=["memory", "messages"],
+                token_counter=self.chain.llm.get_num_tokens,
+                user_feedback=self.user_feedback[-1]
             )
+            self.chain.prompt = prompt
+
+        ConsoleLogger.log_prompt(self.chain.prompt.construct_full_prompt())
 
-            # Update message history
-            self.full_message_history.append(HumanMessage(
-                content="Generate a new ruleset consistent with the original request and the user's feedback."
-            ))
+        # Set response color for console logger
+        ConsoleLogger.set_response_stream_color()
+        # Send message to AI, get response
+        self.generated_ruleset = self.chain.run(
+            messages=messages,
+            memory=self.memory,
+            user_input="You're doing great. Without any other niceties, provide a ruleset with no additional text before or after. Your message should start with \"You are xxx-GPT...\"",
+        )
+
+        # Update message history
+        self.full_message_history.append(HumanMessage(
+            content="Generate a new ruleset consistent with the original request and the user's feedback."
+        ))
+        self.full_message_history.append(
+            AIMessage(content=self.generated_ruleset))
+
+        self.memory.add_documents([Document(
+            page_content=self.generated_ruleset,
+            metadata={
+                "ruleset_count": f"{loop_count}"
+            }
+        )])
+
+    # region Library
+
+    def run_with_library(
+        self,
+        library: RulesetLibrary,
+        interactive: bool = True,
+        candidates: int = RULESET_CANDIDATES,
+    ) -> str:
+        """
+        Reuse a stored ruleset for this request & topic, or generate one (seeded by a similar stored ruleset) & store it.
+        - Rulesets at or above RULESET_LIBRARY_REUSE_SIMILARITY are reused as is (interactive runs can give feedback instead)
+        - Less similar matches above RULESET_LIBRARY_SEED_SIMILARITY become the ruleset the first round refines
+        - Sets library_entry_id so the caller can record how the run went (RulesetLibrary.record_outcome)
+        """
+        match = library.lookup(self.request, self.topic)
+        if match is not None:
+            entry = match.entry
+            label = "exact match" if match.exact else f"similarity {match.similarity:.2f}"
+            ConsoleLogger.log(
+                f"Found a stored ruleset for \"{entry['request']}: {entry['topic']}\" ({label}, {len(entry['outcomes'])} runs)", color=ConsoleLogger.COLOR_MAGENTA)
+
+            if match.similarity >= RULESET_LIBRARY_REUSE_SIMILARITY and library.success_rate(entry) > 0:
+                if not interactive:
+                    self.library_entry_id = entry["id"]
+                    return entry["ruleset"]
+                ConsoleLogger.log(entry["ruleset"],
+                                  color=ConsoleLogger.COLOR_REPSONSE)
+                user_input = ConsoleLogger.input(
+                    "Type (y) and hit enter to reuse this ruleset. Otherwise, provide feedback for a new one based on it: ").strip()
+                if user_input == "y":
+                    self.library_entry_id = entry["id"]
+                    return entry["ruleset"]
+                self.user_feedback.append(user_input)
+            else:
+                self.user_feedback.append(
+                    f"It should instruct CommandGPT to {self.request}: {self.topic}")
+            self.generated_ruleset = entry["ruleset"]
             self.full_message_history.append(
                 AIMessage(content=self.generated_ruleset))
 
-            self.memory.add_documents([Document(
-                page_content=self.generated_ruleset,
-                metadata={
-                    "ruleset_count": f"{loop_count}"
-                }
-            )])
+        ruleset = self.run(interactive=interactive, candidates=candidates)
+        self.library_entry_id = library.add(
+            self.request, self.topic, ruleset, feedback=self.user_feedback)
+        return ruleset
+
+    # endregion
+    # region Candidates
+
+    def generate_candidates(
+        self,
+        count: int = RULESET_CANDIDATES,
+        tool_names: Optional[List[str]] = None,
+        priority: Optional[int] = None,
+    ) -> List[RulesetCandidate]:
+        """
+        Generate count rulesets concurrently (one variant each, see RULESET_VARIANTS) & return them ranked best first.
+        - The best candidate becomes generated_ruleset, so feedback in the next round refines it
+        - Failed candidates are logged & dropped; raises if all of them fail
+        :param tool_names: Tools the ruleset should cover when scoring (defaults to DEFAULT_TOOL_NAMES)
+        :param priority: Scheduler priority for the requests (pool threads don't inherit the caller's)
+        """
+        agent_prefix = ConsoleLogger.get_agent_prefix()
+        feedback = self.user_feedback[-1] if self.user_feedback else ""
+
+        def generate(index: int) -> RulesetCandidate:
+            ConsoleLogger.set_agent_prefix(agent_prefix)
+            temperature, variant = RULESET_VARIANTS[index % len(RULESET_VARIANTS)]
+            temperature = min(1.0, temperature + VARIANT_TEMPERATURE_STEP *
+                              (index // len(RULESET_VARIANTS)))
+            prompt = RulesetPrompt(
+                ruleset_that_will=self.request,
+                topic=self.topic,
+                generated_ruleset=self.generated_ruleset,
+                user_feedback=feedback,
+                variant_instructions=variant,
+                input_variables=["memory", "messages"],
+                token_counter=self.chain.llm.get_num_tokens,
+            )
+            llm = _with_temperature(self.chain.llm, temperature)
+            # No history or memory: each candidate is a single fresh request (works for chat & completion models)
+            prompt_value = prompt.format_prompt(messages=[])
+            if priority is None:
+                result = llm.generate_prompt([prompt_value])
+            else:
+                with request_priority(priority):
+                    result = llm.generate_prompt([prompt_value])
+            ruleset = result.generations[0][0].text.strip()
+            details = score_ruleset(ruleset, tool_names)
+            ConsoleLogger.log(
+                f"Ruleset candidate {index + 1}/{count} (temperature {temperature:.1f}): score {details['score']:.2f}", color=ConsoleLogger.COLOR_MAGENTA)
+            return RulesetCandidate(ruleset, details["score"], details, temperature, variant)
+
+        def try_generate(index: int) -> Optional[RulesetCandidate]:
+            try:
+                return generate(index)
+            except Exception as e:
+                ConsoleLogger.log_error(
+                    f"Ruleset candidate {index + 1} failed: {e}")
+                return None
+
+        ConsoleLogger.log(
+            f"Generating {count} ruleset candidates...", color=ConsoleLogger.COLOR_MAGENTA)
+        with ThreadPoolExecutor(max_workers=count, thread_name_prefix="ruleset") as pool:
+            results = list(pool.map(try_generate, range(count)))
+        candidates = rank_rulesets([c for c in results if c is not None])
+        if not candidates:
+            raise RuntimeError("All ruleset candidates failed")
+
+        self.generated_ruleset = candidates[0].ruleset
+        self.full_message_history.append(
+            AIMessage(content=self.generated_ruleset))
+        return candidates
+
+    def _run_candidates(self, interactive: bool, count: int) -> str:
+        """
+        Candidate rounds: show the ranked candidates & let the user pick one, or give feedback for a new round built on the best
+        """
+        while True:
+            candidates = self.generate_candidates(
+                count, priority=PRIORITY_HIGH if interactive else None)
+            if not interactive:
+                return candidates[0].ruleset
+
+            for number, candidate in enumerate(candidates, start=1):
+                ConsoleLogger.log(
+                    f"\nCANDIDATE {number} (score {candidate.score:.2f}):\n", color=ConsoleLogger.COLOR_MAGENTA)
+                ConsoleLogger.log(candidate.ruleset,
+                                  color=ConsoleLogger.COLOR_REPSONSE)
+            user_input = ConsoleLogger.input(
+                f"\nType a candidate number (1-{len(candidates)}) or (y) for candidate 1 to accept it. Otherwise, provide feedback for new candidates: ").strip()
+            if user_input == "y":
+                return candidates[0].ruleset
+            if user_input.isdigit() and 1 <= int(user_input) <= len(candidates):
+                return candidates[int(user_input) - 1].ruleset
+            self.user_feedback.append(user_input)
+
+    # endregion
@@ -0,0 +1,222 @@
+# Persistent library of accepted rulesets with their request, topic, feedback & run outcomes, looked up exactly or by embedding similarity
+
+import hashlib
+import json
+from pathlib import Path
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from config import RULESET_LIBRARY_PATH, RULESET_LIBRARY_SEED_SIMILARITY
+from command_gpt.utils.console_logger import ConsoleLogger
+from command_gpt.utils.text_terms import split_terms
+
+# Outcome statuses counted as successful runs (see JOB_FINISHED in command_gpt/batch.py)
+SUCCESS_STATUSES = {"finished"}
+# Success rate assumed for rulesets that haven't been run yet
+UNKNOWN_SUCCESS_RATE = 0.5
+
+
+class LibraryMatch(NamedTuple):
+    entry: Dict
+    # 1.0 for an exact (normalized) request/topic match, otherwise cosine similarity of the embeddings
+    similarity: float
+    exact: bool = False
+
+
+class RulesetLibrary:
+    """
+    Stores rulesets in a JSONL log, one "ruleset" record per accepted ruleset & one "outcome" record per run of it.
+    - Exact lookup is by normalized request & topic; similarity lookup embeds "request: topic" & compares cosine similarity.
+    - Embeddings are stored with each ruleset, so lookups only embed the query.
+    - Among matches, rulesets whose runs finished more often are preferred.
+    """
+
+    def __init__(self, path: str = RULESET_LIBRARY_PATH, embeddings=None):
+        self.path = Path(path)
+        self._embeddings = embeddings
+        self.entries: Dict[str, Dict] = {}
+        self._embedding_cache: Dict[str, Optional[List[float]]] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    # region Lookup
+
+    def find_exact(self, request: str, topic: str) -> Optional[Dict]:
+        """
+        Return the best ruleset stored for this exact (normalized) request & topic, or None.
+        """
+        key = self.make_key(request, topic)
+        with self._lock:
+            matches = [entry for entry in self.entries.values()
+                       if entry["key"] == key]
+        if not matches:
+            return None
+        return max(matches, key=lambda entry: (self.success_rate(entry), entry["timestamp"]))
+
+    def find_similar(
+        self,
+        request: str,
+        topic: str,
+        min_similarity: float = RULESET_LIBRARY_SEED_SIMILARITY,
+        k: int = 3,
+    ) -> List[LibraryMatch]:
+        """
+        Return up to k rulesets whose request & topic embed within min_similarity of this one, most similar first.
+        - Returns [] if the embedding request fails (lookups then fall back to exact matches only).
+        """
+        query = self._embed(self.embedding_text(request, topic))
+        with self._lock:
+            entries = [entry for entry in self.entries.values()
+                       if entry.get("embedding")]
+        if query is None or not entries:
+            return []
+
+        matrix = np.array([entry["embedding"] for entry in entries], dtype=np.float32)
+        vector = np.array(query, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(vector)
+        similarities = matrix @ vector / np.maximum(norms, 1e-12)
+
+        matches = [LibraryMatch(entry, float(similarity))
+                   for entry, similarity in zip(entries, similarities) if similarity >= min_similarity]
+        matches.sort(key=lambda match: (-match.similarity, -self.success_rate(match.entry)))
+        return matches[:k]
+
+    def lookup(self, request: str, topic: str) -> Optional[LibraryMatch]:
+        """
+        Return the exact match if there is one, otherwise the most similar ruleset above RULESET_LIBRARY_SEED_SIMILARITY.
+        """
+        entry = self.find_exact(request, topic)
+        if entry is not None:
+            return LibraryMatch(entry, 1.0, exact=True)
+        similar = self.find_similar(request, topic, k=1)
+        return similar[0] if similar else None
+
+    # endregion
+    # region Recording
+
+    def add(self, request: str, topic: str, ruleset: str, feedback: Optional[List[str]] = None) -> str:
+        """
+        Store an accepted ruleset & return its id (adding the same ruleset for the same request & topic returns the existing id).
+        """
+        key = self.make_key(request, topic)
+        entry_id = hashlib.sha256(
+            f"{key}\n{ruleset.strip()}".encode("utf-8")).hexdigest()[:16]
+        with self._lock:
+            if entry_id in self.entries:
+                return entry_id
+
+        entry = {
+            "type": "ruleset",
+            "id": entry_id,
+            "key": key,
+            "request": request,
+            "topic": topic,
+            "ruleset": ruleset,
+            "feedback": [text for text in (feedback or []) if text],
+            "timestamp": time.time(),
+            "embedding": self._embed(self.embedding_text(request, topic)),
+        }
+        with self._lock:
+            self.entries[entry_id] = dict(entry, outcomes=[])
+            self._append(entry)
+        return entry_id
+
+    def record_outcome(self, entry_id: str, status: str, loops: int = 0, total_tokens: int = 0):
+        """
+        Record a run of a stored ruleset (status is a batch job status, e.g. "finished" or "max_loops").
+        """
+        outcome = {
+            "type": "outcome",
+            "id": entry_id,
+            "status": status,
+            "loops": loops,
+            "total_tokens": total_tokens,
+            "timestamp": time.time(),
+        }
+        with self._lock:
+            entry = self.entries.get(entry_id)
+            if entry is None:
+                return
+            entry["outcomes"].append(outcome)
+            self._append(outcome)
+
+    # endregion
+    # region Helpers
+
+    @staticmethod
+    def make_key(request: str, topic: str) -> str:
+        """
+        Casefold & collapse punctuation/whitespace so trivially different spellings match exactly.
+        - Non-ASCII letters & symbols like + and # are kept, so "C++", "C#" & "Ünïcode" topics don't collide
+        - Text made only of punctuation keeps its casefolded form rather than normalizing to an empty key
+        """
+        def normalize(text: str) -> str:
+            return " ".join(split_terms(text) or (text or "").casefold().split())
+        return f"{normalize(request)}|{normalize(topic)}"
+
+    @staticmethod
+    def embedding_text(request: str, topic: str) -> str:
+        return f"{request.strip()}: {(topic or '').strip()}"
+
+    @staticmethod
+    def success_rate(entry: Dict) -> float:
+        outcomes = entry.get("outcomes") or []
+        if not outcomes:
+            return UNKNOWN_SUCCESS_RATE
+        return sum(outcome["status"] in SUCCESS_STATUSES for outcome in outcomes) / len(outcomes)
+
+    def _embed(self, text: str) -> Optional[List[float]]:
+        """Embed text with the shared embeddings model (memoized; None if the request fails)."""
+        if text in self._embedding_cache:
+            return self._embedding_cache[text]
+        if self._embeddings is None:
+            from config import get_model
+            self._embeddings = get_model("default_embeddings")
+        try:
+            embedding = list(self._embeddings.embed_query(text))
+        except Exception as e:
+            ConsoleLogger.log_error(f"Ruleset library embedding failed: {e}")
+            return None
+        self._embedding_cache[text] = embedding
+        return embedding
+
+    def _append(self, record: Dict):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(record) + "\n")
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Skip lines truncated by an interrupted write
+                if record.get("type") == "ruleset":
+                    # Re-key with the current normalization so entries stored by older versions still match exactly
+                    key = self.make_key(record.get("request", ""), record.get("topic", ""))
+                    self.entries[record["id"]] = dict(record, key=key, outcomes=[])
+                elif record.get("type") == "outcome" and record.get("id") in self.entries:
+                    self.entries[record["id"]]["outcomes"].append(record)
+
+    # endregion
+
+
+_ruleset_library: Optional[RulesetLibrary] = None
+_ruleset_library_lock = threading.Lock()
+
+
+def get_ruleset_library() -> RulesetLibrary:
+    """
+    Return the process-wide RulesetLibrary, loading it on first use.
+    """
+    global _ruleset_library
+    with _ruleset_library_lock:
+        if _ruleset_library is None:
+            _ruleset_library = RulesetLibrary()
+        return _ruleset_library
@@ -1,6 +1,6 @@
 # Full prompt with base prompt, time, memory, and historical messages
 
-from typing import Any, Callable, List
+from typing import Any, Callable, List, Optional
 
 from pydantic import BaseModel
 
@@ -19,6 +19,8 @@ class RulesetPrompt(BaseChatPromptTemplate, BaseModel):
     topic: str = "the effects of climate change on the economy"
     generated_ruleset: str = None
     user_feedback: str = ""
+    # Extra guidance appended to the request (used to vary candidate rulesets)
+    variant_instructions: str = ""
     token_counter: Callable[[str], int]
     send_token_limit: int = 3000
 
@@ -27,27 +29,34 @@ class RulesetPrompt(BaseChatPromptTemplate, BaseModel):
 
         # If a ruleset hasn't been generated yet, just request one
         if self.generated_ruleset is None:
-            return ruleset_request
+            return self._with_variant(ruleset_request)
 
         # If a ruleset has been generated, request a new one that incorporates user feedback
         new_ruleset_request = f"User: Thank you for this! Please provide an additional ruleset with the following in mind:\n- {self.user_feedback}\n...starting your response with \"You are xxx-gpt\" and providing only the ruleset with no additional text or niceties:\n"
 
-        return new_ruleset_request
+        return self._with_variant(new_ruleset_request)
+
+    def _with_variant(self, request: str) -> str:
+        if self.variant_instructions:
+            return f"{request}\n\n{self.variant_instructions}"
+        return request
 
     def format_messages(self, **kwargs: Any) -> List[BaseMessage]:
         base_prompt = SystemMessage(content=self.construct_full_prompt())
         used_tokens = self.token_counter(base_prompt.content)
 
-        # Get relevant memory & format into message
-        memory: VectorStoreRetriever = kwargs["memory"]
+        # Get relevant memory & format into message (skipped when there's no history, saving an embedding call)
+        memory: Optional[VectorStoreRetriever] = kwargs.get("memory")
         previous_messages = kwargs["messages"]
-        relevant_docs = memory.get_relevant_documents(
-            str(previous_messages[-10:]))
-        relevant_memory = [d.page_content for d in relevant_docs]
+        relevant_memory = []
+        if memory is not None and previous_messages:
+            relevant_docs = memory.get_relevant_documents(
+                str(previous_messages[-10:]))
+            relevant_memory = [d.page_content for d in relevant_docs]
         relevant_memory_tokens = sum(
             [self.token_counter(doc) for doc in relevant_memory]
         )
-        while used_tokens + relevant_memory_tokens > 2500:
+        while relevant_memory and used_tokens + relevant_memory_tokens > 2500:
             relevant_memory = relevant_memory[:-1]
             relevant_memory_tokens = sum(
                 [self.token_counter(doc) for doc in relevant_memory]
@@ -0,0 +1,72 @@
+# Cheap local heuristics for ranking candidate rulesets (no LLM calls)
+
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+# (temperature, extra instructions) per candidate; candidates past the end reuse the list with higher temperatures
+RULESET_VARIANTS = [
+    (0.2, ""),
+    (0.6, "Break the work into numbered phases, and name the markdown file to write at the end of each phase."),
+    (0.9, "Emphasize writing findings to files early & often, and building higher order summaries from those files."),
+    (0.6, "Emphasize searching broadly first, then reading the most relevant sources in depth before writing."),
+]
+
+# Tools a ruleset is expected to steer the agent towards (matched by the first word of the tool name)
+DEFAULT_TOOL_NAMES = ["search", "fetch_url", "write_file", "read_file", "list_directory"]
+
+# Word counts outside this range are penalized
+IDEAL_WORDS = (120, 600)
+
+FILE_WRITING_PATTERN = re.compile(
+    r"\bwrit(?:e|es|ing|ten)\b|\.md\b|\bmarkdown\b|\bfiles?\b", re.IGNORECASE)
+OUTLINE_LINE_PATTERN = re.compile(r"^\s*(?:\d+[.)]|[-*•])\s+", re.MULTILINE)
+
+
+class RulesetCandidate(NamedTuple):
+    ruleset: str
+    score: float
+    details: Dict[str, float]
+    temperature: Optional[float] = None
+    variant: str = ""
+
+
+def score_ruleset(ruleset: str, tool_names: Optional[List[str]] = None) -> Dict[str, float]:
+    """
+    Score a ruleset on the things the generator prompt asks for. Each part is 0-1; "score" is their weighted sum.
+    - phrasing: starts with "You are ..."
+    - length: word count within IDEAL_WORDS
+    - file_writing: mentions of writing/markdown/files (saturates at 5)
+    - coverage: share of tool_names whose first word appears
+    - structure: outline lines (numbered or bulleted, saturates at 4)
+    """
+    text = ruleset.strip()
+    lowered = text.lower()
+    words = len(text.split())
+    low, high = IDEAL_WORDS
+    if words < low:
+        length = words / low
+    elif words > high:
+        length = max(0.0, 1 - (words - high) / high)
+    else:
+        length = 1.0
+
+    tool_words = {name.split("_")[0] for name in (tool_names or DEFAULT_TOOL_NAMES)}
+    coverage = sum(1 for word in tool_words if re.search(
+        rf"\b{re.escape(word)}", lowered)) / max(len(tool_words), 1)
+
+    details = {
+        "phrasing": 1.0 if lowered.startswith("you are") else 0.0,
+        "length": length,
+        "file_writing": min(len(FILE_WRITING_PATTERN.findall(text)) / 5, 1.0),
+        "coverage": coverage,
+        "structure": min(len(OUTLINE_LINE_PATTERN.findall(text)) / 4, 1.0),
+    }
+    weights = {"phrasing": 1.0, "length": 1.0,
+               "file_writing": 1.5, "coverage": 1.0, "structure": 0.5}
+    details["score"] = sum(details[key] * weight for key, weight in weights.items())
+    return details
+
+
+def rank_rulesets(candidates: List[RulesetCandidate]) -> List[RulesetCandidate]:
+    """Best first; ties keep generation order."""
+    return sorted(candidates, key=lambda candidate: -candidate.score)
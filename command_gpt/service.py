@@ -0,0 +1,570 @@
+# Local HTTP job service: queues CommandGPT runs persistently, runs them on a bounded worker pool & streams their events over SSE
+
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import itertools
+import json
+from pathlib import Path
+import threading
+import time
+from typing import Any, Deque, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+import uuid
+
+from config import (
+    BATCH_DEFAULT_REQUEST,
+    BATCH_MAX_LOOPS,
+    COMMAND_PROTOCOL,
+    RULESET_LIBRARY_ENABLED,
+    SERVICE_DIR,
+    SERVICE_EVENT_HISTORY,
+    SERVICE_EVENT_RETENTION_SECONDS,
+    SERVICE_HOST,
+    SERVICE_JOB_EVENT_HISTORY,
+    SERVICE_JOB_RETENTION,
+    SERVICE_MAX_QUEUED,
+    SERVICE_MAX_WORKERS,
+    SERVICE_PORT,
+    SERVICE_SSE_KEEPALIVE_SECONDS,
+    SERVICE_THROUGHPUT_WINDOW_SECONDS,
+    get_model,
+    model_registry,
+)
+from command_gpt.batch import JOB_ERROR, JOB_FINISHED, JOB_MAX_LOOPS, TOOLKITS, BatchJob, run_job, safe_job_name
+from command_gpt.tooling.tool_executor import ToolExecutor
+from command_gpt.utils.command_parser import PROTOCOLS
+from command_gpt.utils.console_logger import ConsoleLogger
+from command_gpt.utils.hedged_llm import LatencyHistogram
+from command_gpt.utils.workspace_writer import get_workspace_writer
+
+# Job statuses besides the batch ones (JOB_FINISHED, JOB_MAX_LOOPS, JOB_ERROR)
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_CANCELLED = "cancelled"
+TERMINAL_STATUSES = {JOB_FINISHED, JOB_MAX_LOOPS, JOB_ERROR, JOB_CANCELLED}
+
+# Histogram buckets for queue wait & run time (loops use the default, seconds-scale buckets)
+JOB_LATENCY_BOUNDS_SECONDS = [1, 5, 15, 60, 300, 900, 3600]
+
+
+class ServiceJob:
+    def __init__(self, job_id: str, spec: Dict[str, Any], submitted_at: float):
+        self.id = job_id
+        # Validated submission: name, ruleset or request & topic, toolkit, max_loops, model, protocol
+        self.spec = spec
+        self.status = JOB_QUEUED
+        self.submitted_at = submitted_at
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.loops = 0
+        self.result: Optional[Dict[str, Any]] = None
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=SERVICE_JOB_EVENT_HISTORY)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "spec": self.spec,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "loops": self.loops,
+            "result": self.result,
+        }
+
+
+class JobService:
+    """
+    Persistent queue of CommandGPT jobs run by max_workers worker threads, each job in SERVICE_DIR/jobs/<id>.
+    - Submissions & status changes are appended to SERVICE_DIR/jobs.jsonl; jobs still queued or running when the service
+      stopped are queued again on start. The log is compacted on start.
+    - Every change is published as an event (queued, started, loop, finished, cancelled) with an increasing id, kept in a
+      bounded history per job & overall, so SSE clients can resume with Last-Event-ID.
+    - Finished jobs' events are dropped after event_retention_seconds & only the newest job_retention finished jobs are
+      kept, so a long-running service doesn't grow without bound.
+    - Jobs share one ToolExecutor (per-tool concurrency limits apply across jobs) & the registered models' rate limits.
+    """
+
+    def __init__(
+        self,
+        service_dir: str = SERVICE_DIR,
+        max_workers: int = SERVICE_MAX_WORKERS,
+        use_library: bool = RULESET_LIBRARY_ENABLED,
+        max_queued: int = SERVICE_MAX_QUEUED,
+        job_retention: int = SERVICE_JOB_RETENTION,
+        event_retention_seconds: float = SERVICE_EVENT_RETENTION_SECONDS,
+    ):
+        self.service_dir = Path(service_dir)
+        self.log_path = self.service_dir / "jobs.jsonl"
+        self.max_workers = max(1, max_workers)
+        self.use_library = use_library
+        self.max_queued = max_queued
+        self.job_retention = max(0, job_retention)
+        self.event_retention_seconds = event_retention_seconds
+        self.jobs: Dict[str, ServiceJob] = {}
+        self._queue: Deque[str] = deque()
+        self._events: Deque[Dict[str, Any]] = deque(maxlen=SERVICE_EVENT_HISTORY)
+        self._event_ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._log_lock = threading.Lock()
+        self._workers: List[threading.Thread] = []
+        self._stopping = False
+        self.tool_executor: Optional[ToolExecutor] = None
+        self.library = None
+        # Stats
+        self.started_at = time.time()
+        self.queue_wait = LatencyHistogram(JOB_LATENCY_BOUNDS_SECONDS)
+        self.run_time = LatencyHistogram(JOB_LATENCY_BOUNDS_SECONDS)
+        self.loop_time = LatencyHistogram()
+        self._completions: Deque[float] = deque()
+        self._loop_completions: Deque[float] = deque()
+        self._load()
+
+    # region Lifecycle
+
+    def start(self) -> "JobService":
+        self.tool_executor = ToolExecutor()
+        if self.use_library:
+            from command_gpt.prompting.ruleset_library import get_ruleset_library
+            self.library = get_ruleset_library()
+        for index in range(self.max_workers):
+            worker = threading.Thread(
+                target=self._work, name=f"service-worker-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        return self
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Stop taking jobs off the queue & wait up to timeout for running jobs (unfinished ones run again on the next start).
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+        if self.tool_executor is not None:
+            self.tool_executor.shutdown()
+        get_workspace_writer().flush_all()
+
+    # endregion
+    # region Jobs
+
+    def submit(self, request: Dict[str, Any]) -> ServiceJob:
+        """
+        Validate & queue a job: {"ruleset": ...} or {"topic": ..., "request": ...}, plus optional "name",
+        "toolkit" (base, memory_only or a toolkit class name), "max_loops", "model" (registered in config.py) & "protocol"
+        (text or functions).
+        - Raises ValueError for invalid requests & OverflowError when the queue is full.
+        """
+        spec = self._validate(request)
+        with self._cond:
+            if len(self._queue) >= self.max_queued:
+                raise OverflowError(f"Queue is full ({self.max_queued} jobs)")
+            job = ServiceJob(uuid.uuid4().hex[:12], spec, time.time())
+            self.jobs[job.id] = job
+            self._queue.append(job.id)
+            self._append({"type": "job", "id": job.id, "spec": spec, "submitted_at": job.submitted_at})
+            self._publish(job, JOB_QUEUED, {"position": len(self._queue)})
+            self._cond.notify_all()
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued job. Returns False if it's already running or done."""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None or job.status != JOB_QUEUED:
+                return False
+            self._queue.remove(job_id)
+            job.finished_at = time.time()
+            self._set_status(job, JOB_CANCELLED)
+            self._publish(job, JOB_CANCELLED, {})
+            self._evict(job.finished_at)
+            return True
+
+    def get(self, job_id: str) -> Optional[ServiceJob]:
+        with self._cond:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._cond:
+            return [job.to_dict() for job in self.jobs.values() if status is None or job.status == status]
+
+    def events_since(self, last_event_id: int, job_id: Optional[str] = None,
+                     timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Return events after last_event_id (for job_id, or every job), waiting up to timeout for one if there are none yet.
+        - Doesn't wait once job_id is done or the service is stopping (returns [] once it's been forgotten).
+        """
+        with self._cond:
+            job = self.jobs.get(job_id) if job_id else None
+            if job_id and job is None:
+                return []
+            source = job.events if job else self._events
+
+            def ready() -> bool:
+                if self._stopping or (job is not None and job.status in TERMINAL_STATUSES):
+                    return True
+                return bool(source) and source[-1]["id"] > last_event_id
+
+            self._cond.wait_for(ready, timeout)
+            return [event for event in source if event["id"] > last_event_id]
+
+    # endregion
+    # region Stats
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._cond:
+            counts: Dict[str, int] = {}
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            window = min(SERVICE_THROUGHPUT_WINDOW_SECONDS, max(1.0, now - self.started_at))
+            completions = sum(1 for t in self._completions if t >= now - window)
+            loops = sum(1 for t in self._loop_completions if t >= now - window)
+            queue_depth = len(self._queue)
+        return {
+            "queue_depth": queue_depth,
+            "running": counts.get(JOB_RUNNING, 0),
+            "workers": self.max_workers,
+            "jobs": counts,
+            "throughput": {
+                "window_seconds": window,
+                "jobs_per_minute": completions * 60 / window,
+                "loops_per_minute": loops * 60 / window,
+            },
+            "latency": {
+                "queue_wait": self.queue_wait.summary(),
+                "run_time": self.run_time.summary(),
+                "loop": self.loop_time.summary(),
+            },
+        }
+
+    # endregion
+    # region Helpers
+
+    @staticmethod
+    def _validate(request: Dict[str, Any]) -> Dict[str, Any]:
+        if not isinstance(request, dict):
+            raise ValueError("Expected a JSON object")
+        ruleset = request.get("ruleset")
+        topic = request.get("topic")
+        if not ruleset and not topic:
+            raise ValueError("Job needs a 'ruleset' or a 'topic'")
+        toolkit = request.get("toolkit") or "base"
+        toolkit_names = {cls.__name__: name for name, cls in TOOLKITS.items()}
+        toolkit = toolkit_names.get(toolkit, toolkit)
+        if toolkit not in TOOLKITS:
+            raise ValueError(
+                f"Unknown toolkit '{toolkit}' (choose from {', '.join([*TOOLKITS, *toolkit_names])})")
+        model = request.get("model") or "default_chat_llm"
+        if model not in model_registry:
+            raise ValueError(f"Unknown model '{model}'")
+        try:
+            max_loops = int(request.get("max_loops") or BATCH_MAX_LOOPS)
+        except (TypeError, ValueError):
+            raise ValueError("'max_loops' must be an integer")
+        if max_loops < 1:
+            raise ValueError("'max_loops' must be at least 1")
+        protocol = request.get("protocol") or COMMAND_PROTOCOL
+        if protocol not in PROTOCOLS:
+            raise ValueError(f"Unknown protocol '{protocol}' (choose from {', '.join(PROTOCOLS)})")
+        return {
+            "name": safe_job_name(str(request.get("name") or topic or "job")),
+            "ruleset": ruleset,
+            "request": request.get("request") or BATCH_DEFAULT_REQUEST,
+            "topic": topic,
+            "toolkit": toolkit,
+            "max_loops": max_loops,
+            "model": model,
+            "protocol": protocol,
+        }
+
+    def _work(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._stopping)
+                if self._stopping:
+                    return
+                job = self.jobs[self._queue.popleft()]
+                job.started_at = time.time()
+                self._set_status(job, JOB_RUNNING)
+                self._publish(job, "started", {"queue_seconds": job.started_at - job.submitted_at})
+            self.queue_wait.record(job.started_at - job.submitted_at)
+            self._run(job)
+
+    def _run(self, job: ServiceJob):
+        spec = job.spec
+        try:
+            llm = get_model(spec["model"])
+        except Exception as e:
+            llm = None
+            error = f"Model '{spec['model']}' failed to load: {e}"
+        if llm is not None:
+            result = run_job(
+                BatchJob(name=spec["name"], ruleset=spec["ruleset"], request=spec["request"], topic=spec["topic"]),
+                self.service_dir / "jobs" / job.id,
+                llm,
+                self.tool_executor,
+                TOOLKITS[spec["toolkit"]],
+                spec["max_loops"],
+                self.library,
+                on_loop=lambda event: self._on_loop(job, event),
+                # Jobs persisted before protocols were selectable
+                protocol=spec.get("protocol", COMMAND_PROTOCOL),
+            )
+            status = result.status
+            result_dict = dict(result._asdict(), total_tokens=result.total_tokens)
+        else:
+            ConsoleLogger.log_error(f"Job {job.id} failed: {error}")
+            status = JOB_ERROR
+            result_dict = {"status": JOB_ERROR, "error": error}
+
+        finished_at = time.time()
+        self.run_time.record(finished_at - job.started_at)
+        with self._cond:
+            job.finished_at = finished_at
+            job.result = result_dict
+            self._completions.append(finished_at)
+            self._trim(self._completions, finished_at)
+            self._set_status(job, status, result_dict)
+            self._publish(job, "finished", result_dict)
+            self._evict(finished_at)
+
+    def _on_loop(self, job: ServiceJob, event):
+        now = time.time()
+        self.loop_time.record(event.seconds)
+        with self._cond:
+            job.loops = event.loop
+            self._loop_completions.append(now)
+            self._trim(self._loop_completions, now)
+            self._publish(job, "loop", event._asdict())
+
+    @staticmethod
+    def _trim(timestamps: Deque[float], now: float):
+        while timestamps and timestamps[0] < now - SERVICE_THROUGHPUT_WINDOW_SECONDS:
+            timestamps.popleft()
+
+    def _publish(self, job: ServiceJob, kind: str, data: Dict[str, Any]):
+        """Record an event for job & wake SSE clients (call with _cond held)."""
+        event = {"id": next(self._event_ids), "job": job.id, "event": kind, "ts": round(time.time(), 3), "data": data}
+        job.events.append(event)
+        self._events.append(event)
+        self._cond.notify_all()
+
+    def _evict(self, now: float):
+        """
+        Drop the events of jobs finished over event_retention_seconds ago & forget the oldest finished jobs past
+        job_retention (call with _cond held; forgotten jobs leave jobs.jsonl when it's next compacted).
+        """
+        done = sorted((job for job in self.jobs.values() if job.status in TERMINAL_STATUSES),
+                      key=lambda job: job.finished_at or job.submitted_at)
+        forget = len(done) - self.job_retention
+        for index, job in enumerate(done):
+            if index < forget:
+                del self.jobs[job.id]
+            elif job.events and (job.finished_at or job.submitted_at) < now - self.event_retention_seconds:
+                job.events.clear()
+
+    def _set_status(self, job: ServiceJob, status: str, result: Optional[Dict[str, Any]] = None):
+        job.status = status
+        record = {"type": "status", "id": job.id, "status": status, "timestamp": time.time()}
+        if result is not None:
+            record["result"] = result
+        self._append(record)
+
+    def _append(self, record: Dict[str, Any]):
+        with self._log_lock:
+            self.service_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(record) + "\n")
+
+    def _load(self):
+        """
+        Replay jobs.jsonl, re-queue interrupted jobs & compact the log to one job & one status record per kept job.
+        """
+        if not self.log_path.exists():
+            return
+        line_count = 0
+        with open(self.log_path, "r", encoding="utf-8") as file:
+            for line in file:
+                line_count += 1
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Skip lines truncated by an interrupted write
+                if record.get("type") == "job":
+                    self.jobs[record["id"]] = ServiceJob(record["id"], record["spec"], record["submitted_at"])
+                elif record.get("type") == "status" and record.get("id") in self.jobs:
+                    job = self.jobs[record["id"]]
+                    job.status = record["status"]
+                    if "result" in record:
+                        job.result = record["result"]
+                    if job.status in TERMINAL_STATUSES:
+                        job.finished_at = record["timestamp"]
+        for job in self.jobs.values():
+            if job.status not in TERMINAL_STATUSES:
+                # Interrupted while queued or running: run it (again) from the start
+                job.status = JOB_QUEUED
+                self._queue.append(job.id)
+        self._evict(time.time())
+        if line_count > 2 * len(self.jobs):
+            self._compact()
+
+    def _compact(self):
+        tmp_path = self.log_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            for job in self.jobs.values():
+                file.write(json.dumps({"type": "job", "id": job.id, "spec": job.spec, "submitted_at": job.submitted_at}) + "\n")
+                status = {"type": "status", "id": job.id, "status": job.status,
+                          "timestamp": job.finished_at or job.submitted_at}
+                if job.result is not None:
+                    status["result"] = job.result
+                file.write(json.dumps(status) + "\n")
+        tmp_path.replace(self.log_path)
+
+    # endregion
+
+
+# region HTTP
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API over a JobService (self.server.service):
+    - POST /jobs queues a job & returns it (202); GET /jobs[?status=] lists jobs; GET /jobs/<id> returns one
+    - DELETE /jobs/<id> cancels a queued job (409 once it's running or done)
+    - GET /jobs/<id>/events & GET /events stream events as SSE (resumable with Last-Event-ID); a job's stream ends after it does
+    - GET /stats returns queue depth, throughput & latency histograms
+    """
+    server_version = "CommandGPTService/1.0"
+
+    @property
+    def service(self) -> JobService:
+        return self.server.service
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        if parts == ["stats"]:
+            self._send_json(200, self.service.stats())
+        elif parts == ["jobs"]:
+            status = parse_qs(url.query).get("status")
+            self._send_json(200, {"jobs": self.service.list_jobs(status[0] if status else None)})
+        elif parts == ["events"]:
+            self._stream_events(None)
+        elif len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.service.get(parts[1])
+            if job is None:
+                self._send_json(404, {"error": f"No job '{parts[1]}'"})
+            elif len(parts) == 2:
+                self._send_json(200, job.to_dict())
+            elif parts[2] == "events":
+                self._stream_events(job.id)
+            else:
+                self._send_json(404, {"error": "Not found"})
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            self._send_json(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            job = self.service.submit(json.loads(self.rfile.read(length) or b"{}"))
+        except (ValueError, json.JSONDecodeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except OverflowError as e:
+            self._send_json(503, {"error": str(e)})
+            return
+        self._send_json(202, job.to_dict())
+
+    def do_DELETE(self):
+        parts = [part for part in self.path.split("/") if part]
+        if len(parts) != 2 or parts[0] != "jobs":
+            self._send_json(404, {"error": "Not found"})
+        elif self.service.get(parts[1]) is None:
+            self._send_json(404, {"error": f"No job '{parts[1]}'"})
+        elif self.service.cancel(parts[1]):
+            self._send_json(200, self.service.get(parts[1]).to_dict())
+        else:
+            self._send_json(409, {"error": "Only queued jobs can be cancelled"})
+
+    def log_message(self, format: str, *args):
+        pass  # Requests aren't logged; job output goes through ConsoleLogger
+
+    def _send_json(self, status: int, body: Dict[str, Any]):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream_events(self, job_id: Optional[str]):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            last_event_id = int(self.headers.get("Last-Event-ID") or 0)
+        except ValueError:
+            last_event_id = 0
+        try:
+            while True:
+                events = self.service.events_since(last_event_id, job_id, SERVICE_SSE_KEEPALIVE_SECONDS)
+                if not events:
+                    self.wfile.write(b": keepalive\n\n")
+                for event in events:
+                    self.wfile.write(
+                        f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n".encode("utf-8"))
+                    last_event_id = event["id"]
+                self.wfile.flush()
+                if self.service.stopping:
+                    return
+                job = self.service.get(job_id) if job_id is not None else None
+                if job_id is not None and (job is None or job.status in TERMINAL_STATUSES):
+                    # Anything published before the status changed was in this batch
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            return  # Client went away
+
+
+class ServiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, service: JobService, host: str = SERVICE_HOST, port: int = SERVICE_PORT):
+        self.service = service
+        super().__init__((host, port), ServiceRequestHandler)
+
+
+def serve(
+    host: str = SERVICE_HOST,
+    port: int = SERVICE_PORT,
+    service_dir: str = SERVICE_DIR,
+    max_workers: int = SERVICE_MAX_WORKERS,
+    use_library: bool = RULESET_LIBRARY_ENABLED,
+):
+    """
+    Run the job service until interrupted (Ctrl+C stops taking jobs; running jobs are re-queued on the next start).
+    """
+    service = JobService(service_dir, max_workers, use_library).start()
+    server = ServiceServer(service, host, port)
+    ConsoleLogger.log(
+        f"Job service listening on http://{host}:{server.server_address[1]} "
+        f"({max_workers} workers, {len(service._queue)} jobs queued)", color=ConsoleLogger.COLOR_MAGENTA)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop(timeout=0)
+
+# endregion
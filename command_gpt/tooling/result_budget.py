@@ -0,0 +1,140 @@
+# Keeps large tool results out of the prompt & memory: the full text goes to the workspace & a digest with a pointer stays in context
+
+import re
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from config import (
+    READ_FILE_MAX_PAGE_CHARS,
+    TOOL_RESULT_DIGEST_HEAD_CHARS,
+    TOOL_RESULT_DIGEST_TAIL_CHARS,
+    TOOL_RESULT_MAX_TOKENS,
+    TOOL_RESULT_SPILL_DIR,
+    TOOL_RESULTS_ON_DISK,
+)
+from command_gpt.utils.workspace_writer import get_workspace_writer
+
+# Workspace-relative file names mentioned in tool output (e.g. "written to file named: search_results/results_x.txt")
+FILE_REFERENCE_PATTERN = re.compile(r"[\w\-./]+\.(?:md|txt|json|csv|html)\b")
+# Lines read per page when pointing the agent at the rest of a file
+PAGE_LINES = 50
+# What wraps a read_file page in the result: CommandGPT's "Command read_file returned: " & the tool's paging footer
+RESULT_PREFIX_PATTERN = re.compile(r"^Command \w+ returned: ")
+PAGE_FOOTER_PATTERN = re.compile(r"\n\n\[Lines? \d+[^\n]*\]$")
+
+
+class BudgetedResult(NamedTuple):
+    # What goes into message history & memory (the result itself if it fit)
+    text: str
+    original_tokens: int
+    tokens: int
+    # Workspace-relative path holding the full result, if it was budgeted
+    full_output_path: Optional[str] = None
+
+
+class ResultBudget:
+    """
+    Replaces tool results over max_tokens with a digest (head, tail & size) plus a pointer to the full text in the workspace.
+    - read_file pages within READ_FILE_MAX_PAGE_CHARS (not counting the result prefix & paging footer) pass through, since
+      budgeting them would only point back at the same page; larger reads (e.g. previews) point back at the file
+    - Tools in TOOL_RESULTS_ON_DISK (search, fetch_url) already wrote their output; the digest points at those files
+    - Anything else is written to TOOL_RESULT_SPILL_DIR in the workspace (through the WorkspaceWriter)
+    """
+
+    def __init__(
+        self,
+        workspace_dir: str,
+        token_counter: Callable[[str], int],
+        max_tokens: int = TOOL_RESULT_MAX_TOKENS,
+        read_file_max_chars: int = READ_FILE_MAX_PAGE_CHARS,
+    ):
+        self.workspace_path = Path(workspace_dir)
+        self.token_counter = token_counter
+        self.max_tokens = max_tokens
+        self.read_file_max_chars = read_file_max_chars
+        self.stats: Dict[str, int] = {
+            "results": 0,
+            "budgeted": 0,
+            "spilled": 0,
+            "tokens_saved": 0,
+        }
+
+    def apply(self, loop: int, command_name: str, args: Dict, result: str, tokens: Optional[int] = None) -> BudgetedResult:
+        """
+        Budget result, counting its tokens unless they're already known (e.g. recorded by the ToolResultCache).
+        """
+        self.stats["results"] += 1
+        if tokens is None:
+            tokens = self.token_counter(result)
+        if tokens <= self.max_tokens or self.max_tokens <= 0:
+            return BudgetedResult(result, tokens, tokens)
+        if command_name == "read_file" and self._page_chars(result) <= self.read_file_max_chars:
+            return BudgetedResult(result, tokens, tokens)
+
+        if command_name == "read_file" and args.get("file_path"):
+            path = str(args["file_path"])
+            head = self._head(result)
+            # Always move forward, even when the head is a single unbroken line
+            next_offset = int(args.get("offset") or 0) + max(head.count("\n"), 1)
+            if f"File {path} is large (" in result:
+                # A preview (head, tail & outline) rather than consecutive lines
+                next_offset = "<line>"
+            pointer = f"The rest is still in {path}: continue with read_file --file_path {path} --offset {next_offset} --limit {PAGE_LINES}"
+            digest = self._digest(result, tokens, pointer, tail=False)
+        else:
+            existing = self._existing_files(result) if command_name in TOOL_RESULTS_ON_DISK else []
+            if existing:
+                path = existing[0]
+                files = ", ".join(existing)
+                pointer = f"Full results are in {files}: page through them with read_file --file_path <file> --offset <line> --limit {PAGE_LINES}"
+            else:
+                path = self._spill(loop, command_name, result)
+                self.stats["spilled"] += 1
+                pointer = f"Full output saved to {path}: page through it with read_file --file_path {path} --offset <line> --limit {PAGE_LINES}"
+            digest = self._digest(result, tokens, pointer)
+
+        digest_tokens = self.token_counter(digest)
+        self.stats["budgeted"] += 1
+        self.stats["tokens_saved"] += max(0, tokens - digest_tokens)
+        return BudgetedResult(digest, tokens, digest_tokens, path)
+
+    # region Helpers
+
+    @staticmethod
+    def _page_chars(result: str) -> int:
+        """Length of a read_file result without the prefix & paging footer around the page."""
+        prefix = RESULT_PREFIX_PATTERN.match(result)
+        footer = PAGE_FOOTER_PATTERN.search(result)
+        return len(result) - (prefix.end() if prefix else 0) - (len(footer.group()) if footer else 0)
+
+    @staticmethod
+    def _head(text: str) -> str:
+        head = text[:TOOL_RESULT_DIGEST_HEAD_CHARS]
+        # End on a line break so the continuation offset is exact
+        cut = head.rfind("\n")
+        return head[:cut + 1] if cut > 0 else head
+
+    def _digest(self, text: str, tokens: int, pointer: str, tail: bool = True) -> str:
+        head = self._head(text)
+        parts = [head.rstrip()]
+        if tail and len(text) > len(head) + TOOL_RESULT_DIGEST_TAIL_CHARS:
+            parts.append("...")
+            parts.append(text[-TOOL_RESULT_DIGEST_TAIL_CHARS:].lstrip())
+        parts.append(
+            f"[Output shortened from {tokens} tokens, {text.count(chr(10)) + 1} lines. {pointer}]")
+        return "\n".join(parts)
+
+    def _existing_files(self, text: str) -> List[str]:
+        files = []
+        for name in FILE_REFERENCE_PATTERN.findall(text):
+            if name not in files and (self.workspace_path / name).is_file():
+                files.append(name)
+        return files
+
+    def _spill(self, loop: int, command_name: str, text: str) -> str:
+        name = re.sub(r"[^A-Za-z0-9_-]", "_", command_name)
+        relative_path = f"{TOOL_RESULT_SPILL_DIR}/loop_{loop}_{name}.txt"
+        get_workspace_writer().write(self.workspace_path / relative_path, text)
+        return relative_path
+
+    # endregion
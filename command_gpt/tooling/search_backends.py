@@ -0,0 +1,81 @@
+# Search backends used by SearchAndWriteTool, built on a pooled HTTP client so queries can run concurrently
+
+from abc import ABC, abstractmethod
+import threading
+from typing import Dict, List, Optional
+
+from config import SEARCH_MAX_CONCURRENCY
+from command_gpt.utils.http_session import create_pooled_session
+
+GOOGLE_CSE_ENDPOINT = "https://www.googleapis.com/customsearch/v1"
+
+
+class SearchBackend(ABC):
+    """
+    Interface for search backends. Matches GoogleSearchAPIWrapper.results() so either can be passed to SearchAndWriteTool.
+    - max_concurrency limits how many queries can be in flight against this backend at once.
+    """
+
+    max_concurrency: int = 1
+
+    @abstractmethod
+    def results(self, query: str, num_results: int) -> List[Dict]:
+        """Return a list of dicts with title, link & snippet keys"""
+
+
+class HTTPSearchBackend(SearchBackend):
+    """
+    Search backend for any endpoint that answers GET ?q=&num= with Google Custom Search style JSON ({"items": [...]}).
+    - Point it at a local stand-in server to run searches offline for tests and benchmarks.
+    - Requests share one pooled session & retry with backoff on rate limits and server errors.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        params: Optional[Dict[str, str]] = None,
+        max_concurrency: int = SEARCH_MAX_CONCURRENCY,
+        retries: int = 3,
+        timeout: float = 15,
+    ):
+        self.endpoint = endpoint
+        self.params = params or {}
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.session = create_pooled_session(max_concurrency, retries)
+
+    def results(self, query: str, num_results: int) -> List[Dict]:
+        with self._semaphore:
+            response = self.session.get(
+                self.endpoint,
+                params={**self.params, "q": query, "num": num_results},
+                timeout=self.timeout,
+            )
+        response.raise_for_status()
+        items = response.json().get("items", [])
+
+        # Same shape as GoogleSearchAPIWrapper.results()
+        if len(items) == 0:
+            return [{"Result": "No good Google Search Result was found"}]
+        return [
+            {
+                "title": item.get("title", ""),
+                "link": item.get("link", ""),
+                "snippet": item.get("snippet", ""),
+            }
+            for item in items[:num_results]
+        ]
+
+
+class GoogleSearchBackend(HTTPSearchBackend):
+    """
+    Google Custom Search JSON API over the pooled HTTP client (googleapiclient's transport isn't safe to share across threads).
+    """
+
+    def __init__(self, google_api_key: str, google_cse_id: str, **kwargs):
+        super().__init__(
+            GOOGLE_CSE_ENDPOINT,
+            params={"key": google_api_key, "cx": google_cse_id},
+            **kwargs,
+        )
@@ -0,0 +1,142 @@
+# Persistent on-disk cache for search results, keyed by normalized query, with a URL-level dedupe index across queries
+
+import json
+from pathlib import Path
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config import SEARCH_CACHE_DIR, SEARCH_CACHE_TTL_SECONDS
+from command_gpt.utils.file_lock import file_lock
+from command_gpt.utils.text_terms import split_terms
+
+# Filler words dropped when normalizing queries so trivial rephrasings share a cache entry
+QUERY_STOPWORDS = {"a", "an", "and", "the", "of", "on", "in", "for", "to", "about", "with"}
+
+
+class SearchCache:
+    """
+    Caches structured search results (title/link/snippet) in a JSONL file keyed by normalized query.
+    - Entries older than ttl_seconds are treated as misses (ttl_seconds <= 0 disables expiry).
+    - Keeps an index of every link seen across queries so repeated links can be flagged.
+    - Queries that normalize to nothing (e.g. only punctuation or filler words) bypass the cache.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = SEARCH_CACHE_DIR,
+        ttl_seconds: int = SEARCH_CACHE_TTL_SECONDS,
+    ):
+        self.cache_path = Path(cache_dir) / "results.jsonl"
+        self.ttl_seconds = ttl_seconds
+        self.entries: Dict[str, Dict] = {}
+        # Maps link -> query it was first seen under
+        self.url_index: Dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    # region Cache Access
+
+    def get(self, query: str) -> Optional[List[Dict]]:
+        """
+        Return cached results for the query, or None if missing or expired.
+        """
+        key = self.normalize_query(query)
+        if not key:
+            return None
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or self._is_expired(entry):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry["results"]
+
+    def put(self, query: str, results: List[Dict]):
+        """
+        Store results for the query & append them to the JSONL log.
+        """
+        key = self.normalize_query(query)
+        if not key:
+            return
+        entry = {
+            "key": key,
+            "query": query,
+            "timestamp": time.time(),
+            "results": results,
+        }
+        with self._lock:
+            self.entries[entry["key"]] = entry
+            self._index_urls(entry)
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with file_lock(self.cache_path), open(self.cache_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(entry) + "\n")
+
+    def seen_under(self, link: str, query: str) -> Optional[str]:
+        """
+        Return the query a link was first seen under if it differs from this query, otherwise None.
+        """
+        with self._lock:
+            first_query = self.url_index.get(link)
+        if first_query is None or self.normalize_query(first_query) == self.normalize_query(query):
+            return None
+        return first_query
+
+    # endregion
+    # region Helpers
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """
+        Casefold, strip punctuation & filler words, then dedupe the remaining terms (keeping their order, which can matter to
+        the search engine).
+        """
+        return " ".join(dict.fromkeys(term for term in split_terms(query) if term not in QUERY_STOPWORDS))
+
+    def _is_expired(self, entry: Dict) -> bool:
+        return self.ttl_seconds > 0 and time.time() - entry["timestamp"] > self.ttl_seconds
+
+    def _index_urls(self, entry: Dict):
+        for result in entry["results"]:
+            link = result.get("link")
+            if link:
+                self.url_index.setdefault(link, entry["query"])
+
+    def _load(self):
+        """
+        Load the JSONL log, keeping the newest live entry per key & compacting the file if anything was dropped.
+        - Entries are re-keyed with the current normalize_query, so logs written by older versions stay usable.
+        - Loading & compacting hold the file lock that appends take, so lines other jobs append meanwhile aren't lost.
+        """
+        if not self.cache_path.exists():
+            return
+        with file_lock(self.cache_path):
+            line_count = 0
+            rekeyed = False
+            with open(self.cache_path, "r", encoding="utf-8") as file:
+                for line in file:
+                    line_count += 1
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Skip lines truncated by an interrupted write
+                    key = self.normalize_query(entry.get("query", ""))
+                    if key and not self._is_expired(entry):
+                        rekeyed = rekeyed or entry.get("key") != key
+                        self.entries[key] = dict(entry, key=key)
+            if line_count > len(self.entries) or rekeyed:
+                self._compact()
+        for entry in sorted(self.entries.values(), key=lambda e: e["timestamp"]):
+            self._index_urls(entry)
+
+    def _compact(self):
+        """Rewrite the log with one line per live entry (callers hold the file lock)."""
+        tmp_path = self.cache_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            for entry in self.entries.values():
+                file.write(json.dumps(entry) + "\n")
+        tmp_path.replace(self.cache_path)
+
+    # endregion
@@ -0,0 +1,299 @@
+# Runs tools off the main loop thread with per-tool timeouts, concurrency limits & optional process isolation
+
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import multiprocessing
+from pathlib import Path
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from pydantic import ValidationError
+
+from langchain.tools.base import BaseTool
+
+from config import (
+    TOOL_CONCURRENCY_LIMITS,
+    TOOL_DEFAULT_TIMEOUT_SECONDS,
+    TOOL_MAX_WORKERS,
+    TOOL_PROCESS_ISOLATED,
+    TOOL_PROCESS_MEMORY_LIMIT_MB,
+    TOOL_RESULT_CACHE_ENABLED,
+    TOOL_TIMEOUTS,
+)
+from command_gpt.tooling.tool_result_cache import ToolResultCache
+from command_gpt.utils.console_logger import ConsoleLogger
+from command_gpt.utils.workspace_writer import get_workspace_writer, reset_workspace_writer
+
+try:
+    import resource  # Unix only, used for memory limits on process-isolated tools
+except ImportError:
+    resource = None
+
+# Tool result statuses
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+STATUS_VALIDATION_ERROR = "validation_error"
+STATUS_TIMEOUT = "timeout"
+
+
+class ToolResult(NamedTuple):
+    tool_name: str
+    status: str
+    output: str
+    duration_seconds: float
+    # Served from the ToolResultCache (tokens is the recorded token count of the result, if any)
+    cached: bool = False
+    tokens: Optional[int] = None
+
+
+class _PendingCall:
+    """
+    Handshake between execute() & the pool thread running a call: the call either starts or is abandoned before it
+    starts, and its concurrency slot is released exactly once (by whichever side gives it up first).
+    """
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.abandoned = False
+        self._released = False
+        self._lock = threading.Lock()
+
+    def start(self) -> bool:
+        with self._lock:
+            if self.abandoned:
+                return False
+            self.started.set()
+            return True
+
+    def abandon(self) -> bool:
+        """Give up on a call that hasn't started. Returns False if it already has."""
+        with self._lock:
+            if self.started.is_set():
+                return False
+            self.abandoned = True
+            return True
+
+    def release(self, semaphore: Optional[threading.BoundedSemaphore]):
+        with self._lock:
+            if semaphore is None or self._released:
+                return
+            self._released = True
+        semaphore.release()
+
+
+def _run_tool_in_child(tool: BaseTool, args: Dict, memory_limit_mb: Optional[int], connection):
+    """
+    Child process entry point for process-isolated tools. Sends (status, output, paths written) back over the pipe.
+    - Writes go through a fresh WorkspaceWriter (the one copied by fork holds the parent's pending appends & listeners)
+      & are committed before the result is sent; the parent notifies its own listeners of the paths.
+    """
+    writer = reset_workspace_writer()
+    written: Dict[str, None] = {}
+    writer.subscribe(lambda path: written.setdefault(str(path)))
+    if memory_limit_mb and resource is not None:
+        limit_bytes = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, limit_bytes))
+    try:
+        status, output = STATUS_OK, str(tool.run(args))
+    except ValidationError as e:
+        status, output = STATUS_VALIDATION_ERROR, f"Validation Error in args: {str(e)}, args: {args}"
+    except MemoryError:
+        status, output = STATUS_ERROR, f"Error: memory limit of {memory_limit_mb}MB exceeded, args: {args}"
+    except Exception as e:
+        status, output = STATUS_ERROR, f"Error: {str(e)}, {type(e).__name__}, args: {args}"
+    try:
+        # Buffered appends would otherwise be lost (there's no flusher thread after fork, & no exit hook on kill)
+        writer.flush_all()
+    except Exception as e:
+        status, output = STATUS_ERROR, f"Error: {str(e)}, {type(e).__name__}, args: {args}"
+    try:
+        connection.send((status, output, list(written)))
+    finally:
+        connection.close()
+
+
+class ToolExecutor:
+    """
+    Executes tools in a worker pool so a hung or slow tool can't stall the agent loop.
+    - Every call is bounded by a per-tool timeout (timeouts[name] or default_timeout, None for no limit), counted from when
+      it starts running; waiting for a worker & the tool's concurrency limit is bounded by the same timeout again.
+    - concurrency_limits[name] caps how many calls of a tool run at once (shared across agents using this executor).
+    - Tools named in process_isolated run in a child process that is killed on timeout and can have a memory limit. Their
+      workspace writes are committed in the child & reported to this process's WorkspaceWriter listeners (a child killed
+      on timeout reports nothing, so writing tools are best left thread-run).
+    - Thread-run tools can't be killed; on timeout the loop moves on & the call finishes (or hangs) in the background. It
+      gives up its concurrency slot & new calls go to a fresh pool, so hung calls don't starve later ones of workers.
+    - Read-only tools are served from result_cache while the paths they read are unchanged (see tool_result_cache.py).
+    """
+
+    def __init__(
+        self,
+        default_timeout: Optional[float] = TOOL_DEFAULT_TIMEOUT_SECONDS,
+        timeouts: Optional[Dict[str, Optional[float]]] = None,
+        concurrency_limits: Optional[Dict[str, int]] = None,
+        process_isolated: Optional[Iterable[str]] = None,
+        memory_limit_mb: Optional[int] = TOOL_PROCESS_MEMORY_LIMIT_MB,
+        max_workers: int = TOOL_MAX_WORKERS,
+        result_cache: Optional[ToolResultCache] = None,
+    ):
+        self.default_timeout = default_timeout
+        self.result_cache = result_cache
+        if result_cache is None and TOOL_RESULT_CACHE_ENABLED:
+            self.result_cache = ToolResultCache()
+        self.timeouts = dict(TOOL_TIMEOUTS if timeouts is None else timeouts)
+        self.process_isolated = set(
+            TOOL_PROCESS_ISOLATED if process_isolated is None else process_isolated)
+        self.memory_limit_mb = memory_limit_mb
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="tool")
+        # Pools replaced after a thread-run call timed out (still finishing their calls)
+        self.replaced_pools = 0
+        self._semaphores = {
+            name: threading.BoundedSemaphore(limit)
+            for name, limit in (TOOL_CONCURRENCY_LIMITS if concurrency_limits is None else concurrency_limits).items()
+        }
+        self._pending: List[Future] = []
+        self._processes: List[multiprocessing.Process] = []
+        self._lock = threading.Lock()
+        # Fork keeps tools un-pickled & startup cheap where it's available
+        methods = multiprocessing.get_all_start_methods()
+        self._mp_context = multiprocessing.get_context(
+            "fork" if "fork" in methods else "spawn")
+
+    def get_timeout(self, tool_name: str) -> Optional[float]:
+        return self.timeouts.get(tool_name, self.default_timeout)
+
+    def execute(self, tool: BaseTool, args: Dict) -> ToolResult:
+        """
+        Run the tool with args & wait for it up to its timeout. Never raises for tool failures.
+        """
+        timeout = self.get_timeout(tool.name)
+        start = time.monotonic()
+        snapshot = None
+        if self.result_cache is not None:
+            cached = self.result_cache.get(tool, args)
+            if cached is not None:
+                return ToolResult(tool.name, STATUS_OK, cached.output, time.monotonic() - start,
+                                  cached=True, tokens=cached.tokens)
+            snapshot = self.result_cache.snapshot(tool, args)
+        call = _PendingCall()
+        with self._lock:
+            # Pool threads log under the caller's agent prefix
+            future = self._pool.submit(
+                self._run, tool, args, timeout, call, ConsoleLogger.get_agent_prefix())
+            self._pending = [f for f in self._pending if not f.done()] + [future]
+
+        if not call.started.wait(timeout) and call.abandon():
+            future.cancel()
+            status = STATUS_TIMEOUT
+            output = f"Timed out after {timeout}s waiting for {tool.name} to start (too many calls running), args: {args}"
+        else:
+            try:
+                status, output = future.result(timeout=timeout)
+            except FutureTimeoutError:
+                status = STATUS_TIMEOUT
+                output = f"Timed out after {timeout}s, args: {args}"
+                if tool.name not in self.process_isolated:
+                    call.release(self._semaphores.get(tool.name))
+                    self._replace_pool()
+        if snapshot is not None and status == STATUS_OK:
+            self.result_cache.put(snapshot, output)
+        return ToolResult(tool.name, status, output, time.monotonic() - start)
+
+    def cancel_all(self):
+        """
+        Cancel queued calls & kill running process-isolated calls.
+        """
+        with self._lock:
+            for future in self._pending:
+                future.cancel()
+            self._pending = []
+            for process in self._processes:
+                if process.is_alive():
+                    process.kill()
+
+    def shutdown(self):
+        self.cancel_all()
+        with self._lock:
+            pool = self._pool
+        pool.shutdown(wait=False, cancel_futures=True)
+        if self.result_cache is not None:
+            self.result_cache.close()
+
+    # region Helpers
+
+    def _run(self, tool: BaseTool, args: Dict, timeout: Optional[float], call: _PendingCall,
+             agent: Optional[str] = None):
+        semaphore = self._semaphores.get(tool.name)
+        # Waits no longer than execute() waits for the call to start
+        if semaphore is not None and not semaphore.acquire(timeout=timeout):
+            call.abandon()
+            return STATUS_TIMEOUT, f"Timed out after {timeout}s waiting for {tool.name} to start, args: {args}"
+        if not call.start():
+            # execute() gave up while this call was queued
+            if semaphore is not None:
+                semaphore.release()
+            return STATUS_TIMEOUT, f"Timed out before starting, args: {args}"
+        ConsoleLogger.set_agent_prefix(agent)
+        try:
+            if tool.name in self.process_isolated:
+                return self._run_in_process(tool, args, timeout)
+            return self._run_in_thread(tool, args)
+        finally:
+            call.release(semaphore)
+            ConsoleLogger.set_agent_prefix(None)
+
+    def _replace_pool(self):
+        """
+        A timed-out thread-run call keeps its worker: send new calls to a fresh pool. The old one finishes the calls it
+        already has (its idle workers exit), so hung calls no longer shrink the pool.
+        """
+        with self._lock:
+            old_pool = self._pool
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="tool")
+            self.replaced_pools += 1
+        old_pool.shutdown(wait=False)
+
+    @staticmethod
+    def _run_in_thread(tool: BaseTool, args: Dict):
+        try:
+            return STATUS_OK, str(tool.run(args))
+        except ValidationError as e:
+            return STATUS_VALIDATION_ERROR, f"Validation Error in args: {str(e)}, args: {args}"
+        except Exception as e:
+            return STATUS_ERROR, f"Error: {str(e)}, {type(e).__name__}, args: {args}"
+
+    def _run_in_process(self, tool: BaseTool, args: Dict, timeout: Optional[float]):
+        writer = get_workspace_writer()
+        # The child reads files as committed on disk
+        writer.flush_all()
+        receiver, sender = self._mp_context.Pipe(duplex=False)
+        process = self._mp_context.Process(
+            target=_run_tool_in_child,
+            args=(tool, args, self.memory_limit_mb, sender),
+            daemon=True,
+        )
+        with self._lock:
+            self._processes = [p for p in self._processes if p.is_alive()] + [process]
+        process.start()
+        sender.close()
+        try:
+            if receiver.poll(timeout):
+                status, output, written = receiver.recv()
+                # Listeners here (workspace index, repetition detector, result cache) didn't see the child's commits
+                for path in written:
+                    writer.notify(Path(path))
+                return status, output
+            return STATUS_TIMEOUT, f"Timed out after {timeout}s, args: {args}"
+        except EOFError:
+            # Child died without reporting (e.g. killed by the memory limit or cancel_all)
+            return STATUS_ERROR, f"Error: tool process exited with code {process.exitcode}, args: {args}"
+        finally:
+            receiver.close()
+            if process.is_alive():
+                process.kill()
+            process.join()
+
+    # endregion
@@ -0,0 +1,194 @@
+# In-memory cache of read-only tool results, dropped precisely when the workspace paths they read are written
+
+from collections import OrderedDict
+import json
+import os
+from pathlib import Path
+import threading
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from langchain.tools.base import BaseTool
+
+from config import TOOL_RESULT_CACHE_MAX_BYTES, TOOL_RESULT_CACHE_TOOLS
+from command_gpt.utils.workspace_writer import get_workspace_writer
+
+# (tool name, root dir, normalized args)
+CacheKey = Tuple[str, str, str]
+# (mtime_ns, size) per dependency, None if the path doesn't exist
+PathVersions = Tuple[Optional[Tuple[int, int]], ...]
+
+
+class CachedToolResult(NamedTuple):
+    output: str
+    # Token count of the formatted result (before budgeting), once a caller has recorded it
+    tokens: Optional[int] = None
+
+
+class _Entry:
+    def __init__(self, output: str, paths: List[str], versions: PathVersions):
+        self.output = output
+        self.paths = paths
+        self.versions = versions
+        self.tokens: Optional[int] = None
+
+
+class ToolResultCache:
+    """
+    LRU cache of read-only tool results (TOOL_RESULT_CACHE_TOOLS), keyed by tool name, root dir & args.
+    - Each entry depends on the paths its tool reads (the file for read_file, the directory for list_directory). A
+      WorkspaceWriter commit to a path drops the entries for that path & every directory above it.
+    - The (mtime_ns, size) of each path is taken before the tool runs & re-checked on get, so edits made outside the
+      writer (or during the call) are caught too.
+    - Entries are evicted least recently used first once their outputs exceed max_bytes.
+    - record_tokens() stores the result's token count, so cached results aren't re-tokenized.
+    """
+
+    def __init__(self, max_bytes: int = TOOL_RESULT_CACHE_MAX_BYTES, tools: Optional[List[str]] = None):
+        self.max_bytes = max_bytes
+        self.tools = set(TOOL_RESULT_CACHE_TOOLS if tools is None else tools)
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        # Resolved path -> keys of entries depending on it
+        self._dependents: Dict[str, Set[CacheKey]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        get_workspace_writer().subscribe(self.invalidate)
+
+    # region Cache Access
+
+    def snapshot(self, tool: BaseTool, args: Dict) -> Optional[Tuple[CacheKey, List[str], PathVersions]]:
+        """
+        Return the key, dependencies & their current versions for a cacheable call (None if the call isn't cacheable).
+        Take this before running the tool & pass it to put().
+        """
+        paths = self.dependencies(tool, args)
+        if paths is None:
+            return None
+        # Commit buffered appends first, so their notifications land before the versions are read
+        for path in paths:
+            get_workspace_writer().flush(Path(path))
+        root = str(Path(getattr(tool, "root_dir", None) or ".").resolve())
+        key = (tool.name, root, json.dumps(args, sort_keys=True, default=str))
+        return key, paths, self._versions(paths)
+
+    def get(self, tool: BaseTool, args: Dict) -> Optional[CachedToolResult]:
+        snapshot = self.snapshot(tool, args)
+        if snapshot is None:
+            return None
+        key, _, versions = snapshot
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.versions != versions:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return CachedToolResult(entry.output, entry.tokens)
+
+    def put(self, snapshot: Tuple[CacheKey, List[str], PathVersions], output: str):
+        key, paths, versions = snapshot
+        size = len(output)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = _Entry(output, paths, versions)
+            for path in paths:
+                self._dependents.setdefault(path, set()).add(key)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def record_tokens(self, tool: BaseTool, args: Dict, tokens: int):
+        """Remember the token count of a cached result (assumes one tokenizer per cache, e.g. agents sharing a model)."""
+        snapshot = self.snapshot(tool, args)
+        if snapshot is None:
+            return
+        with self._lock:
+            entry = self._entries.get(snapshot[0])
+            if entry is not None and entry.versions == snapshot[2]:
+                entry.tokens = tokens
+
+    def invalidate(self, path: Path):
+        """
+        Drop entries depending on path or any directory above it (WorkspaceWriter listener).
+        """
+        path = Path(path).resolve()
+        with self._lock:
+            for dependency in [path, *path.parents]:
+                keys = self._dependents.pop(str(dependency), None)
+                for key in keys or ():
+                    if key in self._entries:
+                        self._drop(key)
+                        self.invalidations += 1
+
+    def close(self):
+        """Stop listening for workspace writes & drop every entry."""
+        get_workspace_writer().unsubscribe(self.invalidate)
+        with self._lock:
+            self._entries.clear()
+            self._dependents.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+            }
+
+    # endregion
+    # region Helpers
+
+    def dependencies(self, tool: BaseTool, args: Dict) -> Optional[List[str]]:
+        """
+        Resolved paths a read-only tool call reads, or None if the call isn't cacheable.
+        """
+        if tool.name not in self.tools or not hasattr(tool, "get_relative_path"):
+            return None
+        if tool.name == "read_file":
+            target = args.get("file_path")
+        elif tool.name == "list_directory":
+            target = args.get("dir_path") or "."
+        else:
+            return None
+        if not target:
+            return None
+        try:
+            return [str(Path(tool.get_relative_path(str(target))).resolve())]
+        except Exception:
+            return None  # Invalid or out-of-workspace path; let the tool report it
+
+    @staticmethod
+    def _versions(paths: List[str]) -> PathVersions:
+        versions = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                versions.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                versions.append(None)
+        return tuple(versions)
+
+    def _drop(self, key: CacheKey):
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry.output)
+        for path in entry.paths:
+            dependents = self._dependents.get(path)
+            if dependents is not None:
+                dependents.discard(key)
+                if not dependents:
+                    del self._dependents[path]
+
+    # endregion
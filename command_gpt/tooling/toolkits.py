@@ -1,100 +1,144 @@
 from abc import ABC
-from pathlib import Path
-from typing import List
+from typing import List, Optional
 
-from langchain import GoogleSearchAPIWrapper
 from langchain.agents import Tool
 from langchain.tools import BaseTool
-from langchain.tools.file_management import (
-    ReadFileTool,
-    ListDirectoryTool,
-)
-from langchain.tools.human.tool import HumanInputRun
 
-from config import GOOGLE_API_KEY, GOOGLE_CSE_ID, WORKSPACE_DIR
+from config import GOOGLE_API_KEY, GOOGLE_CSE_ID, SEARCH_BACKEND_URL, WORKSPACE_DIR
 from command_gpt.utils.custom_stream import CustomStreamCallback
-from command_gpt.tooling.tools import SearchAndWriteTool, WriteFileToolNewlines
-
-WORKSPACE_PATH = Path(WORKSPACE_DIR)
+from command_gpt.utils.lazy_registry import LazyRegistry
 
 
 class BaseToolkit(ABC):
     """
-    Base Toolkit with tools initialized for the project, stored in a dict.
-    - Use get_toolkit() to get the List[BaseTool] for this toolkit.
-    - Available Tools: ["search", "write_file", "read_file", "list_directory", "finish", "human_input"]
+    Base Toolkit with tool factories registered for the project, stored in a LazyRegistry.
+    - Use get_toolkit() to get the List[BaseTool] for this toolkit. Tools (and their imports) are only built when included.
+    - Subclasses can list tool names in excluded_tools to leave them out (they are never constructed).
+    - File & web tools read & write under workspace_dir (e.g. a per-job workspace for batch runs).
+    - Available Tools: ["search", "fetch_url", "write_file", "read_file", "list_directory", "finish", "human_input"]
     """
 
-    def __init__(self):
+    excluded_tools: List[str] = []
+
+    def __init__(self, workspace_dir: str = WORKSPACE_DIR, excluded_tools: Optional[List[str]] = None):
         super().__init__()
+        self.workspace_dir = workspace_dir
+        # Extends the class-level exclusions for this instance
+        self.excluded_tools = list(self.excluded_tools) + list(excluded_tools or [])
+
+        # region TOOLS REGISTRY
+        # - Registers tool factories accessible by name
+
+        self.tools = LazyRegistry()
+        self.tools.register('search', self._create_search_tool)
+        self.tools.register('fetch_url', self._create_fetch_url_tool)
+        self.tools.register('write_file', self._create_write_file_tool)
+        self.tools.register('read_file', self._create_read_file_tool)
+        self.tools.register('list_directory', self._create_list_directory_tool)
+        self.tools.register('finish', self._create_finish_tool)
+        self.tools.register('human_input', self._create_human_input_tool)
 
-        # region Search/Web
-        # - Custom Google Search API Wrapper used by SearchAndWriteTool to run a search query and automatically write the results to a file (saving resources)
-        search = GoogleSearchAPIWrapper(
-            google_api_key=GOOGLE_API_KEY,
-            google_cse_id=GOOGLE_CSE_ID,
-        )
-        search_and_write = SearchAndWriteTool(search)
-        search_tool = Tool(
+        # endregion
+
+    def get_toolkit(self) -> List[BaseTool]:
+        """
+        Return the list of tools for this toolkit.
+        """
+        return [self.tools.get(name) for name in self.tools.names() if name not in self.excluded_tools]
+
+    # region Search/Web
+
+    def _create_search_tool(self) -> BaseTool:
+        """
+        Search backend queried by SearchAndWriteTool to run search queries and automatically write the results to files (saving resources)
+        - Set SEARCH_BACKEND_URL to point search at a local stand-in server instead of Google
+        - Results are cached on disk by normalized query (see SEARCH_CACHE_TTL_SECONDS in config.py)
+        """
+        from command_gpt.tooling.search_backends import GoogleSearchBackend, HTTPSearchBackend
+        from command_gpt.tooling.search_cache import SearchCache
+        from command_gpt.tooling.tools import SearchAndWriteTool
+
+        if SEARCH_BACKEND_URL:
+            search = HTTPSearchBackend(SEARCH_BACKEND_URL)
+        else:
+            search = GoogleSearchBackend(
+                google_api_key=GOOGLE_API_KEY,
+                google_cse_id=GOOGLE_CSE_ID,
+            )
+        search_and_write = SearchAndWriteTool(
+            search, cache=SearchCache(), workspace_dir=self.workspace_dir)
+        return Tool(
             name="search",
             func=search_and_write.run,
-            description="Gather search results from query (they will automatically be written to a file called 'results_{query}').",
+            description="Gather search results from query (they will automatically be written to a file called 'results_{query}'). Separate multiple queries with ' | ' to run them at once.",
             callbacks=[CustomStreamCallback()]
         )
 
-        # endregion
-        # region File Management
-        # - Tools for reading, writing, and listing files in the workspace directory
-        # - Note: WriteFileToolNewlines is a simple extension of WriteFileTool that re-writes new line characters properly for file writing
-        write_file_tool = WriteFileToolNewlines(
-            root_dir=WORKSPACE_DIR,
+    def _create_fetch_url_tool(self) -> BaseTool:
+        """
+        Fetches pages, writes their main text to "web_pages/" & returns a short digest (full text is read with read_file)
+        """
+        from command_gpt.tooling.web_fetch import FetchAndExtractTool
+
+        fetch_and_extract = FetchAndExtractTool(workspace_dir=self.workspace_dir)
+        return Tool(
+            name="fetch_url",
+            func=fetch_and_extract.run,
+            description="Read a web page (e.g. a search result link); its text will automatically be written to a file in 'web_pages/'. Separate multiple URLs with ' | ' to fetch them at once.",
             callbacks=[CustomStreamCallback()]
         )
-        read_file_tool = ReadFileTool(
-            root_dir=WORKSPACE_DIR,
+
+    # endregion
+    # region File Management
+    # - Tools for reading, writing, and listing files in the workspace directory
+    # - Note: WriteFileToolNewlines is a simple extension of WriteFileTool that re-writes new line characters properly for file writing
+    # - Note: ReadFileToolChunked extends ReadFileTool with --offset/--limit paging & previews of large files
+
+    def _create_write_file_tool(self) -> BaseTool:
+        from command_gpt.tooling.tools import WriteFileToolNewlines
+        return WriteFileToolNewlines(
+            root_dir=self.workspace_dir,
             callbacks=[CustomStreamCallback()]
         )
-        list_directory_tool = ListDirectoryTool(
-            root_dir=WORKSPACE_DIR,
+
+    def _create_read_file_tool(self) -> BaseTool:
+        from command_gpt.tooling.tools import ReadFileToolChunked
+        return ReadFileToolChunked(
+            root_dir=self.workspace_dir,
+            callbacks=[CustomStreamCallback()]
+        )
+
+    def _create_list_directory_tool(self) -> BaseTool:
+        from langchain.tools.file_management import ListDirectoryTool
+        return ListDirectoryTool(
+            root_dir=self.workspace_dir,
             description="List files to read from or append to.",
             callbacks=[CustomStreamCallback()]
         )
 
-        # endregion
-        # region Other
-        finish_tool = Tool(
+    # endregion
+    # region Other
+
+    @staticmethod
+    def _create_finish_tool() -> BaseTool:
+        return Tool(
             name="finish",
             func=lambda: None,
             description="End the program.",
             callbacks=[CustomStreamCallback()]
         )
-        human_input_tool = Tool(
+
+    @staticmethod
+    def _create_human_input_tool() -> BaseTool:
+        from langchain.tools.human.tool import HumanInputRun
+        return Tool(
             name="human_input",
             func=HumanInputRun,
             description="Get input from a human if you find yourself overly confused.",
             callbacks=[CustomStreamCallback()]
         )
 
-        # endregion
-        # region TOOLS DICTIONARY
-        # - Adds tools to dictionary accessible by name
-
-        self.tools = {
-            'search': search_tool,
-            'write_file': write_file_tool,
-            'read_file': read_file_tool,
-            'list_directory': list_directory_tool,
-            'finish': finish_tool,
-            'human_input': human_input_tool
-        }
-
-        # endregion
-
-    def get_toolkit(self) -> List[BaseTool]:
-        """
-        Return the list of tools for this toolkit.
-        """
-        return list(self.tools.values())
+    # endregion
 
 
 class MemoryOnlyToolkit(BaseToolkit):
@@ -103,8 +147,5 @@ class MemoryOnlyToolkit(BaseToolkit):
     - Available tools: ["write_file", "read_file", "list_directory", "finish", "human_input"]
     """
 
-    def get_toolkit(self) -> List[BaseTool]:
-        """
-        Return a modified list of tools for this toolkit, excluding search/web tools.
-        """
-        return [tool for tool in super().get_toolkit() if tool.name not in ['search']]
+    # Search/web tools are excluded before construction, so no search client is created
+    excluded_tools = ['search', 'fetch_url']
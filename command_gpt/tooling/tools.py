@@ -1,25 +1,41 @@
 # Defines custom LangChain tools & Bundles tools set up with custom stream callback for printing to console
 
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from itertools import islice
+import mmap
 from pathlib import Path
 import re
-from typing import Optional
+from typing import Dict, List, Optional, Type, Union
+
+from pydantic import BaseModel, Field
 
 from langchain import GoogleSearchAPIWrapper
 from langchain.tools.file_management import (
+    ReadFileTool,
     WriteFileTool,
 )
+from langchain.tools.file_management.utils import (
+    INVALID_PATH_TEMPLATE,
+    FileValidationError,
+)
 from langchain.callbacks.manager import (
     CallbackManagerForToolRun,
 )
 
-from config import WORKSPACE_DIR
+from config import READ_FILE_MAX_PAGE_CHARS, WORKSPACE_DIR
+from command_gpt.tooling.search_backends import SearchBackend
+from command_gpt.tooling.search_cache import SearchCache
+from command_gpt.utils.workspace_writer import get_workspace_writer
 
-WORKSPACE_PATH = Path(WORKSPACE_DIR)
+# Matches escaped newlines ((\\x2+)n) written by the LLM
+NEWLINE_PATTERN = re.compile(r'\\+n')
 
 
 class WriteFileToolNewlines(WriteFileTool):
     """
     Extends WriteFileTool to replace any occurrences of (\\x2+)n with \n for clean newlines.
+    - Writes go through the WorkspaceWriter, which coalesces appends & commits files atomically.
     """
 
     def _run(
@@ -29,47 +45,275 @@ class WriteFileToolNewlines(WriteFileTool):
         append: bool = False,
         run_manager: Optional[CallbackManagerForToolRun] = None,
     ) -> str:
-        # Replace any occurrences of (\\x2+)n with \n
-        text = re.sub(r'\\+n', '\n', text)
-        return super()._run(file_path, text, append, run_manager)
+        try:
+            write_path = self.get_relative_path(file_path)
+        except FileValidationError:
+            return INVALID_PATH_TEMPLATE.format(arg_name="file_path", value=file_path)
+        # Replace any occurrences of (\\x2+)n with \n (skipping the regex when there's no backslash)
+        if "\\" in text:
+            text = NEWLINE_PATTERN.sub('\n', text)
+        try:
+            get_workspace_writer().write(write_path, text, append)
+            return f"File written successfully to {file_path}."
+        except Exception as e:
+            return "Error: " + str(e)
+
+
+class ReadFileChunkedInput(BaseModel):
+    """Input for ReadFileToolChunked."""
+
+    file_path: str = Field(..., description="name of file")
+    offset: int = Field(
+        0, description="line number to start reading from (0 for the start of the file)")
+    limit: int = Field(
+        0, description="number of lines to read (0 for the whole file, or a preview if the file is large)")
+    char_offset: int = Field(
+        0, description="character to start from within the first line (to continue a very long line)")
+
+
+class ReadFileToolChunked(ReadFileTool):
+    """
+    Extends ReadFileTool with --offset/--limit line paging so large files are never pushed into the context whole.
+    - Files are streamed line by line, so only the requested page is held in memory.
+    - Reading a large file without a limit returns a preview (head, tail & markdown outline) instead of the full text.
+    - Pages end on a line break; a single line longer than a page is read in pieces with --char_offset.
+    """
+
+    args_schema: Type[BaseModel] = ReadFileChunkedInput
+    description: str = "Read file from disk. Large files return a preview; page through them with --offset and --limit."
+
+    # Files at or below this size are returned whole when no limit is given
+    preview_threshold_bytes: int = 8000
+    # Hard caps on a single page
+    max_lines: int = 200
+    max_chars: int = READ_FILE_MAX_PAGE_CHARS
+    # Preview sizing
+    preview_lines: int = 20
+    max_outline_entries: int = 30
+
+    def _run(
+        self,
+        file_path: str,
+        offset: int = 0,
+        limit: int = 0,
+        char_offset: int = 0,
+        run_manager: Optional[CallbackManagerForToolRun] = None,
+    ) -> str:
+        try:
+            read_path = self.get_relative_path(file_path)
+        except FileValidationError:
+            return INVALID_PATH_TEMPLATE.format(arg_name="file_path", value=file_path)
+        # Commit any buffered appends so the read sees them
+        get_workspace_writer().flush(read_path)
+        if not read_path.exists():
+            return f"Error: no such file or directory: {file_path}"
+
+        offset = max(int(offset or 0), 0)
+        limit = max(int(limit or 0), 0)
+        char_offset = max(int(char_offset or 0), 0)
+        try:
+            file_size = read_path.stat().st_size
+            if offset == 0 and limit == 0 and char_offset == 0:
+                if file_size <= self.preview_threshold_bytes:
+                    return read_path.read_text(encoding="utf-8", errors="ignore")
+                return self._preview(read_path, file_path, file_size)
+            return self._read_page(read_path, file_path, offset, limit or self.max_lines, char_offset)
+        except Exception as e:
+            return "Error: " + str(e)
+
+    def _read_page(self, read_path: Path, file_path: str, offset: int, limit: int, char_offset: int = 0) -> str:
+        """
+        Stream lines [offset, offset + limit) from the file (the first from char_offset), capped at max_lines & max_chars.
+        - A line that doesn't fit starts the next page; one that doesn't fit a page on its own is cut at max_chars & the
+          footer points at the --char_offset to continue from
+        """
+        limit = min(limit, self.max_lines)
+        page: List[str] = []
+        page_chars = 0
+        # Where the next page starts
+        next_line, next_char = offset, 0
+        cut_line_chars = 0
+        with read_path.open("r", encoding="utf-8", errors="ignore") as f:
+            for line_number, line in enumerate(islice(f, offset, offset + limit), start=offset):
+                text = line[char_offset:] if line_number == offset else line
+                if page_chars + len(text) > self.max_chars:
+                    if not page:
+                        page.append(text[:self.max_chars])
+                        cut_line_chars = len(line.rstrip("\n"))
+                        if char_offset + self.max_chars < cut_line_chars:
+                            next_char = char_offset + self.max_chars
+                        else:
+                            # Only the line break was left over
+                            next_line = line_number + 1
+                    break
+                page.append(text)
+                page_chars += len(text)
+                next_line = line_number + 1
+
+        total_lines = self._count_lines(read_path)
+        if not page:
+            return f"No lines to read in {file_path} from offset {offset} (file has {total_lines} lines)."
+
+        if next_char:
+            return "".join(page) + (
+                f"\n\n[Line {offset} of {total_lines} in {file_path}, characters {char_offset}-{next_char - 1} of "
+                f"{cut_line_chars}. Use --offset {offset} --char_offset {next_char} to continue reading.]")
+        from_char = f" (line {offset} from character {char_offset})" if char_offset else ""
+        footer = f"\n\n[Lines {offset}-{next_line - 1} of {total_lines} in {file_path}{from_char}."
+        if next_line < total_lines:
+            footer += f" Use --offset {next_line} to continue reading."
+        footer += "]"
+        return "".join(page) + footer
+
+    def _preview(self, read_path: Path, file_path: str, file_size: int) -> str:
+        """
+        Summarize a large file with its head, tail & markdown outline without loading it whole.
+        """
+        head: List[str] = []
+        outline: List[str] = []
+        total_lines = 0
+        with read_path.open("r", encoding="utf-8", errors="ignore") as f:
+            for line_number, line in enumerate(f):
+                total_lines += 1
+                if line_number < self.preview_lines:
+                    head.append(line[:200])
+                if line.startswith("#") and len(outline) < self.max_outline_entries:
+                    outline.append(f"{line_number}: {line.strip()[:120]}")
+
+        tail = self._read_tail(read_path, self.preview_lines)
+
+        preview = f"File {file_path} is large ({file_size}b, {total_lines} lines). Preview:\n\n"
+        preview += "HEAD:\n" + "".join(head).rstrip("\n") + "\n\n"
+        if outline:
+            preview += "OUTLINE (line: heading):\n" + "\n".join(outline) + "\n\n"
+        if total_lines > self.preview_lines:
+            preview += "TAIL:\n" + "".join(tail).rstrip("\n") + "\n\n"
+        preview += f"Use --offset <line> --limit <lines> (max {self.max_lines}) to read specific sections."
+        return preview
+
+    @staticmethod
+    def _read_tail(read_path: Path, line_count: int) -> List[str]:
+        """
+        Return the last line_count lines of a file using a memory map, scanning backwards from the end.
+        """
+        with read_path.open("rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                end = len(mm)
+                # Ignore a trailing newline so it doesn't count as an empty last line
+                if end and mm[end - 1:end] == b"\n":
+                    end -= 1
+                start = end
+                for _ in range(line_count):
+                    start = mm.rfind(b"\n", 0, start)
+                    if start == -1:
+                        break
+                tail = mm[start + 1:end]
+        return [line[:200] + "\n" for line in tail.decode("utf-8", errors="ignore").split("\n")]
+
+    @staticmethod
+    def _count_lines(read_path: Path) -> int:
+        """
+        Count lines by streaming the file in fixed-size binary blocks.
+        """
+        count = 0
+        last_block = b""
+        with read_path.open("rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                count += block.count(b"\n")
+                last_block = block
+        # A final line without a trailing newline still counts
+        if last_block and not last_block.endswith(b"\n"):
+            count += 1
+        return count
 
 
 class SearchAndWriteTool:
     """
-    Wraps the .results() method of a GoogleSearchAPIWrapper in a custom Tool.
+    Wraps the .results() method of a GoogleSearchAPIWrapper (or a SearchBackend) in a custom Tool.
     Runs a search query, writes the results to a file, and returns a result message.
+    - Several queries separated by QUERY_SEPARATOR are fanned out concurrently, each written to its own results file.
+    - If a SearchCache is provided, repeated (or trivially rephrased) queries are served from disk without an API call.
     """
 
-    def __init__(self, search: GoogleSearchAPIWrapper):
+    # Spaced, since a bare | is the search engine's OR operator
+    QUERY_SEPARATOR = " | "
+
+    def __init__(
+        self,
+        search: Union[GoogleSearchAPIWrapper, SearchBackend],
+        cache: Optional[SearchCache] = None,
+        workspace_dir: str = WORKSPACE_DIR,
+    ):
         self.search = search
+        self.cache = cache
+        self.workspace_path = Path(workspace_dir)
 
     def run(self, query: str) -> str:
-        """Run a search query, write the results to a file, and return a result message."""
-        # Run the search query
-        results = self.search.results(query, num_results=5)
+        """Run one or more search queries, write the results to files, and return a result message."""
+        queries = [q.strip() for q in query.split(self.QUERY_SEPARATOR) if q.strip()]
+        if len(queries) <= 1:
+            return self.run_query(query)
+
+        # Fan out, bounded by the backend's concurrency limit
+        max_workers = min(len(queries), getattr(self.search, "max_concurrency", 1))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.run_query, q) for q in queries]
+            results = []
+            for q, future in zip(queries, futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append(f"Error searching '{q}': {str(e)}, {type(e).__name__}")
+        return "\n\n".join(results)
+
+    def run_query(self, query: str) -> str:
+        """Run a single search query, write the results to a file, and return a result message."""
+        # Check the cache before running the search query
+        results = self.cache.get(query) if self.cache else None
+        from_cache = results is not None
+        if not from_cache:
+            results = [
+                self.to_record(result) for result in self.search.results(query, num_results=5)
+            ]
+            if self.cache:
+                self.cache.put(query, results)
         # Format the results
         results_text = []
         for i, result in enumerate(results, start=1):
             result_text = (
                 f"Result {i}:\n"
-                f"Title: {self.remove_non_ascii(result['title'])}\n"
-                f"Link: {self.remove_non_ascii(result['link'])}\n"
-                f"Snippet: {self.remove_non_ascii(result['snippet'])}\n\n"
+                f"Title: {result['title']}\n"
+                f"Link: {result['link']}\n"
+                f"Snippet: {result['snippet']}\n"
             )
-            results_text.append(result_text)
+            seen_under = self.cache.seen_under(
+                result["link"], query) if self.cache else None
+            if seen_under:
+                result_text += f"(Previously seen in results for '{seen_under}')\n"
+            results_text.append(result_text + "\n")
         results_text = "".join(results_text)
         # Sanitize the query to use it as a filename
         safe_query = self.sanitize_filename(query)
-        # Prepare the filename
-        file_name = f"search_results/results_{safe_query}.txt"
-        file_path = WORKSPACE_PATH / file_name
-        # Ensure the directory exists
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        # Write the results to the file
-        with open(file_path, "w") as file:
-            file.write(results_text)
+        # Queries that sanitize alike (e.g. "C++ tips" & "C tips", fanned out together) would otherwise overwrite each other's file
+        query_hash = hashlib.sha256(query.encode("utf-8")).hexdigest()[:8]
+        file_name = f"search_results/results_{safe_query}_{query_hash}.txt"
+        file_path = self.workspace_path / file_name
+        # Write the results to the file (the writer ensures the directory exists)
+        get_workspace_writer().write(file_path, results_text)
         # Return a result message
-        return f"Search results:\n\n {results_text}\n\n written to file named: {file_name}"
+        cached_note = " (from cache)" if from_cache else ""
+        return f"Search results{cached_note}:\n\n {results_text}\n\n written to file named: {file_name}"
+
+    @classmethod
+    def to_record(cls, result: Dict) -> Dict:
+        """
+        Map a raw search result to a structured title/link/snippet record with non-ascii characters removed.
+        """
+        return {
+            "title": cls.remove_non_ascii(result.get("title", result.get("Result", ""))),
+            "link": cls.remove_non_ascii(result.get("link", "")),
+            "snippet": cls.remove_non_ascii(result.get("snippet", "")),
+        }
 
     @staticmethod
     def sanitize_filename(name: str) -> str:
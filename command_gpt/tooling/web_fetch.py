@@ -0,0 +1,241 @@
+# Fetches web pages concurrently, extracts their main text, caches it on disk by URL/ETag & writes it into the workspace
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from html.parser import HTMLParser
+import json
+from pathlib import Path
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    FETCH_MAX_BYTES,
+    FETCH_MAX_CONCURRENCY,
+    FETCH_TIMEOUT_SECONDS,
+    PAGE_CACHE_DIR,
+    WORKSPACE_DIR,
+)
+from command_gpt.utils.http_session import create_pooled_session
+from command_gpt.utils.workspace_writer import get_workspace_writer
+
+
+class MainTextExtractor(HTMLParser):
+    """
+    Collects readable text from HTML, skipping scripts, styles & page chrome.
+    - If the page has <article> or <main> elements, only their text is kept.
+    """
+
+    SKIP_TAGS = {"script", "style", "noscript", "nav", "header",
+                 "footer", "aside", "form", "svg", "button", "iframe"}
+    MAIN_TAGS = {"article", "main"}
+    BLOCK_TAGS = {"p", "div", "section", "li", "br", "tr", "pre", "blockquote",
+                  "h1", "h2", "h3", "h4", "h5", "h6"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self._in_title = False
+        self._skip_depth = 0
+        self._main_depth = 0
+        self._all_blocks: List[str] = []
+        self._main_blocks: List[str] = []
+        self._current: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in self.MAIN_TAGS:
+            self._flush()
+            self._main_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        if tag in self.BLOCK_TAGS:
+            self._flush()
+            if tag.startswith("h") and len(tag) == 2:
+                self._current.append("#" * int(tag[1]) + " ")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag in self.MAIN_TAGS and self._main_depth:
+            self._flush()
+            self._main_depth -= 1
+        elif tag == "title":
+            self._in_title = False
+        if tag in self.BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data.strip()
+        elif not self._skip_depth:
+            self._current.append(data)
+
+    def _flush(self):
+        block = re.sub(r"\s+", " ", "".join(self._current)).strip()
+        self._current = []
+        # Skip empty blocks & bare heading markers
+        if not block.strip("# "):
+            return
+        self._all_blocks.append(block)
+        if self._main_depth:
+            self._main_blocks.append(block)
+
+    def get_text(self) -> str:
+        self._flush()
+        return "\n\n".join(self._main_blocks or self._all_blocks)
+
+
+class FetchAndExtractTool:
+    """
+    Downloads one or more URLs concurrently over a pooled HTTP client & writes their main text to the workspace.
+    - Downloads are capped at max_bytes and time out after timeout seconds.
+    - Extracted text is cached on disk by URL; cached pages are revalidated with their ETag/Last-Modified headers.
+    - Returns a short digest per page rather than the full text, which can be read from the written file.
+    """
+
+    # Spaced, since | is legal inside URLs
+    URL_SEPARATOR = " | "
+    DIGEST_CHARS = 400
+
+    def __init__(
+        self,
+        cache_dir: str = PAGE_CACHE_DIR,
+        max_concurrency: int = FETCH_MAX_CONCURRENCY,
+        max_bytes: int = FETCH_MAX_BYTES,
+        timeout: float = FETCH_TIMEOUT_SECONDS,
+        workspace_dir: str = WORKSPACE_DIR,
+    ):
+        self.cache_path = Path(cache_dir)
+        self.workspace_path = Path(workspace_dir)
+        self.max_concurrency = max_concurrency
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.session = create_pooled_session(max_concurrency)
+        self.session.headers["User-Agent"] = "CommandGPT/1.0 (+fetch_url)"
+
+    def run(self, urls: str) -> str:
+        """Fetch one or more URLs separated by URL_SEPARATOR & return a digest for each."""
+        url_list = [u.strip() for u in urls.split(self.URL_SEPARATOR) if u.strip()]
+        if not url_list:
+            return "Error: no URL provided."
+
+        with ThreadPoolExecutor(max_workers=min(len(url_list), self.max_concurrency)) as executor:
+            futures = [executor.submit(self.fetch, url) for url in url_list]
+            digests = []
+            for url, future in zip(url_list, futures):
+                try:
+                    digests.append(future.result())
+                except Exception as e:
+                    digests.append(f"Error fetching {url}: {str(e)}, {type(e).__name__}")
+        return "\n\n".join(digests)
+
+    def fetch(self, url: str) -> str:
+        """Fetch a single URL (or revalidate its cached copy), write its text to the workspace & return a digest."""
+        meta, text = self._load_cached(url)
+
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+            if response.status_code == 304 and text is not None:
+                from_cache = True
+            else:
+                response.raise_for_status()
+                content_type = response.headers.get("Content-Type", "")
+                if "html" not in content_type and "text" not in content_type:
+                    return f"Unsupported content type for {url}: {content_type or 'unknown'} (only HTML & text pages can be read)."
+                body, truncated = self._read_capped(response)
+                # requests assumes ISO-8859-1 for text/* without a charset, which mangles most modern pages
+                encoding = response.encoding if "charset" in content_type else "utf-8"
+                meta, text = self._extract(url, body.decode(encoding, errors="ignore"), content_type)
+                meta.update({
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "truncated": truncated,
+                })
+                self._store_cached(url, meta, text)
+                from_cache = False
+
+        file_name = self._write_to_workspace(url, meta, text)
+        return self._digest(url, meta, text, file_name, from_cache)
+
+    # region Helpers
+
+    def _read_capped(self, response) -> Tuple[bytes, bool]:
+        """
+        Read the streamed response body up to max_bytes. Returns the body & whether it was truncated.
+        """
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > self.max_bytes:
+                return b"".join(chunks)[:self.max_bytes], True
+        return b"".join(chunks), False
+
+    @staticmethod
+    def _extract(url: str, body: str, content_type: str) -> Tuple[Dict, str]:
+        if "html" in content_type:
+            extractor = MainTextExtractor()
+            extractor.feed(body)
+            extractor.close()
+            return {"url": url, "title": extractor.title}, extractor.get_text()
+        return {"url": url, "title": ""}, body.strip()
+
+    def _write_to_workspace(self, url: str, meta: Dict, text: str) -> str:
+        safe_name = re.sub(r"[^a-zA-Z0-9_-]", "_", re.sub(r"^https?://", "", url))[:100]
+        # Long URLs sharing a prefix (or URLs differing only in punctuation) would otherwise overwrite each other's file
+        url_hash = hashlib.sha256(url.encode("utf-8")).hexdigest()[:8]
+        file_name = f"web_pages/{safe_name}_{url_hash}.md"
+        file_path = self.workspace_path / file_name
+        get_workspace_writer().write(
+            file_path, f"# {meta.get('title') or url}\n\nSource: {url}\n\n{text}\n")
+        return file_name
+
+    def _digest(self, url: str, meta: Dict, text: str, file_name: str, from_cache: bool) -> str:
+        preview = text[:self.DIGEST_CHARS].replace("\n\n", " ")
+        notes = []
+        if from_cache:
+            notes.append("unchanged since last fetch")
+        if meta.get("truncated"):
+            notes.append(f"truncated at {self.max_bytes}b")
+        notes_text = f" ({', '.join(notes)})" if notes else ""
+        return (
+            f"Fetched {url}{notes_text}\n"
+            f"Title: {meta.get('title') or 'n/a'}\n"
+            f"Length: {len(text)} chars\n"
+            f"Preview: {preview}{'...' if len(text) > self.DIGEST_CHARS else ''}\n"
+            f"Full text written to file named: {file_name}"
+        )
+
+    def _cache_files(self, url: str) -> Tuple[Path, Path]:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.cache_path / f"{key}.json", self.cache_path / f"{key}.txt"
+
+    def _load_cached(self, url: str) -> Tuple[Dict, Optional[str]]:
+        meta_path, text_path = self._cache_files(url)
+        if not meta_path.exists() or not text_path.exists():
+            return {}, None
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            return meta, text_path.read_text(encoding="utf-8")
+        except (OSError, json.JSONDecodeError):
+            return {}, None
+
+    def _store_cached(self, url: str, meta: Dict, text: str):
+        meta_path, text_path = self._cache_files(url)
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        meta = {**meta, "fetched_at": time.time()}
+        # Write text before metadata so a metadata file always has its text
+        for path, content in ((text_path, text), (meta_path, json.dumps(meta))):
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            tmp_path.write_text(content, encoding="utf-8")
+            tmp_path.replace(path)
+
+    # endregion
@@ -0,0 +1,543 @@
+# Benchmarks for CommandGPT internals. Run with: python -m command_gpt.utils.benchmarks <benchmark>
+
+import argparse
+import itertools
+import os
+import random
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+# region Import Time
+# - Each measurement runs in a fresh interpreter so module caches don't skew results
+
+IMPORT_TARGETS = [
+    "config",
+    "command_gpt.tooling.toolkits",
+    "command_gpt.command_gpt",
+]
+
+STARTUP_SNIPPETS = {
+    "config + MemoryOnlyToolkit": "import config; from command_gpt.tooling.toolkits import MemoryOnlyToolkit; MemoryOnlyToolkit().get_toolkit()",
+    "config + BaseToolkit": "import config; from command_gpt.tooling.toolkits import BaseToolkit; BaseToolkit().get_toolkit()",
+}
+
+
+def _time_snippet(snippet: str) -> float:
+    code = (
+        "import time; _start = time.perf_counter()\n"
+        f"{snippet}\n"
+        "print(time.perf_counter() - _start)"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def benchmark_import_times(runs: int = 5) -> Dict[str, float]:
+    """
+    Return the median wall time (seconds) to import each target & build each toolkit in a fresh interpreter.
+    """
+    snippets = {target: f"import {target}" for target in IMPORT_TARGETS}
+    snippets.update(STARTUP_SNIPPETS)
+    return {
+        name: statistics.median(_time_snippet(snippet) for _ in range(runs))
+        for name, snippet in snippets.items()
+    }
+
+# endregion
+# region Command Parsing
+# - Compares the tolerant tokenizer against the previous shlex-based parser on a seed corpus plus seeded fuzz mutations
+
+PARSE_SEED_CORPUS = [
+    '<cmd> search --tool_input "climate change effects on agriculture" </cmd>',
+    '<cmd> write_file --file_path "report.md" --text "# Report\\n\\nFindings so far." --append true </cmd>',
+    '<cmd> read_file --file_path "search_results/results_ocean temps.txt" </cmd>',
+    '<cmd> list_directory </cmd>',
+    'I will write the summary now.\n<context>summarizing</context>\n<cmd>\nwrite_file --file_path "summary.md" --text "Line one\nLine two"\n</cmd>',
+    '<cmd> write_file --file_path "notes.md" --text "It\'s clear the \\"baseline\\" is shifting" </cmd>',
+    '<cmd> fetch_url --tool_input "https://example.com/a | https://example.com/b" </cmd>',
+    '<cmd> read_file --file_path=report.md --offset=100 --limit=50 </cmd>',
+]
+
+
+def _mutate_command(command: str, rng: random.Random) -> str:
+    """
+    Apply one of the mistakes LLMs commonly make to a well-formed command.
+    """
+    mutations = [
+        lambda c: c.replace("</cmd>", ""),  # Missing end tag
+        lambda c: c.replace('"', "", 1),  # Unbalanced quote
+        lambda c: c.replace('--text "', "--text \"Don't forget: "),  # Apostrophe in text
+        lambda c: c.replace('"', "'"),  # Single quotes
+        lambda c: c.replace('--tool_input "', "--tool_input ").replace('" </cmd>', " </cmd>"),  # Unquoted multi-word value
+        lambda c: c.replace(' "', '="'),  # --flag=value
+        lambda c: c.replace("--text \"", "--text \"He said \"hi\" and "),  # Unescaped inner quotes
+        lambda c: c.replace("--append true", "--append"),  # Bare boolean flag
+        lambda c: c.replace(" --", "\n--"),  # Flags across lines
+    ]
+    return rng.choice(mutations)(command)
+
+
+def build_parse_corpus(fuzz_count: int = 2000, seed: int = 0) -> List[Tuple[str, str]]:
+    """
+    Return (text, seed_text) pairs: the seeds themselves followed by fuzz_count mutated seeds.
+    """
+    rng = random.Random(seed)
+    corpus = [(text, text) for text in PARSE_SEED_CORPUS]
+    for _ in range(fuzz_count):
+        seed_text = rng.choice(PARSE_SEED_CORPUS)
+        corpus.append((_mutate_command(seed_text, rng), seed_text))
+    return corpus
+
+
+def _shlex_parse(text: str):
+    """
+    The previous shlex-based parser, kept as the benchmark baseline.
+    """
+    from command_gpt.utils.command_parser import GPTCommand, COMMAND_LINE_END, COMMAND_LINE_START
+    try:
+        start_index = text.find(COMMAND_LINE_START)
+        end_index = text.find(
+            COMMAND_LINE_END, start_index + len(COMMAND_LINE_START))
+        if start_index == -1 or end_index == -1:
+            raise ValueError("Invalid command line format")
+        cmd_str = text[start_index + len(COMMAND_LINE_START):end_index].strip()
+        cmd_str_splitted = shlex.split(cmd_str)
+        if len(cmd_str_splitted) < 1:
+            raise ValueError("Missing command name")
+        command_name = cmd_str_splitted.pop(0)
+        command_args = dict(itertools.zip_longest(
+            *[iter(cmd_str_splitted)] * 2, fillvalue=""))
+        return GPTCommand(name=command_name, args={arg.lstrip('-'): value for arg, value in command_args.items()})
+    except Exception as e:
+        return GPTCommand(name="ERROR", args={"error": str(e)})
+
+
+def _run_parser(parse: Callable, corpus: List[Tuple[str, str]], reference=None) -> Dict[str, float]:
+    """
+    A parse is "intact" if it recovers the seed's command name & argument names (values may differ after mutation).
+    - Seeds are parsed with reference (default: the tolerant <cmd> parser)
+    """
+    from command_gpt.utils.command_parser import CommandGPTOutputParser
+    reference = reference or CommandGPTOutputParser()
+
+    failures = 0
+    exceptions = 0
+    intact = 0
+    elapsed = 0.0
+    for text, seed_text in corpus:
+        try:
+            start = time.perf_counter()
+            command = parse(text)
+            elapsed += time.perf_counter() - start
+        except Exception:
+            exceptions += 1
+            continue
+        if command.name == "ERROR":
+            failures += 1
+            continue
+        expected = reference.parse(seed_text)
+        if command.name == expected.name and command.args.keys() == expected.args.keys():
+            intact += 1
+    return {
+        "success_rate": 1 - (failures + exceptions) / len(corpus),
+        "intact_rate": intact / len(corpus),
+        "exceptions": exceptions,
+        "us_per_parse": elapsed / len(corpus) * 1e6,
+    }
+
+
+def benchmark_parsers(fuzz_count: int = 2000, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """
+    Return success rate, exception count & time per parse for the shlex baseline & the tolerant parser.
+    """
+    from command_gpt.utils.command_parser import CommandGPTOutputParser
+
+    corpus = build_parse_corpus(fuzz_count, seed)
+    return {
+        "shlex (baseline)": _run_parser(_shlex_parse, corpus),
+        "tolerant": _run_parser(CommandGPTOutputParser().parse, corpus),
+    }
+
+# endregion
+# region Soak Test
+# - See soak_test.py; exits with status 1 when memory grows faster than the threshold
+
+
+def print_soak_result(result) -> None:
+    _print_table([["loop", "rss (MB)", "traced (MB)", "history msgs", "memory docs"]] + [
+        [str(s.loop), f"{s.rss_bytes / 1e6:.1f}" if s.rss_bytes is not None else "-",
+         f"{s.traced_bytes / 1e6:.1f}", str(s.history_messages), str(s.memory_documents)]
+        for s in result.samples
+    ])
+    print()
+    _print_table([["subsystem", "traced growth (KB)"]] + [
+        [name, f"{size / 1e3:.1f}"] for name, size in result.subsystem_growth.items()
+    ])
+    print()
+    _print_table([["allocation site", "traced growth (KB)"]] + [
+        [site, f"{size / 1e3:.1f}"] for site, size in result.top_allocators
+    ])
+    print()
+    rss = f"{result.rss_growth_per_loop:.0f}" if result.rss_growth_per_loop is not None else "n/a"
+    print(f"{result.loops} loops in {result.seconds:.1f}s, growth per loop: rss {rss} bytes, "
+          f"traced {result.traced_growth_per_loop:.0f} bytes -> {'PASS' if result.passed else 'FAIL'} "
+          f"(judged on {result.judged_on})")
+
+# endregion
+# region Hedged Requests
+# - Offline DelayedChatModel backends: the primary stalls on every stall_every-th call, the backup is slower but steady
+
+
+def benchmark_hedging(
+    requests: int = 100,
+    stall_every: int = 25,
+    stall_seconds: float = 1.0,
+    first_token_seconds: float = 0.02,
+    backup_first_token_seconds: float = 0.05,
+) -> Dict[str, Dict]:
+    """
+    Return latency summaries (see LatencyHistogram.summary) for the primary alone & hedged with the backup.
+    """
+    from langchain.schema import HumanMessage
+    from command_gpt.utils.console_logger import ConsoleLogger
+    from command_gpt.utils.hedged_llm import LatencyHistogram, with_hedging
+    from command_gpt.utils.offline_models import DelayedChatModel
+
+    script = ["Let me look at the files so far.\n<cmd>list_directory</cmd>"]
+
+    def primary():
+        return DelayedChatModel(responses=script, first_token_seconds=first_token_seconds,
+                                token_seconds=0.001, stall_every=stall_every, stall_seconds=stall_seconds)
+
+    backup = DelayedChatModel(responses=script, first_token_seconds=backup_first_token_seconds, token_seconds=0.001)
+    models = {
+        "primary only": primary(),
+        "hedged": with_hedging(primary(), [backup], min_samples=10, initial_delay_seconds=stall_seconds / 2,
+                               min_delay_seconds=0.0),
+    }
+    results = {}
+    previous_output = ConsoleLogger.output
+    with open(os.devnull, "w") as devnull:
+        ConsoleLogger.configure(output=devnull)
+        try:
+            for name, model in models.items():
+                histogram = LatencyHistogram()
+                for _ in range(requests):
+                    start = time.perf_counter()
+                    model([HumanMessage(content="What is your next command?")])
+                    histogram.record(time.perf_counter() - start)
+                results[name] = histogram.summary()
+                results[name]["hedges"] = getattr(model, "hedges", 0)
+                results[name]["hedge_wins"] = getattr(model, "hedge_wins", 0)
+        finally:
+            ConsoleLogger.configure(output=previous_output)
+    return results
+
+# endregion
+# region Command Protocols
+# - <cmd> text vs native function calls: prompt tokens per loop with the offline scripted model, & parse success on fuzz
+#   corpora of the mistakes each protocol is prone to (the same seed commands, as <cmd> lines or function calls)
+
+
+def _mutate_function_call(call: Dict[str, str], rng: random.Random) -> Dict[str, str]:
+    """
+    Apply one of the mistakes LLMs commonly make in function call arguments.
+    """
+    arguments = call["arguments"]
+    mutations = [
+        lambda: dict(call, arguments=arguments[:-max(1, len(arguments) // 5)]),  # Cut off (max tokens)
+        lambda: dict(call, arguments=arguments.replace('": "', '": "C:\\data\\', 1)),  # Unescaped backslash
+        lambda: dict(call, arguments=f"```json\n{arguments}\n```"),  # Code fence
+        lambda: dict(call, name=f"functions.{call['name']}"),  # Namespaced name
+        lambda: dict(call, arguments=arguments.replace("\\n", "\n")),  # Raw newline inside a string
+        lambda: dict(call, arguments=arguments.replace('"', "'")),  # Single quotes
+        lambda: dict(call, arguments=arguments + "\nI'll continue after this."),  # Text after the JSON
+    ]
+    return rng.choice(mutations)()
+
+
+def build_function_call_corpus(fuzz_count: int = 2000, seed: int = 0) -> List[Tuple[str, str]]:
+    """
+    Return (serialized call, serialized seed call) pairs for PARSE_SEED_CORPUS as function calls, then fuzz_count mutations.
+    """
+    import json
+    from command_gpt.utils.command_parser import CommandGPTOutputParser
+
+    parser = CommandGPTOutputParser()
+    seeds = []
+    for text in PARSE_SEED_CORPUS:
+        command = parser.parse(text)
+        seeds.append({"name": command.name, "arguments": json.dumps(command.args)})
+    rng = random.Random(seed)
+    corpus = [(json.dumps(call), json.dumps(call)) for call in seeds]
+    for _ in range(fuzz_count):
+        call = rng.choice(seeds)
+        corpus.append((json.dumps(_mutate_function_call(call, rng)), json.dumps(call)))
+    return corpus
+
+
+def benchmark_protocols(loops: int = 40, fuzz_count: int = 2000, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """
+    Return system prompt tokens (function definitions included), mean prompt & completion tokens per loop & parse rates
+    for each command protocol.
+    - Tokens are counted with the scripted model's chars / 4 estimate, definitions as their JSON
+    """
+    import json
+    import tempfile
+    from command_gpt.command_gpt import CommandGPT
+    from command_gpt.prompting.prompt_generator import get_prompt
+    from command_gpt.tooling.toolkits import MemoryOnlyToolkit
+    from command_gpt.utils.command_parser import (
+        PROTOCOL_FUNCTIONS,
+        PROTOCOL_TEXT,
+        CommandGPTOutputParser,
+        FunctionCallOutputParser,
+    )
+    from command_gpt.utils.console_logger import ConsoleLogger
+    from command_gpt.utils.offline_models import HashEmbeddings, ScriptedChatModel
+    from command_gpt.utils.soak_test import SOAK_RULESET, SOAK_SCRIPT
+    from command_gpt.utils.vector_memory import create_vectorstore_retriever
+
+    parse_rates = {
+        PROTOCOL_TEXT: _run_parser(CommandGPTOutputParser().parse, build_parse_corpus(fuzz_count, seed)),
+        PROTOCOL_FUNCTIONS: _run_parser(FunctionCallOutputParser().parse, build_function_call_corpus(fuzz_count, seed),
+                                        reference=FunctionCallOutputParser()),
+    }
+    results = {}
+    previous_output = ConsoleLogger.output
+    with open(os.devnull, "w") as devnull:
+        ConsoleLogger.configure(output=devnull)
+        try:
+            for protocol in (PROTOCOL_TEXT, PROTOCOL_FUNCTIONS):
+                with tempfile.TemporaryDirectory(prefix="protocol-") as workspace:
+                    llm = ScriptedChatModel(responses=SOAK_SCRIPT)
+                    agent = CommandGPT.from_ruleset_and_tools(
+                        SOAK_RULESET,
+                        memory=create_vectorstore_retriever(HashEmbeddings()),
+                        tools=MemoryOnlyToolkit(
+                            workspace_dir=workspace, excluded_tools=["human_input"]).get_toolkit(),
+                        llm=llm,
+                        workspace_dir=workspace,
+                        protocol=protocol,
+                    )
+                    errors = []
+                    agent.subscribe(lambda event: errors.append(event) if event.command == "ERROR" else None)
+                    agent.run(max_loops=loops)
+                    prompt = agent.chain.prompt
+                    system_tokens = llm.get_num_tokens(get_prompt(prompt.ruleset, prompt.tools, protocol))
+                    if protocol == PROTOCOL_FUNCTIONS:
+                        system_tokens += llm.get_num_tokens(json.dumps(prompt.function_definitions))
+                    results[protocol] = {
+                        "system_tokens": system_tokens,
+                        "prompt_tokens": agent.prompt_tokens / agent.loop_count,
+                        "completion_tokens": agent.completion_tokens / agent.loop_count,
+                        "loop_parse_failures": len(errors),
+                        **parse_rates[protocol],
+                    }
+        finally:
+            ConsoleLogger.configure(output=previous_output)
+    return results
+
+# endregion
+# region Compressed Memory
+# - Synthetic clustered, normalized vectors (like OpenAI embeddings) with agent-memory-sized texts
+
+
+MEMORY_WORDS = ("agent", "search", "result", "file", "notes", "topic", "research", "paper", "trend", "summary",
+                "command", "write", "read", "directory", "found", "future", "analysis", "data", "model", "source")
+
+
+def _memory_corpus(entries: int, queries: int, dim: int, seed: int):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, entries // 50), dim)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=entries)] + rng.standard_normal((entries, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    texts = [
+        f"Assistant Reply: {' '.join(rng.choice(MEMORY_WORDS, size=60))} <cmd>read_file --file_path notes_{i}.md</cmd>"
+        f"\nResult: Command read_file returned: {' '.join(rng.choice(MEMORY_WORDS, size=120))}"
+        for i in range(entries)
+    ]
+    picks = vectors[rng.integers(entries, size=queries)]
+    query_vectors = picks + 0.05 * rng.standard_normal(picks.shape).astype(np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    return vectors, texts, query_vectors
+
+
+def benchmark_memory(entries: int = 5000, queries: int = 200, k: int = 4, seed: int = 0,
+                     shared_quantizer: bool = False) -> Dict[str, Dict[str, float]]:
+    """
+    Return bytes per entry (vectors, text & exact vectors on disk), query latency & recall@k against the float32
+    baseline for each compression mode.
+    - Stores under MEMORY_COMPRESSION_TRAIN_SIZE entries aren't compressed by int8 & pq on their own; with
+      shared_quantizer, they start with a quantizer trained on a separate corpus (as the memory server shares one)
+    """
+    from config import MEMORY_COMPRESSION_TRAIN_SIZE
+    from command_gpt.utils.compressed_memory import COMPRESSION_MODES, COMPRESSION_NONE, CompressedIndex, train_quantizer
+    from command_gpt.utils.offline_models import HashEmbeddings
+    from command_gpt.utils.vector_memory import EMBEDDING_SIZE, create_vectorstore_retriever
+
+    vectors, texts, query_vectors = _memory_corpus(entries, queries, EMBEDDING_SIZE, seed)
+    training = _memory_corpus(MEMORY_COMPRESSION_TRAIN_SIZE, 0, EMBEDDING_SIZE, seed + 1)[0] if shared_quantizer else None
+    baseline: List[List[str]] = []
+    results = {}
+    for mode in COMPRESSION_MODES:
+        store = create_vectorstore_retriever(HashEmbeddings(), compression=mode).vectorstore
+        if training is not None and isinstance(store.index, CompressedIndex):
+            store.index.use_quantizer(train_quantizer(EMBEDDING_SIZE, mode, training))
+        for start in range(0, entries, 100):
+            store.add_embeddings(list(zip(texts[start:start + 100], vectors[start:start + 100].tolist())))
+
+        latencies = []
+        found = []
+        for query in query_vectors.tolist():
+            start = time.perf_counter()
+            documents = store.similarity_search_by_vector(query, k=k)
+            latencies.append(time.perf_counter() - start)
+            found.append([document.page_content for document in documents])
+        if mode == COMPRESSION_NONE:
+            baseline = found
+        recall = statistics.mean(len(set(a) & set(b)) / k for a, b in zip(found, baseline))
+
+        index, docstore = store.index, store.docstore
+        if isinstance(index, CompressedIndex):
+            vector_bytes = index.memory_bytes()
+            text_bytes = docstore.text_bytes()
+            disk_bytes = index.ntotal * index.d * 4 if index._exact is not None else 0
+        else:
+            vector_bytes = index.ntotal * index.d * 4
+            text_bytes = sum(len(document.page_content.encode("utf-8")) for document in docstore._dict.values())
+            disk_bytes = 0
+        if isinstance(index, CompressedIndex):
+            index.close()
+        latencies.sort()
+        results[mode] = {
+            "vector_bytes": vector_bytes / entries,
+            "text_bytes": text_bytes / entries,
+            "disk_bytes": disk_bytes / entries,
+            "p50_ms": latencies[len(latencies) // 2] * 1000,
+            "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+            "recall": recall,
+        }
+    return results
+
+# endregion
+
+
+def _print_table(rows: List[List[str]]):
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CommandGPT benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    imports_parser = subparsers.add_parser(
+        "imports", help="Import & toolkit startup time")
+    imports_parser.add_argument("--runs", type=int, default=5)
+
+    parse_parser = subparsers.add_parser(
+        "parse", help="Command parser success rate & speed on a fuzz corpus")
+    parse_parser.add_argument("--fuzz-count", type=int, default=2000)
+    parse_parser.add_argument("--seed", type=int, default=0)
+
+    from config import (
+        SOAK_LOOPS,
+        SOAK_MAX_GROWTH_BYTES_PER_LOOP,
+        SOAK_MIN_RSS_LOOPS,
+        SOAK_SAMPLE_EVERY,
+        SOAK_WARMUP_LOOPS,
+    )
+    soak_parser = subparsers.add_parser(
+        "soak", help="Long offline agent run sampling RSS & tracemalloc; fails on per-loop memory growth")
+    soak_parser.add_argument("--loops", type=int, default=SOAK_LOOPS)
+    soak_parser.add_argument("--sample-every", type=int, default=SOAK_SAMPLE_EVERY)
+    soak_parser.add_argument("--warmup", type=int, default=SOAK_WARMUP_LOOPS)
+    soak_parser.add_argument("--max-growth", type=float, default=SOAK_MAX_GROWTH_BYTES_PER_LOOP,
+                             help="Max bytes of RSS growth per loop")
+    soak_parser.add_argument("--min-rss-loops", type=int, default=SOAK_MIN_RSS_LOOPS,
+                             help="Loops after warmup needed to judge RSS (shorter runs are judged on traced growth)")
+
+    hedge_parser = subparsers.add_parser(
+        "hedge", help="Tail latency of a stalling offline backend, alone & hedged with a backup")
+    hedge_parser.add_argument("--requests", type=int, default=100)
+    hedge_parser.add_argument("--stall-every", type=int, default=25)
+    hedge_parser.add_argument("--stall-seconds", type=float, default=1.0)
+
+    memory_parser = subparsers.add_parser(
+        "memory", help="Vector memory size, latency & recall per compression mode (see compressed_memory.py)")
+    memory_parser.add_argument("--entries", type=int, default=5000)
+    memory_parser.add_argument("--queries", type=int, default=200)
+    memory_parser.add_argument("--k", type=int, default=4)
+    memory_parser.add_argument("--shared-quantizer", action="store_true",
+                               help="Start int8 & pq stores with a pre-trained quantizer (e.g. small stores, --entries 200)")
+
+    protocol_parser = subparsers.add_parser(
+        "protocol", help="Prompt tokens & parse failures with <cmd> text vs native function calls")
+    protocol_parser.add_argument("--loops", type=int, default=40)
+    protocol_parser.add_argument("--fuzz-count", type=int, default=2000)
+    protocol_parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+
+    if args.benchmark == "imports":
+        results = benchmark_import_times(args.runs)
+        _print_table([["target", "median (ms)"]] + [
+            [name, f"{seconds * 1000:.1f}"] for name, seconds in results.items()
+        ])
+    elif args.benchmark == "parse":
+        results = benchmark_parsers(args.fuzz_count, args.seed)
+        _print_table([["parser", "parsed", "intact", "exceptions", "us/parse"]] + [
+            [name, f"{r['success_rate']:.1%}", f"{r['intact_rate']:.1%}",
+             str(r["exceptions"]), f"{r['us_per_parse']:.1f}"]
+            for name, r in results.items()
+        ])
+    elif args.benchmark == "soak":
+        from command_gpt.utils.soak_test import run_soak
+        result = run_soak(args.loops, args.sample_every,
+                          args.warmup, args.max_growth, min_rss_loops=args.min_rss_loops)
+        print_soak_result(result)
+        if not result.passed:
+            sys.exit(1)
+    elif args.benchmark == "memory":
+        results = benchmark_memory(args.entries, args.queries, args.k, shared_quantizer=args.shared_quantizer)
+        _print_table([["mode", "vector B/entry", "text B/entry", "disk B/entry", "p50 (ms)", "p95 (ms)", f"recall@{args.k}"]] + [
+            [mode, f"{r['vector_bytes']:.0f}", f"{r['text_bytes']:.0f}", f"{r['disk_bytes']:.0f}",
+             f"{r['p50_ms']:.2f}", f"{r['p95_ms']:.2f}", f"{r['recall']:.3f}"]
+            for mode, r in results.items()
+        ])
+    elif args.benchmark == "protocol":
+        results = benchmark_protocols(args.loops, args.fuzz_count, args.seed)
+        _print_table([["protocol", "system prompt tokens", "prompt tokens/loop", "completion tokens/loop",
+                       "loop parse failures", "fuzz parsed", "fuzz intact"]] + [
+            [name, str(r["system_tokens"]), f"{r['prompt_tokens']:.0f}", f"{r['completion_tokens']:.0f}",
+             str(r["loop_parse_failures"]), f"{r['success_rate']:.1%}", f"{r['intact_rate']:.1%}"]
+            for name, r in results.items()
+        ])
+    elif args.benchmark == "hedge":
+        results = benchmark_hedging(args.requests, args.stall_every, args.stall_seconds)
+        _print_table([["mode", "p50 (ms)", "p95 (ms)", "p99 (ms)", "max (ms)", "hedges", "hedge wins"]] + [
+            [name, *(f"{r[key] * 1000:.0f}" for key in ("p50", "p95", "p99", "max")),
+             str(r["hedges"]), str(r["hedge_wins"])]
+            for name, r in results.items()
+        ])
+
+
+if __name__ == "__main__":
+    main()
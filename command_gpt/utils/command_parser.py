@@ -1,20 +1,46 @@
-import itertools
 from abc import abstractmethod
+import ast
+import json
 import re
-import shlex
-from typing import Dict, NamedTuple
+from typing import Any, Dict, List, NamedTuple, Tuple
 
-from langchain.schema import BaseOutputParser
+from langchain.schema import BaseMessage, BaseOutputParser
 
 # Command response format
 COMMAND_LINE_START = "<cmd>"
 COMMAND_LINE_END = "</cmd>"
 COMMAND_FORMAT = f"{COMMAND_LINE_START} command_name --arg1 value1 --arg2 value2{COMMAND_LINE_END}"
 
+# Command protocols (COMMAND_PROTOCOL in config.py): a <cmd> line in the reply text, or a native function call
+PROTOCOL_TEXT = "text"
+PROTOCOL_FUNCTIONS = "functions"
+PROTOCOLS = [PROTOCOL_TEXT, PROTOCOL_FUNCTIONS]
+# Where a reply's function call ({"name": ..., "arguments": "<JSON>"}) is kept in the AIMessage's additional_kwargs
+FUNCTION_CALL_KEY = "function_call"
+# Some models prefix the function name with its namespace
+FUNCTION_NAME_PREFIX = "functions."
+CODE_FENCE_PATTERN = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+# Positional (un-flagged) arguments are mapped to this key, which single-input LangChain Tools accept
+DEFAULT_ARG_NAME = "tool_input"
+
+QUOTE_CHARS = "\"'"
+# A quote only closes a value if what follows is the end, another flag, or another quoted value.
+# This lets quotes & apostrophes appear inside values without escaping (e.g. --text "It's "fine"")
+CLOSING_QUOTE_FOLLOWER = re.compile(r"\s*$|\s+(?:-|[\"'])")
+ESCAPED_QUOTE = re.compile(r"\\([\\\"'])")
+
 
 class GPTCommand(NamedTuple):
     name: str
     args: Dict
+    # Descriptions of any local repairs applied while parsing (empty for well-formed commands)
+    repairs: Tuple[str, ...] = ()
+
+
+class CommandToken(NamedTuple):
+    text: str
+    quoted: bool
 
 
 class BaseCommandGPTOutputParser(BaseOutputParser):
@@ -22,6 +48,10 @@ class BaseCommandGPTOutputParser(BaseOutputParser):
     def parse(self, text: str) -> GPTCommand:
         """Return GPTCommand"""
 
+    def parse_message(self, message: BaseMessage) -> GPTCommand:
+        """Return GPTCommand from the reply message (its text, unless the protocol carries the command elsewhere)"""
+        return self.parse(message.content)
+
 
 def preprocess_json_input(input_str: str) -> str:
     """
@@ -34,45 +64,230 @@ def preprocess_json_input(input_str: str) -> str:
     return corrected_str
 
 
+def _find_closing_quote(text: str, start: int, quote: str) -> int:
+    """
+    Return the index of the quote closing a value that opened before start, or -1 if it is never closed.
+    """
+    index = text.find(quote, start)
+    while index != -1:
+        # Count preceding backslashes; an odd number means the quote is escaped
+        backslashes = 0
+        while index - backslashes - 1 >= start and text[index - backslashes - 1] == "\\":
+            backslashes += 1
+        if backslashes % 2 == 0 and CLOSING_QUOTE_FOLLOWER.match(text, index + 1):
+            return index
+        index = text.find(quote, index + 1)
+    return -1
+
+
+def tokenize_command(cmd_str: str) -> Tuple[List[CommandToken], List[str]]:
+    """
+    Split a command line into tokens in a single pass, tolerating what shlex rejects.
+    - Quoted values may span lines & contain unescaped quotes/apostrophes (see CLOSING_QUOTE_FOLLOWER).
+    - --flag=value is split into a flag & a value token.
+    - An unbalanced quote runs to the end of the command (recorded as a repair).
+    Returns the tokens & a list of repairs made.
+    """
+    tokens: List[CommandToken] = []
+    repairs: List[str] = []
+    length = len(cmd_str)
+    i = 0
+    while i < length:
+        char = cmd_str[i]
+        if char.isspace():
+            i += 1
+            continue
+
+        if char in QUOTE_CHARS:
+            end = _find_closing_quote(cmd_str, i + 1, char)
+            if end == -1:
+                repairs.append(f"closed unbalanced {char} quote")
+                value = cmd_str[i + 1:].rstrip()
+                tokens.append(CommandToken(ESCAPED_QUOTE.sub(r"\1", value), True))
+                break
+            tokens.append(CommandToken(ESCAPED_QUOTE.sub(r"\1", cmd_str[i + 1:end]), True))
+            i = end + 1
+            continue
+
+        # Bare token runs to the next whitespace
+        j = i
+        while j < length and not cmd_str[j].isspace():
+            j += 1
+        token = cmd_str[i:j]
+        if token.startswith("-") and "=" in token:
+            # --flag=value: emit the flag, then parse the value (which may be quoted) as the next token
+            flag_end = i + token.index("=")
+            tokens.append(CommandToken(cmd_str[i:flag_end], False))
+            i = flag_end + 1
+            continue
+        tokens.append(CommandToken(token, False))
+        i = j
+    return tokens, repairs
+
+
+def _is_flag(token: CommandToken) -> bool:
+    return not token.quoted and len(token.text) > 1 and token.text.startswith("-") and token.text.lstrip("-")[:1].isalpha()
+
+
+def build_command(tokens: List[CommandToken], repairs: List[str]) -> GPTCommand:
+    """
+    Map tokens to a GPTCommand, repairing common mistakes:
+    - Several unquoted words after a flag are joined into one value.
+    - A flag with no value is set to "true".
+    - Values before any flag are mapped to DEFAULT_ARG_NAME.
+    """
+    command_name = tokens[0].text
+    args: Dict[str, str] = {}
+    arg_name = None
+    values: List[str] = []
+
+    def commit():
+        if arg_name is None:
+            if values:
+                repairs.append(f"mapped positional value to --{DEFAULT_ARG_NAME}")
+                args[DEFAULT_ARG_NAME] = " ".join(values)
+            return
+        if not values:
+            repairs.append(f"set bare --{arg_name} to true")
+            args[arg_name] = "true"
+            return
+        if len(values) > 1:
+            repairs.append(f"joined {len(values)} unquoted values for --{arg_name}")
+        args[arg_name] = " ".join(values)
+
+    for token in tokens[1:]:
+        if _is_flag(token):
+            commit()
+            # Remove '--' from argument names
+            arg_name = token.text.lstrip("-")
+            values = []
+        else:
+            values.append(token.text)
+    commit()
+    return GPTCommand(name=command_name, args=args, repairs=tuple(repairs))
+
+
 class CommandGPTOutputParser(BaseCommandGPTOutputParser):
     """
     Custom Parser for CommandGPT that extracts the command string from the response and maps it to a GPTCommand.
+    - Recoverable mistakes (missing </cmd>, unbalanced quotes, apostrophes, unquoted values) are repaired locally instead of costing a retry loop.
     """
 
     def parse(self, text: str) -> GPTCommand:
         try:
+            repairs: List[str] = []
             start_index = text.find(COMMAND_LINE_START)
-            end_index = text.find(
-                COMMAND_LINE_END, start_index + len(COMMAND_LINE_START))
-
-            if start_index == -1 or end_index == -1:
+            if start_index == -1:
                 raise ValueError(
                     f"Invalid command line format. Expected '{COMMAND_LINE_START}' and '{COMMAND_LINE_END}'")
 
+            end_index = text.find(
+                COMMAND_LINE_END, start_index + len(COMMAND_LINE_START))
+            if end_index == -1:
+                # Treat the rest of the response as the command
+                repairs.append(f"added missing {COMMAND_LINE_END}")
+                end_index = len(text)
+
             # Extract the command string, stripping any leading/trailing whitespace or newline characters
             cmd_str = text[start_index +
                            len(COMMAND_LINE_START):end_index].strip()
 
-            # If the command string starts with a newline, remove it
-            if cmd_str.startswith('\n'):
-                cmd_str = cmd_str[1:]
-
-            # Use shlex.split to handle quoted arguments correctly
-            cmd_str_splitted = shlex.split(cmd_str)
-
-            if len(cmd_str_splitted) < 1:
+            tokens, tokenize_repairs = tokenize_command(cmd_str)
+            if len(tokens) < 1:
                 raise ValueError(
                     "Command line format error: Missing command name")
 
-            command_name = cmd_str_splitted.pop(0)
-            command_args = dict(itertools.zip_longest(
-                *[iter(cmd_str_splitted)] * 2, fillvalue=""))
+            return build_command(tokens, repairs + tokenize_repairs)
+        except Exception as e:
+            # If there is any error in parsing, return an error command
+            return GPTCommand(name="ERROR", args={"error": str(e)})
 
-            # Remove '--' from argument names
-            command_args = {arg.lstrip(
-                '-'): value for arg, value in command_args.items()}
+    def get_format_instructions(self) -> str:
+        return f"Improperly formatted command line. Proper formatting:\n\n {COMMAND_FORMAT}"
+
+
+def _load_arguments(arguments: Any, repairs: List[str]) -> Dict:
+    """
+    Load a function call's JSON arguments, repairing what models commonly get wrong:
+    - Code fences, unescaped backslashes, text after the object & Python-style (single-quoted) dicts
+    - Arguments cut off at the end (closed, or cut back to the last complete argument)
+    - Raw newlines & tabs inside strings are accepted as is (strict=False)
+    """
+    if isinstance(arguments, dict):
+        return arguments
+    raw = (arguments or "").strip()
+    text = CODE_FENCE_PATTERN.sub("", raw).strip()
+    if text != raw:
+        repairs.append("removed code fence around arguments")
+    text = text or "{}"
+
+    candidates = [(text, [])]
+    escaped = preprocess_json_input(text)
+    if escaped != text:
+        candidates.append((escaped, ["escaped backslashes in arguments"]))
+    truncated = "closed truncated arguments"
+    for candidate, candidate_repairs in list(candidates):
+        candidates.append((candidate + "}", candidate_repairs + [truncated]))
+        candidates.append((candidate + "\"}", candidate_repairs + [truncated]))
+    last_pair = text.rfind(', "')
+    if last_pair > 0:
+        candidates.append((text[:last_pair] + "}", [truncated]))
+
+    decoder = json.JSONDecoder(strict=False)
+    for candidate, candidate_repairs in candidates:
+        try:
+            args, end = decoder.raw_decode(candidate)
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(args, dict):
+            raise ValueError("Function call format error: arguments must be a JSON object")
+        repairs.extend(candidate_repairs)
+        if candidate[end:].strip():
+            repairs.append("ignored text after arguments")
+        return args
 
-            return GPTCommand(name=command_name, args=command_args)
+    try:
+        args = ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        args = None
+    if not isinstance(args, dict):
+        raise ValueError("Function call format error: arguments are not valid JSON")
+    repairs.append("read single-quoted arguments")
+    return args
+
+
+class FunctionCallOutputParser(BaseCommandGPTOutputParser):
+    """
+    Parser for the function-call protocol: maps the reply's function call (name & JSON arguments) to a GPTCommand.
+    - Recoverable mistakes (code fences, unescaped backslashes, truncated arguments, a "functions." prefix) are repaired locally.
+    - parse() takes a serialized call ({"name": ..., "arguments": ...}), e.g. from a log or benchmark corpus.
+    """
+
+    def parse(self, text: str) -> GPTCommand:
+        try:
+            return self.parse_call(json.loads(text))
         except Exception as e:
-            # If there is any error in parsing, return an error command
             return GPTCommand(name="ERROR", args={"error": str(e)})
+
+    def parse_message(self, message: BaseMessage) -> GPTCommand:
+        call = message.additional_kwargs.get(FUNCTION_CALL_KEY)
+        if not call:
+            return GPTCommand(name="ERROR", args={"error": "Response did not call a function"})
+        return self.parse_call(call)
+
+    def parse_call(self, call: Dict) -> GPTCommand:
+        try:
+            repairs: List[str] = []
+            name = str(call.get("name") or "").strip()
+            if name.startswith(FUNCTION_NAME_PREFIX):
+                repairs.append(f"removed {FUNCTION_NAME_PREFIX} prefix")
+                name = name[len(FUNCTION_NAME_PREFIX):]
+            if not name:
+                raise ValueError("Function call format error: Missing function name")
+            args = _load_arguments(call.get("arguments"), repairs)
+            return GPTCommand(name=name, args=args, repairs=tuple(repairs))
+        except Exception as e:
+            return GPTCommand(name="ERROR", args={"error": str(e)})
+
+    def get_format_instructions(self) -> str:
+        return "Improperly formatted function call. Call exactly one of the provided functions, with its arguments as a JSON object."
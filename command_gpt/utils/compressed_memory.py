@@ -0,0 +1,296 @@
+# Compressed vector memory: quantized FAISS indexes (fp16, int8 or product quantization) & a zlib-compressed docstore
+
+import tempfile
+import threading
+import zlib
+from typing import Dict, List, Union
+
+import numpy as np
+from langchain.docstore.base import AddableMixin, Docstore
+from langchain.docstore.document import Document
+
+from config import (
+    MEMORY_COMPRESSION_TRAIN_SIZE,
+    MEMORY_PQ_BITS,
+    MEMORY_PQ_SUBQUANTIZERS,
+    MEMORY_RERANK_FACTOR,
+    MEMORY_TEXT_COMPRESSION_LEVEL,
+)
+
+# Compression modes (MEMORY_COMPRESSION in config.py)
+COMPRESSION_NONE = "none"
+COMPRESSION_FP16 = "fp16"
+COMPRESSION_INT8 = "int8"
+COMPRESSION_PQ = "pq"
+COMPRESSION_MODES = [COMPRESSION_NONE, COMPRESSION_FP16, COMPRESSION_INT8, COMPRESSION_PQ]
+# Modes lossy enough that results are re-ranked against the exact vectors
+RERANKED_MODES = {COMPRESSION_INT8, COMPRESSION_PQ}
+# Codes decoded at once when scanning an index that uses a shared quantizer (bounds the float32 scratch memory)
+DECODE_BATCH_SIZE = 1024
+
+
+class _VectorFile:
+    """
+    Append-only float32 rows in an anonymous temporary file, read back a few rows at a time for re-ranking.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.row_bytes = dim * 4
+        self.rows = 0
+        self._file = tempfile.TemporaryFile(prefix="gpt-memory-")
+        self._lock = threading.Lock()
+
+    def append(self, vectors: np.ndarray):
+        data = np.ascontiguousarray(vectors, dtype=np.float32).tobytes()
+        with self._lock:
+            self._file.seek(0, 2)
+            self._file.write(data)
+            self.rows += len(vectors)
+
+    def read(self, ids: List[int]) -> np.ndarray:
+        rows = np.empty((len(ids), self.dim), dtype=np.float32)
+        with self._lock:
+            self._file.flush()
+            for row, vector_id in enumerate(ids):
+                self._file.seek(vector_id * self.row_bytes)
+                rows[row] = np.frombuffer(self._file.read(self.row_bytes), dtype=np.float32)
+        return rows
+
+    def close(self):
+        self._file.close()
+
+
+class CompressedIndex:
+    """
+    L2 index storing quantized vectors, used in place of faiss.IndexFlatL2 by langchain's FAISS vectorstore
+    (add, search, reconstruct & ntotal).
+    - fp16 & int8 use a scalar quantizer (2 & 1 bytes per dimension); pq uses product quantization (subquantizers * bits / 8 bytes)
+    - int8 & pq need training: vectors are kept in an exact flat index until train_size have been added, then the
+      quantizer is trained on them & they're moved over. Stores smaller than train_size are never compressed on their
+      own; use_quantizer() switches them to a quantizer trained elsewhere & shared by reference (the memory server
+      shares one across agents), keeping only this index's codes, which are scanned by decoding them in batches
+    - For int8 & pq, exact float32 vectors are kept in a temporary file (not in memory) & the rerank_factor * k nearest
+      candidates from the quantized index are re-ranked by their exact distances
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        mode: str = COMPRESSION_PQ,
+        rerank_factor: int = MEMORY_RERANK_FACTOR,
+        train_size: int = MEMORY_COMPRESSION_TRAIN_SIZE,
+        pq_subquantizers: int = MEMORY_PQ_SUBQUANTIZERS,
+        pq_bits: int = MEMORY_PQ_BITS,
+    ):
+        import faiss
+
+        self.d = dim
+        self.mode = mode
+        self.rerank_factor = max(1, rerank_factor)
+        self.train_size = train_size
+        self.index = _new_quantized_index(dim, mode, pq_subquantizers, pq_bits)
+        # Exact vectors waiting for training (None once trained)
+        self._pending = None if self.index.is_trained else faiss.IndexFlatL2(dim)
+        # Shared quantizer (see use_quantizer) & this index's codes from it
+        self._shared = None
+        self._codes = np.empty((0, 0), dtype=np.uint8)
+        self._exact = _VectorFile(dim) if mode in RERANKED_MODES else None
+        self._lock = threading.RLock()
+
+    @property
+    def ntotal(self) -> int:
+        with self._lock:
+            return self.index.ntotal + len(self._codes) + (self._pending.ntotal if self._pending is not None else 0)
+
+    @property
+    def is_trained(self) -> bool:
+        return self._pending is None
+
+    def add(self, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self._exact is not None:
+                self._exact.append(vectors)
+            if self._shared is not None:
+                self._codes = np.concatenate([self._codes, self._shared.sa_encode(vectors)])
+                return
+            if self._pending is None:
+                self.index.add(vectors)
+                return
+            self._pending.add(vectors)
+            if self._pending.ntotal >= self.train_size:
+                self._train()
+
+    def search(self, queries: np.ndarray, k: int):
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        with self._lock:
+            if self._pending is not None:
+                return self._pending.search(queries, k)
+            if self._exact is None:
+                return self.index.search(queries, k)
+            if self._shared is not None:
+                candidates = self._scan_codes(queries, k * self.rerank_factor)
+            else:
+                _, candidates = self.index.search(queries, k * self.rerank_factor)
+        return self._rerank(queries, candidates, k)
+
+    def reconstruct(self, vector_id: int) -> np.ndarray:
+        with self._lock:
+            if self._exact is not None:
+                return self._exact.read([vector_id])[0]
+            if self._pending is not None:
+                return self._pending.reconstruct(vector_id)
+            return self.index.reconstruct(vector_id)
+
+    def use_quantizer(self, quantizer) -> bool:
+        """
+        Switch an untrained int8 or pq index to quantizer (a trained index of the same mode, see train_quantizer),
+        encoding the vectors waiting for training. The quantizer is shared, not copied: only its codes are kept here.
+        Returns False if this index is already trained.
+        """
+        if quantizer.d != self.d:
+            raise ValueError(f"Quantizer has {quantizer.d} dimensions, index has {self.d}")
+        with self._lock:
+            if self._pending is None or self._exact is None:
+                return False
+            self._codes = quantizer.sa_encode(self.pending_vectors())
+            self._shared = quantizer
+            self._pending = None
+            return True
+
+    def pending_vectors(self) -> np.ndarray:
+        """Copy of the vectors waiting for training (empty once trained)."""
+        with self._lock:
+            if self._pending is None or not self._pending.ntotal:
+                return np.empty((0, self.d), dtype=np.float32)
+            return self._pending.reconstruct_n(0, self._pending.ntotal)
+
+    def close(self):
+        """Delete the temporary file of exact vectors (the index can't be searched or added to afterwards)."""
+        with self._lock:
+            if self._exact is not None:
+                self._exact.close()
+
+    def memory_bytes(self) -> int:
+        """
+        Approximate resident bytes of the vectors (codes, codebooks & untrained vectors; not the exact vectors on disk or
+        a shared quantizer's codebook).
+        """
+        import faiss
+        with self._lock:
+            if self._shared is not None:
+                return self._codes.nbytes
+            codes = self.index.ntotal * self.index.sa_code_size()
+            if isinstance(self.index, faiss.IndexPQ) and self.index.is_trained:
+                pq = self.index.pq
+                codes += pq.M * pq.ksub * pq.dsub * 4
+            pending = self._pending.ntotal * self.d * 4 if self._pending is not None else 0
+        return codes + pending
+
+    # region Helpers
+
+    def _train(self):
+        training = self._pending.reconstruct_n(0, self._pending.ntotal)
+        self.index.train(training)
+        self.index.add(training)
+        self._pending = None
+
+    def _scan_codes(self, queries: np.ndarray, n: int) -> np.ndarray:
+        """Ids of the n nearest codes (by decoded vector) for each query, padded with -1."""
+        distances = np.empty((len(queries), len(self._codes)), dtype=np.float32)
+        query_norms = (queries ** 2).sum(axis=1)[:, None]
+        for start in range(0, len(self._codes), DECODE_BATCH_SIZE):
+            decoded = self._shared.sa_decode(self._codes[start:start + DECODE_BATCH_SIZE])
+            distances[:, start:start + len(decoded)] = (
+                query_norms - 2 * queries @ decoded.T + (decoded ** 2).sum(axis=1)[None, :])
+        candidates = np.full((len(queries), n), -1, dtype=np.int64)
+        if len(self._codes):
+            nearest = np.argsort(distances, axis=1)[:, :n]
+            candidates[:, :nearest.shape[1]] = nearest
+        return candidates
+
+    def _rerank(self, queries: np.ndarray, candidates: np.ndarray, k: int):
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, (query, ids) in enumerate(zip(queries, candidates)):
+            ids = [int(i) for i in ids if i != -1]
+            if not ids:
+                continue
+            exact = self._exact.read(ids)
+            exact_distances = ((exact - query) ** 2).sum(axis=1)
+            order = np.argsort(exact_distances)[:k]
+            distances[row, :len(order)] = exact_distances[order]
+            indices[row, :len(order)] = np.array(ids)[order]
+        return distances, indices
+
+    # endregion
+
+
+class CompressedDocstore(Docstore, AddableMixin):
+    """
+    Docstore keeping each document's text zlib-compressed (metadata is kept as is).
+    """
+
+    def __init__(self, level: int = MEMORY_TEXT_COMPRESSION_LEVEL):
+        self.level = level
+        self._dict: Dict[str, tuple] = {}
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        overlapping = set(texts).intersection(self._dict)
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        for doc_id, document in texts.items():
+            self._dict[doc_id] = (
+                zlib.compress(document.page_content.encode("utf-8"), self.level), document.metadata)
+
+    def search(self, search: str) -> Union[str, Document]:
+        if search not in self._dict:
+            return f"ID {search} not found."
+        text, metadata = self._dict[search]
+        return Document(page_content=zlib.decompress(text).decode("utf-8"), metadata=metadata)
+
+    def text_bytes(self) -> int:
+        return sum(len(text) for text, _ in self._dict.values())
+
+
+def _new_quantized_index(dim: int, mode: str, pq_subquantizers: int = MEMORY_PQ_SUBQUANTIZERS,
+                         pq_bits: int = MEMORY_PQ_BITS):
+    import faiss
+
+    if mode not in COMPRESSION_MODES or mode == COMPRESSION_NONE:
+        raise ValueError(f"Unknown compression mode '{mode}'")
+    if mode == COMPRESSION_PQ:
+        if dim % pq_subquantizers:
+            raise ValueError(f"{dim} dimensions don't split into {pq_subquantizers} subquantizers")
+        index = faiss.IndexPQ(dim, pq_subquantizers, pq_bits)
+        # Train on what's there rather than warning about fewer than 39 points per centroid
+        index.pq.cp.min_points_per_centroid = 1
+        return index
+    quantizer = faiss.ScalarQuantizer.QT_fp16 if mode == COMPRESSION_FP16 else faiss.ScalarQuantizer.QT_8bit
+    return faiss.IndexScalarQuantizer(dim, quantizer, faiss.METRIC_L2)
+
+
+def train_quantizer(dim: int, mode: str, vectors: np.ndarray):
+    """
+    Return an empty faiss index for mode, trained on vectors, to share across CompressedIndexes (see use_quantizer).
+    """
+    index = _new_quantized_index(dim, mode)
+    if not index.is_trained:
+        index.train(np.ascontiguousarray(vectors, dtype=np.float32))
+    return index
+
+
+def create_index(dim: int, mode: str):
+    """Return a faiss.IndexFlatL2 for mode "none", otherwise a CompressedIndex."""
+    if mode == COMPRESSION_NONE:
+        import faiss
+        return faiss.IndexFlatL2(dim)
+    return CompressedIndex(dim, mode)
+
+
+def create_docstore(mode: str) -> Docstore:
+    if mode == COMPRESSION_NONE:
+        from langchain.docstore import InMemoryDocstore
+        return InMemoryDocstore({})
+    return CompressedDocstore()
@@ -1,10 +1,19 @@
+import json
 import sys
+import threading
+import time
+from typing import Optional, TextIO
+
+from config import CONSOLE_FLUSH_BYTES, CONSOLE_FLUSH_INTERVAL_SECONDS, CONSOLE_HEADLESS, LOG_FULL_PROMPT
 
 
 class ConsoleLogger:
     """
     This class handles console logging in various colors consistently across the project.
     Additionally, handles coloring streamed output from the Language Models, which is only available on select LLMs
+    - Streamed tokens are buffered & flushed by size/time rather than written (and flushed) one at a time.
+    - set_agent_prefix() tags output from the current thread so several agents can share one console.
+    - Headless mode (configure(headless=True)) emits compact JSONL events instead of colored text.
     """
 
     # ANSI color codes
@@ -20,48 +29,104 @@ class ConsoleLogger:
     COLOR_TOOL = COLOR_MAGENTA
     COLOR_ERROR = COLOR_RED
 
-    # Controls the color of streamed output
-    current_stream_color = COLOR_RESET
+    # Render settings (see configure())
+    headless = CONSOLE_HEADLESS
+    output: Optional[TextIO] = None  # None writes to the current sys.stdout
+    flush_interval = CONSOLE_FLUSH_INTERVAL_SECONDS
+    flush_bytes = CONSOLE_FLUSH_BYTES
+
+    # Per-thread stream state (color, buffered tokens, agent prefix)
+    _local = threading.local()
+    _write_lock = threading.Lock()
+
+    # region Configuration
+
+    @staticmethod
+    def configure(
+        headless: Optional[bool] = None,
+        output: Optional[TextIO] = None,
+        flush_interval: Optional[float] = None,
+        flush_bytes: Optional[int] = None,
+    ):
+        """
+        Change render settings for all threads. Pending streamed output is flushed first.
+        """
+        ConsoleLogger.flush()
+        if headless is not None:
+            ConsoleLogger.headless = headless
+        if output is not None:
+            ConsoleLogger.output = output
+        if flush_interval is not None:
+            ConsoleLogger.flush_interval = flush_interval
+        if flush_bytes is not None:
+            ConsoleLogger.flush_bytes = flush_bytes
+
+    @staticmethod
+    def set_agent_prefix(agent: Optional[str]):
+        """
+        Tag all output from the current thread with agent (None to clear).
+        """
+        ConsoleLogger.flush()
+        ConsoleLogger._state().agent = agent
+
+    @staticmethod
+    def get_agent_prefix() -> Optional[str]:
+        return ConsoleLogger._state().agent
 
+    # endregion
     # region Logging Methods
     # - These methods are used to control the color of output & input
 
     @staticmethod
-    def log(message, color = COLOR_RESET, prefix=""):
-        ConsoleLogger.current_stream_color = ConsoleLogger.COLOR_RESET
+    def log(message, color=COLOR_RESET, prefix=""):
+        ConsoleLogger.set_default_stream_color()
         if prefix:
-            print(f"{color}{prefix}: {message}{ConsoleLogger.COLOR_RESET}")
+            ConsoleLogger._log_line("log", f"{prefix}: {message}", color)
         else:
-            print(f"{color}{message}{ConsoleLogger.COLOR_RESET}")
+            ConsoleLogger._log_line("log", message, color)
 
     @staticmethod
     def input(message, color=COLOR_INPUT):
+        ConsoleLogger.flush()
         user_input = input(f"{ConsoleLogger.COLOR_CYAN}{message}")
         return user_input
 
     @staticmethod
     def log_input(input_text):
-        print(
-            f"{ConsoleLogger.COLOR_INPUT}INPUT: {input_text}{ConsoleLogger.COLOR_RESET}")
+        ConsoleLogger._log_line(
+            "input", f"INPUT: {input_text}", ConsoleLogger.COLOR_INPUT)
 
     @staticmethod
     def log_thinking():
-        print(
-            f"\n{ConsoleLogger.COLOR_THINKING}Thinking...{ConsoleLogger.COLOR_RESET}\n")
+        ConsoleLogger._log_line(
+            "thinking", "\nThinking...\n", ConsoleLogger.COLOR_THINKING)
 
     @staticmethod
     def log_response(response_text):
-        print(
-            f"{ConsoleLogger.COLOR_REPSONSE}RESPONSE: {response_text}{ConsoleLogger.COLOR_RESET}")
+        ConsoleLogger._log_line(
+            "response", f"RESPONSE: {response_text}", ConsoleLogger.COLOR_REPSONSE)
 
     @staticmethod
     def log_tool(tool_text):
-        print(f"{ConsoleLogger.COLOR_TOOL}TOOL: {tool_text}{ConsoleLogger.COLOR_RESET}")
+        ConsoleLogger._log_line(
+            "tool", f"TOOL: {tool_text}", ConsoleLogger.COLOR_TOOL)
 
     @staticmethod
     def log_error(error_text):
-        print(
-            f"{ConsoleLogger.COLOR_ERROR}ERROR: {error_text}{ConsoleLogger.COLOR_RESET}")
+        ConsoleLogger._log_line(
+            "error", f"ERROR: {error_text}", ConsoleLogger.COLOR_ERROR)
+
+    @staticmethod
+    def log_prompt(prompt_text):
+        """
+        Log a full prompt. Headless mode (or LOG_FULL_PROMPT = False) records only its size.
+        """
+        if ConsoleLogger.headless or not LOG_FULL_PROMPT:
+            ConsoleLogger._log_line(
+                "prompt", f"PROMPT: {len(prompt_text)} chars", ConsoleLogger.COLOR_INPUT)
+        else:
+            ConsoleLogger.log(
+                f"\nFULL PROMPT:\n\n{prompt_text}", ConsoleLogger.COLOR_INPUT)
 
     # endregion
     # region Streamed output
@@ -69,13 +134,54 @@ class ConsoleLogger:
 
     @staticmethod
     def log_streaming(token: str):
-        sys.stdout.write(ConsoleLogger.current_stream_color +
-                         token + ConsoleLogger.COLOR_RESET)
-        sys.stdout.flush()
+        state = ConsoleLogger._state()
+        state.buffer.append(token)
+        state.buffer_size += len(token)
+        if state.buffer_size >= ConsoleLogger.flush_bytes or time.monotonic() - state.last_flush >= ConsoleLogger.flush_interval:
+            ConsoleLogger.flush()
+
+    @staticmethod
+    def flush():
+        """
+        Write out any buffered stream tokens for the current thread.
+        """
+        state = ConsoleLogger._state()
+        state.last_flush = time.monotonic()
+        if not state.buffer:
+            return
+        text = "".join(state.buffer)
+        state.buffer = []
+        state.buffer_size = 0
+
+        if ConsoleLogger.headless:
+            ConsoleLogger._write_event("stream", text)
+            return
+
+        if state.agent:
+            # Prefix each new line so interleaved agents stay readable
+            line_prefix = f"[{state.agent}] "
+            if state.at_line_start:
+                text = line_prefix + text
+            text = text[:-1].replace("\n", "\n" + line_prefix) + text[-1]
+        state.at_line_start = text.endswith("\n")
+        ConsoleLogger._write(state.stream_color + text + ConsoleLogger.COLOR_RESET)
+
+    @staticmethod
+    def end_stream():
+        """
+        Prints an empty line & resets the stream color once a stream finishes (or is cut short).
+        """
+        ConsoleLogger.flush()
+        if not ConsoleLogger.headless:
+            ConsoleLogger._write("\n\n")
+            ConsoleLogger._state().at_line_start = True
+        ConsoleLogger.set_default_stream_color()
 
     @staticmethod
     def set_stream_color(color: str):
-        ConsoleLogger.current_stream_color = color
+        # Flush first so buffered tokens keep the color they were streamed with
+        ConsoleLogger.flush()
+        ConsoleLogger._state().stream_color = color
 
     @staticmethod
     def set_response_stream_color():
@@ -86,3 +192,45 @@ class ConsoleLogger:
         ConsoleLogger.set_stream_color(ConsoleLogger.COLOR_RESET)
 
     # endregion
+    # region Helpers
+
+    @staticmethod
+    def _state():
+        state = ConsoleLogger._local
+        if not hasattr(state, "buffer"):
+            state.buffer = []
+            state.buffer_size = 0
+            state.last_flush = time.monotonic()
+            state.stream_color = ConsoleLogger.COLOR_RESET
+            state.agent = None
+            state.at_line_start = True
+        return state
+
+    @staticmethod
+    def _log_line(event: str, text: str, color: str):
+        ConsoleLogger.flush()
+        if ConsoleLogger.headless:
+            ConsoleLogger._write_event(event, text.strip("\n"))
+            return
+        state = ConsoleLogger._state()
+        if state.agent:
+            text = "\n".join(f"[{state.agent}] {line}" for line in text.split("\n"))
+        ConsoleLogger._write(f"{color}{text}{ConsoleLogger.COLOR_RESET}\n")
+        state.at_line_start = True
+
+    @staticmethod
+    def _write_event(event: str, text: str):
+        record = {"ts": round(time.time(), 3), "event": event, "text": text}
+        agent = ConsoleLogger._state().agent
+        if agent:
+            record["agent"] = agent
+        ConsoleLogger._write(json.dumps(record) + "\n")
+
+    @staticmethod
+    def _write(text: str):
+        output = ConsoleLogger.output or sys.stdout
+        with ConsoleLogger._write_lock:
+            output.write(text)
+            output.flush()
+
+    # endregion
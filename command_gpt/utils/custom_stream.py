@@ -1,14 +1,21 @@
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, Optional, Union
 
 from langchain.schema import AgentAction, LLMResult
+from langchain.callbacks.base import BaseCallbackHandler
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 
+from command_gpt.utils.command_parser import COMMAND_LINE_END, COMMAND_LINE_START
 from command_gpt.utils.console_logger import ConsoleLogger
 
+CONTEXT_START = "<context>"
+CONTEXT_END = "</context>"
+# Enough already-scanned text to catch any tag split across tokens
+TAG_OVERLAP = max(len(tag) for tag in (COMMAND_LINE_START, COMMAND_LINE_END, CONTEXT_START, CONTEXT_END))
+
 
 class CustomStreamCallback(StreamingStdOutCallbackHandler):
     """
-    Custom callback handler that uses ConsoleLogger log output & color streamed output from current_stream_color
+    Custom callback handler that uses ConsoleLogger log output & color streamed output with the current thread's stream color
     """
 
     def on_llm_start(
@@ -27,8 +34,7 @@ class CustomStreamCallback(StreamingStdOutCallbackHandler):
         """
         Resets stream color and prints an empty line on LLM stream end.
         """
-        print("\n")
-        ConsoleLogger.set_default_stream_color()
+        ConsoleLogger.end_stream()
 
     def on_agent_action(self, action: AgentAction, **kwargs: Any) -> Any:
         ConsoleLogger.log_tool(f"Agent action: {action}")
@@ -45,3 +51,71 @@ class CustomStreamCallback(StreamingStdOutCallbackHandler):
         self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any
     ) -> None:
         ConsoleLogger.log_error(f"Tool error: {error}")
+
+
+class CommandComplete(BaseException):
+    """
+    Raised from CommandStreamDetector to abort an LLM stream once the command is complete.
+    - Derives from BaseException because LangChain's callback manager logs & swallows Exceptions raised by handlers.
+    """
+
+    def __init__(self, text: str):
+        super().__init__("Command complete")
+        self.text = text
+
+
+class CommandStreamDetector(BaseCallbackHandler):
+    """
+    Watches streamed tokens for a complete <cmd>...</cmd> (and <context>...</context>) as they arrive.
+    - If stop_on_command is set, raises CommandComplete as soon as </cmd> streams in, cutting generation short so the command can run immediately.
+    - Pass to chain.run(callbacks=[...]) so it is inherited by the LLM; only available when streaming is enabled.
+    """
+
+    def __init__(self, stop_on_command: bool = True):
+        self.stop_on_command = stop_on_command
+        self.reset()
+
+    def reset(self):
+        self.text = ""
+        self.command: Optional[str] = None
+        self.context: Optional[str] = None
+        self._command_start = -1
+        self._context_start = -1
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
+        self.reset()
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], **kwargs: Any) -> None:
+        self.reset()
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        """
+        Only the newly streamed region (plus enough overlap to catch a tag split across tokens) is scanned.
+        """
+        scan_from = max(0, len(self.text) - TAG_OVERLAP)
+        self.text += token
+
+        if self.context is None:
+            self._context_start, self.context = self._find_tag(
+                CONTEXT_START, CONTEXT_END, self._context_start, scan_from)
+        if self.command is None:
+            self._command_start, self.command = self._find_tag(
+                COMMAND_LINE_START, COMMAND_LINE_END, self._command_start, scan_from)
+            if self.command is not None and self.stop_on_command:
+                # Drop any part of the last token past </cmd>
+                end_index = self.text.find(COMMAND_LINE_END, self._command_start)
+                raise CommandComplete(self.text[:end_index + len(COMMAND_LINE_END)])
+
+    def _find_tag(self, start_tag: str, end_tag: str, start_index: int, scan_from: int):
+        """
+        Return (start_index, tag_body) where tag_body is None until the closing tag has streamed in.
+        """
+        if start_index == -1:
+            start_index = self.text.find(start_tag, scan_from)
+            if start_index == -1:
+                return -1, None
+        body_start = start_index + len(start_tag)
+        end_index = self.text.find(end_tag, max(body_start, scan_from))
+        if end_index == -1:
+            return start_index, None
+        return start_index, self.text[body_start:end_index]
@@ -1,14 +1,54 @@
 from pathlib import Path
 import os
+import threading
+from typing import Dict, Optional, Tuple
 
 from config import WORKSPACE_DIR
+from command_gpt.utils.workspace_writer import get_workspace_writer
 
 WORKSPACE_PATH = Path(WORKSPACE_DIR)
 
 
-def get_filesystem_representation(path=WORKSPACE_PATH, verbose=False):
+class WorkspaceIndex:
+    """
+    Caches get_file_stats() results so unchanged files aren't re-read every loop.
+    - Entries are dropped on WorkspaceWriter change notifications & re-checked against mtime/size for outside edits.
+    """
+
+    def __init__(self):
+        # Maps resolved path -> ((mtime_ns, size), stats)
+        self._stats: Dict[str, Tuple[Tuple[int, int], Dict]] = {}
+        self._lock = threading.Lock()
+        get_workspace_writer().subscribe(self.invalidate)
+
+    def invalidate(self, path: Path):
+        with self._lock:
+            self._stats.pop(str(path), None)
+
+    def close(self):
+        """Stop listening for workspace writes & drop the cached stats."""
+        get_workspace_writer().unsubscribe(self.invalidate)
+        with self._lock:
+            self._stats.clear()
+
+    def get_file_stats(self, file_path: str) -> Dict:
+        key = str(Path(file_path).resolve())
+        stat = os.stat(file_path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._stats.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        stats = get_file_stats(file_path)
+        with self._lock:
+            self._stats[key] = (version, stats)
+        return stats
+
+
+def get_filesystem_representation(path=WORKSPACE_PATH, verbose=False, index: Optional[WorkspaceIndex] = None):
     """
     Return map of all files in a directory with the value being the file contents if verbose=True or a summary if verbose=False
+    - If an index is provided, summaries of unchanged files are served from it
     """
     file_system = {}
 
@@ -25,10 +65,15 @@ def get_filesystem_representation(path=WORKSPACE_PATH, verbose=False):
             current_dir = current_dir[subdir]
 
         for file in files:
+            # Skip in-progress atomic writes from the WorkspaceWriter
+            if file.startswith('.') and file.endswith('.tmp'):
+                continue
             file_path = os.path.join(root, file)
             if verbose:
                 with open(file_path, 'r', errors='ignore') as file_obj:
                     current_dir[file] = file_obj.read()
+            elif index is not None:
+                current_dir[file] = index.get_file_stats(file_path)
             else:
                 current_dir[file] = get_file_stats(file_path)
 
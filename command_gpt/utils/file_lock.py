@@ -0,0 +1,36 @@
+# Advisory inter-process lock for files shared by concurrent jobs (e.g. JSONL caches appended to by batch workers)
+
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def file_lock(path: Path):
+    """
+    Hold an exclusive lock on path's sidecar ".lock" file for the duration of the block.
+    - Locks are per open file, so threads of one process exclude each other too
+    - Only code that takes the same lock is excluded (the locked file itself can still be read)
+    """
+    lock_path = Path(f"{path}.lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a+b") as file:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        else:
+            file.seek(0)
+            # Retries for ~10s before raising OSError
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
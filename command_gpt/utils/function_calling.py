@@ -0,0 +1,146 @@
+# Native function calling: tools are sent as function definitions & the model replies with a JSON function call
+# (the PROTOCOL_FUNCTIONS alternative to parsing <cmd> lines, see COMMAND_PROTOCOL in config.py)
+
+from contextlib import contextmanager
+import json
+import threading
+from typing import Any, Dict, List, Optional
+
+from langchain.callbacks.manager import CallbackManagerForLLMRun
+from langchain.chains.llm import LLMChain
+from langchain.chat_models import ChatOpenAI
+from langchain.schema import AIMessage, BaseMessage, ChatGeneration, ChatResult, LLMResult
+
+from command_gpt.utils.command_parser import FUNCTION_CALL_KEY
+
+_function_context = threading.local()
+
+
+@contextmanager
+def function_definitions(definitions: Optional[List[Dict]]):
+    """
+    Send definitions with the chat requests the current thread makes inside this block (see FunctionCallingChatOpenAI).
+    """
+    previous = getattr(_function_context, "definitions", None)
+    _function_context.definitions = definitions
+    try:
+        yield
+    finally:
+        _function_context.definitions = previous
+
+
+def get_function_definitions() -> Optional[List[Dict]]:
+    """Definitions set by function_definitions() for the current thread, if any (e.g. to carry them over to another thread)."""
+    return getattr(_function_context, "definitions", None)
+
+
+# region Messages
+
+def get_function_call(message: BaseMessage) -> Optional[Dict[str, str]]:
+    return message.additional_kwargs.get(FUNCTION_CALL_KEY)
+
+
+def function_call_message(content: str, call: Optional[Dict[str, str]]) -> AIMessage:
+    return AIMessage(content=content, additional_kwargs={FUNCTION_CALL_KEY: call} if call else {})
+
+
+def format_function_call(call: Dict[str, str]) -> str:
+    """One line for logs & memory, e.g. read_file {"file_path": "notes.md"}"""
+    return f"{call.get('name', '')} {call.get('arguments', '')}".strip()
+
+
+def reply_text(message: BaseMessage) -> str:
+    """The reply's text followed by its function call, if it made one (what memory & token counts see)."""
+    call = get_function_call(message)
+    if not call:
+        return message.content
+    return f"{message.content}\n{format_function_call(call)}".lstrip()
+
+
+def serialize_reply(message: BaseMessage) -> str:
+    """JSON of the reply's text & function call, for caching (see load_reply)."""
+    return json.dumps({"content": message.content, FUNCTION_CALL_KEY: get_function_call(message)})
+
+
+def load_reply(text: str) -> AIMessage:
+    data = json.loads(text)
+    return function_call_message(data.get("content") or "", data.get(FUNCTION_CALL_KEY))
+
+# endregion
+
+
+class FunctionCallChain(LLMChain):
+    """
+    LLMChain that also outputs the reply's function call (under FUNCTION_CALL_KEY, None if the model only answered in text).
+    """
+
+    @property
+    def output_keys(self) -> List[str]:
+        return [self.output_key, FUNCTION_CALL_KEY]
+
+    def create_outputs(self, response: LLMResult) -> List[Dict[str, Any]]:
+        outputs = []
+        for generation in response.generations:
+            message = getattr(generation[0], "message", None)
+            outputs.append({
+                self.output_key: generation[0].text,
+                FUNCTION_CALL_KEY: get_function_call(message) if message is not None else None,
+            })
+        return outputs
+
+
+class FunctionCallingChatOpenAI(ChatOpenAI):
+    """
+    ChatOpenAI that sends the current thread's function_definitions() with each request & keeps the model's function call
+    in the reply's additional_kwargs (langchain's ChatOpenAI drops it).
+    - Without definitions, requests are exactly those of ChatOpenAI
+    - Function calls earlier in the history are sent back as the assistant's function_call
+    - Only content is streamed to callbacks; the call's arguments arrive with the result. Each function call delta is
+      reported as an empty token, so wrappers waiting on the stream (e.g. HedgedChatModel) see the reply is underway
+    """
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+    ) -> ChatResult:
+        definitions = get_function_definitions()
+        if not definitions:
+            return super()._generate(messages, stop=stop, run_manager=run_manager)
+        message_dicts, params = self._create_message_dicts(messages, stop)
+        params["functions"] = definitions
+        if not self.streaming:
+            response = self.completion_with_retry(messages=message_dicts, **params)
+            reply = response["choices"][0]["message"]
+            message = function_call_message(reply.get("content") or "", reply.get(FUNCTION_CALL_KEY))
+            return ChatResult(
+                generations=[ChatGeneration(message=message)],
+                llm_output={"token_usage": response["usage"], "model_name": self.model_name},
+            )
+
+        content, name, arguments = "", "", ""
+        params["stream"] = True
+        for stream_resp in self.completion_with_retry(messages=message_dicts, **params):
+            delta = stream_resp["choices"][0]["delta"]
+            token = delta.get("content") or ""
+            if token:
+                content += token
+                if run_manager:
+                    run_manager.on_llm_new_token(token)
+            call = delta.get(FUNCTION_CALL_KEY) or {}
+            if call:
+                name += call.get("name") or ""
+                arguments += call.get("arguments") or ""
+                if run_manager:
+                    run_manager.on_llm_new_token("")
+        call = {"name": name, "arguments": arguments} if name else None
+        return ChatResult(generations=[ChatGeneration(message=function_call_message(content, call))])
+
+    def _create_message_dicts(self, messages: List[BaseMessage], stop: Optional[List[str]]):
+        message_dicts, params = super()._create_message_dicts(messages, stop)
+        for message, message_dict in zip(messages, message_dicts):
+            call = get_function_call(message)
+            if call:
+                message_dict[FUNCTION_CALL_KEY] = call
+        return message_dicts, params
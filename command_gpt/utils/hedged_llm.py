@@ -0,0 +1,313 @@
+# Hedged chat requests: a request the primary model is slow to answer is also sent to a backup & the first to respond is kept
+
+from collections import deque
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import BaseMessage, ChatResult
+
+from config import (
+    HEDGE_HISTOGRAM_BOUNDS_SECONDS,
+    HEDGE_INITIAL_DELAY_SECONDS,
+    HEDGE_LATENCY_WINDOW,
+    HEDGE_MAX_DELAY_SECONDS,
+    HEDGE_MIN_DELAY_SECONDS,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_PERCENTILE,
+)
+from command_gpt.prompting.context_budget import get_model_name
+from command_gpt.utils.console_logger import ConsoleLogger
+from command_gpt.utils.function_calling import function_definitions, get_function_definitions
+from command_gpt.utils.rate_limiter import get_request_priority, request_priority
+
+
+class LatencyHistogram:
+    """
+    Latencies counted in fixed buckets (for reporting) plus a window of recent samples (for percentiles).
+    """
+
+    def __init__(self, bounds: List[float] = HEDGE_HISTOGRAM_BOUNDS_SECONDS, window: int = HEDGE_LATENCY_WINDOW):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            bucket = next((i for i, bound in enumerate(self.bounds) if seconds <= bound), len(self.bounds))
+            self.counts[bucket] += 1
+            self.count += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self._recent.append(seconds)
+
+    def samples(self) -> int:
+        with self._lock:
+            return len(self._recent)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Nearest-rank percentile of the recent samples (None if there are none)."""
+        with self._lock:
+            recent = sorted(self._recent)
+        if not recent:
+            return None
+        rank = max(0, min(len(recent) - 1, int(round(percent / 100 * len(recent))) - 1))
+        return recent[rank]
+
+    def summary(self) -> Dict[str, Any]:
+        labels = [f"<={bound:g}s" for bound in self.bounds] + [f">{self.bounds[-1]:g}s"]
+        with self._lock:
+            count, total, maximum, counts = self.count, self.total_seconds, self.max_seconds, list(self.counts)
+        return {
+            "count": count,
+            "mean": total / count if count else 0.0,
+            "p50": self.percentile(50) or 0.0,
+            "p95": self.percentile(95) or 0.0,
+            "p99": self.percentile(99) or 0.0,
+            "max": maximum,
+            "buckets": dict(zip(labels, counts)),
+        }
+
+
+class BackendStats:
+    def __init__(self, name: str):
+        self.name = name
+        # Seconds from sending the request to its first streamed token (or the full response, when not streaming)
+        self.first_token = LatencyHistogram()
+        # Seconds to the full response, for requests this backend won
+        self.latency = LatencyHistogram()
+        self.requests = 0
+        self.wins = 0
+        self.errors = 0
+        self.cancelled = 0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "wins": self.wins,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "first_token": self.first_token.summary(),
+            "latency": self.latency.summary(),
+        }
+
+
+class HedgeCancelled(Exception):
+    """Raised inside a losing attempt's stream (at its next token) to stop it."""
+
+
+class _Attempt:
+    def __init__(self, index: int, backend: BaseChatModel, events: queue.Queue):
+        self.index = index
+        self.backend = backend
+        self.events = events
+        self.started = time.monotonic()
+        self.first_token_seconds: Optional[float] = None
+        self.cancelled = threading.Event()
+        self.finished = False
+
+
+class _AttemptRunManager:
+    """
+    Stands in for the run manager inside an attempt: tokens are queued for the caller's thread, which forwards the winner's.
+    """
+
+    def __init__(self, attempt: _Attempt):
+        self.attempt = attempt
+
+    def on_llm_new_token(self, token: str, **kwargs: Any):
+        if self.attempt.cancelled.is_set():
+            raise HedgeCancelled()
+        self.attempt.events.put((self.attempt, "token", token))
+
+
+class HedgedChatModel(BaseChatModel):
+    """
+    Sends a request to the primary model (llm) & hedges it with the next backup when no token has arrived by the deadline.
+    - The deadline is the percentile of the primary's recent first-token latencies (HEDGE_* in config.py), clamped, or
+      initial_delay_seconds until min_samples requests have been seen
+    - The first attempt to stream a token (or to return, for models that don't stream) wins: its tokens are forwarded to
+      the callbacks on the caller's thread & every other attempt is cancelled at its next token. Empty tokens (function
+      call deltas, see FunctionCallingChatOpenAI) count as progress but aren't forwarded
+    - A backup is also sent right away when every running attempt has failed before the deadline
+    - Latency histograms are kept per backend in backend_stats (see stats())
+    """
+    llm: BaseChatModel
+    backups: List[BaseChatModel]
+    backend_stats: List[BackendStats]
+    percentile: float = HEDGE_PERCENTILE
+    min_samples: int = HEDGE_MIN_SAMPLES
+    initial_delay_seconds: float = HEDGE_INITIAL_DELAY_SECONDS
+    min_delay_seconds: float = HEDGE_MIN_DELAY_SECONDS
+    max_delay_seconds: float = HEDGE_MAX_DELAY_SECONDS
+    hedges: int = 0
+    hedge_wins: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return f"hedged_{self.llm._llm_type}"
+
+    @property
+    def _identifying_params(self):
+        return self.llm._identifying_params
+
+    def get_num_tokens(self, text: str) -> int:
+        return self.llm.get_num_tokens(text)
+
+    def get_num_tokens_from_messages(self, messages: List[BaseMessage]) -> int:
+        return self.llm.get_num_tokens_from_messages(messages)
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for the primary's first token before hedging."""
+        primary = self.backend_stats[0].first_token
+        delay = self.initial_delay_seconds
+        if primary.samples() >= self.min_samples:
+            delay = primary.percentile(self.percentile)
+        return min(self.max_delay_seconds, max(self.min_delay_seconds, delay))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay": self.hedge_delay(),
+            "backends": {stats.name: stats.summary() for stats in self.backend_stats},
+        }
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+    ) -> ChatResult:
+        backends = [self.llm] + self.backups
+        events: queue.Queue = queue.Queue()
+        attempts: List[_Attempt] = []
+        winner: Optional[_Attempt] = None
+        last_error: Optional[BaseException] = None
+
+        def launch():
+            attempt = _Attempt(len(attempts), backends[len(attempts)], events)
+            attempts.append(attempt)
+            self.backend_stats[attempt.index].requests += 1
+            threading.Thread(
+                target=self._run_attempt,
+                args=(attempt, messages, stop, ConsoleLogger.get_agent_prefix(), get_request_priority(),
+                      get_function_definitions()),
+                daemon=True,
+            ).start()
+            return time.monotonic() + self.hedge_delay()
+
+        def settle(attempt: _Attempt):
+            nonlocal winner
+            winner = attempt
+            self.backend_stats[attempt.index].wins += 1
+            if attempt.index > 0:
+                self.hedge_wins += 1
+            for other in attempts:
+                if other is not attempt and not other.finished:
+                    other.cancelled.set()
+                    self.backend_stats[other.index].cancelled += 1
+
+        deadline = launch()
+        try:
+            while True:
+                can_hedge = winner is None and len(attempts) < len(backends)
+                running = [a for a in attempts if not a.finished]
+                if can_hedge and not running:
+                    # Everything sent so far failed; don't wait out the deadline
+                    deadline = launch()
+                    continue
+                try:
+                    timeout = max(0.0, deadline - time.monotonic()) if can_hedge else None
+                    attempt, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    self.hedges += 1
+                    ConsoleLogger.log_error(
+                        f"No response after {time.monotonic() - attempts[0].started:.2f}s, also sending the request to {self.backend_stats[len(attempts)].name}")
+                    deadline = launch()
+                    continue
+                if attempt.cancelled.is_set():
+                    continue
+                elapsed = time.monotonic() - attempt.started
+                if kind == "token":
+                    if attempt.first_token_seconds is None:
+                        attempt.first_token_seconds = elapsed
+                        self.backend_stats[attempt.index].first_token.record(elapsed)
+                    if winner is None:
+                        settle(attempt)
+                    # Empty tokens only report progress (e.g. function call deltas)
+                    if run_manager and payload:
+                        run_manager.on_llm_new_token(payload)
+                elif kind == "done":
+                    attempt.finished = True
+                    if attempt.first_token_seconds is None:
+                        self.backend_stats[attempt.index].first_token.record(elapsed)
+                    if winner is None:
+                        settle(attempt)
+                    self.backend_stats[attempt.index].latency.record(elapsed)
+                    return payload
+                else:
+                    attempt.finished = True
+                    self.backend_stats[attempt.index].errors += 1
+                    last_error = last_error or payload
+                    if attempt is winner or (
+                            len(attempts) == len(backends) and all(a.finished for a in attempts)):
+                        raise payload if attempt is winner else last_error
+        finally:
+            # Also stops the winner when a callback raised (e.g. CommandComplete at </cmd>)
+            for attempt in attempts:
+                if not attempt.finished:
+                    attempt.cancelled.set()
+            primary = attempts[0]
+            if primary.first_token_seconds is None and primary is not winner and not primary.finished:
+                # Censored at the time it lost, which still pushes the deadline toward the slow tail
+                self.backend_stats[0].first_token.record(time.monotonic() - primary.started)
+
+    def _run_attempt(self, attempt: _Attempt, messages: List[BaseMessage], stop: Optional[List[str]],
+                     agent: Optional[str], priority: Optional[int], definitions: Optional[List[Dict]]):
+        ConsoleLogger.set_agent_prefix(agent)
+        try:
+            with request_priority(priority), function_definitions(definitions):
+                result = attempt.backend._generate(
+                    messages, stop=stop, run_manager=_AttemptRunManager(attempt))
+            attempt.events.put((attempt, "done", result))
+        except HedgeCancelled:
+            pass
+        except Exception as e:
+            attempt.events.put((attempt, "error", e))
+        finally:
+            ConsoleLogger.set_agent_prefix(None)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+    ) -> ChatResult:
+        return await self.llm._agenerate(messages, stop=stop, run_manager=run_manager)
+
+
+def with_hedging(llm: BaseChatModel, backups: List[BaseChatModel], **kwargs) -> HedgedChatModel:
+    """
+    Wrap a chat model so slow requests are hedged with backups (tried in order, one more per deadline). Keeps llm's callbacks.
+    - kwargs override the HEDGE_* settings (percentile, min_samples, initial_delay_seconds, ...)
+    """
+    names: List[str] = []
+    for index, backend in enumerate([llm] + backups):
+        name = get_model_name(backend) or backend._llm_type
+        names.append(name if name not in names else f"{name} ({index})")
+    return HedgedChatModel(
+        llm=llm,
+        backups=backups,
+        backend_stats=[BackendStats(name) for name in names],
+        callbacks=llm.callbacks,
+        verbose=llm.verbose,
+        **kwargs,
+    )
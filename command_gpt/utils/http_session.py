@@ -0,0 +1,24 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def create_pooled_session(max_concurrency: int, retries: int = 3) -> requests.Session:
+    """
+    Return a requests Session whose connection pool fits max_concurrency threads & retries GETs with backoff on rate limits and server errors.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+    )
+    adapter = HTTPAdapter(
+        pool_connections=max_concurrency,
+        pool_maxsize=max_concurrency,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
@@ -0,0 +1,41 @@
+import threading
+from typing import Any, Callable, Dict, List
+
+
+class LazyRegistry:
+    """
+    Maps names to factories & builds each component on first get(), so startup only pays for what is used.
+    - Factories should do their own heavy imports so registering a component costs nothing.
+    - Components are built once & shared; get() is thread safe.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        """
+        Register (or replace) the factory for a component, discarding any instance already built.
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._instances.pop(name, None)
+
+    def get(self, name: str) -> Any:
+        """
+        Return the component, building it on first use. Raises KeyError for unregistered names.
+        """
+        with self._lock:
+            if name not in self._instances:
+                self._instances[name] = self._factories[name]()
+            return self._instances[name]
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def names(self) -> List[str]:
+        return list(self._factories.keys())
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._factories
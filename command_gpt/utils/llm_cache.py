@@ -0,0 +1,376 @@
+# Persistent exact-match cache of LLM responses (SQLite), keyed by model, temperature & the fully formatted prompt
+
+import hashlib
+import json
+from pathlib import Path
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain.chat_models.base import BaseChatModel
+from langchain.llms.base import BaseLLM
+from langchain.schema import AIMessage, BaseMessage, ChatGeneration, ChatResult, Generation, LLMResult
+
+from config import LLM_CACHE_MAX_BYTES, LLM_CACHE_PATH
+from command_gpt.prompting.context_budget import unwrap_model
+from command_gpt.prompting.prompt import TIME_PROMPT_PREFIX
+from command_gpt.utils.custom_stream import CommandComplete
+from command_gpt.utils.function_calling import get_function_call, get_function_definitions, load_reply, serialize_reply
+
+# Parts of a formatted prompt that change on every call without changing its meaning
+VOLATILE_PATTERN = re.compile(re.escape(TIME_PROMPT_PREFIX) + r"[^\n]*")
+
+# Once over max_bytes, least recently used entries are evicted down to this fraction of it
+EVICT_TO_FRACTION = 0.9
+
+
+class ResponseCache:
+    """
+    SQLite-backed cache of LLM responses with least-recently-used eviction once max_bytes of responses are stored.
+    - Keys come from make_key(): model name, temperature, stop words & a hash of the formatted prompt.
+    - Hits, misses & evictions are counted per process (see stats()).
+    - Safe to share across threads (one connection guarded by a lock).
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER, "
+            "created REAL, last_access REAL, hits INTEGER DEFAULT 0)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._db.commit()
+        self._total_bytes = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    # region Keys
+
+    @staticmethod
+    def make_key(llm: Any, prompt_text: str, stop: Optional[List[str]] = None) -> str:
+        """
+        Return the cache key for a prompt (from format_prompt() or format_messages()) sent to llm.
+        """
+        llm = unwrap_model(llm)
+        model = getattr(llm, "model_name", None) or llm._llm_type
+        temperature = getattr(llm, "temperature", None)
+        digest = hashlib.sha256(prompt_text.encode("utf-8")).hexdigest()
+        return json.dumps([model, temperature, stop or [], digest])
+
+    @staticmethod
+    def format_prompt(prompt: str) -> str:
+        """Normalize a text prompt, dropping the time so reruns can hit."""
+        return VOLATILE_PATTERN.sub(TIME_PROMPT_PREFIX, prompt)
+
+    @staticmethod
+    def format_messages(messages: List[BaseMessage]) -> str:
+        """Serialize & normalize chat messages, dropping the time so reruns can hit."""
+        return json.dumps([
+            [message.type, ResponseCache.format_prompt(message.content)] + (
+                [get_function_call(message)] if get_function_call(message) else [])
+            for message in messages
+        ])
+
+    # endregion
+    # region Reading & Writing
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute(
+                "UPDATE responses SET last_access = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return row[0]
+
+    def put(self, key: str, response: str):
+        model = json.loads(key)[0]
+        size = len(response.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            previous = self._db.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now),
+            )
+            self._total_bytes += size - (previous[0] if previous else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._db.execute(
+                "SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": self._total_bytes,
+        }
+
+    def _evict(self):
+        """
+        Delete least recently used entries until under EVICT_TO_FRACTION of max_bytes. Caller holds self._lock.
+        """
+        target = self.max_bytes * EVICT_TO_FRACTION
+        evicted = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            if self._total_bytes <= target:
+                break
+            evicted.append((key,))
+            self._total_bytes -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+
+    # endregion
+
+
+def _replay(llm: Any, text: str, run_manager: Optional[CallbackManagerForLLMRun]):
+    """
+    Stream a cached response to the callbacks as one token, as the wrapped model would have (streaming models only).
+    """
+    if run_manager and getattr(llm, "streaming", False):
+        run_manager.on_llm_new_token(text)
+
+
+async def _areplay(llm: Any, text: str, run_manager: Optional[AsyncCallbackManagerForLLMRun]):
+    """Async counterpart of _replay."""
+    if run_manager and getattr(llm, "streaming", False):
+        await run_manager.on_llm_new_token(text)
+
+
+class CachedChatModel(BaseChatModel):
+    """
+    Serves responses for repeated prompts from a ResponseCache in front of a chat model.
+    - Responses cut short at </cmd> (CommandComplete) are cached as cut.
+    - Requests sent with function_definitions() are keyed by them too & cache the reply's function call.
+    - Async requests go through the same cache (lookups & stores are quick local SQLite calls).
+    """
+    llm: BaseChatModel
+    response_cache: ResponseCache
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cached_{self.llm._llm_type}"
+
+    @property
+    def _identifying_params(self):
+        return self.llm._identifying_params
+
+    def get_num_tokens(self, text: str) -> int:
+        return self.llm.get_num_tokens(text)
+
+    def get_num_tokens_from_messages(self, messages: List[BaseMessage]) -> int:
+        return self.llm.get_num_tokens_from_messages(messages)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+    ) -> ChatResult:
+        key, definitions, message = self._lookup(messages, stop)
+        if message is not None:
+            if message.content:
+                _replay(self.llm, message.content, run_manager)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+        try:
+            result = self.llm._generate(messages, stop=stop, run_manager=run_manager)
+        except CommandComplete as complete:
+            self._store(key, definitions, AIMessage(content=complete.text))
+            raise
+        self._store(key, definitions, result.generations[0].message)
+        return result
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+    ) -> ChatResult:
+        key, definitions, message = self._lookup(messages, stop)
+        if message is not None:
+            if message.content:
+                await _areplay(self.llm, message.content, run_manager)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+        try:
+            result = await self.llm._agenerate(messages, stop=stop, run_manager=run_manager)
+        except CommandComplete as complete:
+            self._store(key, definitions, AIMessage(content=complete.text))
+            raise
+        self._store(key, definitions, result.generations[0].message)
+        return result
+
+    # region Helpers
+
+    def _lookup(self, messages: List[BaseMessage], stop: Optional[List[str]]):
+        """Return the cache key, the current function definitions & the cached reply (None on a miss)."""
+        definitions = get_function_definitions()
+        prompt_text = self.response_cache.format_messages(messages)
+        if definitions:
+            prompt_text += json.dumps(definitions, sort_keys=True)
+        key = self.response_cache.make_key(self.llm, prompt_text, stop)
+        cached = self.response_cache.get(key)
+        if cached is None:
+            return key, definitions, None
+        return key, definitions, load_reply(cached) if definitions else AIMessage(content=cached)
+
+    def _store(self, key: str, definitions: Optional[List[Dict]], message: BaseMessage):
+        # Responses cut at </cmd> (CommandComplete) are stored as cut
+        self.response_cache.put(key, serialize_reply(message) if definitions else message.content)
+
+    # endregion
+
+
+class CachedLLM(BaseLLM):
+    """
+    Serves responses for repeated prompts from a ResponseCache in front of a completion model.
+    - Only the prompts that miss are sent to the wrapped model.
+    """
+    llm: BaseLLM
+    response_cache: ResponseCache
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cached_{self.llm._llm_type}"
+
+    @property
+    def _identifying_params(self):
+        return self.llm._identifying_params
+
+    def get_num_tokens(self, text: str) -> int:
+        return self.llm.get_num_tokens(text)
+
+    def _generate(
+        self,
+        prompts: List[str],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+    ) -> LLMResult:
+        keys, generations, missed = self._lookup(prompts, stop)
+        for generation in generations:
+            if generation is not None:
+                _replay(self.llm, generation[0].text, run_manager)
+
+        llm_output = None
+        if missed:
+            try:
+                result = self.llm._generate(
+                    [prompts[i] for i in missed], stop=stop, run_manager=run_manager)
+            except CommandComplete as complete:
+                self._store_cut(keys, missed, complete)
+                raise
+            llm_output = result.llm_output
+            self._store(keys, missed, generations, result)
+        return LLMResult(generations=generations, llm_output=llm_output)
+
+    async def _agenerate(
+        self,
+        prompts: List[str],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+    ) -> LLMResult:
+        keys, generations, missed = self._lookup(prompts, stop)
+        for generation in generations:
+            if generation is not None:
+                await _areplay(self.llm, generation[0].text, run_manager)
+
+        llm_output = None
+        if missed:
+            try:
+                result = await self.llm._agenerate(
+                    [prompts[i] for i in missed], stop=stop, run_manager=run_manager)
+            except CommandComplete as complete:
+                self._store_cut(keys, missed, complete)
+                raise
+            llm_output = result.llm_output
+            self._store(keys, missed, generations, result)
+        return LLMResult(generations=generations, llm_output=llm_output)
+
+    # region Helpers
+
+    def _lookup(self, prompts: List[str], stop: Optional[List[str]]):
+        """Return each prompt's cache key, its cached generations (None on a miss) & the indexes that missed."""
+        keys = [
+            self.response_cache.make_key(
+                self.llm, self.response_cache.format_prompt(prompt), stop)
+            for prompt in prompts
+        ]
+        generations: List[Optional[List[Generation]]] = []
+        missed = []
+        for index, key in enumerate(keys):
+            cached = self.response_cache.get(key)
+            if cached is None:
+                generations.append(None)
+                missed.append(index)
+            else:
+                generations.append([Generation(text=cached)])
+        return keys, generations, missed
+
+    def _store(self, keys: List[str], missed: List[int], generations: List[Optional[List[Generation]]],
+               result: LLMResult):
+        for index, generation in zip(missed, result.generations):
+            self.response_cache.put(keys[index], generation[0].text)
+            generations[index] = generation
+
+    def _store_cut(self, keys: List[str], missed: List[int], complete: CommandComplete):
+        # Only a single prompt's stream can be told apart from the cut text
+        if len(missed) == 1:
+            self.response_cache.put(keys[missed[0]], complete.text)
+
+    # endregion
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Return the process-wide ResponseCache, opening it on first use.
+    """
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
+
+
+def with_response_cache(llm, cache: Optional[ResponseCache] = None):
+    """
+    Wrap a chat or completion model so repeated prompts are served from cache (the wrapper keeps the model's callbacks).
+    """
+    cache = cache or get_response_cache()
+    if isinstance(llm, BaseChatModel):
+        return CachedChatModel(llm=llm, response_cache=cache, callbacks=llm.callbacks, verbose=llm.verbose)
+    return CachedLLM(llm=llm, response_cache=cache, callbacks=llm.callbacks, verbose=llm.verbose)
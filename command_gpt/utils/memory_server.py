@@ -0,0 +1,309 @@
+# Memory server: one local process owns the FAISS indexes & embedding cache for agents sharded across worker processes
+
+from collections import OrderedDict
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from multiprocessing.managers import BaseManager
+from typing import Dict, List, Optional, Tuple
+
+from langchain.schema import BaseRetriever, Document
+
+import numpy as np
+
+from config import MEMORY_COMPRESSION_TRAIN_SIZE, MEMORY_SERVER_EMBEDDING_CACHE_SIZE, MEMORY_SERVER_SEARCH_K
+
+
+class MemoryService:
+    """
+    Vector memory for many agents, each in its own namespace (an empty FAISS store created on demand).
+    - Texts are embedded once: embeddings are cached by exact text (LRU, MEMORY_SERVER_EMBEDDING_CACHE_SIZE entries)
+      & shared by every namespace, so agents storing or querying the same text don't pay for it twice
+    - Served to worker processes by MemoryManager; each client connection is handled on its own thread
+    - With int8 or pq MEMORY_COMPRESSION, one quantizer is trained once the namespaces hold train_size vectors between
+      them & shared by every namespace (agent memories are usually too small to train their own, see compressed_memory.py)
+    """
+
+    def __init__(
+        self,
+        embeddings_model: str = "default_embeddings",
+        cache_size: int = MEMORY_SERVER_EMBEDDING_CACHE_SIZE,
+        train_size: int = MEMORY_COMPRESSION_TRAIN_SIZE,
+    ):
+        self.embeddings_model = embeddings_model
+        self.cache_size = cache_size
+        self.train_size = train_size
+        # Trained, empty index shared by compressed namespaces (None until enough vectors were stored)
+        self._quantizer = None
+        self._training = False
+        self._embeddings = None
+        self._stores: Dict[str, object] = {}
+        self._store_locks: Dict[str, threading.Lock] = {}
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # region Namespaces
+
+    def create_namespace(self) -> str:
+        namespace = uuid.uuid4().hex
+        self._get_store(namespace)
+        return namespace
+
+    def drop_namespace(self, namespace: str):
+        with self._lock:
+            store = self._stores.pop(namespace, None)
+            lock = self._store_locks.pop(namespace, None)
+        if store is not None and hasattr(store.index, "close"):
+            with lock:
+                store.index.close()  # Compressed indexes keep exact vectors in a temporary file
+
+    def add_texts(self, namespace: str, texts: List[str], metadatas: Optional[List[Dict]] = None):
+        vectors = self.embed_documents(texts)
+        store, lock = self._get_store(namespace)
+        with lock:
+            store.add_embeddings(list(zip(texts, vectors)), metadatas)
+        self._share_quantizer()
+
+    def similarity_search(self, namespace: str, query: str, k: int = MEMORY_SERVER_SEARCH_K) -> List[Tuple[str, Dict]]:
+        """Return (page_content, metadata) pairs for the k nearest documents in the namespace."""
+        vector = self.embed_query(query)
+        store, lock = self._get_store(namespace)
+        with lock:
+            if store.index.ntotal == 0:
+                return []
+            documents = store.similarity_search_by_vector(vector, k=k)
+        return [(document.page_content, document.metadata) for document in documents]
+
+    # endregion
+    # region Embeddings
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts, requesting only the ones not already cached (in one batch).
+        """
+        results: Dict[int, List[float]] = {}
+        missing: Dict[str, List[int]] = {}
+        with self._lock:
+            for i, text in enumerate(texts):
+                if text in self._cache:
+                    self._cache.move_to_end(text)
+                    results[i] = self._cache[text]
+                    self.hits += 1
+                else:
+                    missing.setdefault(text, []).append(i)
+                    self.misses += 1
+
+        if missing:
+            missing_texts = list(missing)
+            vectors = self._get_embeddings().embed_documents(missing_texts)
+            with self._lock:
+                for text, vector in zip(missing_texts, vectors):
+                    vector = list(vector)
+                    for i in missing[text]:
+                        results[i] = vector
+                    self._cache[text] = vector
+                    self._cache.move_to_end(text)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return [results[i] for i in range(len(texts))]
+
+    # endregion
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stores = list(self._stores.values())
+            cached = len(self._cache)
+        return {
+            "pid": os.getpid(),
+            "namespaces": len(stores),
+            "documents": sum(store.index.ntotal for store in stores),
+            "cached_embeddings": cached,
+            "shared_quantizer": self._quantizer is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    # region Helpers
+
+    def _get_embeddings(self):
+        if self._embeddings is None:
+            from config import get_model
+            self._embeddings = get_model(self.embeddings_model)
+        return self._embeddings
+
+    def _get_store(self, namespace: str):
+        with self._lock:
+            if namespace not in self._stores:
+                from command_gpt.utils.vector_memory import create_vectorstore_retriever
+                # Queries are embedded through the service's cache, so the store itself never calls the model
+                store = create_vectorstore_retriever(embeddings=self, local=True).vectorstore
+                if self._quantizer is not None:
+                    store.index.use_quantizer(self._quantizer)
+                self._stores[namespace] = store
+                self._store_locks[namespace] = threading.Lock()
+            return self._stores[namespace], self._store_locks[namespace]
+
+    def _share_quantizer(self):
+        """
+        Once the untrained compressed namespaces hold train_size vectors between them, train one quantizer on those
+        vectors & switch every namespace over to it (new namespaces start with it).
+        """
+        from command_gpt.utils.compressed_memory import CompressedIndex, train_quantizer
+
+        def untrained():
+            return [(store, self._store_locks[namespace]) for namespace, store in self._stores.items()
+                    if isinstance(store.index, CompressedIndex) and not store.index.is_trained]
+
+        with self._lock:
+            if self._quantizer is not None or self._training:
+                return
+            stores = untrained()
+            if not stores or sum(store.index.ntotal for store, _ in stores) < self.train_size:
+                return
+            self._training = True
+        try:
+            vectors = []
+            for store, lock in stores:
+                with lock:
+                    vectors.append(store.index.pending_vectors())
+            index = stores[0][0].index
+            quantizer = train_quantizer(index.d, index.mode, np.concatenate(vectors))
+            with self._lock:
+                self._quantizer = quantizer
+                stores = untrained()
+            for store, lock in stores:
+                with lock:
+                    store.index.use_quantizer(quantizer)
+        finally:
+            with self._lock:
+                self._training = False
+
+    # endregion
+
+
+# region Server
+
+_service: Optional[MemoryService] = None
+
+
+def _init_service(embeddings_model: str):
+    global _service
+    _service = MemoryService(embeddings_model)
+
+
+def _get_service() -> MemoryService:
+    return _service
+
+
+class MemoryManager(BaseManager):
+    pass
+
+
+MemoryManager.register("get_memory_service", callable=_get_service)
+
+
+class MemoryServer:
+    """
+    Runs a MemoryService in a child process, listening on a Unix socket (a localhost port where Unix sockets aren't available).
+    - Pass address & authkey to worker processes; they call use_memory_server() so their agents' memory goes through it
+    """
+
+    def __init__(self, embeddings_model: str = "default_embeddings"):
+        self.embeddings_model = embeddings_model
+        self.authkey = os.urandom(16)
+        self.address = None
+        self._manager: Optional[MemoryManager] = None
+        # Directory holding the Unix socket (removed on shutdown)
+        self._socket_dir: Optional[str] = None
+
+    def start(self) -> "MemoryServer":
+        if hasattr(os, "fork"):
+            self._socket_dir = tempfile.mkdtemp(prefix="gpt-memory-")
+            address = os.path.join(self._socket_dir, "memory.sock")
+        else:
+            address = ("127.0.0.1", 0)
+        self._manager = MemoryManager(address=address, authkey=self.authkey)
+        self._manager.start(_init_service, (self.embeddings_model,))
+        self.address = self._manager.address
+        return self
+
+    def service(self):
+        return self._manager.get_memory_service()
+
+    def shutdown(self):
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+        if self._socket_dir is not None:
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+            self._socket_dir = None
+
+    def __enter__(self) -> "MemoryServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+# endregion
+# region Client
+
+
+class RemoteMemoryRetriever(BaseRetriever):
+    """
+    Retriever over one namespace of a MemoryService, standing in for the VectorStoreRetriever agents use locally.
+    """
+
+    def __init__(self, service, namespace: Optional[str] = None, k: int = MEMORY_SERVER_SEARCH_K):
+        self.service = service
+        self.namespace = namespace or service.create_namespace()
+        self.k = k
+
+    def get_relevant_documents(self, query: str) -> List[Document]:
+        return [Document(page_content=text, metadata=metadata)
+                for text, metadata in self.service.similarity_search(self.namespace, query, self.k)]
+
+    async def aget_relevant_documents(self, query: str) -> List[Document]:
+        return self.get_relevant_documents(query)
+
+    def add_documents(self, documents: List[Document], **kwargs) -> None:
+        self.service.add_texts(
+            self.namespace,
+            [document.page_content for document in documents],
+            [document.metadata for document in documents],
+        )
+
+    def close(self):
+        """Drop this retriever's namespace on the server (called through close_retriever() once the agent is done)."""
+        if self.namespace is not None:
+            self.service.drop_namespace(self.namespace)
+            self.namespace = None
+
+
+_client_service = None
+_client_lock = threading.Lock()
+
+
+def use_memory_server(address, authkey: bytes):
+    """
+    Route create_vectorstore_retriever() in this process to the memory server at address.
+    """
+    global _client_service
+    manager = MemoryManager(address=address, authkey=authkey)
+    manager.connect()
+    with _client_lock:
+        _client_service = manager.get_memory_service()
+
+
+def get_memory_service():
+    """Return the memory server's service proxy if use_memory_server() was called in this process, otherwise None."""
+    with _client_lock:
+        return _client_service
+
+# endregion
@@ -0,0 +1,170 @@
+# Offline stand-ins for the chat model & embeddings, so soak tests & benchmarks run without network access or API keys
+
+import asyncio
+import json
+import re
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain.chat_models.base import BaseChatModel
+from langchain.embeddings.base import Embeddings
+from langchain.schema import AIMessage, BaseMessage, ChatGeneration, ChatResult
+
+from command_gpt.utils.command_parser import COMMAND_LINE_START, CommandGPTOutputParser
+from command_gpt.utils.function_calling import function_call_message, get_function_definitions
+from command_gpt.utils.vector_memory import EMBEDDING_SIZE
+
+# Streamed chunks are words with their trailing whitespace (close enough to real token boundaries for callbacks)
+STREAM_CHUNK_PATTERN = re.compile(r"\S+\s*|\s+")
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Chat model that replies with scripted responses in order, cycling back to the first.
+    - Each response is formatted with {loop} (calls so far) & {slot} (loop % slots), e.g. to rotate file names
+    - Streams word-sized chunks to callbacks like a streaming model, so the </cmd> detector & console renderer run
+    - Token counts are approximated as chars / 4 (tiktoken needs to download its encodings)
+    - While function_definitions() are set, a response's <cmd> line is returned as a function call with JSON arguments
+      instead, like a function-calling model (so the same script drives both protocols)
+    """
+
+    responses: List[str]
+    slots: int = 20
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"responses": len(self.responses), "slots": self.slots}
+
+    def next_response(self) -> str:
+        text = self.responses[self.calls % len(self.responses)].format(
+            loop=self.calls, slot=self.calls % self.slots)
+        self.calls += 1
+        return text
+
+    def reply_message(self, text: str) -> AIMessage:
+        start = text.find(COMMAND_LINE_START)
+        if not get_function_definitions() or start == -1:
+            return AIMessage(content=text)
+        content = text[:start].rstrip()
+        command = CommandGPTOutputParser().parse(text)
+        if command.name == "ERROR":
+            return AIMessage(content=content)
+        return function_call_message(content, {"name": command.name, "arguments": json.dumps(command.args)})
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+    ) -> ChatResult:
+        message = self.reply_message(self.next_response())
+        if run_manager:
+            for chunk in STREAM_CHUNK_PATTERN.findall(message.content):
+                run_manager.on_llm_new_token(chunk)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+    ) -> ChatResult:
+        message = self.reply_message(self.next_response())
+        if run_manager:
+            for chunk in STREAM_CHUNK_PATTERN.findall(message.content):
+                await run_manager.on_llm_new_token(chunk)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def get_num_tokens(self, text: str) -> int:
+        return len(text) // 4 + 1
+
+    def get_num_tokens_from_messages(self, messages: List[BaseMessage]) -> int:
+        return sum(self.get_num_tokens(message.content) for message in messages)
+
+
+class DelayedChatModel(ScriptedChatModel):
+    """
+    ScriptedChatModel with injected latency, standing in for a real backend in hedging tests & benchmarks.
+    - Waits first_token_seconds before the first chunk & token_seconds between chunks
+    - Every stall_every-th call (1-based, 0 = never) waits stall_seconds instead before its first chunk
+    - fail_every-th calls raise a ConnectionError before streaming anything (0 = never)
+    """
+
+    first_token_seconds: float = 0.05
+    token_seconds: float = 0.0
+    stall_every: int = 0
+    stall_seconds: float = 5.0
+    fail_every: int = 0
+    # Calls started (calls only counts responses, which a stalled call hasn't reached yet)
+    started: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "delayed"
+
+    def _first_chunk_delay(self) -> float:
+        self.started += 1
+        call = self.started
+        if self.fail_every and call % self.fail_every == 0:
+            raise ConnectionError(f"Injected failure on call {call}")
+        stalled = self.stall_every and call % self.stall_every == 0
+        return self.stall_seconds if stalled else self.first_token_seconds
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+    ) -> ChatResult:
+        time.sleep(self._first_chunk_delay())
+        message = self.reply_message(self.next_response())
+        if run_manager:
+            for index, chunk in enumerate(STREAM_CHUNK_PATTERN.findall(message.content)):
+                if index and self.token_seconds:
+                    time.sleep(self.token_seconds)
+                run_manager.on_llm_new_token(chunk)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+    ) -> ChatResult:
+        await asyncio.sleep(self._first_chunk_delay())
+        message = self.reply_message(self.next_response())
+        if run_manager:
+            for index, chunk in enumerate(STREAM_CHUNK_PATTERN.findall(message.content)):
+                if index and self.token_seconds:
+                    await asyncio.sleep(self.token_seconds)
+                await run_manager.on_llm_new_token(chunk)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic bag-of-words embeddings (feature hashing), so texts sharing words land close together.
+    """
+
+    def __init__(self, size: int = EMBEDDING_SIZE):
+        self.size = size
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            vector[zlib.crc32(word.encode("utf-8")) % self.size] += 1.0
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
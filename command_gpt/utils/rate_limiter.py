@@ -0,0 +1,553 @@
+# Process-wide scheduler for LLM & embedding requests: token-bucket rate limits, priorities, fair sharing across agents & jittered retries
+
+import asyncio
+from contextlib import contextmanager
+import itertools
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain.chat_models.base import BaseChatModel
+from langchain.embeddings.base import Embeddings
+from langchain.llms.base import BaseLLM
+from langchain.schema import BaseMessage, ChatResult, LLMResult
+
+from config import (
+    RATE_LIMITS,
+    RATE_LIMIT_BACKOFF_SECONDS,
+    RATE_LIMIT_COMPLETION_TOKENS,
+    RATE_LIMIT_MAX_BACKOFF_SECONDS,
+    RATE_LIMIT_MAX_RETRIES,
+)
+from command_gpt.utils.console_logger import ConsoleLogger
+from command_gpt.utils.function_calling import reply_text
+
+# Request priorities (lower runs first)
+PRIORITY_HIGH = 0  # A human is waiting (e.g. interactive ruleset generation)
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# Errors worth retrying (matched by name so the openai package isn't imported here)
+RATE_LIMIT_ERRORS = {"RateLimitError"}
+TRANSIENT_ERRORS = {"APIError", "Timeout", "APIConnectionError",
+                    "ServiceUnavailableError", "TryAgain"}
+
+# Per-agent usage used for fair sharing decays by half over this many seconds
+USAGE_HALF_LIFE_SECONDS = 60.0
+
+_request_context = threading.local()
+
+
+@contextmanager
+def request_priority(priority: int):
+    """
+    Run requests made by the current thread inside this block at priority.
+    """
+    previous = getattr(_request_context, "priority", None)
+    _request_context.priority = priority
+    try:
+        yield
+    finally:
+        _request_context.priority = previous
+
+
+def get_request_priority() -> Optional[int]:
+    """Priority set by request_priority() for the current thread, if any (e.g. to carry it over to another thread)."""
+    return getattr(_request_context, "priority", None)
+
+
+class TokenBucket:
+    """
+    Allows up to capacity units at once, refilled continuously at capacity per minute. Not thread safe on its own.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level +
+                         (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount (capped at capacity) is available."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float):
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _Ticket:
+    def __init__(self, priority: int, agent: str, tokens: int, seq: int):
+        self.priority = priority
+        self.agent = agent
+        self.tokens = tokens
+        self.seq = seq
+
+
+class RequestScheduler:
+    """
+    Admits requests under requests-per-minute & tokens-per-minute token buckets shared by every agent in the process.
+    - Waiting requests are admitted by priority, then to the agent with the least recent usage (fair sharing), then in arrival order.
+    - Rate limit & transient API errors are retried with jittered exponential backoff; a rate limit error also pauses admissions for everyone.
+    - Agents are identified by the current thread's ConsoleLogger agent prefix (set per job in batch runs), else the thread name.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_retries: int = RATE_LIMIT_MAX_RETRIES,
+        backoff: float = RATE_LIMIT_BACKOFF_SECONDS,
+        max_backoff: float = RATE_LIMIT_MAX_BACKOFF_SECONDS,
+    ):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        # Stats
+        self.admitted = 0
+        self.retries = 0
+        self.rate_limit_errors = 0
+        self.wait_seconds = 0.0
+
+        self._waiting: List[_Ticket] = []
+        self._usage: Dict[str, float] = {}
+        self._usage_updated = time.monotonic()
+        self._paused_until = 0.0
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    # region Running Requests
+
+    def run(
+        self,
+        request: Callable[[], Any],
+        tokens: int = 0,
+        priority: Optional[int] = None,
+        can_retry: Optional[Callable[[], bool]] = None,
+    ) -> Any:
+        """
+        Wait for capacity, run request() & return its result, retrying rate limit & transient errors.
+        - tokens is the estimated token cost charged against the tokens-per-minute bucket.
+        - can_retry() is asked before each retry, e.g. to stop retrying once a streamed response has reached the callbacks.
+        """
+        priority, agent = self._caller(priority)
+        attempt = 0
+        while True:
+            self.acquire(tokens, priority, agent)
+            try:
+                return request()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, can_retry)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+
+    async def arun(
+        self,
+        request: Callable[[], Awaitable[Any]],
+        tokens: int = 0,
+        priority: Optional[int] = None,
+        can_retry: Optional[Callable[[], bool]] = None,
+    ) -> Any:
+        """
+        Async version of run(): awaits request() under the same buckets, queue & retries (waiting for capacity in a worker
+        thread so the event loop keeps running).
+        """
+        priority, agent = self._caller(priority)
+        attempt = 0
+        while True:
+            await asyncio.to_thread(self.acquire, tokens, priority, agent)
+            try:
+                return await request()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, can_retry)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    def acquire(self, tokens: int, priority: int = PRIORITY_NORMAL, agent: str = ""):
+        """
+        Block until this request is next in line & both buckets have capacity, then charge them.
+        """
+        start = time.monotonic()
+        with self._cond:
+            ticket = _Ticket(priority, agent, tokens, next(self._seq))
+            self._waiting.append(ticket)
+            # A new high priority or under-served request may change who is next
+            self._cond.notify_all()
+            try:
+                while True:
+                    if self._next_ticket() is not ticket:
+                        self._cond.wait()
+                        continue
+                    wait = self._wait_time(tokens)
+                    if wait <= 0:
+                        break
+                    self._cond.wait(timeout=wait)
+                self._charge(ticket)
+            finally:
+                self._waiting.remove(ticket)
+                self._cond.notify_all()
+            self.wait_seconds += time.monotonic() - start
+
+    def adjust(self, tokens: int):
+        """
+        Correct an earlier estimate once the real token count is known (positive charges more, negative refunds).
+        """
+        if self.tokens is None or tokens == 0:
+            return
+        with self._cond:
+            if tokens > 0:
+                self.tokens.take(tokens)
+            else:
+                self.tokens.give_back(-tokens)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "admitted": self.admitted,
+                "retries": self.retries,
+                "rate_limit_errors": self.rate_limit_errors,
+                "wait_seconds": self.wait_seconds,
+                "waiting": len(self._waiting),
+            }
+
+    # endregion
+    # region Helpers
+
+    @staticmethod
+    def _caller(priority: Optional[int]) -> Tuple[int, str]:
+        """Priority & agent of a request made by the current thread (read here, since acquire() may run on another thread)."""
+        if priority is None:
+            priority = getattr(_request_context, "priority", None)
+        if priority is None:
+            priority = PRIORITY_NORMAL
+        return priority, ConsoleLogger.get_agent_prefix() or threading.current_thread().name
+
+    def _retry_delay(self, error: Exception, attempt: int, can_retry: Optional[Callable[[], bool]]) -> Optional[float]:
+        """
+        Seconds to wait before retrying a request that failed with error after attempt retries, or None to give up.
+        """
+        error_name = type(error).__name__
+        if attempt >= self.max_retries or error_name not in RATE_LIMIT_ERRORS | TRANSIENT_ERRORS:
+            return None
+        if can_retry is not None and not can_retry():
+            return None
+        delay = self._backoff_delay(attempt + 1)
+        with self._cond:
+            self.retries += 1
+            if error_name in RATE_LIMIT_ERRORS:
+                # Everyone backs off, not just this request
+                self.rate_limit_errors += 1
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + delay)
+        ConsoleLogger.log_error(
+            f"{self.name} request failed ({error_name}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+        return delay
+
+    def _next_ticket(self) -> _Ticket:
+        self._decay_usage()
+        return min(self._waiting, key=lambda t: (t.priority, self._usage.get(t.agent, 0.0), t.seq))
+
+    def _wait_time(self, tokens: int) -> float:
+        wait = self._paused_until - time.monotonic()
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    def _charge(self, ticket: _Ticket):
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(ticket.tokens)
+        # Count at least one unit so agents with tiny requests still take turns
+        self._usage[ticket.agent] = self._usage.get(
+            ticket.agent, 0.0) + max(ticket.tokens, 1)
+        self.admitted += 1
+
+    def _decay_usage(self):
+        now = time.monotonic()
+        factor = 0.5 ** ((now - self._usage_updated) / USAGE_HALF_LIFE_SECONDS)
+        self._usage_updated = now
+        self._usage = {agent: usage * factor for agent, usage in self._usage.items()
+                       if usage * factor >= 1}
+
+    def _backoff_delay(self, attempt: int) -> float:
+        # Full jitter keeps agents that failed together from retrying together
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    # endregion
+
+
+# region Model Wrappers
+# - Route requests for the models in config.py through a shared scheduler (see with_rate_limits())
+
+
+def _completion_estimate(llm: Any) -> int:
+    max_tokens = getattr(llm, "max_tokens", None)
+    return max_tokens if isinstance(max_tokens, int) and max_tokens > 0 else RATE_LIMIT_COMPLETION_TOKENS
+
+
+class _StreamedTokens:
+    """
+    Stands in for the run manager inside a rate limited request: forwards tokens & keeps what was streamed so far.
+    """
+
+    def __init__(self, run_manager: Optional[CallbackManagerForLLMRun]):
+        self.run_manager = run_manager
+        self.tokens: List[str] = []
+
+    def on_llm_new_token(self, token: str, **kwargs: Any):
+        # Counted before forwarding: a callback that stops the stream (e.g. CommandComplete) still got this token
+        if token:
+            self.tokens.append(token)
+        if self.run_manager:
+            self.run_manager.on_llm_new_token(token, **kwargs)
+
+    def text(self) -> str:
+        return "".join(self.tokens)
+
+
+class _AsyncStreamedTokens(_StreamedTokens):
+    """_StreamedTokens for async requests (awaits the async run manager)."""
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any):
+        if token:
+            self.tokens.append(token)
+        if self.run_manager:
+            await self.run_manager.on_llm_new_token(token, **kwargs)
+
+
+class RateLimitedChatModel(BaseChatModel):
+    """
+    Sends a chat model's requests through a RequestScheduler.
+    - The cost charged up front is the prompt's token count plus a completion estimate, corrected once the response is in
+      (or with the tokens streamed so far, when a callback stopped the stream or the request failed)
+    - Failed requests aren't retried once tokens have been streamed to the callbacks, which can't take them back
+    - Async requests wait in the same queue & buckets (see RequestScheduler.arun)
+    """
+    llm: BaseChatModel
+    scheduler: RequestScheduler
+
+    @property
+    def _llm_type(self) -> str:
+        return self.llm._llm_type
+
+    @property
+    def _identifying_params(self):
+        return self.llm._identifying_params
+
+    def get_num_tokens(self, text: str) -> int:
+        return self.llm.get_num_tokens(text)
+
+    def get_num_tokens_from_messages(self, messages: List[BaseMessage]) -> int:
+        return self.llm.get_num_tokens_from_messages(messages)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+    ) -> ChatResult:
+        streamed = _StreamedTokens(run_manager)
+        tokens, estimate = self._estimate(messages)
+        result: Optional[ChatResult] = None
+        try:
+            result = self.scheduler.run(
+                lambda: self.llm._generate(messages, stop=stop, run_manager=streamed),
+                tokens=tokens,
+                can_retry=lambda: not streamed.tokens,
+            )
+            return result
+        finally:
+            self._settle(result, streamed, estimate)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+    ) -> ChatResult:
+        streamed = _AsyncStreamedTokens(run_manager)
+        tokens, estimate = self._estimate(messages)
+        result: Optional[ChatResult] = None
+        try:
+            result = await self.scheduler.arun(
+                lambda: self.llm._agenerate(messages, stop=stop, run_manager=streamed),
+                tokens=tokens,
+                can_retry=lambda: not streamed.tokens,
+            )
+            return result
+        finally:
+            self._settle(result, streamed, estimate)
+
+    def _estimate(self, messages: List[BaseMessage]) -> Tuple[int, int]:
+        """Tokens to charge up front & the completion estimate among them."""
+        # Same counter the prompt templates use to budget their messages
+        prompt_tokens = sum(self.llm.get_num_tokens(m.content) for m in messages)
+        estimate = _completion_estimate(self.llm)
+        return prompt_tokens + estimate, estimate
+
+    def _settle(self, result: Optional[ChatResult], streamed: _StreamedTokens, estimate: int):
+        """Correct the completion estimate with the reply (or what was streamed, if the request didn't return one)."""
+        text = reply_text(result.generations[0].message) if result is not None else streamed.text()
+        self.scheduler.adjust(self.llm.get_num_tokens(text) - estimate)
+
+
+class RateLimitedLLM(BaseLLM):
+    """
+    Sends a completion model's requests through a RequestScheduler (see RateLimitedChatModel).
+    """
+    llm: BaseLLM
+    scheduler: RequestScheduler
+
+    @property
+    def _llm_type(self) -> str:
+        return self.llm._llm_type
+
+    @property
+    def _identifying_params(self):
+        return self.llm._identifying_params
+
+    def get_num_tokens(self, text: str) -> int:
+        return self.llm.get_num_tokens(text)
+
+    def _generate(
+        self,
+        prompts: List[str],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+    ) -> LLMResult:
+        streamed = _StreamedTokens(run_manager)
+        tokens, estimate = self._estimate(prompts)
+        result: Optional[LLMResult] = None
+        try:
+            result = self.scheduler.run(
+                lambda: self.llm._generate(prompts, stop=stop, run_manager=streamed),
+                tokens=tokens,
+                can_retry=lambda: not streamed.tokens,
+            )
+            return result
+        finally:
+            self._settle(result, streamed, estimate)
+
+    async def _agenerate(
+        self,
+        prompts: List[str],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+    ) -> LLMResult:
+        streamed = _AsyncStreamedTokens(run_manager)
+        tokens, estimate = self._estimate(prompts)
+        result: Optional[LLMResult] = None
+        try:
+            result = await self.scheduler.arun(
+                lambda: self.llm._agenerate(prompts, stop=stop, run_manager=streamed),
+                tokens=tokens,
+                can_retry=lambda: not streamed.tokens,
+            )
+            return result
+        finally:
+            self._settle(result, streamed, estimate)
+
+    def _estimate(self, prompts: List[str]) -> Tuple[int, int]:
+        prompt_tokens = sum(self.llm.get_num_tokens(p) for p in prompts)
+        estimate = _completion_estimate(self.llm) * len(prompts)
+        return prompt_tokens + estimate, estimate
+
+    def _settle(self, result: Optional[LLMResult], streamed: _StreamedTokens, estimate: int):
+        if result is not None:
+            completion_tokens = sum(self.llm.get_num_tokens(g[0].text)
+                                    for g in result.generations if g)
+        else:
+            completion_tokens = self.llm.get_num_tokens(streamed.text())
+        self.scheduler.adjust(completion_tokens - estimate)
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """
+    Sends embedding requests through a RequestScheduler (tokens are estimated at ~4 chars each).
+    """
+
+    def __init__(self, embeddings: Embeddings, scheduler: RequestScheduler):
+        self.embeddings = embeddings
+        self.scheduler = scheduler
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.scheduler.run(
+            lambda: self.embeddings.embed_documents(texts),
+            tokens=sum(len(text) // 4 + 1 for text in texts),
+        )
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.scheduler.run(
+            lambda: self.embeddings.embed_query(text),
+            tokens=len(text) // 4 + 1,
+        )
+
+# endregion
+
+
+_schedulers: Dict[str, RequestScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(kind: str) -> RequestScheduler:
+    """
+    Return the process-wide scheduler for a kind of request in RATE_LIMITS (e.g. "chat", "embeddings").
+    """
+    with _schedulers_lock:
+        if kind not in _schedulers:
+            _schedulers[kind] = RequestScheduler(kind, **RATE_LIMITS.get(kind, {}))
+        return _schedulers[kind]
+
+
+def scale_rate_limits(fraction: float):
+    """
+    Scale every limit in RATE_LIMITS by fraction for this process, e.g. 1 / processes when sharding agents across
+    processes that each have their own schedulers. Must run before the models are built.
+    """
+    with _schedulers_lock:
+        for limits in RATE_LIMITS.values():
+            for key, value in limits.items():
+                limits[key] = max(1, int(value * fraction))
+        _schedulers.clear()
+
+
+def with_rate_limits(model, kind: str):
+    """
+    Wrap a chat model, completion model or embeddings so its requests go through the shared scheduler for kind.
+    - The wrapped model's own retries are turned off; the scheduler retries instead.
+    """
+    scheduler = get_scheduler(kind)
+    if hasattr(model, "max_retries"):
+        model.max_retries = 1
+    if isinstance(model, BaseChatModel):
+        return RateLimitedChatModel(llm=model, scheduler=scheduler, callbacks=model.callbacks, verbose=model.verbose)
+    if isinstance(model, BaseLLM):
+        return RateLimitedLLM(llm=model, scheduler=scheduler, callbacks=model.callbacks, verbose=model.verbose)
+    return RateLimitedEmbeddings(model, scheduler)
@@ -0,0 +1,226 @@
+# Spots repeated commands & command cycles across loops, serving repeated read-only commands from a per-agent result cache
+
+from collections import OrderedDict, deque
+import hashlib
+import json
+from pathlib import Path
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+from config import (
+    REPETITION_CACHEABLE_COMMANDS,
+    REPETITION_CACHE_MAX_ENTRIES,
+    REPETITION_PREVIEW_CHARS,
+    REPETITION_WINDOW,
+)
+from command_gpt.tooling.search_cache import SearchCache
+from command_gpt.utils.workspace_writer import get_workspace_writer
+
+# Commands that aren't fingerprinted (the loop ends on finish, ERROR is a parse failure)
+UNTRACKED_COMMANDS = {"finish", "ERROR"}
+
+# (command, normalized args, workspace version)
+Fingerprint = Tuple[str, str, str]
+
+# Separates several queries/URLs in one search or fetch_url input (SearchAndWriteTool.QUERY_SEPARATOR & FetchAndExtractTool.URL_SEPARATOR)
+MULTI_INPUT_SEPARATOR = " | "
+
+
+def _normalize_url(url: str) -> str:
+    # Only the scheme & host are case-insensitive
+    parts = urlsplit(url)
+    return urlunsplit(parts._replace(scheme=parts.scheme.lower(), netloc=parts.netloc.lower()))
+
+
+# How each query/URL in these commands' input is normalized (see RepetitionDetector.normalize_args)
+INPUT_NORMALIZERS: Dict[str, Callable[[str], str]] = {
+    "search": lambda query: SearchCache.normalize_query(query) or query.casefold(),
+    "fetch_url": _normalize_url,
+}
+
+
+class RepetitionCheck(NamedTuple):
+    fingerprint: Optional[Fingerprint]
+    # Result to use instead of running the command (repeated read-only command with an unchanged workspace)
+    cached_result: Optional[str] = None
+    # Loop in which the same command last ran against the same workspace (None if it hasn't)
+    repeat_of_loop: Optional[int] = None
+    # Commands making up a detected cycle, in order (empty if none)
+    cycle: Tuple[str, ...] = ()
+
+
+class RepetitionDetector:
+    """
+    Fingerprints each command as (command, normalized args, workspace version) over a sliding window of loops.
+    - The workspace version changes whenever the listing changes or a file in the workspace is committed, so repeats
+      after real progress aren't flagged.
+    - Repeated read-only commands (REPETITION_CACHEABLE_COMMANDS) are answered from the result cache, with a short
+      pointer to the earlier loop instead of the full output again. Results are keyed by the workspace version seen on
+      the next loop, so commands that write their own output (e.g. search results) still match their repeats.
+    - A cycle is the last N fingerprints repeating the N before them (N = 1 is the same command twice in a row).
+    """
+
+    def __init__(
+        self,
+        workspace_dir: str,
+        token_counter: Callable[[str], int],
+        window: int = REPETITION_WINDOW,
+        cacheable_commands: Optional[List[str]] = None,
+    ):
+        self.workspace_path = Path(workspace_dir).resolve()
+        self.token_counter = token_counter
+        self.window = window
+        self.cacheable_commands = set(
+            REPETITION_CACHEABLE_COMMANDS if cacheable_commands is None else cacheable_commands)
+        self.recent: deque = deque(maxlen=window)
+        # fingerprint -> (loop, full result), least recently used first
+        self.results: "OrderedDict[Fingerprint, Tuple[int, str]]" = OrderedDict()
+        self._durations: Dict[Fingerprint, float] = {}
+        # (command, normalized args, loop, result, duration) of the last cacheable command, keyed on the next check
+        self._pending: Optional[Tuple[str, str, int, str, float]] = None
+        self.loop = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        # Cycle flagged on the previous loop, to count it as broken if the next command leaves it
+        self._open_cycle: Tuple[str, ...] = ()
+        self.stats: Dict[str, float] = {
+            "commands": 0,
+            "repeats": 0,
+            "cache_hits": 0,
+            "cycles": 0,  # Loops in which a cycle was flagged (& a correction injected)
+            "cycles_broken": 0,
+            "tool_seconds_saved": 0.0,
+            "tokens_saved": 0,
+            "loops_saved": 0,
+        }
+        get_workspace_writer().subscribe(self._on_write)
+
+    # region Checks
+
+    def check(self, name: str, args: Dict, workspace: str) -> RepetitionCheck:
+        """
+        Fingerprint a parsed command against the current workspace listing & record it in the window.
+        """
+        self.loop += 1
+        if name in UNTRACKED_COMMANDS:
+            return RepetitionCheck(None)
+
+        version = self._workspace_version(workspace)
+        self._store_pending(version)
+        fingerprint = (name, self.normalize_args(args, name), version)
+        self.stats["commands"] += 1
+        if self._open_cycle and fingerprint[0] not in self._open_cycle:
+            # The agent moved on after a correction; credit at least one more pass through the cycle
+            self.stats["cycles_broken"] += 1
+            self.stats["loops_saved"] += len(self._open_cycle)
+        self._open_cycle = ()
+
+        previous = self.results.get(fingerprint)
+        repeat_of_loop = previous[0] if previous else None
+        if repeat_of_loop is None:
+            repeat_of_loop = next((loop for loop, seen in reversed(self.recent)
+                                   if seen == fingerprint), None)
+        if repeat_of_loop is not None:
+            self.stats["repeats"] += 1
+        self.recent.append((self.loop, fingerprint))
+
+        cached_result = None
+        if previous is not None and name in self.cacheable_commands:
+            self.results.move_to_end(fingerprint)
+            self.stats["cache_hits"] += 1
+            cached_result = self._repeat_message(name, previous[0], previous[1])
+            self.stats["tokens_saved"] += max(
+                0, self.token_counter(previous[1]) - self.token_counter(cached_result))
+
+        cycle = self._find_cycle()
+        if cycle:
+            self.stats["cycles"] += 1
+            self._open_cycle = cycle
+        return RepetitionCheck(fingerprint, cached_result, repeat_of_loop, cycle)
+
+    def record_result(self, check: RepetitionCheck, result: str, duration_seconds: float = 0.0):
+        """
+        Store a command's result so a repeat against the same workspace can be served from cache.
+        """
+        if check.fingerprint is None or check.fingerprint[0] not in self.cacheable_commands:
+            return
+        name, args, _ = check.fingerprint
+        self._pending = (name, args, self.loop, result, duration_seconds)
+
+    def record_cache_hit(self, check: RepetitionCheck):
+        """Count the tool time a cached result saved (the original call's duration)."""
+        self.stats["tool_seconds_saved"] += self._durations.get(
+            check.fingerprint, 0.0)
+
+    def correction_message(self, check: RepetitionCheck) -> str:
+        commands = " -> ".join(check.cycle)
+        return (
+            f"You are repeating yourself: the command sequence [{commands}] just ran again with the same arguments and nothing in the workspace changed, so repeating it will return the same results. "
+            "Use what you already have instead: write your findings to a file, or move on to the next step of the plan with a different command."
+        )
+
+    def close(self):
+        """Stop listening for workspace writes & drop cached results."""
+        get_workspace_writer().unsubscribe(self._on_write)
+        self.results.clear()
+        self._pending = None
+
+    # endregion
+    # region Helpers
+
+    @staticmethod
+    def normalize_args(args: Dict, command_name: str = "") -> str:
+        """
+        Collapse whitespace in string args & sort keys, so trivially different repeats match.
+        - search queries are normalized like SearchCache keys (case, punctuation & filler words), fetch_url URLs by scheme
+          & host case; both per " | "-separated part, whichever arg name they came in under (usually tool_input)
+        """
+        normalize_part = INPUT_NORMALIZERS.get(command_name)
+        normalized = {}
+        for key, value in (args or {}).items():
+            if isinstance(value, str):
+                value = " ".join(value.split())
+                if normalize_part is not None:
+                    value = MULTI_INPUT_SEPARATOR.join(
+                        normalize_part(part.strip()) for part in value.split(MULTI_INPUT_SEPARATOR))
+            normalized[key] = value
+        return json.dumps(normalized, sort_keys=True, default=str)
+
+    def _store_pending(self, version: str):
+        """Cache the last command's result under the workspace version it left behind."""
+        if self._pending is None:
+            return
+        name, args, loop, result, duration_seconds = self._pending
+        self._pending = None
+        fingerprint = (name, args, version)
+        self.results[fingerprint] = (loop, result)
+        self.results.move_to_end(fingerprint)
+        self._durations[fingerprint] = duration_seconds
+        while len(self.results) > REPETITION_CACHE_MAX_ENTRIES:
+            evicted, _ = self.results.popitem(last=False)
+            self._durations.pop(evicted, None)
+
+    def _workspace_version(self, workspace: str) -> str:
+        with self._lock:
+            writes = self._writes
+        return hashlib.sha1(f"{writes}\n{workspace}".encode("utf-8")).hexdigest()[:12]
+
+    def _on_write(self, path: Path):
+        if self.workspace_path in Path(path).resolve().parents:
+            with self._lock:
+                self._writes += 1
+
+    def _find_cycle(self) -> Tuple[str, ...]:
+        fingerprints = [fingerprint for _, fingerprint in self.recent]
+        for period in range(1, len(fingerprints) // 2 + 1):
+            if fingerprints[-period:] == fingerprints[-2 * period:-period]:
+                return tuple(fingerprint[0] for fingerprint in fingerprints[-period:])
+        return ()
+
+    @staticmethod
+    def _repeat_message(name: str, loop: int, result: str) -> str:
+        preview = result if len(result) <= REPETITION_PREVIEW_CHARS else result[:REPETITION_PREVIEW_CHARS] + "..."
+        return f"Command {name} was already run with the same arguments in loop {loop} and the workspace hasn't changed since, so it was not run again. Its result was: {preview}"
+
+    # endregion
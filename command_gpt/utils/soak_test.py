@@ -0,0 +1,220 @@
+# Long-run soak test: drives CommandGPT for thousands of loops against offline stand-ins while sampling memory use
+
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from config import (
+    SOAK_LOOPS,
+    SOAK_MAX_GROWTH_BYTES_PER_LOOP,
+    SOAK_MIN_RSS_LOOPS,
+    SOAK_SAMPLE_EVERY,
+    SOAK_TRACE_FRAMES,
+    SOAK_WARMUP_LOOPS,
+)
+
+try:
+    import resource  # Unix only, peak RSS fallback where /proc isn't available
+except ImportError:
+    resource = None
+
+SOAK_RULESET = "You are soak-gpt, an AI designed to take notes on a topic & keep them organized in markdown files."
+
+# Replies cycle through writing, reading & listing notes ({slot} rotates through a fixed set of files)
+SOAK_SCRIPT = [
+    "I'll record what I found this loop.\n<cmd>write_file --file_path notes_{slot}.md --text \"Loop {loop}: findings about the topic, with a few sentences of detail so files have realistic sizes.\"</cmd>",
+    "Let me check what's in that file.\n<cmd>read_file --file_path notes_{slot}.md</cmd>",
+    "Let me look at the files so far.\n<cmd>list_directory</cmd>",
+    "I'll add to the notes.\n<cmd>write_file --file_path notes_{slot}.md --text \"\\nLoop {loop}: follow up.\" --append true</cmd>",
+]
+
+# Allocation sites are grouped by the first matching path fragment
+SUBSYSTEMS: List[Tuple[str, str]] = [
+    ("agent", "command_gpt/command_gpt.py"),
+    ("prompting", "command_gpt/prompting/"),
+    ("tooling", "command_gpt/tooling/"),
+    ("utils", "command_gpt/utils/"),
+    ("faiss", "faiss"),
+    ("langchain", "langchain"),
+    ("pydantic", "pydantic"),
+    ("numpy", "numpy"),
+    ("stdlib", "/lib/python"),
+]
+
+
+class MemorySample(NamedTuple):
+    loop: int
+    rss_bytes: Optional[int]
+    traced_bytes: int
+    history_messages: int
+    memory_documents: int
+
+
+class SoakResult(NamedTuple):
+    loops: int
+    seconds: float
+    samples: List[MemorySample]
+    # Least squares slopes over the samples after warmup
+    rss_growth_per_loop: Optional[float]
+    traced_growth_per_loop: float
+    # Traced bytes allocated since warmup (& still live), per subsystem & per allocation site
+    subsystem_growth: Dict[str, int]
+    top_allocators: List[Tuple[str, int]]
+    passed: bool
+    # Which growth the run was judged on: "rss", or "traced" for short runs (see SOAK_MIN_RSS_LOOPS) & without RSS
+    judged_on: str = "rss"
+
+
+def read_rss_bytes() -> Optional[int]:
+    """
+    Current resident set size from /proc (Linux), falling back to peak RSS from getrusage elsewhere (None if unavailable).
+    """
+    try:
+        with open("/proc/self/statm", "r") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    try:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except (AttributeError, ValueError):
+        return None
+    # kB on Linux, bytes on macOS
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def subsystem_of(filename: str) -> str:
+    path = filename.replace("\\", "/")
+    for name, fragment in SUBSYSTEMS:
+        if fragment in path:
+            return name
+    return "other"
+
+
+def _slope(points: List[Tuple[int, float]]) -> float:
+    """Least squares slope of y over x."""
+    if len(points) < 2:
+        return 0.0
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if variance == 0:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+def _allocation_site(traceback: tracemalloc.Traceback) -> str:
+    """Innermost frame, plus the nearest CommandGPT frame that led to it when the allocation happened in a library."""
+    innermost = traceback[-1]
+    site = f"{innermost.filename}:{innermost.lineno}"
+    if "command_gpt" not in innermost.filename.replace("\\", "/"):
+        for frame in reversed(traceback):
+            if "command_gpt" in frame.filename.replace("\\", "/") and "soak_test" not in frame.filename:
+                return f"{site} (from {frame.filename}:{frame.lineno})"
+    return site
+
+
+def _memory_document_count(agent) -> int:
+    docstore = getattr(getattr(agent.memory, "vectorstore", None), "docstore", None)
+    return len(getattr(docstore, "_dict", {}))
+
+
+def run_soak(
+    loops: int = SOAK_LOOPS,
+    sample_every: int = SOAK_SAMPLE_EVERY,
+    warmup_loops: int = SOAK_WARMUP_LOOPS,
+    max_growth_bytes_per_loop: float = SOAK_MAX_GROWTH_BYTES_PER_LOOP,
+    trace_frames: int = SOAK_TRACE_FRAMES,
+    min_rss_loops: int = SOAK_MIN_RSS_LOOPS,
+    top: int = 10,
+    workspace_dir: Optional[str] = None,
+) -> SoakResult:
+    """
+    Run an agent with MemoryOnlyToolkit, a ScriptedChatModel & HashEmbeddings for loops loops, sampling every sample_every.
+    - The run fails when RSS grows faster than max_growth_bytes_per_loop after warmup. Traced bytes are judged instead when
+      RSS is unavailable or fewer than min_rss_loops were measured (RSS steps make short slopes unreliable)
+    - tracemalloc only sees Python allocations: FAISS index vectors show up in RSS but not in the subsystem breakdown
+    - Console output goes to os.devnull for the duration
+    """
+    from command_gpt.command_gpt import CommandGPT
+    from command_gpt.tooling.toolkits import MemoryOnlyToolkit
+    from command_gpt.utils.console_logger import ConsoleLogger
+    from command_gpt.utils.offline_models import HashEmbeddings, ScriptedChatModel
+    from command_gpt.utils.vector_memory import create_vectorstore_retriever
+    from command_gpt.utils.workspace_writer import get_workspace_writer
+
+    samples: List[MemorySample] = []
+    baseline: Optional[tracemalloc.Snapshot] = None
+    previous_output = ConsoleLogger.output
+    tracemalloc.start(trace_frames)
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="soak-") as temp_dir, open(os.devnull, "w") as devnull:
+        ConsoleLogger.configure(output=devnull)
+        try:
+            workspace = workspace_dir or temp_dir
+            agent = CommandGPT.from_ruleset_and_tools(
+                SOAK_RULESET,
+                memory=create_vectorstore_retriever(HashEmbeddings()),
+                tools=MemoryOnlyToolkit(
+                    workspace_dir=workspace, excluded_tools=["human_input"]).get_toolkit(),
+                llm=ScriptedChatModel(responses=SOAK_SCRIPT),
+                workspace_dir=workspace,
+            )
+            checkpoints = sorted({*range(sample_every, loops + 1, sample_every), warmup_loops, loops})
+            for checkpoint in checkpoints:
+                if checkpoint <= 0:
+                    continue
+                agent.run(max_loops=checkpoint)
+                get_workspace_writer().flush_all()
+                gc.collect()
+                samples.append(MemorySample(
+                    loop=agent.loop_count,
+                    rss_bytes=read_rss_bytes(),
+                    traced_bytes=tracemalloc.get_traced_memory()[0],
+                    history_messages=len(agent.full_message_history),
+                    memory_documents=_memory_document_count(agent),
+                ))
+                if checkpoint == warmup_loops:
+                    baseline = tracemalloc.take_snapshot()
+            final = tracemalloc.take_snapshot()
+        finally:
+            ConsoleLogger.configure(output=previous_output)
+            tracemalloc.stop()
+    seconds = time.perf_counter() - start
+
+    measured = [sample for sample in samples if sample.loop >= warmup_loops]
+    traced_growth = _slope([(s.loop, s.traced_bytes) for s in measured])
+    rss_growth = None
+    if all(s.rss_bytes is not None for s in measured):
+        rss_growth = _slope([(s.loop, s.rss_bytes) for s in measured])
+
+    subsystem_growth: Dict[str, int] = {}
+    sites: Dict[str, int] = {}
+    if baseline is not None:
+        for stat in final.compare_to(baseline, "traceback"):
+            if stat.size_diff <= 0:
+                continue
+            subsystem = subsystem_of(stat.traceback[-1].filename)
+            subsystem_growth[subsystem] = subsystem_growth.get(subsystem, 0) + stat.size_diff
+            site = _allocation_site(stat.traceback)
+            sites[site] = sites.get(site, 0) + stat.size_diff
+    top_allocators = sorted(sites.items(), key=lambda item: -item[1])[:top]
+
+    measured_loops = measured[-1].loop - measured[0].loop if measured else 0
+    judged_on = "rss" if rss_growth is not None and measured_loops >= min_rss_loops else "traced"
+    growth = rss_growth if judged_on == "rss" else traced_growth
+    return SoakResult(
+        loops=samples[-1].loop if samples else 0,
+        seconds=seconds,
+        samples=samples,
+        rss_growth_per_loop=rss_growth,
+        traced_growth_per_loop=traced_growth,
+        subsystem_growth=dict(sorted(subsystem_growth.items(), key=lambda item: -item[1])),
+        top_allocators=top_allocators,
+        passed=growth <= max_growth_bytes_per_loop,
+        judged_on=judged_on,
+    )
@@ -0,0 +1,14 @@
+# Splits free text (search queries, ruleset requests & topics) into casefolded terms for cache & library keys
+
+import re
+from typing import List
+
+# Runs of anything but (Unicode) letters, digits & symbols that change a term's meaning (e.g. C++, C#) separate terms
+TERM_SEPARATOR_PATTERN = re.compile(r"[^\w+#]+", re.UNICODE)
+
+
+def split_terms(text: str) -> List[str]:
+    """
+    Casefold text & split it into terms on punctuation & whitespace, e.g. "Straße, C++!" -> ["strasse", "c++"]
+    """
+    return TERM_SEPARATOR_PATTERN.sub(" ", (text or "").casefold()).split()
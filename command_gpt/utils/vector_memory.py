@@ -0,0 +1,54 @@
+# Vector store memory setup shared by CommandGPT & the RulesetGeneratorAgent (faiss & vectorstores are imported on first use)
+
+from typing import Optional
+
+from langchain.vectorstores.base import VectorStoreRetriever
+
+EMBEDDING_SIZE = 1536  # OpenAI embeddings
+
+
+def create_vectorstore_retriever(
+    embeddings=None,
+    embedding_size: int = EMBEDDING_SIZE,
+    local: bool = False,
+    compression: Optional[str] = None,
+) -> VectorStoreRetriever:
+    """
+    Return a retriever over an empty FAISS vectorstore.
+    - In worker processes connected to a memory server (see memory_server.py), returns a retriever over a new namespace
+      there instead, unless local is True or embeddings are given
+    :param embeddings: Embeddings model, defaults to the shared "default_embeddings" from config.py
+    :param compression: "none", "fp16", "int8" or "pq" (see compressed_memory.py), defaults to MEMORY_COMPRESSION
+    """
+    if not local and embeddings is None:
+        from command_gpt.utils.memory_server import RemoteMemoryRetriever, get_memory_service
+        service = get_memory_service()
+        if service is not None:
+            return RemoteMemoryRetriever(service)
+
+    from langchain.vectorstores import FAISS
+    from config import MEMORY_COMPRESSION
+    from command_gpt.utils.compressed_memory import create_docstore, create_index
+
+    if embeddings is None:
+        from config import get_model
+        embeddings = get_model("default_embeddings")
+
+    compression = compression or MEMORY_COMPRESSION
+    vectorstore = FAISS(embeddings.embed_query,
+                        create_index(embedding_size, compression), create_docstore(compression), {})
+    return vectorstore.as_retriever()
+
+
+def close_retriever(retriever):
+    """
+    Release what a retriever from create_vectorstore_retriever() holds outside the heap (e.g. a compressed index's
+    temporary file of exact vectors, or a memory server namespace). Call once its agent is done with it.
+    """
+    if hasattr(retriever, "close"):
+        retriever.close()
+        return
+    vectorstore = getattr(retriever, "vectorstore", None)
+    close = getattr(getattr(vectorstore, "index", None), "close", None)
+    if close is not None:
+        close()
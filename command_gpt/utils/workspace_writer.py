@@ -0,0 +1,226 @@
+# Workspace write layer: coalesces appends per file, commits atomically (temp file + rename) & notifies listeners of changes
+
+import atexit
+import os
+from pathlib import Path
+import shutil
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Union
+import uuid
+import weakref
+
+from config import WRITE_FLUSH_BYTES, WRITE_FLUSH_DELAY_SECONDS, WRITE_FSYNC_POLICY
+
+# fsync policies
+FSYNC_ALWAYS = "always"  # fsync the file & its directory on every commit
+FSYNC_FILE = "file"  # fsync the file only
+FSYNC_NEVER = "never"  # leave it to the OS
+
+
+class _PendingAppend:
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.size = 0
+        self.first_append_time = time.monotonic()
+
+
+class WorkspaceWriter:
+    """
+    Buffers appends per file & commits them with an atomic temp-file-plus-rename, so a crash never leaves a truncated file.
+    - Appends are coalesced until flush_bytes are pending, flush_delay seconds pass, or the file is read/listed (flush(path)/flush_all()).
+    - Overwrites are committed immediately (discarding any pending appends for that file).
+    - Listeners registered with subscribe() are called with the path after every commit. Bound methods are held weakly,
+      so a listener's owner can still be collected; unsubscribe() detaches one right away.
+    """
+
+    def __init__(
+        self,
+        flush_bytes: int = WRITE_FLUSH_BYTES,
+        flush_delay: float = WRITE_FLUSH_DELAY_SECONDS,
+        fsync_policy: str = WRITE_FSYNC_POLICY,
+    ):
+        self.flush_bytes = flush_bytes
+        self.flush_delay = flush_delay
+        self.fsync_policy = fsync_policy
+        self.commit_count = 0
+        self._pending: Dict[Path, _PendingAppend] = {}
+        self._path_locks: Dict[Path, threading.RLock] = {}
+        # Plain callables, or weakref.WeakMethods for bound methods
+        self._listeners: List[Union[Callable[[Path], None], weakref.WeakMethod]] = []
+        self._lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+
+    # region Writing
+
+    def write(self, path: Path, text: str, append: bool = False):
+        """
+        Write text to path, buffering it if appending.
+        """
+        path = Path(path).resolve()
+        if not append:
+            with self._path_lock(path):
+                with self._lock:
+                    self._pending.pop(path, None)
+                self._commit(path, text, append=False)
+            return
+
+        with self._lock:
+            pending = self._pending.setdefault(path, _PendingAppend())
+            pending.chunks.append(text)
+            pending.size += len(text)
+            should_flush = pending.size >= self.flush_bytes or self.flush_delay <= 0
+            self._start_flusher()
+        if should_flush:
+            self.flush(path)
+
+    def flush(self, path: Path):
+        """
+        Commit any pending appends for path.
+        """
+        path = Path(path).resolve()
+        # Hold the path lock from pop to commit so readers that flush first never see a half-applied state
+        with self._path_lock(path):
+            with self._lock:
+                pending = self._pending.pop(path, None)
+            if pending is not None:
+                self._commit(path, "".join(pending.chunks), append=True)
+
+    def flush_all(self):
+        """
+        Commit all pending appends.
+        """
+        with self._lock:
+            paths = list(self._pending.keys())
+        for path in paths:
+            self.flush(path)
+
+    def subscribe(self, listener: Callable[[Path], None]):
+        """
+        Register a callback that receives the resolved path of every file committed.
+        """
+        if hasattr(listener, "__self__") and hasattr(listener, "__func__"):
+            listener = weakref.WeakMethod(listener)
+        with self._lock:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[Path], None]):
+        with self._lock:
+            self._listeners = [
+                registered for registered in self._listeners
+                if (registered() if isinstance(registered, weakref.WeakMethod) else registered) != listener
+            ]
+
+    def notify(self, path: Path):
+        """
+        Call the listeners for a committed path (also used for files committed by another process, e.g. a process-isolated
+        tool, see tool_executor.py).
+        """
+        path = Path(path).resolve()
+        with self._lock:
+            listeners = list(self._listeners)
+        dead = False
+        for listener in listeners:
+            if isinstance(listener, weakref.WeakMethod):
+                listener = listener()
+                if listener is None:
+                    dead = True
+                    continue
+            listener(path)
+        if dead:
+            with self._lock:
+                self._listeners = [
+                    registered for registered in self._listeners
+                    if not isinstance(registered, weakref.WeakMethod) or registered() is not None
+                ]
+
+    # endregion
+    # region Helpers
+
+    def _commit(self, path: Path, text: str, append: bool):
+        """
+        Write the new contents to a temp file next to path, fsync per policy, then atomically replace path.
+        """
+        with self._path_lock(path):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+            try:
+                with open(tmp_path, "wb") as out:
+                    if append and path.exists():
+                        with open(path, "rb") as src:
+                            shutil.copyfileobj(src, out)
+                    out.write(text.encode("utf-8"))
+                    out.flush()
+                    if self.fsync_policy in (FSYNC_ALWAYS, FSYNC_FILE):
+                        os.fsync(out.fileno())
+                os.replace(tmp_path, path)
+            finally:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+            if self.fsync_policy == FSYNC_ALWAYS:
+                self._fsync_dir(path.parent)
+            self.commit_count += 1
+        self.notify(path)
+
+    def _path_lock(self, path: Path) -> threading.RLock:
+        with self._lock:
+            return self._path_locks.setdefault(path, threading.RLock())
+
+    @staticmethod
+    def _fsync_dir(directory: Path):
+        if not hasattr(os, "O_DIRECTORY"):
+            return  # Directories can't be opened for fsync on Windows
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _start_flusher(self):
+        """
+        Start the background thread that commits appends older than flush_delay. Caller holds self._lock.
+        """
+        if self._flusher is not None or self.flush_delay <= 0:
+            return
+        self._flusher = threading.Thread(
+            target=self._flush_stale_loop, name="workspace-writer", daemon=True)
+        self._flusher.start()
+
+    def _flush_stale_loop(self):
+        while True:
+            time.sleep(self.flush_delay / 2)
+            now = time.monotonic()
+            with self._lock:
+                stale = [path for path, pending in self._pending.items()
+                         if now - pending.first_append_time >= self.flush_delay]
+            for path in stale:
+                self.flush(path)
+
+    # endregion
+
+
+_workspace_writer: Optional[WorkspaceWriter] = None
+_workspace_writer_lock = threading.Lock()
+
+
+def get_workspace_writer() -> WorkspaceWriter:
+    """
+    Return the process-wide WorkspaceWriter, creating it on first use (pending appends are flushed at exit).
+    """
+    global _workspace_writer
+    with _workspace_writer_lock:
+        if _workspace_writer is None:
+            _workspace_writer = WorkspaceWriter()
+            atexit.register(_workspace_writer.flush_all)
+        return _workspace_writer
+
+
+def reset_workspace_writer() -> WorkspaceWriter:
+    """
+    Replace the process-wide WorkspaceWriter with an empty one, e.g. in a forked child: the copy it inherited holds the
+    parent's pending appends & listeners, and no flusher thread.
+    """
+    global _workspace_writer
+    # Not under _workspace_writer_lock, which may have been copied mid-use by fork
+    _workspace_writer = WorkspaceWriter()
+    return _workspace_writer
@@ -1,12 +1,11 @@
 # This file sets up the API keys and default language models for the examples.
 # It includes both OpenAI and HuggingFace Language Models.
+# Models & embeddings are registered lazily: nothing is imported or constructed until first use.
 
 from dotenv import load_dotenv
 import os
 
-from langchain.llms import OpenAI, HuggingFaceHub
-
-from command_gpt.utils.custom_stream import CustomStreamCallback
+from command_gpt.utils.lazy_registry import LazyRegistry
 
 load_dotenv()
 
@@ -16,29 +15,298 @@ OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 HUGGINGFACE_API_KEY = os.environ.get("HUGGINGFACE_API_KEY")
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
 GOOGLE_CSE_ID = os.environ.get("GOOGLE_CSE_ID")
+# Optional Google Custom Search compatible endpoint (e.g. a local stand-in server for tests/benchmarks)
+SEARCH_BACKEND_URL = os.environ.get("SEARCH_BACKEND_URL")
 
 WORKSPACE_DIR = "_gpt_workspace"
 
-# region Instantiate Language Models
+# Search results cache (kept outside the workspace so it isn't listed to the agent)
+SEARCH_CACHE_DIR = "_gpt_cache/search"
+SEARCH_CACHE_TTL_SECONDS = 60 * 60 * 24  # <= 0 disables expiry
+# Max concurrent requests per search backend when fanning out queries
+SEARCH_MAX_CONCURRENCY = 4
+
+# Web page fetching (fetch_url tool)
+PAGE_CACHE_DIR = "_gpt_cache/pages"
+FETCH_MAX_CONCURRENCY = 4
+FETCH_MAX_BYTES = 2_000_000  # Downloads are truncated past this size
+FETCH_TIMEOUT_SECONDS = 15
+
+# Console output (see command_gpt/utils/console_logger.py)
+# - Headless mode emits JSONL events instead of colored text (set COMMAND_GPT_HEADLESS=1)
+CONSOLE_HEADLESS = os.environ.get("COMMAND_GPT_HEADLESS", "") == "1"
+# Streamed tokens are buffered & written once this many chars are pending or after the interval
+CONSOLE_FLUSH_BYTES = 256
+CONSOLE_FLUSH_INTERVAL_SECONDS = 0.05
+# Log the full prompt on the first loop (only its size is logged when False or headless)
+LOG_FULL_PROMPT = True
+
+# Context windows (see command_gpt/prompting/context_budget.py)
+# - Prompts are packed up to the model's window; the slack between local & API token counts is learned from context-length errors
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 4096,
+    "gpt-3.5-turbo-16k": 16384,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "text-davinci-003": 4097,
+}
+CONTEXT_RESPONSE_RESERVE_TOKENS = 1000  # Left free for the response
+CONTEXT_INITIAL_SLACK = 1.0  # Window is divided by the slack (raised when an error shows our counts were low)
+CONTEXT_SLACK_DECAY = 0.01  # Per successful request, toward the largest ratio actually observed
+CONTEXT_SLACK_PATH = "_gpt_cache/context_slack.json"
+
+# Stop streamed responses as soon as the </cmd> tag arrives (only one command is parsed per response)
+STREAM_STOP_AT_COMMAND = True
+
+# How the agent sends commands (see command_gpt/utils/function_calling.py); set COMMAND_GPT_PROTOCOL, or pass protocol per run
+# - "text": <cmd> lines parsed from the reply, with the command list & format rules in the prompt
+# - "functions": tools are sent as function definitions & the model returns JSON arguments (OpenAI function calling models)
+COMMAND_PROTOCOL = os.environ.get("COMMAND_GPT_PROTOCOL", "text")
+
+# Tool execution (see command_gpt/tooling/tool_executor.py)
+# - Timeouts are in seconds, None for no limit; they start once the call runs (a call may wait as long again to start)
+TOOL_DEFAULT_TIMEOUT_SECONDS = 120
+TOOL_TIMEOUTS = {
+    "search": 60,
+    "fetch_url": 90,
+    "human_input": 600,
+}
+# Max simultaneous calls per tool across agents sharing an executor
+TOOL_CONCURRENCY_LIMITS = {
+    "human_input": 1,
+}
+# Tools run in a child process (killed on timeout, memory limited on Unix)
+TOOL_PROCESS_ISOLATED = []
+TOOL_PROCESS_MEMORY_LIMIT_MB = 1024
+TOOL_MAX_WORKERS = 8
+
+# Read-only tool result cache (see command_gpt/tooling/tool_result_cache.py)
+# - Entries are dropped when the WorkspaceWriter commits a path they read (or mtime/size changed)
+TOOL_RESULT_CACHE_ENABLED = True
+TOOL_RESULT_CACHE_TOOLS = ["read_file", "list_directory"]
+TOOL_RESULT_CACHE_MAX_BYTES = 20_000_000
+
+# Tool result budgeting (see command_gpt/tooling/result_budget.py)
+# - Results over TOOL_RESULT_MAX_TOKENS are kept in the workspace; history & memory get a digest with a pointer (<= 0 disables)
+TOOL_RESULT_MAX_TOKENS = 600
+# - read_file pages up to this size are the agent's own paging & are never budgeted (also read_file's per-page cap)
+READ_FILE_MAX_PAGE_CHARS = 8000
+TOOL_RESULT_DIGEST_HEAD_CHARS = 1200
+TOOL_RESULT_DIGEST_TAIL_CHARS = 300
+TOOL_RESULT_SPILL_DIR = "tool_outputs"  # In the workspace, so the agent can page through it with read_file
+# Tools that already write their full output to the workspace (digests point at those files instead)
+TOOL_RESULTS_ON_DISK = ["search", "fetch_url"]
+
+# Repeated commands (see command_gpt/utils/repetition_detector.py)
+# - Commands are fingerprinted with their args & the workspace version over the last REPETITION_WINDOW loops
+REPETITION_WINDOW = 8
+# Read-only commands whose repeats (same args, unchanged workspace) are answered from cache instead of re-run
+REPETITION_CACHEABLE_COMMANDS = ["list_directory", "read_file", "search"]
+REPETITION_CACHE_MAX_ENTRIES = 64
+REPETITION_PREVIEW_CHARS = 1500  # Of the earlier result, included when a repeat is served from cache
+
+# LLM response cache (see command_gpt/utils/llm_cache.py)
+# - Exact-match cache keyed by model, temperature & formatted prompt, for development & reruns (set COMMAND_GPT_LLM_CACHE=1)
+LLM_CACHE_ENABLED = os.environ.get("COMMAND_GPT_LLM_CACHE", "") == "1"
+LLM_CACHE_PATH = "_gpt_cache/llm/responses.sqlite3"
+LLM_CACHE_MAX_BYTES = 50 * 1024 * 1024  # Least recently used responses are evicted past this size
+
+# Shared LLM & embedding request scheduler (see command_gpt/utils/rate_limiter.py)
+# - Token buckets per kind of request, shared by all agents in the process. Set these to your account's quota (None for no limit)
+RATE_LIMITS = {
+    "chat": {"requests_per_minute": 3500, "tokens_per_minute": 90_000},
+    "completion": {"requests_per_minute": 3500, "tokens_per_minute": 90_000},
+    "embeddings": {"requests_per_minute": 3000, "tokens_per_minute": 1_000_000},
+}
+RATE_LIMIT_MAX_RETRIES = 6
+RATE_LIMIT_BACKOFF_SECONDS = 1.0  # Doubles per retry (with jitter), up to the max
+RATE_LIMIT_MAX_BACKOFF_SECONDS = 60.0
+RATE_LIMIT_COMPLETION_TOKENS = 500  # Charged per request for models without max_tokens, corrected after the response
+# Consecutive failed LLM calls CommandGPT tolerates (after the scheduler's retries) before giving up
+LLM_MAX_CONSECUTIVE_ERRORS = 3
+
+# Hedged chat requests (see command_gpt/utils/hedged_llm.py, set COMMAND_GPT_HEDGE=1)
+# - When default_chat_llm hasn't streamed a token by the deadline, the request is also sent to backup_chat_llm & the first to respond is kept
+HEDGE_ENABLED = os.environ.get("COMMAND_GPT_HEDGE", "") == "1"
+HEDGE_BACKUP_MODEL = os.environ.get("COMMAND_GPT_HEDGE_MODEL", "gpt-3.5-turbo-0301")
+HEDGE_BACKUP_API_BASE = os.environ.get("COMMAND_GPT_HEDGE_API_BASE")  # Another endpoint for the backup, e.g. a proxy or Azure deployment
+# Deadline: this percentile of the primary's recent first-token latencies, clamped to the min/max
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20  # Until then the initial delay is used
+HEDGE_INITIAL_DELAY_SECONDS = 5.0
+HEDGE_MIN_DELAY_SECONDS = 0.5
+HEDGE_MAX_DELAY_SECONDS = 20.0
+HEDGE_LATENCY_WINDOW = 200  # Recent latencies the percentile is taken over
+HEDGE_HISTOGRAM_BOUNDS_SECONDS = [0.25, 0.5, 1, 2, 4, 8, 16, 32, 64]
+
+# Ruleset generation (see command_gpt/prompting/ruleset_generator.py)
+# - Candidates are generated concurrently with varied temperatures/instructions & ranked locally (1 = one at a time, streamed)
+# - Each candidate is a full generation request, so opt in with COMMAND_GPT_RULESET_CANDIDATES (or --ruleset-candidates for batch runs)
+RULESET_CANDIDATES = int(os.environ.get("COMMAND_GPT_RULESET_CANDIDATES", "1"))
+# Library of accepted rulesets (see command_gpt/prompting/ruleset_library.py)
+# - Rulesets for the same or a very similar request & topic are reused; less similar ones seed generation
+RULESET_LIBRARY_ENABLED = True
+RULESET_LIBRARY_PATH = "_gpt_cache/ruleset_library.jsonl"
+RULESET_LIBRARY_REUSE_SIMILARITY = 0.97  # Cosine similarity of the "request: topic" embeddings
+RULESET_LIBRARY_SEED_SIMILARITY = 0.88
+
+# Compressed vector memory (see command_gpt/utils/compressed_memory.py)
+# - "none" (float32 IndexFlatL2), "fp16" or "int8" (scalar quantization) or "pq" (product quantization); set COMMAND_GPT_MEMORY_COMPRESSION
+# - Compressed modes also keep memory texts zlib-compressed; int8 & pq re-rank candidates by exact vectors kept in a temp file
+MEMORY_COMPRESSION = os.environ.get("COMMAND_GPT_MEMORY_COMPRESSION", "none")
+# - int8 & pq search exact vectors until MEMORY_COMPRESSION_TRAIN_SIZE are stored, then train on them; smaller stores stay
+#   uncompressed unless a memory server shares one quantizer across agents (benchmark: memory --entries 200 --shared-quantizer)
+MEMORY_COMPRESSION_TRAIN_SIZE = 1024
+MEMORY_PQ_SUBQUANTIZERS = 96  # 16 dimensions each for 1536-dim embeddings
+MEMORY_PQ_BITS = 8  # 96 byte codes
+MEMORY_RERANK_FACTOR = 16  # Candidates per result re-ranked by exact distance (int8 & pq)
+MEMORY_TEXT_COMPRESSION_LEVEL = 6
+
+# Memory server for sharded batch runs (see command_gpt/utils/memory_server.py)
+MEMORY_SERVER_EMBEDDING_CACHE_SIZE = 10_000  # Embeddings cached by exact text, shared by all agents
+MEMORY_SERVER_SEARCH_K = 4  # Documents returned per memory lookup (as with a local retriever)
+
+# Soak test (python -m command_gpt.utils.benchmarks soak, see command_gpt/utils/soak_test.py)
+SOAK_LOOPS = 2000
+SOAK_SAMPLE_EVERY = 100
+SOAK_WARMUP_LOOPS = 200  # Growth is measured from here on
+SOAK_MAX_GROWTH_BYTES_PER_LOOP = 20_000  # RSS slope that fails the run (~10KB/loop is expected: history, FAISS vectors & docstore)
+# RSS grows in allocator-sized steps, so its slope is only judged over at least this many loops after warmup; shorter runs
+# are judged on tracemalloc's (exact) growth instead, which leaves out FAISS vectors
+SOAK_MIN_RSS_LOOPS = 1000
+SOAK_TRACE_FRAMES = 8  # tracemalloc frames kept per allocation
+
+# Batch runs (python -m command_gpt run, see command_gpt/batch.py)
+# - Each job gets its own workspace under BATCH_DIR/<batch>/<job>
+BATCH_DIR = "_gpt_batches"
+BATCH_MAX_WORKERS = 4
+# Worker processes agents are sharded across (1 runs every job on threads in this process)
+# - Vector memory & embeddings are served by one memory server process; rate limits are split between the workers
+BATCH_PROCESSES = 1
+BATCH_MAX_LOOPS = 25  # Jobs that haven't run the finish command by then are stopped
+# Request used to generate rulesets for jobs given only a topic
+BATCH_DEFAULT_REQUEST = "search the web, read research papers, and project future trends on"
+
+# Local HTTP job service (python -m command_gpt serve, see command_gpt/service.py)
+# - Jobs are logged to SERVICE_DIR/jobs.jsonl (unfinished ones are re-queued on restart) & run in SERVICE_DIR/jobs/<id>
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_DIR = "_gpt_service"
+SERVICE_MAX_WORKERS = 4  # Jobs run at once
+SERVICE_MAX_QUEUED = 1000  # Submissions past this are refused (503)
+SERVICE_EVENT_HISTORY = 1000  # Recent events kept for /events (per job: SERVICE_JOB_EVENT_HISTORY)
+SERVICE_JOB_EVENT_HISTORY = 500
+SERVICE_EVENT_RETENTION_SECONDS = 600  # A finished job's events are dropped this long after it ends
+SERVICE_JOB_RETENTION = 1000  # Finished jobs kept in memory & jobs.jsonl (the oldest are forgotten; their directories stay)
+SERVICE_SSE_KEEPALIVE_SECONDS = 15
+SERVICE_THROUGHPUT_WINDOW_SECONDS = 300  # Jobs & loops per minute are averaged over this window
+
+# Workspace writes (see command_gpt/utils/workspace_writer.py)
+# - Appends are coalesced & committed once this many chars are pending or after the delay
+WRITE_FLUSH_BYTES = 64 * 1024
+WRITE_FLUSH_DELAY_SECONDS = 1.0
+WRITE_FSYNC_POLICY = "file"  # "always" (file & directory), "file", or "never"
+
+# region Language Model Registry
 # - Different models can be used for different results/use cases
 # - Temperature - 0-1: "randomness/diversity" of output (higher = more random)
+# - Access with get_model("name") (or `from config import default_llm_open_ai`); each is built on first use
+
+model_registry = LazyRegistry()
+
+
+def _with_rate_limits(model, kind: str):
+    """Route model's requests through the shared scheduler for kind (see RATE_LIMITS)"""
+    from command_gpt.utils.rate_limiter import with_rate_limits
+    return with_rate_limits(model, kind)
+
+
+def _with_response_cache(llm):
+    """Put the persistent response cache in front of llm if LLM_CACHE_ENABLED"""
+    if not LLM_CACHE_ENABLED:
+        return llm
+    from command_gpt.utils.llm_cache import with_response_cache
+    return with_response_cache(llm)
+
+
+def _create_default_llm_open_ai():
+    """Paid OpenAI model (https://openai.com/blog/openai-api)"""
+    from langchain.llms import OpenAI
+    from command_gpt.utils.custom_stream import CustomStreamCallback
+    return _with_response_cache(_with_rate_limits(OpenAI(
+        temperature=0.2,
+        max_tokens=2500,
+        streaming=True,
+        callbacks=[CustomStreamCallback()]  # Sets up output stream with colors
+    ), "completion"))
+
+
+def _create_default_llm_hugging_face():
+    """Free HuggingFace model (https://huggingface.co/google/flan-t5-xl)"""
+    from langchain.llms import HuggingFaceHub
+    from command_gpt.utils.custom_stream import CustomStreamCallback
+    return _with_response_cache(HuggingFaceHub(
+        repo_id="google/flan-t5-xl",
+        model_kwargs={
+            "temperature": 0.6,
+            "max_length": 64
+        },
+        callbacks=[CustomStreamCallback()]  # Sets up output stream with colors
+    ))
+
+
+def _create_default_chat_llm():
+    """OpenAI chat model with streaming for live output (used by main.py), hedged with backup_chat_llm if HEDGE_ENABLED"""
+    from command_gpt.utils.custom_stream import CustomStreamCallback
+    from command_gpt.utils.function_calling import FunctionCallingChatOpenAI
+    llm = _with_rate_limits(FunctionCallingChatOpenAI(
+        temperature=0.2,
+        streaming=True,
+        verbose=True,
+        callbacks=[CustomStreamCallback()]
+    ), "chat")
+    if HEDGE_ENABLED:
+        from command_gpt.utils.hedged_llm import with_hedging
+        llm = with_hedging(llm, [get_model("backup_chat_llm")])
+    return _with_response_cache(llm)
+
+
+def _create_backup_chat_llm():
+    """Chat model hedged requests fall back to (HEDGE_BACKUP_MODEL, at HEDGE_BACKUP_API_BASE if set); streams through the hedge's callbacks"""
+    from command_gpt.utils.function_calling import FunctionCallingChatOpenAI
+    kwargs = {"openai_api_base": HEDGE_BACKUP_API_BASE} if HEDGE_BACKUP_API_BASE else {}
+    return _with_rate_limits(FunctionCallingChatOpenAI(
+        model_name=HEDGE_BACKUP_MODEL,
+        temperature=0.2,
+        streaming=True,
+        **kwargs,
+    ), "chat")
+
+
+def _create_default_embeddings():
+    """OpenAI embeddings used for vector memory"""
+    from langchain.embeddings import OpenAIEmbeddings
+    return _with_rate_limits(OpenAIEmbeddings(), "embeddings")
+
+
+model_registry.register("default_llm_open_ai", _create_default_llm_open_ai)
+model_registry.register("default_llm_hugging_face", _create_default_llm_hugging_face)
+model_registry.register("default_chat_llm", _create_default_chat_llm)
+model_registry.register("backup_chat_llm", _create_backup_chat_llm)
+model_registry.register("default_embeddings", _create_default_embeddings)
+
+
+def get_model(name: str):
+    """
+    Return a registered model or embeddings instance, building it on first use.
+    """
+    return model_registry.get(name)
+
 
-# Paid OpenAI model (https://openai.com/blog/openai-api)
-default_llm_open_ai = OpenAI(
-    temperature=0.2,
-    max_tokens=2500,
-    streaming=True,
-    callbacks=[CustomStreamCallback()]  # Sets up output stream with colors
-)
-
-# Free HuggingFace model (https://huggingface.co/google/flan-t5-xl)
-default_llm_hugging_face = HuggingFaceHub(
-    repo_id="google/flan-t5-xl",
-    model_kwargs={
-        "temperature": 0.6,
-        "max_length": 64
-    },
-    callbacks=[CustomStreamCallback()]  # Sets up output stream with colors
-)
+def __getattr__(name: str):
+    # Keeps `from config import default_llm_open_ai` working without building every model at import
+    if name in model_registry:
+        return model_registry.get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # endregion
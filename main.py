@@ -1,39 +1,19 @@
 # This file initializes and starts a CommandGPT instance with a custom stream callback.
 # A custom ruleset can be provided, or one can be generated using the RulesetGeneratorAgent.
 
-from langchain.vectorstores import FAISS
-from langchain.docstore import InMemoryDocstore
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.chat_models import ChatOpenAI
-
-import faiss
 from command_gpt.prompting.ruleset_generator import RulesetGeneratorAgent
 
-from config import default_llm_open_ai
+from config import RULESET_LIBRARY_ENABLED, get_model
+from command_gpt.prompting.ruleset_library import get_ruleset_library
 from command_gpt.tooling.toolkits import BaseToolkit, MemoryOnlyToolkit
-from command_gpt.utils.custom_stream import CustomStreamCallback
+from command_gpt.utils.vector_memory import create_vectorstore_retriever
 from command_gpt.command_gpt import CommandGPT
 
 # region Setup
 
-# See config.py for API key setup and default LLMs
-llm_open_ai = default_llm_open_ai
-
-# Define your embedding model
-embeddings_model = OpenAIEmbeddings()
-# Initialize the vectorstore as empty
-embedding_size = 1536
-index = faiss.IndexFlatL2(embedding_size)
-vectorstore = FAISS(embeddings_model.embed_query,
-                    index, InMemoryDocstore({}), {})
-
+# See config.py for API key setup and default LLMs (models are built on first use)
 # Prepare LLM with streaming for live output
-llm = ChatOpenAI(
-    temperature=0.2,
-    streaming=True,
-    verbose=True,
-    callbacks=[CustomStreamCallback()]
-)
+llm = get_model("default_chat_llm")
 
 placeholder_ruleset = """
 You are ECO-gpt, an AI designed to search the web, read research papers, and project future trends on ecosystem deterioration, climate change, and the future of humanity. 
@@ -57,8 +37,12 @@ custom_ruleset = """
 # - RulesetGeneratorAgent.from_request_and_topic() generates a ruleset from a hardcoded request and topic
 # - RulesetGeneratorAgent.from_request_prompt_for_topic() prompts user for topic (e.g. "Generate a ruleset for CommandGPT that will {request provided in constructor}: {topic}")
 # - RulesetGeneratorAgent.from_empty_prompt_for_request_and_topic() prompts user for request and topic (e.g. "Generate a ruleset for CommandGPT that will {request}: {topic}")
+# - run_with_library() reuses a stored ruleset for the same/similar request & topic, or stores the new one (see RULESET_LIBRARY_* in config.py)
 
 # To initialize CommandGPT with a custom ruleset, paste it above, NOT HERE
+ruleset_library = get_ruleset_library() if RULESET_LIBRARY_ENABLED else None
+ruleset_generator = None
+
 if custom_ruleset != """
 ...paste ruleset here...
 """:
@@ -74,33 +58,45 @@ else:  # If no custom ruleset is specified above
             prompt_for_topic="predict future trends on",
             llm=llm
         )
-        current_ruleset = ruleset_generator.run()  # Interactive, accepts user feedback
     else:
         # Generate ruleset from hard coded values
-        ruleset_generator_no_input = RulesetGeneratorAgent.from_request_and_topic(
+        ruleset_generator = RulesetGeneratorAgent.from_request_and_topic(
             request="search the web, read research papers, and project future trends on",
             topic="ecosystem deterioration, climate change, and the future of humanity",
             llm=llm
         )
-        # Interactive, accepts user feedback
-        current_ruleset = ruleset_generator_no_input.run()
+
+    # Interactive, accepts user feedback
+    if ruleset_library is not None:
+        current_ruleset = ruleset_generator.run_with_library(ruleset_library)
+    else:
+        current_ruleset = ruleset_generator.run()
 
 # endregion
 # region CommandGPT Initialization
 
-# Prepare toolkits
+# Prepare toolkits (tools are only constructed when get_toolkit() is called)
 base_toolkit = BaseToolkit()  # Contains all tools
 no_web_toolkit = MemoryOnlyToolkit()  # Contains all tools except search/web
 
-# Initialize CommandGPT with tools, LLM, and memory
+# Initialize CommandGPT with tools, LLM, and memory (empty FAISS vectorstore)
 command_gpt = CommandGPT.from_ruleset_and_tools(
     current_ruleset,
     tools=base_toolkit.get_toolkit(),
     llm=llm,
-    memory=vectorstore.as_retriever()
+    memory=create_vectorstore_retriever()
 )
 
 # Run CommandGPT
 command_gpt.run()
 
+# Record how the stored ruleset did, so lookups prefer rulesets that finish
+if ruleset_generator is not None and ruleset_generator.library_entry_id:
+    ruleset_library.record_outcome(
+        ruleset_generator.library_entry_id,
+        "finished" if command_gpt.finished else "stopped",
+        command_gpt.loop_count,
+        command_gpt.prompt_tokens + command_gpt.completion_tokens,
+    )
+
 # endregion
@@ -0,0 +1,21 @@
+# Shared test setup: import the package from the repo root & keep everything offline
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Models are created lazily (see model_registry in config.py), but langchain's OpenAI wrappers check for a key
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    """Empty workspace directory, with the shared WorkspaceWriter flushed after the test"""
+    from command_gpt.utils.workspace_writer import get_workspace_writer
+
+    path = tmp_path / "workspace"
+    path.mkdir()
+    yield path
+    get_workspace_writer().flush_all()
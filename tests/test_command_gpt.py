@@ -0,0 +1,99 @@
+import pytest
+from langchain.schema import SystemMessage
+
+from command_gpt.command_gpt import LOOP_FINISH, CommandGPT
+from command_gpt.tooling.tool_executor import STATUS_OK
+from command_gpt.tooling.toolkits import MemoryOnlyToolkit
+from command_gpt.utils.command_parser import PROTOCOL_FUNCTIONS, PROTOCOL_TEXT
+from command_gpt.utils.function_calling import get_function_call
+from command_gpt.utils.offline_models import HashEmbeddings, ScriptedChatModel
+from command_gpt.utils.vector_memory import create_vectorstore_retriever
+
+RULESET = "You are test-gpt, an AI designed to take notes on a topic."
+
+SCRIPT = [
+    "I'll start the notes.\n<cmd>write_file --file_path notes.md --text \"Roman roads were paved.\"</cmd>",
+    "I'll add to them.\n<cmd>write_file --file_path notes.md --text \"\\nSome are still in use.\" --append true</cmd>",
+    "Let me check the file.\n<cmd>read_file --file_path notes.md</cmd>",
+    "Let me look at the workspace.\n<cmd>list_directory</cmd>",
+    "Done.\n<cmd>finish --response \"notes written\"</cmd>",
+]
+
+
+def create_agent(workspace, protocol, script=SCRIPT):
+    tools = MemoryOnlyToolkit(
+        workspace_dir=str(workspace), excluded_tools=["search", "fetch_url", "human_input"]).get_toolkit()
+    return CommandGPT.from_ruleset_and_tools(
+        RULESET,
+        memory=create_vectorstore_retriever(HashEmbeddings()),
+        tools=tools,
+        llm=ScriptedChatModel(responses=script),
+        workspace_dir=str(workspace),
+        protocol=protocol,
+    )
+
+
+def tool_results(agent):
+    return [m.content for m in agent.full_message_history if isinstance(m, SystemMessage)]
+
+
+@pytest.mark.parametrize("protocol", [PROTOCOL_TEXT, PROTOCOL_FUNCTIONS])
+def test_runs_script_to_finish(workspace, protocol):
+    agent = create_agent(workspace, protocol)
+    events = []
+    agent.subscribe(events.append)
+    try:
+        assert agent.run(max_loops=10) == "notes written"
+    finally:
+        agent.close()
+
+    assert agent.finished and agent.loop_count == 5
+    assert [(e.command, e.status) for e in events] == [
+        ("write_file", STATUS_OK),
+        ("write_file", STATUS_OK),
+        ("read_file", STATUS_OK),
+        ("list_directory", STATUS_OK),
+        ("finish", LOOP_FINISH),
+    ]
+    results = tool_results(agent)
+    assert len(results) == 4
+    assert "Roman roads were paved.\nSome are still in use." in results[2]
+    assert "notes.md" in results[3]
+    assert (workspace / "notes.md").read_text() == "Roman roads were paved.\nSome are still in use."
+    assert len(agent.memory.vectorstore.index_to_docstore_id) == 4
+
+
+def test_function_protocol_sends_function_calls(workspace):
+    agent = create_agent(workspace, PROTOCOL_FUNCTIONS)
+    try:
+        agent.run(max_loops=1)
+    finally:
+        agent.close()
+
+    reply = agent.full_message_history[1]
+    assert reply.content == "I'll start the notes."
+    assert get_function_call(reply)["name"] == "write_file"
+    assert agent.chain.prompt.function_definitions
+
+
+@pytest.mark.parametrize("protocol", [PROTOCOL_TEXT, PROTOCOL_FUNCTIONS])
+def test_reply_without_command_reports_error_and_continues(workspace, protocol):
+    script = ["I'm not sure what to do.", "<cmd>finish --response done</cmd>"]
+    agent = create_agent(workspace, protocol, script)
+    try:
+        assert agent.run(max_loops=5) == "done"
+    finally:
+        agent.close()
+
+    assert agent.loop_count == 2
+    assert tool_results(agent) == [agent.output_parser.get_format_instructions()]
+
+
+def test_stops_at_max_loops(workspace):
+    agent = create_agent(workspace, PROTOCOL_TEXT, SCRIPT[2:4])
+    try:
+        assert agent.run(max_loops=3) == ""
+    finally:
+        agent.close()
+
+    assert not agent.finished and agent.loop_count == 3
@@ -0,0 +1,129 @@
+import json
+
+from langchain.schema import AIMessage
+
+from command_gpt.utils.command_parser import (
+    DEFAULT_ARG_NAME,
+    CommandGPTOutputParser,
+    FunctionCallOutputParser,
+)
+from command_gpt.utils.function_calling import function_call_message
+
+
+# region <cmd> lines
+
+def test_parses_well_formed_command():
+    command = CommandGPTOutputParser().parse(
+        'Let me save that.\n<cmd>write_file --file_path notes.md --text "Some notes"</cmd>')
+    assert command.name == "write_file"
+    assert command.args == {"file_path": "notes.md", "text": "Some notes"}
+    assert command.repairs == ()
+
+
+def test_repairs_missing_closing_tag():
+    command = CommandGPTOutputParser().parse("<cmd>read_file --file_path notes.md")
+    assert command.args == {"file_path": "notes.md"}
+    assert "added missing </cmd>" in command.repairs
+
+
+def test_keeps_apostrophes_and_inner_quotes_in_values():
+    command = CommandGPTOutputParser().parse(
+        """<cmd>write_file --file_path a.md --text "It's "fine" now" --append true</cmd>""")
+    assert command.args == {"file_path": "a.md", "text": 'It\'s "fine" now', "append": "true"}
+
+
+def test_repairs_unbalanced_quote():
+    command = CommandGPTOutputParser().parse('<cmd>write_file --file_path a.md --text "never closed</cmd>')
+    assert command.args["text"] == "never closed"
+    assert 'closed unbalanced " quote' in command.repairs
+
+
+def test_repairs_unquoted_bare_and_positional_values():
+    command = CommandGPTOutputParser().parse("<cmd>search large language models --verbose</cmd>")
+    assert command.args == {DEFAULT_ARG_NAME: "large language models", "verbose": "true"}
+    assert set(command.repairs) == {f"mapped positional value to --{DEFAULT_ARG_NAME}", "set bare --verbose to true"}
+
+
+def test_splits_flag_equals_value():
+    command = CommandGPTOutputParser().parse('<cmd>read_file --file_path="my notes.md" --offset=10</cmd>')
+    assert command.args == {"file_path": "my notes.md", "offset": "10"}
+
+
+def test_missing_command_line_is_an_error():
+    command = CommandGPTOutputParser().parse("I'm not sure what to do next.")
+    assert command.name == "ERROR"
+
+# endregion
+# region Function calls
+
+
+def parse_arguments(arguments):
+    return FunctionCallOutputParser().parse_call({"name": "write_file", "arguments": arguments})
+
+
+def test_parses_function_call_message():
+    message = function_call_message("Saving.", {"name": "write_file", "arguments": '{"file_path": "a.md", "text": "hi"}'})
+    command = FunctionCallOutputParser().parse_message(message)
+    assert command == ("write_file", {"file_path": "a.md", "text": "hi"}, ())
+
+
+def test_reply_without_function_call_is_an_error():
+    assert FunctionCallOutputParser().parse_message(AIMessage(content="Just text")).name == "ERROR"
+
+
+def test_removes_function_name_prefix():
+    command = FunctionCallOutputParser().parse_call({"name": "functions.list_directory", "arguments": "{}"})
+    assert command.name == "list_directory"
+    assert command.repairs == ("removed functions. prefix",)
+
+
+def test_repairs_code_fence():
+    command = parse_arguments('```json\n{"file_path": "a.md"}\n```')
+    assert command.args == {"file_path": "a.md"}
+    assert command.repairs == ("removed code fence around arguments",)
+
+
+def test_repairs_unescaped_backslashes():
+    command = parse_arguments(r'{"file_path": "C:\data\docs.md"}')
+    assert command.args == {"file_path": r"C:\data\docs.md"}
+    assert "escaped backslashes in arguments" in command.repairs
+
+
+def test_closes_truncated_arguments():
+    command = parse_arguments('{"file_path": "a.md", "text": "cut off mid')
+    assert command.args == {"file_path": "a.md", "text": "cut off mid"}
+    assert "closed truncated arguments" in command.repairs
+
+
+def test_cuts_truncated_arguments_back_to_last_complete_one():
+    command = parse_arguments('{"file_path": "a.md", "append": tr')
+    assert command.args == {"file_path": "a.md"}
+    assert "closed truncated arguments" in command.repairs
+
+
+def test_ignores_text_after_arguments():
+    command = parse_arguments('{"file_path": "a.md"} I hope that helps!')
+    assert command.args == {"file_path": "a.md"}
+    assert command.repairs == ("ignored text after arguments",)
+
+
+def test_reads_single_quoted_arguments():
+    command = parse_arguments("{'file_path': 'a.md', 'text': \"it's\"}")
+    assert command.args == {"file_path": "a.md", "text": "it's"}
+    assert command.repairs == ("read single-quoted arguments",)
+
+
+def test_accepts_raw_newlines_in_strings():
+    assert parse_arguments('{"text": "line one\nline two"}').args == {"text": "line one\nline two"}
+
+
+def test_invalid_arguments_are_an_error():
+    assert parse_arguments("not arguments at all").name == "ERROR"
+    assert parse_arguments("[1, 2]").name == "ERROR"
+
+
+def test_parse_takes_serialized_call():
+    text = json.dumps({"name": "read_file", "arguments": '{"file_path": "a.md"}'})
+    assert FunctionCallOutputParser().parse(text).args == {"file_path": "a.md"}
+
+# endregion
@@ -0,0 +1,140 @@
+import faiss
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+
+from command_gpt.utils.compressed_memory import (
+    COMPRESSION_FP16,
+    COMPRESSION_INT8,
+    COMPRESSION_PQ,
+    CompressedDocstore,
+    CompressedIndex,
+    create_index,
+    train_quantizer,
+)
+from command_gpt.utils.offline_models import HashEmbeddings
+from command_gpt.utils.vector_memory import create_vectorstore_retriever
+
+# Splits into MEMORY_PQ_SUBQUANTIZERS (96) subquantizers of 2 dimensions
+DIM = 192
+TRAIN_SIZE = 256
+
+
+def clustered_vectors(count: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((count // 20, DIM)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=count)] + rng.standard_normal((count, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def create_compressed(mode: str) -> CompressedIndex:
+    return CompressedIndex(DIM, mode, train_size=TRAIN_SIZE)
+
+
+def recall(index, vectors: np.ndarray, queries: np.ndarray, k: int = 4) -> float:
+    exact = faiss.IndexFlatL2(DIM)
+    exact.add(vectors)
+    _, expected = exact.search(queries, k)
+    _, found = index.search(queries, k)
+    return np.mean([len(set(a) & set(b)) / k for a, b in zip(found, expected)])
+
+
+@pytest.mark.parametrize("mode", [COMPRESSION_FP16, COMPRESSION_INT8, COMPRESSION_PQ])
+def test_compressed_search_matches_flat_search(mode):
+    vectors = clustered_vectors(1000, seed=0)
+    queries = vectors[:50] + 0.05 * clustered_vectors(50, seed=1)
+    index = create_compressed(mode)
+    try:
+        for start in range(0, len(vectors), 100):
+            index.add(vectors[start:start + 100])
+        assert index.ntotal == 1000 and index.is_trained
+        assert recall(index, vectors, queries) >= 0.95
+        assert index.memory_bytes() <= vectors.nbytes / 2
+    finally:
+        index.close()
+
+
+def test_untrained_index_searches_exact_vectors_until_train_size():
+    vectors = clustered_vectors(TRAIN_SIZE, seed=0)
+    index = create_compressed(COMPRESSION_INT8)
+    try:
+        index.add(vectors[:-1])
+        assert not index.is_trained
+        assert index.memory_bytes() == (TRAIN_SIZE - 1) * DIM * 4
+        assert recall(index, vectors[:-1], vectors[:10]) == 1
+
+        index.add(vectors[-1:])
+        assert index.is_trained
+        assert index.memory_bytes() == TRAIN_SIZE * DIM
+    finally:
+        index.close()
+
+
+def test_reranked_modes_reconstruct_exact_vectors():
+    vectors = clustered_vectors(TRAIN_SIZE, seed=0)
+    index = create_compressed(COMPRESSION_INT8)
+    try:
+        index.add(vectors)
+        np.testing.assert_array_equal(index.reconstruct(7), vectors[7])
+    finally:
+        index.close()
+
+
+def test_small_indexes_share_one_trained_quantizer():
+    quantizer = train_quantizer(DIM, COMPRESSION_PQ, clustered_vectors(TRAIN_SIZE, seed=2))
+    indexes = [create_compressed(COMPRESSION_PQ) for _ in range(2)]
+    vectors = clustered_vectors(200, seed=0)
+    try:
+        for index in indexes:
+            index.add(vectors[:50])
+            assert index.use_quantizer(quantizer)
+            # Later additions are encoded by the shared quantizer too
+            index.add(vectors[50:])
+            assert index.ntotal == 200
+            # 96 byte codes, without a copy of the codebook
+            assert index.memory_bytes() == 200 * 96
+            assert recall(index, vectors, vectors[:20] + 0.05 * clustered_vectors(20, seed=3)) >= 0.95
+        assert indexes[0].use_quantizer(quantizer) is False
+    finally:
+        for index in indexes:
+            index.close()
+
+
+def test_shared_quantizer_must_match_dimensions():
+    index = create_compressed(COMPRESSION_INT8)
+    try:
+        with pytest.raises(ValueError):
+            index.use_quantizer(train_quantizer(DIM * 2, COMPRESSION_INT8, clustered_vectors(20, seed=0).repeat(2, axis=1)))
+    finally:
+        index.close()
+
+
+def test_modes_are_validated():
+    assert isinstance(create_index(DIM, "none"), faiss.IndexFlatL2)
+    with pytest.raises(ValueError):
+        create_index(DIM, "int4")
+    with pytest.raises(ValueError):
+        CompressedIndex(DIM, COMPRESSION_PQ, pq_subquantizers=7)
+
+
+def test_docstore_keeps_texts_compressed():
+    docstore = CompressedDocstore()
+    text = "Result: Command read_file returned: " + "the roads of rome " * 50
+    docstore.add({"a": Document(page_content=text, metadata={"loop": 1})})
+
+    assert docstore.search("a") == Document(page_content=text, metadata={"loop": 1})
+    assert docstore.text_bytes() < len(text) / 4
+    assert docstore.search("b") == "ID b not found."
+    with pytest.raises(ValueError):
+        docstore.add({"a": Document(page_content="again")})
+
+
+def test_compressed_retriever_finds_relevant_memories():
+    retriever = create_vectorstore_retriever(HashEmbeddings(), compression=COMPRESSION_FP16)
+    retriever.vectorstore.add_texts([
+        "Roman roads were paved with stone",
+        "Carthage was founded by the Phoenicians",
+        "Aqueducts carried water into Rome",
+    ])
+    documents = retriever.get_relevant_documents("paved roads")
+    assert documents[0].page_content == "Roman roads were paved with stone"
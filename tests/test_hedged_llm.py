@@ -0,0 +1,96 @@
+import time
+
+import pytest
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.schema import HumanMessage
+
+from command_gpt.utils.hedged_llm import LatencyHistogram, with_hedging
+from command_gpt.utils.offline_models import DelayedChatModel
+
+MESSAGES = [HumanMessage(content="Go")]
+
+
+class TokenCollector(BaseCallbackHandler):
+    def __init__(self):
+        self.tokens = []
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        self.tokens.append(token)
+
+
+def create_hedged(primary: DelayedChatModel, backup: DelayedChatModel, **kwargs):
+    kwargs = {"initial_delay_seconds": 0.2, "min_delay_seconds": 0.01, "min_samples": 5, **kwargs}
+    return with_hedging(primary, [backup], **kwargs)
+
+
+def test_fast_primary_is_not_hedged():
+    backup = DelayedChatModel(responses=["backup reply"])
+    hedged = create_hedged(DelayedChatModel(responses=["primary reply"]), backup)
+
+    assert hedged.predict_messages(MESSAGES).content == "primary reply"
+    stats = hedged.stats()
+    assert (stats["hedges"], stats["hedge_wins"]) == (0, 0)
+    assert backup.started == 0
+    assert stats["backends"]["delayed"]["wins"] == 1
+
+
+def test_stalled_primary_loses_to_the_backup():
+    collector = TokenCollector()
+    primary = DelayedChatModel(responses=["primary reply"], stall_every=1, stall_seconds=2, callbacks=[collector])
+    hedged = create_hedged(primary, DelayedChatModel(responses=["backup reply"]))
+
+    start = time.monotonic()
+    assert hedged.predict_messages(MESSAGES).content == "backup reply"
+    assert time.monotonic() - start < 1
+    assert "".join(collector.tokens) == "backup reply"
+
+    stats = hedged.stats()
+    assert (stats["hedges"], stats["hedge_wins"]) == (1, 1)
+    primary_stats, backup_stats = stats["backends"]["delayed"], stats["backends"]["delayed (1)"]
+    assert (primary_stats["requests"], primary_stats["wins"], primary_stats["cancelled"]) == (1, 0, 1)
+    assert (backup_stats["requests"], backup_stats["wins"]) == (1, 1)
+    # The primary's first-token latency is recorded as censored at the time it lost
+    assert primary_stats["first_token"]["count"] == 1
+    assert primary_stats["first_token"]["max"] >= 0.2
+
+
+def test_failed_primary_is_hedged_without_waiting_for_the_deadline():
+    primary = DelayedChatModel(responses=["primary reply"], fail_every=1)
+    hedged = create_hedged(primary, DelayedChatModel(responses=["backup reply"]), initial_delay_seconds=5)
+
+    start = time.monotonic()
+    assert hedged.predict_messages(MESSAGES).content == "backup reply"
+    assert time.monotonic() - start < 1
+    assert hedged.stats()["backends"]["delayed"]["errors"] == 1
+
+
+def test_error_is_raised_when_every_backend_fails():
+    hedged = create_hedged(DelayedChatModel(responses=["a"], fail_every=1),
+                           DelayedChatModel(responses=["b"], fail_every=1))
+    with pytest.raises(ConnectionError):
+        hedged.predict_messages(MESSAGES)
+
+
+def test_deadline_follows_the_primarys_first_token_latency():
+    primary = DelayedChatModel(responses=["primary reply"], first_token_seconds=0.05)
+    hedged = create_hedged(primary, DelayedChatModel(responses=["backup reply"]), initial_delay_seconds=1)
+    assert hedged.hedge_delay() == 1
+
+    for _ in range(5):
+        hedged.predict_messages(MESSAGES)
+    assert hedged.hedge_delay() == pytest.approx(0.05, abs=0.05)
+    assert hedged.stats()["hedges"] == 0
+
+
+def test_latency_histogram_buckets_and_percentiles():
+    histogram = LatencyHistogram(bounds=[0.5, 1, 2], window=4)
+    for seconds in [0.1, 0.7, 1.5, 3, 0.2]:
+        histogram.record(seconds)
+
+    summary = histogram.summary()
+    assert summary["buckets"] == {"<=0.5s": 2, "<=1s": 1, "<=2s": 1, ">2s": 1}
+    assert (summary["count"], summary["max"]) == (5, 3)
+    # Percentiles only cover the window of recent samples
+    assert histogram.samples() == 4
+    assert histogram.percentile(50) == 0.7
+    assert histogram.percentile(100) == 3
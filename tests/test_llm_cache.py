@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+from langchain.llms.fake import FakeListLLM
+from langchain.schema import HumanMessage, SystemMessage
+
+from command_gpt.prompting.prompt import TIME_PROMPT_PREFIX
+from command_gpt.utils.custom_stream import CommandComplete
+from command_gpt.utils.function_calling import function_definitions, get_function_call
+from command_gpt.utils.llm_cache import ResponseCache, with_response_cache
+from command_gpt.utils.offline_models import ScriptedChatModel
+
+
+class AsyncFakeListLLM(FakeListLLM):
+    calls: int = 0
+
+    def _call(self, prompt, stop=None, run_manager=None):
+        self.calls += 1
+        return super()._call(prompt, stop)
+
+    async def _acall(self, prompt, stop=None, run_manager=None):
+        return self._call(prompt, stop)
+
+
+class CutChatModel(ScriptedChatModel):
+    """Stops its reply at </cmd> the way CommandStreamDetector does"""
+
+    def _generate(self, messages, stop=None, run_manager=None):
+        text = self.next_response()
+        raise CommandComplete(text[:text.index("</cmd>") + len("</cmd>")])
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(path=str(tmp_path / "responses.sqlite3"))
+
+
+def prompt_messages(time="10:00"):
+    return [SystemMessage(content=f"You are a tester.\n{TIME_PROMPT_PREFIX} {time}"), HumanMessage(content="Go")]
+
+
+def test_repeated_chat_prompt_is_served_from_cache(cache):
+    model = ScriptedChatModel(responses=["first", "second"])
+    cached = with_response_cache(model, cache)
+
+    assert cached.predict_messages(prompt_messages("10:00")).content == "first"
+    # Only the time line differs, so this is the same prompt
+    assert cached.predict_messages(prompt_messages("11:30")).content == "first"
+    assert model.calls == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    assert cached.predict_messages([HumanMessage(content="Something else")]).content == "second"
+    assert model.calls == 2
+
+
+def test_async_chat_requests_share_the_cache(cache):
+    model = ScriptedChatModel(responses=["first", "second"])
+    cached = with_response_cache(model, cache)
+
+    def apredict():
+        result = asyncio.run(cached.agenerate([prompt_messages()]))
+        return result.generations[0][0].message.content
+
+    assert apredict() == "first"
+    assert cached.predict_messages(prompt_messages()).content == "first"
+    assert apredict() == "first"
+    assert model.calls == 1
+    assert cache.stats()["hits"] == 2
+
+
+def test_responses_cut_at_the_command_are_cached_as_cut(cache):
+    model = CutChatModel(responses=["Done.\n<cmd>finish</cmd> and some rambling"])
+    cached = with_response_cache(model, cache)
+
+    with pytest.raises(CommandComplete):
+        cached.predict_messages(prompt_messages())
+    assert cached.predict_messages(prompt_messages()).content == "Done.\n<cmd>finish</cmd>"
+    assert model.calls == 1
+
+
+def test_function_calls_are_cached_separately_from_text_replies(cache):
+    model = ScriptedChatModel(responses=["Done.\n<cmd>finish --response \"ok\"</cmd>"])
+    cached = with_response_cache(model, cache)
+    definitions = [{"name": "finish", "parameters": {"type": "object", "properties": {}}}]
+
+    with function_definitions(definitions):
+        first = cached.predict_messages(prompt_messages())
+        again = cached.predict_messages(prompt_messages())
+    assert get_function_call(first)["name"] == "finish"
+    assert get_function_call(again) == get_function_call(first)
+    assert model.calls == 1
+
+    # Without definitions the same messages are a different request
+    assert "<cmd>finish" in cached.predict_messages(prompt_messages()).content
+    assert model.calls == 2
+
+
+def test_completion_batches_only_send_the_prompts_that_missed(cache):
+    model = AsyncFakeListLLM(responses=["a", "b", "c"])
+    cached = with_response_cache(model, cache)
+
+    assert cached.predict("one") == "a"
+    result = cached.generate(["one", "two"])
+    assert [generation[0].text for generation in result.generations] == ["a", "b"]
+    assert model.calls == 2
+
+    result = asyncio.run(cached.agenerate(["two", "three"]))
+    assert [generation[0].text for generation in result.generations] == ["b", "c"]
+    assert model.calls == 3
+
+
+def test_responses_persist_across_cache_instances(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    with_response_cache(ScriptedChatModel(responses=["stored"]), ResponseCache(path=path)).predict_messages(
+        prompt_messages())
+
+    model = ScriptedChatModel(responses=["fresh"])
+    assert with_response_cache(model, ResponseCache(path=path)).predict_messages(
+        prompt_messages()).content == "stored"
+    assert model.calls == 0
+
+
+def test_least_recently_used_entries_are_evicted_past_max_bytes(cache):
+    cache.max_bytes = 250
+    for name in ["a", "b", "c"]:
+        cache.put(f'["model", null, [], "{name}"]', name * 100)
+    assert cache.get('["model", null, [], "a"]') is None
+    assert cache.get('["model", null, [], "c"]') == "c" * 100
+
+    # Reading "b" makes "c" the least recently used
+    cache.get('["model", null, [], "b"]')
+    cache.put('["model", null, [], "d"]', "d" * 100)
+    assert cache.get('["model", null, [], "c"]') is None
+    assert cache.get('["model", null, [], "b"]') == "b" * 100
+
+    stats = cache.stats()
+    assert stats["evictions"] == 2
+    assert stats["entries"] == 2
+    assert stats["bytes"] == 200
@@ -0,0 +1,154 @@
+import asyncio
+import threading
+import time
+from typing import List
+
+import pytest
+from langchain.llms.fake import FakeListLLM
+from langchain.schema import HumanMessage
+
+from command_gpt.utils.offline_models import ScriptedChatModel
+from command_gpt.utils.rate_limiter import (
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    RateLimitedChatModel,
+    RateLimitedLLM,
+    RequestScheduler,
+    TokenBucket,
+)
+
+
+class RateLimitError(Exception):
+    """Matched by name, like openai's"""
+
+
+class StreamThenFailChatModel(ScriptedChatModel):
+    """Streams the first word of its reply, then fails with a rate limit error"""
+
+    def _generate(self, messages, stop=None, run_manager=None):
+        self.calls += 1
+        run_manager.on_llm_new_token("Partial ")
+        raise RateLimitError("rate limited mid-stream")
+
+    async def _agenerate(self, messages, stop=None, run_manager=None):
+        self.calls += 1
+        await run_manager.on_llm_new_token("Partial ")
+        raise RateLimitError("rate limited mid-stream")
+
+
+class AsyncFakeListLLM(FakeListLLM):
+    async def _acall(self, prompt, stop=None, run_manager=None):
+        return self._call(prompt, stop)
+
+    def get_num_tokens(self, text: str) -> int:
+        return len(text) // 4 + 1
+
+
+class LimitedScriptedChatModel(ScriptedChatModel):
+    max_tokens: int = 500
+
+
+def create_scheduler(**kwargs) -> RequestScheduler:
+    return RequestScheduler("test", backoff=0.01, max_backoff=0.02, **kwargs)
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(per_minute=6000)
+    bucket.take(6000)
+    assert bucket.wait_time(100) == pytest.approx(1.0, abs=0.05)
+    time.sleep(0.1)
+    assert bucket.wait_time(100) == pytest.approx(0.9, abs=0.05)
+
+
+def test_retries_rate_limit_errors():
+    scheduler = create_scheduler()
+    failures = [RateLimitError("slow down"), RateLimitError("slow down")]
+
+    def request():
+        if failures:
+            raise failures.pop()
+        return "ok"
+
+    assert scheduler.run(request) == "ok"
+    assert scheduler.stats()["retries"] == 2 and scheduler.stats()["rate_limit_errors"] == 2
+
+
+def test_does_not_retry_other_errors():
+    scheduler = create_scheduler()
+    with pytest.raises(ValueError):
+        scheduler.run(lambda: (_ for _ in ()).throw(ValueError("bad request")))
+    assert scheduler.stats()["retries"] == 0
+
+
+def test_admits_waiting_requests_by_priority():
+    scheduler = create_scheduler(requests_per_minute=600)
+    scheduler.requests.level = 0
+    admitted: List[int] = []
+
+    def request(priority):
+        scheduler.run(lambda: admitted.append(priority), priority=priority)
+
+    threads = [threading.Thread(target=request, args=(priority,)) for priority in (PRIORITY_LOW, PRIORITY_LOW, PRIORITY_HIGH)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join()
+    assert admitted == [PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_LOW]
+
+
+def test_chat_model_charges_prompt_and_reply_tokens():
+    scheduler = create_scheduler(tokens_per_minute=100000)
+    llm = RateLimitedChatModel(llm=LimitedScriptedChatModel(responses=["A short reply."]), scheduler=scheduler)
+
+    assert llm([HumanMessage(content="x" * 400)]).content == "A short reply."
+    # Prompt (101) & reply (4) tokens stay charged; the unused part of the 500 token completion estimate is refunded
+    assert 100000 - scheduler.tokens.level == pytest.approx(105, abs=1)
+
+
+def test_async_requests_go_through_scheduler():
+    scheduler = create_scheduler(requests_per_minute=600, tokens_per_minute=100000)
+    scheduler.requests.level = 0
+    llm = RateLimitedChatModel(llm=ScriptedChatModel(responses=["Async reply."]), scheduler=scheduler)
+
+    start = time.monotonic()
+    result = asyncio.run(llm.agenerate([[HumanMessage(content="hello")]]))
+    assert result.generations[0][0].text == "Async reply."
+    assert scheduler.stats()["admitted"] == 1
+    # Waited for the empty request bucket to refill (600 per minute is one request per 0.1s)
+    assert time.monotonic() - start >= 0.08
+
+
+def test_async_completion_requests_go_through_scheduler():
+    scheduler = create_scheduler()
+    llm = RateLimitedLLM(llm=AsyncFakeListLLM(responses=["one", "two"]), scheduler=scheduler)
+
+    result = asyncio.run(llm.agenerate(["first", "second"]))
+    assert [g[0].text for g in result.generations] == ["one", "two"]
+    assert scheduler.stats()["admitted"] == 1
+
+
+def test_streamed_requests_are_not_retried():
+    scheduler = create_scheduler()
+    model = StreamThenFailChatModel(responses=["unused"])
+    llm = RateLimitedChatModel(llm=model, scheduler=scheduler)
+
+    with pytest.raises(RateLimitError):
+        llm([HumanMessage(content="hello")])
+    with pytest.raises(RateLimitError):
+        asyncio.run(llm.agenerate([[HumanMessage(content="hello")]]))
+    assert model.calls == 2
+    assert scheduler.stats()["retries"] == 0
+
+
+def test_async_requests_retry_before_streaming():
+    scheduler = create_scheduler()
+    failures = [RateLimitError("slow down")]
+
+    async def request():
+        if failures:
+            raise failures.pop()
+        return "ok"
+
+    assert asyncio.run(scheduler.arun(request)) == "ok"
+    assert scheduler.stats()["retries"] == 1
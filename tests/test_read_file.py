@@ -0,0 +1,68 @@
+import re
+
+from command_gpt.tooling.tools import ReadFileToolChunked
+
+
+def read(workspace, **args):
+    return ReadFileToolChunked(root_dir=str(workspace)).run({"file_path": "report.md", **args})
+
+
+def continuation(result):
+    match = re.search(r"Use --offset (\d+)(?: --char_offset (\d+))? to continue", result)
+    return (int(match.group(1)), int(match.group(2) or 0)) if match else None
+
+
+def page_text(result):
+    return result[:result.rindex("\n\n[Line")]
+
+
+def test_small_file_is_returned_whole(workspace):
+    (workspace / "report.md").write_text("# Notes\nshort\n")
+    assert read(workspace) == "# Notes\nshort\n"
+
+
+def test_large_file_returns_preview(workspace):
+    (workspace / "report.md").write_text("".join(f"# Section {i}\n" + "some text\n" * 500 for i in range(3)))
+    preview = read(workspace)
+    assert preview.startswith("File report.md is large (")
+    assert "0: # Section 0" in preview and "1002: # Section 2" in preview
+
+
+def test_pages_through_file_with_offset_and_limit(workspace):
+    (workspace / "report.md").write_text("".join(f"line {i}\n" for i in range(300)))
+
+    result = read(workspace, offset=0, limit=200)
+    assert page_text(result) == "".join(f"line {i}\n" for i in range(200))
+    assert "[Lines 0-199 of 300 in report.md." in result
+    assert continuation(result) == (200, 0)
+
+    result = read(workspace, offset=200, limit=200)
+    assert "[Lines 200-299 of 300 in report.md.]" in result
+    assert continuation(result) is None
+
+
+def test_line_that_does_not_fit_starts_next_page(workspace):
+    lines = ["a" * 5000 + "\n", "b" * 5000 + "\n", "c\n"]
+    (workspace / "report.md").write_text("".join(lines))
+
+    result = read(workspace, offset=0, limit=10)
+    assert page_text(result) == lines[0]
+    assert continuation(result) == (1, 0)
+    assert page_text(read(workspace, offset=1, limit=10)) == lines[1] + lines[2]
+
+
+def test_line_longer_than_a_page_is_read_in_pieces(workspace):
+    long_line = "".join(f"{i:05d} " for i in range(4000))
+    (workspace / "report.md").write_text(f"before\n{long_line}\nafter\n")
+
+    pieces = []
+    offset, char_offset = 1, 0
+    for _ in range(10):
+        result = read(workspace, offset=offset, limit=1, char_offset=char_offset)
+        pieces.append(page_text(result))
+        if continuation(result) is None or continuation(result)[0] != 1:
+            break
+        offset, char_offset = continuation(result)
+    assert "".join(pieces) == long_line
+    assert len(pieces) == 3
+    assert continuation(result) == (2, 0)
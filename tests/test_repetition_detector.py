@@ -0,0 +1,64 @@
+import pytest
+
+from command_gpt.utils.repetition_detector import RepetitionDetector
+from command_gpt.utils.workspace_writer import get_workspace_writer
+
+
+@pytest.fixture
+def detector(workspace):
+    detector = RepetitionDetector(str(workspace), token_counter=lambda text: len(text) // 4 + 1)
+    yield detector
+    detector.close()
+
+
+def run(detector, name, args, workspace_listing="notes.md", result="result"):
+    check = detector.check(name, args, workspace_listing)
+    if check.cached_result is None:
+        detector.record_result(check, result)
+    return check
+
+
+def test_search_repeats_match_regardless_of_case_and_filler():
+    normalize = RepetitionDetector.normalize_args
+    assert normalize({"tool_input": "History of  ROME"}, "search") == normalize({"tool_input": "history rome?"}, "search")
+    assert normalize({"tool_input": "rome | carthage"}, "search") == normalize({"tool_input": "Rome | Carthage"}, "search")
+    assert normalize({"tool_input": "rome"}, "search") != normalize({"tool_input": "carthage"}, "search")
+
+
+def test_fetch_url_repeats_match_on_scheme_and_host_case_only():
+    normalize = RepetitionDetector.normalize_args
+    assert normalize({"tool_input": "HTTPS://Example.com/Page"}, "fetch_url") == normalize(
+        {"tool_input": "https://example.com/Page"}, "fetch_url")
+    assert normalize({"tool_input": "https://example.com/Page"}, "fetch_url") != normalize(
+        {"tool_input": "https://example.com/page"}, "fetch_url")
+
+
+def test_other_commands_keep_case():
+    normalize = RepetitionDetector.normalize_args
+    assert normalize({"file_path": "Notes.md"}, "read_file") != normalize({"file_path": "notes.md"}, "read_file")
+    assert normalize({"file_path": " notes.md "}, "read_file") == normalize({"file_path": "notes.md"}, "read_file")
+
+
+def test_repeated_search_is_served_from_cache(detector):
+    assert run(detector, "search", {"tool_input": "Roman roads"}, result="Search results: ...").cached_result is None
+    check = run(detector, "search", {"tool_input": "roman roads"})
+    assert check.repeat_of_loop == 1
+    assert check.cached_result is not None and "Search results: ..." in check.cached_result
+    assert detector.stats["cache_hits"] == 1
+
+
+def test_workspace_write_invalidates_repeats(detector, workspace):
+    run(detector, "read_file", {"file_path": "notes.md"})
+    run(detector, "write_file", {"file_path": "notes.md", "text": "changed"})
+    get_workspace_writer().write(workspace / "notes.md", "changed")
+    check = run(detector, "read_file", {"file_path": "notes.md"})
+    assert check.cached_result is None and check.repeat_of_loop is None
+
+
+def test_flags_command_cycles(detector):
+    run(detector, "list_directory", {})
+    run(detector, "read_file", {"file_path": "notes.md"})
+    run(detector, "list_directory", {})
+    check = run(detector, "read_file", {"file_path": "notes.md"})
+    assert check.cycle == ("list_directory", "read_file")
+    assert "You are repeating yourself" in detector.correction_message(check)
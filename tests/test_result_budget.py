@@ -0,0 +1,48 @@
+from command_gpt.tooling.result_budget import ResultBudget
+from command_gpt.tooling.tools import ReadFileToolChunked
+from command_gpt.utils.workspace_writer import get_workspace_writer
+
+
+def create_budget(workspace):
+    return ResultBudget(str(workspace), token_counter=lambda text: len(text) // 4, max_tokens=600)
+
+
+def test_full_read_file_page_passes_through(workspace):
+    (workspace / "report.md").write_text("".join(f"Line {i:03d} of the report, with some detail.\n" for i in range(400)))
+    page = ReadFileToolChunked(root_dir=str(workspace)).run({"file_path": "report.md", "offset": 0, "limit": 200})
+    result = f"Command read_file returned: {page}"
+    assert len(page) > 8000 - 100
+
+    budgeted = create_budget(workspace).apply(1, "read_file", {"file_path": "report.md", "limit": 200}, result)
+    assert budgeted.text == result
+    assert budgeted.full_output_path is None
+    assert "Use --offset 190 to continue reading." in result
+
+
+def test_large_read_file_preview_points_back_at_file(workspace):
+    preview = "File report.md is large (90000b, 3000 lines). Preview:\n\n" + "HEAD:\n" + "x" * 150 + "\n\n"
+    preview += "".join(f"{i}: # Heading {i} {'y' * 100}\n" for i in range(100))
+    budget = create_budget(workspace)
+
+    budgeted = budget.apply(1, "read_file", {"file_path": "report.md"}, f"Command read_file returned: {preview}")
+    assert budgeted.full_output_path == "report.md"
+    assert "read_file --file_path report.md --offset <line>" in budgeted.text
+    assert budgeted.tokens < budgeted.original_tokens
+    assert budget.stats["budgeted"] == 1 and budget.stats["spilled"] == 0
+
+
+def test_large_output_of_other_tools_is_spilled(workspace):
+    output = "Command list_directory returned: " + "\n".join(f"file_{i}.md" for i in range(1000))
+    budget = create_budget(workspace)
+
+    budgeted = budget.apply(3, "list_directory", {}, output)
+    assert budgeted.full_output_path.endswith("/loop_3_list_directory.txt")
+    get_workspace_writer().flush_all()
+    assert (workspace / budgeted.full_output_path).read_text() == output
+    assert "Full output saved to" in budgeted.text
+    assert budget.stats["spilled"] == 1
+
+
+def test_small_results_pass_through(workspace):
+    budgeted = create_budget(workspace).apply(1, "write_file", {}, "Command write_file returned: File written.")
+    assert budgeted.text == "Command write_file returned: File written."
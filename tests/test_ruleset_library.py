@@ -0,0 +1,24 @@
+from command_gpt.prompting.ruleset_library import RulesetLibrary
+from command_gpt.utils.offline_models import HashEmbeddings
+from command_gpt.utils.text_terms import split_terms
+
+
+def test_split_terms_casefolds_and_keeps_meaningful_symbols():
+    assert split_terms("Straße, C++ & C#!") == ["strasse", "c++", "c#"]
+    assert split_terms("東京 観光") == ["東京", "観光"]
+    assert split_terms(None) == []
+
+
+def test_make_key_matches_trivially_different_spellings():
+    assert RulesetLibrary.make_key("Research", "Coral  Reefs!") == RulesetLibrary.make_key("research", "coral reefs")
+    assert RulesetLibrary.make_key("research", "C++") != RulesetLibrary.make_key("research", "C#")
+    assert RulesetLibrary.make_key("research", "?!") == "research|?!"
+
+
+def test_find_exact_uses_normalized_key(tmp_path):
+    library = RulesetLibrary(path=str(tmp_path / "library.jsonl"), embeddings=HashEmbeddings())
+    library.add("Research", "Coral Reefs", "You are reef-gpt")
+
+    reloaded = RulesetLibrary(path=str(tmp_path / "library.jsonl"), embeddings=HashEmbeddings())
+    assert reloaded.find_exact("research", "coral reefs?")["ruleset"] == "You are reef-gpt"
+    assert reloaded.find_exact("research", "coral") is None
@@ -0,0 +1,72 @@
+import json
+import threading
+
+from command_gpt.tooling.search_cache import SearchCache
+
+
+def test_normalize_query_casefolds_and_drops_filler_keeping_order():
+    assert SearchCache.normalize_query("The History of ROME, rome & Carthage") == "history rome carthage"
+    assert SearchCache.normalize_query("carthage rome") != SearchCache.normalize_query("rome carthage")
+
+
+def test_normalize_query_keeps_unicode_and_symbols():
+    assert SearchCache.normalize_query("Straße in München") == "strasse münchen"
+    assert SearchCache.normalize_query("東京 観光") == "東京 観光"
+    assert SearchCache.normalize_query("C++ vs C#") != SearchCache.normalize_query("C vs C")
+
+
+def test_queries_normalizing_to_nothing_bypass_cache(tmp_path):
+    cache = SearchCache(cache_dir=str(tmp_path))
+    cache.put("?!", [{"title": "t", "link": "l", "snippet": "s"}])
+    assert cache.get("?!") is None
+    assert cache.entries == {}
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+def test_rephrased_query_hits_cache_after_reload(tmp_path):
+    results = [{"title": "t", "link": "https://example.com", "snippet": "s"}]
+    SearchCache(cache_dir=str(tmp_path)).put("History of Rome", results)
+
+    cache = SearchCache(cache_dir=str(tmp_path))
+    assert cache.get("the history of rome?") == results
+    assert cache.seen_under("https://example.com", "rome facts") == "History of Rome"
+    assert cache.seen_under("https://example.com", "history ROME") is None
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = SearchCache(cache_dir=str(tmp_path), ttl_seconds=1)
+    cache.put("rome", [])
+    cache.entries["rome"]["timestamp"] -= 10
+    assert cache.get("rome") is None
+
+
+def test_load_rekeys_old_entries_and_compacts(tmp_path):
+    path = tmp_path / "results.jsonl"
+    old = {"key": "History Rome", "query": "History of Rome", "timestamp": 1e12, "results": []}
+    path.write_text(json.dumps(old) + "\n" + json.dumps(dict(old, results=[{"link": "x"}])) + "\n{truncated")
+
+    cache = SearchCache(cache_dir=str(tmp_path))
+    assert list(cache.entries) == ["history rome"]
+    assert cache.get("history of rome") == [{"link": "x"}]
+    lines = path.read_text().splitlines()
+    assert len(lines) == 1 and json.loads(lines[0])["key"] == "history rome"
+
+
+def test_loading_while_other_jobs_append_keeps_their_lines(tmp_path):
+    # Each put of "shared" leaves a stale line behind, so every new cache compacts the log while the writers append
+    def append(worker):
+        cache = SearchCache(cache_dir=str(tmp_path))
+        for i in range(40):
+            cache.put(f"worker {worker} query {i}", [])
+            cache.put("shared", [])
+
+    writers = [threading.Thread(target=append, args=(worker,)) for worker in range(4)]
+    for writer in writers:
+        writer.start()
+    while any(writer.is_alive() for writer in writers):
+        SearchCache(cache_dir=str(tmp_path))
+    for writer in writers:
+        writer.join()
+
+    entries = SearchCache(cache_dir=str(tmp_path)).entries
+    assert len(entries) == 4 * 40 + 1
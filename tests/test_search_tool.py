@@ -0,0 +1,63 @@
+import re
+from typing import Dict, List
+
+from command_gpt.tooling.search_backends import SearchBackend
+from command_gpt.tooling.search_cache import SearchCache
+from command_gpt.tooling.tools import SearchAndWriteTool
+from command_gpt.utils.workspace_writer import get_workspace_writer
+
+
+class FakeSearchBackend(SearchBackend):
+    """Returns two results per query & records the queries it was sent"""
+
+    max_concurrency = 4
+
+    def __init__(self):
+        self.queries: List[str] = []
+
+    def results(self, query: str, num_results: int) -> List[Dict]:
+        self.queries.append(query)
+        return [
+            {"title": f"{query} {i}", "link": f"https://example.com/{i}", "snippet": f"About {query}"}
+            for i in range(2)
+        ]
+
+
+def written_file(result: str) -> str:
+    return result.rsplit("written to file named: ", 1)[1]
+
+
+def test_search_writes_results_and_serves_repeats_from_cache(tmp_path, workspace):
+    backend = FakeSearchBackend()
+    tool = SearchAndWriteTool(backend, cache=SearchCache(cache_dir=str(tmp_path / "cache")), workspace_dir=str(workspace))
+
+    first = tool.run("roman roads")
+    assert "(from cache)" not in first
+    file_name = written_file(first)
+    assert file_name.startswith("search_results/results_roman roads_") and file_name.endswith(".txt")
+    get_workspace_writer().flush_all()
+    assert "Title: roman roads 0" in (workspace / file_name).read_text()
+
+    assert "(from cache)" in tool.run("Roman roads?")
+    assert backend.queries == ["roman roads"]
+
+
+def test_search_splits_queries_on_spaced_separator_only(tmp_path, workspace):
+    backend = FakeSearchBackend()
+    tool = SearchAndWriteTool(backend, cache=SearchCache(cache_dir=str(tmp_path / "cache")), workspace_dir=str(workspace))
+
+    result = tool.run("roman roads | aqueducts|bridges")
+    assert sorted(backend.queries) == ["aqueducts|bridges", "roman roads"]
+    assert result.count("Search results") == 2
+    # Both queries returned the same links, so the second query's results are flagged
+    assert "(Previously seen in results for " in result
+
+
+def test_fanned_out_queries_that_sanitize_alike_get_their_own_files(workspace):
+    tool = SearchAndWriteTool(FakeSearchBackend(), workspace_dir=str(workspace))
+
+    file_names = re.findall(r"written to file named: (.+)", tool.run("C++ tips | C tips"))
+    assert len(set(file_names)) == 2
+    get_workspace_writer().flush_all()
+    assert "Title: C++ tips 0" in (workspace / file_names[0]).read_text()
+    assert "Title: C tips 0" in (workspace / file_names[1]).read_text()
@@ -0,0 +1,33 @@
+import importlib
+import sys
+
+from command_gpt.utils import soak_test
+
+
+def test_short_run_is_judged_on_traced_growth(workspace):
+    result = soak_test.run_soak(loops=24, sample_every=8, warmup_loops=8, min_rss_loops=1000,
+                                workspace_dir=str(workspace))
+    assert result.loops == 24
+    assert [sample.loop for sample in result.samples] == [8, 16, 24]
+    assert result.samples[-1].memory_documents == 24
+    assert result.judged_on == "traced"
+    assert result.passed == (result.traced_growth_per_loop <= soak_test.SOAK_MAX_GROWTH_BYTES_PER_LOOP)
+
+
+def test_growth_threshold_fails_run(workspace):
+    result = soak_test.run_soak(loops=16, sample_every=8, warmup_loops=8, max_growth_bytes_per_loop=-1e9,
+                                min_rss_loops=0, workspace_dir=str(workspace))
+    assert result.judged_on == ("rss" if result.rss_growth_per_loop is not None else "traced")
+    assert not result.passed
+
+
+def test_imports_without_resource_module(monkeypatch):
+    # As on Windows
+    monkeypatch.setitem(sys.modules, "resource", None)
+    try:
+        module = importlib.reload(soak_test)
+        assert module.resource is None
+        assert module.read_rss_bytes() is None or module.read_rss_bytes() > 0
+    finally:
+        monkeypatch.undo()
+        importlib.reload(soak_test)
@@ -0,0 +1,114 @@
+import threading
+import time
+
+from langchain.tools import Tool
+
+from command_gpt.tooling.tool_executor import (
+    STATUS_OK,
+    STATUS_TIMEOUT,
+    STATUS_VALIDATION_ERROR,
+    ToolExecutor,
+)
+from command_gpt.tooling.tool_result_cache import ToolResultCache
+from command_gpt.tooling.tools import ReadFileToolChunked, WriteFileToolNewlines
+from command_gpt.utils.workspace_writer import get_workspace_writer
+
+
+def sleep_tool(name="sleep"):
+    return Tool(name=name, func=lambda seconds: time.sleep(float(seconds)) or f"slept {seconds}", description="Sleep.")
+
+
+def create_executor(**kwargs) -> ToolExecutor:
+    kwargs = {"default_timeout": 1.0, "concurrency_limits": {}, "process_isolated": [], "result_cache": None, **kwargs}
+    executor = ToolExecutor(**kwargs)
+    if kwargs["result_cache"] is None and executor.result_cache is not None:
+        executor.result_cache.close()
+        executor.result_cache = None
+    return executor
+
+
+def test_runs_tool():
+    executor = create_executor()
+    try:
+        result = executor.execute(sleep_tool(), {"tool_input": "0"})
+    finally:
+        executor.shutdown()
+    assert (result.status, result.output) == (STATUS_OK, "slept 0")
+
+
+def test_hung_thread_tool_times_out_and_gets_out_of_the_way():
+    executor = create_executor(default_timeout=0.1, max_workers=1)
+    try:
+        start = time.monotonic()
+        assert executor.execute(sleep_tool(), {"tool_input": "1"}).status == STATUS_TIMEOUT
+        assert time.monotonic() - start < 0.5
+        # The hung call still holds the only worker of the old pool
+        assert executor.replaced_pools == 1
+        assert executor.execute(sleep_tool(), {"tool_input": "0"}).status == STATUS_OK
+    finally:
+        executor.shutdown()
+
+
+def test_timeout_counts_from_when_tool_starts():
+    executor = create_executor(default_timeout=0.5, concurrency_limits={"sleep": 1})
+    results = []
+    try:
+        threads = [threading.Thread(target=lambda: results.append(executor.execute(sleep_tool(), {"tool_input": "0.3"})))
+                   for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        executor.shutdown()
+    # The second call waited ~0.3s for the first, then ran for 0.3s: over 0.5s in total, but each ran within its timeout
+    assert [result.status for result in results] == [STATUS_OK, STATUS_OK]
+    assert max(result.duration_seconds for result in results) > 0.5
+
+
+def test_invalid_args_are_reported():
+    executor = create_executor()
+    try:
+        result = executor.execute(WriteFileToolNewlines(root_dir="."), {"file_path": "a.md"})
+    finally:
+        executor.shutdown()
+    assert result.status == STATUS_VALIDATION_ERROR
+
+
+def test_process_isolated_tool_is_killed_on_timeout():
+    executor = create_executor(default_timeout=0.2, process_isolated=["sleep"])
+    try:
+        start = time.monotonic()
+        result = executor.execute(sleep_tool(), {"tool_input": "5"})
+    finally:
+        executor.shutdown()
+    assert result.status == STATUS_TIMEOUT
+    assert time.monotonic() - start < 2
+
+
+def test_process_isolated_writes_are_committed_and_reported(workspace):
+    writer = get_workspace_writer()
+    committed = []
+    listener = committed.append
+    writer.subscribe(listener)
+    cache = ToolResultCache()
+    executor = create_executor(process_isolated=["write_file"], result_cache=cache)
+    read_file = ReadFileToolChunked(root_dir=str(workspace))
+    write_file = WriteFileToolNewlines(root_dir=str(workspace))
+    try:
+        writer.write(workspace / "notes.md", "one\n")
+        # Buffered in this process when the isolated write runs
+        writer.write(workspace / "notes.md", "two\n", append=True)
+        assert executor.execute(write_file, {"file_path": "notes.md", "text": "three\n", "append": True}).status == STATUS_OK
+        assert executor.execute(read_file, {"file_path": "notes.md"}).output == "one\ntwo\nthree\n"
+
+        committed.clear()
+        result = executor.execute(write_file, {"file_path": "notes.md", "text": "four\n", "append": True})
+        assert result.status == STATUS_OK
+        assert (workspace / "notes.md").resolve() in committed
+        # The cached read was invalidated by the child's write
+        read = executor.execute(read_file, {"file_path": "notes.md"})
+        assert not read.cached and read.output == "one\ntwo\nthree\nfour\n"
+    finally:
+        writer.unsubscribe(listener)
+        executor.shutdown()
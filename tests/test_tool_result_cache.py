@@ -0,0 +1,120 @@
+import os
+
+import pytest
+from langchain.tools.file_management import ListDirectoryTool
+
+from command_gpt.tooling.tool_result_cache import CachedToolResult, ToolResultCache
+from command_gpt.tooling.tools import ReadFileToolChunked
+from command_gpt.utils.workspace_writer import get_workspace_writer
+
+
+@pytest.fixture
+def cache():
+    cache = ToolResultCache()
+    yield cache
+    cache.close()
+
+
+def cache_result(cache, tool, args):
+    """Run the tool through the cache like ToolExecutor does & return its output"""
+    cached = cache.get(tool, args)
+    if cached is not None:
+        return cached.output
+    snapshot = cache.snapshot(tool, args)
+    output = tool.run(args)
+    cache.put(snapshot, output)
+    return output
+
+
+def test_repeated_reads_hit_until_the_file_is_written(cache, workspace):
+    read_file = ReadFileToolChunked(root_dir=str(workspace))
+    get_workspace_writer().write(workspace / "notes.md", "one\n")
+
+    assert cache_result(cache, read_file, {"file_path": "notes.md"}) == "one\n"
+    assert cache.get(read_file, {"file_path": "notes.md"}) == CachedToolResult("one\n")
+
+    # Buffered appends are committed (& drop the entry) before the next lookup reads the file's version
+    get_workspace_writer().write(workspace / "notes.md", "two\n", append=True)
+    assert cache.get(read_file, {"file_path": "notes.md"}) is None
+    assert cache.stats()["invalidations"] == 1
+    assert cache_result(cache, read_file, {"file_path": "notes.md"}) == "one\ntwo\n"
+
+
+def test_writes_drop_listings_of_every_directory_above(cache, workspace):
+    list_directory = ListDirectoryTool(root_dir=str(workspace))
+    (workspace / "sub").mkdir()
+    get_workspace_writer().write(workspace / "other.md", "x")
+
+    for dir_path in [".", "sub"]:
+        cache_result(cache, list_directory, {"dir_path": dir_path})
+    assert cache.stats()["entries"] == 2
+
+    get_workspace_writer().write(workspace / "sub" / "notes.md", "x")
+    assert cache.stats()["entries"] == 0
+    assert "notes.md" in cache_result(cache, list_directory, {"dir_path": "sub"})
+
+
+def test_writes_to_other_files_keep_entries(cache, workspace):
+    read_file = ReadFileToolChunked(root_dir=str(workspace))
+    get_workspace_writer().write(workspace / "notes.md", "one\n")
+    cache_result(cache, read_file, {"file_path": "notes.md"})
+
+    get_workspace_writer().write(workspace / "other.md", "x")
+    assert cache.get(read_file, {"file_path": "notes.md"}) is not None
+
+
+def test_edits_made_outside_the_writer_are_misses(cache, workspace):
+    read_file = ReadFileToolChunked(root_dir=str(workspace))
+    path = workspace / "notes.md"
+    path.write_text("one\n")
+    cache_result(cache, read_file, {"file_path": "notes.md"})
+
+    # Same size, so only the modification time tells
+    path.write_text("two\n")
+    os.utime(path, ns=(0, 0))
+    assert cache.get(read_file, {"file_path": "notes.md"}) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted_past_max_bytes(workspace):
+    cache = ToolResultCache(max_bytes=250)
+    read_file = ReadFileToolChunked(root_dir=str(workspace))
+    try:
+        for name in "abc":
+            (workspace / f"{name}.md").write_text(name * 100)
+            cache_result(cache, read_file, {"file_path": f"{name}.md"})
+        assert cache.get(read_file, {"file_path": "a.md"}) is None
+        assert cache.get(read_file, {"file_path": "b.md"}) is not None
+
+        # Reading b made c the least recently used
+        (workspace / "d.md").write_text("d" * 100)
+        cache_result(cache, read_file, {"file_path": "d.md"})
+        assert cache.get(read_file, {"file_path": "c.md"}) is None
+        assert cache.get(read_file, {"file_path": "b.md"}) is not None
+        assert cache.stats()["evictions"] == 2
+
+        # Larger than the whole cache: not stored
+        (workspace / "big.md").write_text("x" * 300)
+        cache_result(cache, read_file, {"file_path": "big.md"})
+        assert cache.get(read_file, {"file_path": "big.md"}) is None
+    finally:
+        cache.close()
+
+
+def test_recorded_token_counts_are_returned_with_hits(cache, workspace):
+    read_file = ReadFileToolChunked(root_dir=str(workspace))
+    (workspace / "notes.md").write_text("one\n")
+    cache_result(cache, read_file, {"file_path": "notes.md"})
+
+    cache.record_tokens(read_file, {"file_path": "notes.md"}, 42)
+    assert cache.get(read_file, {"file_path": "notes.md"}).tokens == 42
+
+
+def test_only_read_only_tools_with_paths_are_cached(cache, workspace):
+    read_file = ReadFileToolChunked(root_dir=str(workspace))
+    assert cache.snapshot(read_file, {}) is None
+    assert cache.snapshot(read_file, {"file_path": "../outside.md"}) is None
+    uncached = ToolResultCache(tools=[])
+    assert uncached.snapshot(read_file, {"file_path": "notes.md"}) is None
+    uncached.close()
+
@@ -0,0 +1,95 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+from typing import List
+from urllib.parse import unquote
+
+import pytest
+
+from command_gpt.tooling.web_fetch import FetchAndExtractTool
+from command_gpt.utils.workspace_writer import get_workspace_writer
+
+
+PAGES = {
+    "/article": ("text/html; charset=utf-8",
+                 "<html><head><title>Roman Roads</title></head><body><nav>Menu</nav>"
+                 "<article><h1>Via Appia</h1><p>Built in 312 BC.</p></article><footer>Footer</footer></body></html>"),
+    "/a|b": ("text/plain", "Pipe in the path."),
+    "/image": ("image/png", "not text"),
+}
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    requests: List[str] = []
+
+    def do_GET(self):
+        path = unquote(self.path)
+        self.requests.append(path)
+        if path not in PAGES:
+            self.send_error(404)
+            return
+        content_type, body = PAGES[path]
+        etag = f'"{len(body)}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def page_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    PageHandler.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_extracts_main_text_and_revalidates_cache(tmp_path, workspace, page_server):
+    tool = FetchAndExtractTool(cache_dir=str(tmp_path / "pages"), workspace_dir=str(workspace))
+    url = f"{page_server}/article"
+
+    digest = tool.fetch(url)
+    assert "Title: Roman Roads" in digest
+    assert "unchanged since last fetch" not in digest
+    file_name = digest.rsplit("file named: ", 1)[1]
+    get_workspace_writer().flush_all()
+    text = (workspace / file_name).read_text()
+    assert "# Via Appia\n\nBuilt in 312 BC." in text
+    assert "Menu" not in text and "Footer" not in text
+
+    assert "unchanged since last fetch" in FetchAndExtractTool(
+        cache_dir=str(tmp_path / "pages"), workspace_dir=str(workspace)).fetch(url)
+
+
+def test_fetch_file_names_differ_for_similar_urls(tmp_path, workspace):
+    tool = FetchAndExtractTool(cache_dir=str(tmp_path / "pages"), workspace_dir=str(workspace))
+    meta = {"title": "t"}
+    first = tool._write_to_workspace("https://example.com/a?b", meta, "one")
+    second = tool._write_to_workspace("https://example.com/a-b", meta, "two")
+    assert first != second
+    assert first.startswith("web_pages/example_com_a_b_")
+
+
+def test_fetch_splits_urls_on_spaced_separator_only(tmp_path, workspace, page_server):
+    tool = FetchAndExtractTool(cache_dir=str(tmp_path / "pages"), workspace_dir=str(workspace))
+
+    result = tool.run(f"{page_server}/article | {page_server}/a|b | {page_server}/image | {page_server}/missing")
+    digests = result.split("\n\n")
+    assert len(digests) == 4
+    assert digests[0].startswith(f"Fetched {page_server}/article")
+    assert "Preview: Pipe in the path." in digests[1]
+    assert digests[2].startswith("Unsupported content type")
+    assert digests[3].startswith(f"Error fetching {page_server}/missing")
+    assert set(PageHandler.requests) == {"/article", "/a|b", "/image", "/missing"}
@@ -0,0 +1,117 @@
+import threading
+
+from command_gpt.utils.workspace_writer import FSYNC_NEVER, WorkspaceWriter
+
+
+def create_writer(**kwargs) -> WorkspaceWriter:
+    return WorkspaceWriter(**{"flush_bytes": 1000, "flush_delay": 60, "fsync_policy": FSYNC_NEVER, **kwargs})
+
+
+def test_appends_are_coalesced_into_one_commit(tmp_path):
+    writer = create_writer()
+    path = tmp_path / "notes.txt"
+    for i in range(5):
+        writer.write(path, f"line {i}\n", append=True)
+    assert not path.exists()
+    assert writer.commit_count == 0
+
+    writer.flush(path)
+    assert path.read_text() == "".join(f"line {i}\n" for i in range(5))
+    assert writer.commit_count == 1
+
+
+def test_appends_flush_once_past_flush_bytes(tmp_path):
+    writer = create_writer(flush_bytes=10)
+    path = tmp_path / "notes.txt"
+    writer.write(path, "12345", append=True)
+    assert not path.exists()
+    writer.write(path, "67890", append=True)
+    assert path.read_text() == "1234567890"
+
+
+def test_appends_extend_existing_contents(tmp_path):
+    writer = create_writer()
+    path = tmp_path / "notes.txt"
+    path.write_text("existing\n")
+    writer.write(path, "appended\n", append=True)
+    writer.flush_all()
+    assert path.read_text() == "existing\nappended\n"
+
+
+def test_overwrite_discards_pending_appends(tmp_path):
+    writer = create_writer()
+    path = tmp_path / "notes.txt"
+    writer.write(path, "stale\n", append=True)
+    writer.write(path, "fresh\n")
+    writer.flush_all()
+    assert path.read_text() == "fresh\n"
+    assert writer.commit_count == 1
+
+
+def test_commits_leave_no_temp_files(tmp_path):
+    writer = create_writer(flush_bytes=1)
+    for i in range(3):
+        writer.write(tmp_path / "sub" / "notes.txt", f"{i}\n", append=True)
+    assert [p.name for p in (tmp_path / "sub").iterdir()] == ["notes.txt"]
+    assert (tmp_path / "sub" / "notes.txt").read_text() == "0\n1\n2\n"
+
+
+def test_concurrent_appends_all_land(tmp_path):
+    writer = create_writer(flush_bytes=50)
+    path = tmp_path / "notes.txt"
+
+    def append(worker):
+        for i in range(100):
+            writer.write(path, f"{worker}:{i}\n", append=True)
+
+    threads = [threading.Thread(target=append, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.flush_all()
+    assert sorted(path.read_text().splitlines()) == sorted(f"{w}:{i}" for w in range(4) for i in range(100))
+
+
+def test_stale_appends_are_committed_in_the_background(tmp_path):
+    writer = create_writer(flush_delay=0.05)
+    path = tmp_path / "notes.txt"
+    committed = threading.Event()
+    writer.subscribe(lambda _: committed.set())
+    writer.write(path, "later\n", append=True)
+    assert committed.wait(2)
+    assert path.read_text() == "later\n"
+
+
+def test_listeners_receive_committed_paths_until_unsubscribed(tmp_path):
+    writer = create_writer()
+    seen = []
+    writer.subscribe(seen.append)
+    writer.write(tmp_path / "a.txt", "a")
+    writer.write(tmp_path / "b.txt", "b", append=True)
+    assert seen == [(tmp_path / "a.txt").resolve()]
+    writer.flush_all()
+    assert seen[-1] == (tmp_path / "b.txt").resolve()
+
+    writer.unsubscribe(seen.append)
+    writer.write(tmp_path / "a.txt", "again")
+    assert len(seen) == 2
+
+
+def test_bound_method_listeners_are_held_weakly(tmp_path):
+    class Listener:
+        def __init__(self):
+            self.paths = []
+
+        def on_commit(self, path):
+            self.paths.append(path)
+
+    writer = create_writer()
+    listener = Listener()
+    writer.subscribe(listener.on_commit)
+    writer.write(tmp_path / "a.txt", "a")
+    assert listener.paths == [(tmp_path / "a.txt").resolve()]
+
+    del listener
+    writer.write(tmp_path / "a.txt", "b")
+    assert writer._listeners == []